@@ -363,13 +363,9 @@ async def get_daily_reward_info(current_user: User = Depends(get_current_user),
         
         total_reward = int(base_reward * bonus_multiplier)
         
-        # Check if already claimed today
-        from models import DailyReward
-        today = datetime.utcnow().date()
-        already_claimed = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id,
-            DailyReward.claim_date == today
-        ).first() is not None
+        # Check if already claimed today (read from the user's streak columns)
+        from daily_rewards import DailyRewardService
+        already_claimed = not DailyRewardService(db).get_status(current_user).can_claim
         
         return {
             "success": True,
@@ -13,9 +13,10 @@ DEVELOPMENT_MODE = os.getenv('DEVELOPMENT_MODE', 'false').lower() == 'true'
 SIMULATE_INSTAGRAM_CHALLENGES = os.getenv('SIMULATE_INSTAGRAM_CHALLENGES', 'false').lower() == 'true'
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends, status, Body, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, status, Body, WebSocket, BackgroundTasks, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy import create_engine, select, and_, or_, func, desc
 from sqlalchemy.orm import sessionmaker, Session
@@ -28,57 +29,87 @@ import asyncio
 import bcrypt
 from passlib.context import CryptContext
 import os
-from instagrapi import Client
-from instagrapi.exceptions import LoginRequired, TwoFactorRequired, ChallengeRequired, BadPassword, ClientError, UserNotFound
 import json
 import sys
 import importlib.util
 import asyncio
+from typing import TYPE_CHECKING
 
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-try:
-    from enhanced_instagram_collector import enhanced_instagram_collector
-except ImportError:
-    # If running from parent directory, try different import path
-    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
-    from enhanced_instagram_collector import enhanced_instagram_collector
+# Heavy integrations (instagrapi, Selenium, Firebase, managers) are imported and
+# constructed on first use through the service registry.
+from service_registry import service_registry, profile_startup, current_rss_bytes
+
+def _create_enhanced_instagram_collector():
+    try:
+        from enhanced_instagram_collector import enhanced_instagram_collector
+    except ImportError:
+        # If running from parent directory, try different import path
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+        from enhanced_instagram_collector import enhanced_instagram_collector
+    return enhanced_instagram_collector
+
+service_registry.register("enhanced_instagram_collector", _create_enhanced_instagram_collector)
+enhanced_instagram_collector = service_registry.proxy("enhanced_instagram_collector")
 
 from models import (
     Base, User, Order, Task, CoinTransaction, ValidationLog, OrderType, OrderStatus, TaskStatus, 
-    CoinTransactionType, Notification, UserFCMToken, InstagramCredential, DailyReward, 
+    CoinTransactionType, CoinTransactionCategory, Notification, UserFCMToken, InstagramCredential, 
     EmailVerification, UserStatistics, InstagramProfile,
     # New models
     Referral, Badge, UserBadge, Leaderboard, NotificationSetting, DeviceIPLog, 
-    GDPRRequest, UserEducation, MentalHealthLog, CoinWithdrawalRequest, UserSocial
+    GDPRRequest, UserEducation, MentalHealthLog, CoinWithdrawalRequest
 )
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-import requests
+
+if TYPE_CHECKING:
+    from instagrapi import Client
+    from instagram_service import InstagramAPIService
 
 # Import new services
-from instagram_service import InstagramAPIService
-from selenium_instagram_service import SeleniumInstagramService
-from background_jobs import BackgroundJobManager
-from coin_security import CoinSecurityManager
-from social_features import SocialFeaturesManager
-from gdpr_compliance import GDPRComplianceManager
-from user_education import UserEducationService, EducationModuleType
+from user_education import UserEducationService, EducationModuleType, QUIZ_PAYLOADS
 from mental_health import MentalHealthService
+from usage_analytics import invalidate_user_usage
+from daily_rewards import DailyRewardService
+from coin_ledger import CoinLedger
+from response_cache import response_cache, cached_response, invalidate_on_commit, user_tag
+from idempotency import idempotent
+from fast_json import FastJSONResponse
+from query_instrumentation import QueryInstrumentationMiddleware
+from metrics import metrics_registry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE, register_db_pool_metrics, register_notification_metrics, register_audit_metrics, register_rate_limit_metrics, register_push_metrics
+from audit_log import audit_log, AuditEvent
+from rate_limit import rate_limited, rate_limiter
+from domain_events import event_bus, outbox_dispatcher
+from event_consumers import register_event_consumers
+from user_aggregates import user_aggregates
+from notification_preferences import notification_preferences
+from push_delivery import push_worker, PushMessage
+
+from social_features import SOCIAL_STATS_TAG
+
+# Response cache tags: the badge catalog, badge ownership and per-user education progress
+BADGE_CATALOG_TAG = "badge_catalog"
+BADGE_AWARDS_TAG = "badge_awards"
+EDUCATION_TAG = "education"
+
+invalidate_on_commit({
+    Badge: (BADGE_CATALOG_TAG, BADGE_AWARDS_TAG),
+    UserBadge: (BADGE_AWARDS_TAG,),
+}, user_scoped={
+    # A badge award only changes the awarded user's /social/stats
+    UserBadge: ("user_id", (SOCIAL_STATS_TAG,)),
+})
 
 # Import dependencies for shared services
 from dependencies import get_db, get_current_user, get_instagram_service
 
-import logging 
-import firebase_admin 
-from firebase_admin import credentials, messaging
-import firebase_admin
 import logging
 
 # Enhanced Notifications Import
 from enhanced_notifications import (
     NotificationService,
-    RealTimeNotificationManager, 
     NotificationType,
     NotificationPriority
 )
@@ -89,7 +120,7 @@ from enhanced_badge_system import (
     BadgeCategory,
     BadgeType,
     get_enhanced_badge_system
-) 
+)
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -313,9 +344,15 @@ async def lifespan(app: FastAPI):
     # Initialize database session for services
     db = SessionLocal()
     try:
+        # Sync badge definitions and load the in-memory badge catalog used by every award path
+        await enhanced_badge_system.initialize_badges()
+        
         # Initialize all managers (they don't need async initialization in our current implementation)
         logger.info("Starting background job manager...")
         await background_job_manager.start()
+        await outbox_dispatcher.start()
+        await push_worker.start()
+        metrics_registry.start_worker_exporter()
         
         logger.info("All services initialized successfully")
         
@@ -331,6 +368,11 @@ async def lifespan(app: FastAPI):
         logger.info("Shutting down Instagram Coin Platform...")
         try:
             await background_job_manager.stop()
+            await outbox_dispatcher.stop()
+            await push_worker.stop()
+            # Drain buffered audit rows before the process exits
+            await asyncio.to_thread(audit_log.stop)
+            metrics_registry.stop_worker_exporter()
             logger.info("All services shut down successfully")
         except Exception as e:
             logger.error(f"Error during shutdown: {e}")
@@ -339,7 +381,8 @@ app = FastAPI(
     title="Instagram Coin Platform API",
     description="Advanced Instagram task-based coin earning platform with social features, GDPR compliance, and security",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 app.add_middleware(
@@ -350,17 +393,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize background job manager with Instagram service from dependencies
-from dependencies import instagram_service_instance
-background_job_manager = BackgroundJobManager(SessionLocal, instagram_api_service=instagram_service_instance)
-
-# Initialize advanced services (those that need session factory)
-# instagram_service_instance is now created in dependencies.py
-selenium_service = SeleniumInstagramService()
-# background_job_manager will be initialized after getting instagram service from dependencies
-coin_security_manager = CoinSecurityManager(SessionLocal)
-social_features_manager = SocialFeaturesManager(SessionLocal)
-gdpr_compliance_manager = GDPRComplianceManager(SessionLocal)
+# SQL statement counts / timings per request (headers in debug mode, structured logs)
+app.add_middleware(QueryInstrumentationMiddleware)
+app.add_middleware(MetricsMiddleware)
+register_db_pool_metrics(engine)
+audit_log.configure(SessionLocal)
+user_aggregates.configure(SessionLocal)
+notification_preferences.configure(SessionLocal)
+push_worker.configure(SessionLocal)
+register_audit_metrics(audit_log)
+register_rate_limit_metrics(rate_limiter)
+register_push_metrics(push_worker)
+
+# instagram_service_instance is a lazy proxy created in dependencies.py
+from dependencies import instagram_service_instance, engine as dependencies_engine
+register_db_pool_metrics(dependencies_engine, "dependencies")
+
+# --- Lazily constructed services ---
+# Each factory imports its module on first use so worker boot stays light.
+def _create_background_job_manager():
+    from background_jobs import BackgroundJobManager
+    return BackgroundJobManager(SessionLocal, instagram_api_service=instagram_service_instance)
+
+def _create_selenium_service():
+    from selenium_instagram_service import SeleniumInstagramService
+    return SeleniumInstagramService()
+
+def _create_coin_security_manager():
+    from coin_security import CoinSecurityManager
+    return CoinSecurityManager(SessionLocal)
+
+def _create_social_features_manager():
+    from social_features import SocialFeaturesManager
+    return SocialFeaturesManager(SessionLocal)
+
+def _create_gdpr_compliance_manager():
+    from gdpr_compliance import GDPRComplianceManager
+    return GDPRComplianceManager(SessionLocal)
+
+def _create_enhanced_badge_system():
+    return get_enhanced_badge_system(SessionLocal, notification_service)
+
+service_registry.register("background_job_manager", _create_background_job_manager)
+service_registry.register("selenium_service", _create_selenium_service)
+service_registry.register("coin_security_manager", _create_coin_security_manager)
+service_registry.register("social_features_manager", _create_social_features_manager)
+service_registry.register("gdpr_compliance_manager", _create_gdpr_compliance_manager)
+service_registry.register("enhanced_badge_system", _create_enhanced_badge_system)
+
+background_job_manager = service_registry.proxy("background_job_manager")
+selenium_service = service_registry.proxy("selenium_service")
+coin_security_manager = service_registry.proxy("coin_security_manager")
+social_features_manager = service_registry.proxy("social_features_manager")
+gdpr_compliance_manager = service_registry.proxy("gdpr_compliance_manager")
+enhanced_badge_system = service_registry.proxy("enhanced_badge_system")
 
 # Services that expect db sessions will be created per-request in endpoints
 # mental_health_service and user_education_service
@@ -369,10 +455,15 @@ gdpr_compliance_manager = GDPRComplianceManager(SessionLocal)
 from enhanced_notifications import initialize_notification_service
 initialize_notification_service(SessionLocal)
 notification_service = NotificationService(SessionLocal)
-realtime_notification_manager = RealTimeNotificationManager()
 
-# Initialize enhanced badge system
-enhanced_badge_system = get_enhanced_badge_system(SessionLocal, notification_service)
+# Side effects of coin, badge and reward changes run from the transactional outbox
+outbox_dispatcher.configure(SessionLocal)
+register_event_consumers(
+    event_bus, SessionLocal, notification_service,
+    badge_system=enhanced_badge_system,
+    social_manager=social_features_manager,
+    coin_security=coin_security_manager
+)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -385,24 +476,32 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 # if not FCM_SERVER_KEY: 
 #     print("WARNING: FCM_SERVER_KEY is not set. Push notifications will not work.") 
 
-# --- Firebase Admin SDK Setup --- 
+# --- Firebase Admin SDK Setup (lazy, on first push) --- 
 GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH")
-if GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH and os.path.exists(GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH):
-    try:
-        # Check if Firebase app already exists
-        try:
-            firebase_admin.get_app()
-            logger.info("Firebase Admin SDK already initialized.")
-        except ValueError:
-            # App doesn't exist, initialize it
-            cred = credentials.Certificate(GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH)
-            firebase_admin.initialize_app(cred)
-            logger.info("Firebase Admin SDK initialized successfully.")
-    except Exception as e:
-        logger.error(f"Failed to initialize Firebase Admin SDK: {e}. Push notifications will not work.", exc_info=True)
-        # Uygulamanın çalışmaya devam etmesine izin ver, ancak push'lar çalışmayacak.
-else:
+if not (GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH and os.path.exists(GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH)):
     logger.warning("GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH environment variable not set or file not found. Push notifications will not work.")
+
+def _create_firebase_admin():
+    """Import firebase_admin and initialize the default app if credentials are configured"""
+    import firebase_admin
+    from firebase_admin import credentials
+    if GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH and os.path.exists(GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH):
+        try:
+            # Check if Firebase app already exists
+            try:
+                firebase_admin.get_app()
+                logger.info("Firebase Admin SDK already initialized.")
+            except ValueError:
+                # App doesn't exist, initialize it
+                cred = credentials.Certificate(GOOGLE_APPLICATION_CREDENTIALS_JSON_PATH)
+                firebase_admin.initialize_app(cred)
+                logger.info("Firebase Admin SDK initialized successfully.")
+        except Exception as e:
+            logger.error(f"Failed to initialize Firebase Admin SDK: {e}. Push notifications will not work.", exc_info=True)
+            # Uygulamanın çalışmaya devam etmesine izin ver, ancak push'lar çalışmayacak.
+    return firebase_admin
+
+service_registry.register("firebase_admin", _create_firebase_admin)
 # --- END Firebase Admin SDK Setup ---
 
 sessions = {}
@@ -490,6 +589,7 @@ class EducationModuleProgress(BaseModel):
     module_id: str
     lesson_id: str
     completed: bool = True
+    answers: Optional[List[int]] = None  # chosen option index per quiz question
 
 class MentalHealthMoodReport(BaseModel):
     mood_score: int  # 1-10 scale
@@ -583,6 +683,7 @@ async def claim_daily_reward_legacy(current_user: User = Depends(get_current_use
 
 # Kullanıcı kayıt
 @app.post("/register")
+@rate_limited("register")
 def register(user: UserCreate, db: Session = Depends(get_db)):
     if db.query(User).filter_by(username=user.username).first():
         raise HTTPException(status_code=400, detail="Kullanıcı adı zaten kayıtlı.")
@@ -593,9 +694,19 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return {"message": "Kayıt başarılı."}
 
+def _record_login(request: Request, user_id: Optional[int], login_status: str, failure_reason: Optional[str] = None):
+    audit_log.record(AuditEvent.login(
+        user_id,
+        login_status,
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+        failure_reason=failure_reason
+    ))
+
 # Kullanıcı login (platform specific)
 @app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@rate_limited("login")
+def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     logger.info(f"Login attempt for username: '{form_data.username}'")
 
     # --- BEGIN TEST USER BYPASS ---
@@ -661,6 +772,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             password_verified = pwd_context.verify(form_data.password, user.password_hash)
             if not password_verified:
                 logger.warning(f"Password verification failed for user '{form_data.username}' after auto-registration race condition resolution.")
+                _record_login(request, user.id, "failed", "invalid_password")
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Incorrect password.",
@@ -669,6 +781,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
         password_verified = pwd_context.verify(form_data.password, user.password_hash)
         if not password_verified:
             logger.warning(f"Password verification failed for existing user '{form_data.username}'.")
+            _record_login(request, user.id, "failed", "invalid_password")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Incorrect password.",
@@ -678,13 +791,14 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = jwt.encode({"sub": user.username, "exp": datetime.utcnow() + access_token_expires}, SECRET_KEY, algorithm=ALGORITHM)
     logger.info(f"Login successful for user '{form_data.username}'. Token created.")
+    _record_login(request, user.id, "success")
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/login-instagram", response_model=Union[InstagramLoginResponse, InstagramChallengeResponse])
 async def login_instagram(
     request_data: InstagramLoginRequest, 
     db: Session = Depends(get_db),
-    instagram_service: InstagramAPIService = Depends(get_instagram_service)
+    instagram_service: "InstagramAPIService" = Depends(get_instagram_service)
 ):
     """
     Advanced Instagram login with comprehensive error handling
@@ -1254,7 +1368,7 @@ async def login_instagram_challenge(request_data: InstagramChallengeRequest, db:
 async def get_challenge_status(
     username: str, 
     db: Session = Depends(get_db),
-    instagram_service: InstagramAPIService = Depends(get_instagram_service)
+    instagram_service: "InstagramAPIService" = Depends(get_instagram_service)
 ):
     """
     Get challenge status for a user
@@ -1279,7 +1393,7 @@ async def get_challenge_status(
 async def clear_challenge(
     username: str, 
     db: Session = Depends(get_db),
-    instagram_service: InstagramAPIService = Depends(get_instagram_service)
+    instagram_service: "InstagramAPIService" = Depends(get_instagram_service)
 ):
     """
     Clear challenge for a user
@@ -1307,7 +1421,7 @@ async def clear_challenge(
 async def resolve_instagram_challenge(
     request_data: InstagramChallengeRequest, 
     db: Session = Depends(get_db),
-    instagram_service: InstagramAPIService = Depends(get_instagram_service)
+    instagram_service: "InstagramAPIService" = Depends(get_instagram_service)
 ):
     """
     Resolve Instagram challenge with verification code (public endpoint for login flow)
@@ -1503,14 +1617,16 @@ def get_my_referral_code(
         result = asyncio.run(social_features_manager.generate_referral_code(current_user.id))
         if result["success"]:
             # Get referral stats
-            user_social = db.query(UserSocial).filter(UserSocial.user_id == current_user.id).first()
             referrals_count = db.query(Referral).filter(Referral.referrer_id == current_user.id).count()
+            total_earnings = CoinLedger(db).category_totals(
+                current_user.id, (CoinTransactionCategory.referral_bonus,)
+            ).get(CoinTransactionCategory.referral_bonus, 0)
             
             return {
                 "success": True,
                 "referral_code": result["referral_code"],
                 "referrals_count": referrals_count,
-                "total_earnings": user_social.total_referral_earnings if user_social else 0
+                "total_earnings": total_earnings
             }
         else:
             raise HTTPException(status_code=500, detail=result["message"])
@@ -1521,6 +1637,7 @@ def get_my_referral_code(
         raise HTTPException(status_code=500, detail="Referrans kodu alınamadı")
 
 @app.post("/social/transfer-coins", tags=["Social Features"])
+@idempotent("social_transfer_coins")
 async def transfer_coins(
     request: CoinTransferRequest,
     current_user: User = Depends(get_current_user),
@@ -1538,6 +1655,7 @@ async def transfer_coins(
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/coins/transfer", tags=["Coins"])
+@idempotent("coins_transfer")
 async def transfer_coins_legacy(
     data: dict,
     current_user: User = Depends(get_current_user),
@@ -1589,6 +1707,7 @@ async def get_user_badges(
         raise HTTPException(status_code=500, detail="Rozetler alınamadı")
 
 @app.get("/social/badges/all", tags=["Social Features"])
+@cached_response("social_badges_all", ttl=600, tags=(BADGE_CATALOG_TAG,))
 async def get_all_badges(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -1602,9 +1721,9 @@ async def get_all_badges(
         raise HTTPException(status_code=500, detail="Tüm rozetler alınamadı")
 
 @app.get("/social/stats", tags=["Social Features"])
+@cached_response("social_stats", ttl=300, tags=(SOCIAL_STATS_TAG,), vary_on_user=True)
 async def get_social_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Get comprehensive social statistics"""
     try:
@@ -1670,6 +1789,7 @@ def update_notification_settings(
             user_settings.system_notifications = settings.social_notifications
         
         db.commit()
+        notification_preferences.invalidate(current_user.id)
         return {"message": "Bildirim ayarları güncellendi"}
     except Exception as e:
         logger.error(f"Error updating notification settings: {e}")
@@ -1736,6 +1856,7 @@ def get_privacy_settings(
 # ============================================================================
 
 @app.get("/education/modules", tags=["Education"])
+@cached_response("education_modules", ttl=300, tags=(EDUCATION_TAG,), vary_on_user=True)
 def get_education_modules(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -1743,8 +1864,7 @@ def get_education_modules(
     """Get all available education modules"""
     try:
         service = UserEducationService(db)
-        progress = service.get_user_education_progress(current_user.id)
-        return progress
+        return service.get_user_education_progress(current_user.id)
     except Exception as e:
         logger.error(f"Error getting education modules: {e}")
         raise HTTPException(status_code=500, detail="Eğitim modülleri alınamadı")
@@ -1761,6 +1881,7 @@ def get_education_module(
         # Convert string to enum
         module_type = EducationModuleType(module_id)
         module = service.start_education_module(current_user.id, module_type)
+        response_cache.invalidate_tags(user_tag(EDUCATION_TAG, current_user.id))
         return module
     except ValueError:
         raise HTTPException(status_code=404, detail="Geçersiz modül ID")
@@ -1779,8 +1900,9 @@ def update_education_progress(
         service = UserEducationService(db)
         module_type = EducationModuleType(progress.module_id)
         result = service.complete_education_step(
-            current_user.id, module_type, progress.lesson_id
+            current_user.id, module_type, progress.lesson_id, {"answers": progress.answers}
         )
+        response_cache.invalidate_tags(user_tag(EDUCATION_TAG, current_user.id))
         return result
     except ValueError:
         raise HTTPException(status_code=400, detail="Geçersiz modül veya ders ID")
@@ -1791,19 +1913,18 @@ def update_education_progress(
 @app.get("/education/quiz/{module_id}", tags=["Education"])
 def get_module_quiz(
     module_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: User = Depends(get_current_user)
 ):
     """Get quiz for education module"""
     try:
-        service = UserEducationService(db)
-        # Find quiz steps in the module
+        # Quiz payloads are pre-serialized from the static catalog
         module_type = EducationModuleType(module_id)
-        if module_type in service.education_modules:
-            module_info = service.education_modules[module_type]
-            quiz_steps = [step for step in module_info["steps"] if step["type"] == "quiz"]
-            if quiz_steps:
-                return {"quiz": quiz_steps[0]}
+        payload = QUIZ_PAYLOADS.get(module_type)
+        if payload:
+            if request.headers.get("if-none-match") == payload.etag:
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": payload.etag})
+            return Response(content=payload.body, media_type="application/json", headers={"ETag": payload.etag})
         
         raise HTTPException(status_code=404, detail="Quiz bulunamadı")
     except ValueError:
@@ -1866,6 +1987,7 @@ def get_wellness_recommendations(
 # ============================================================================
 
 @app.post("/coins/withdraw", tags=["Coin Management"])
+@idempotent("coins_withdraw")
 def request_coin_withdrawal(
     withdrawal_request: CoinWithdrawalRequest,
     current_user: User = Depends(get_current_user),
@@ -1906,6 +2028,7 @@ def get_withdrawal_history(
         raise HTTPException(status_code=500, detail="Çekim geçmişi alınamadı")
 
 @app.get("/coins/security-score", tags=["Coin Management"])
+@rate_limited("security_score")
 async def get_security_score(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -1917,7 +2040,8 @@ async def get_security_score(
             return {
                 "security_score": result["security_score"],
                 "fraud_risk": result["fraud_risk"],
-                "risk_level": result["risk_level"]
+                "risk_level": result["risk_level"],
+                "computed_at": result["computed_at"]
             }
         else:
             raise HTTPException(status_code=500, detail=result["message"])
@@ -1934,7 +2058,7 @@ def get_instagram_profile(
     username: str,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
-    instagram_service: InstagramAPIService = Depends(get_instagram_service)
+    instagram_service: "InstagramAPIService" = Depends(get_instagram_service)
 ):
     """Get Instagram profile information"""
     try:
@@ -1952,7 +2076,7 @@ def get_my_recent_posts(
     limit: int = 12,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
-    instagram_service: InstagramAPIService = Depends(get_instagram_service)
+    instagram_service: "InstagramAPIService" = Depends(get_instagram_service)
 ):
     """Get user's recent Instagram posts"""
     try:
@@ -2003,6 +2127,7 @@ def admin_user_action(
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/admin/suspicious-activities", tags=["Admin"])
+@rate_limited("admin_lists")
 def get_suspicious_activities(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -2091,7 +2216,7 @@ def create_order(order_data: OrderCreate, current_user: User = Depends(get_curre
     
     total_cost = order_data.target_count * DEFAULT_COIN_COST_PER_TARGET_UNIT
     if current_user.coin_balance < total_cost:
-        raise HTTPException(status_code=status.HTTP_402_FORBIDDEN, detail=f"Sipariş için yetersiz coin. Gerekli: {total_cost}, Mevcut: {current_user.coin_balance}")
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=f"Sipariş için yetersiz coin. Gerekli: {total_cost}, Mevcut: {current_user.coin_balance}")
 
     try:
         db_order = Order(
@@ -2105,16 +2230,16 @@ def create_order(order_data: OrderCreate, current_user: User = Depends(get_curre
         db.add(db_order)
         db.flush() # Assign an ID to db_order
 
-        current_user.coin_balance -= total_cost
-        
-        coin_tx = CoinTransaction(
-            user_id=current_user.id, 
-            amount=-total_cost, 
-            type=CoinTransactionType.spend, 
-            order_id=db_order.id, 
-            note=f"{order_data.order_type.value} siparişi ({db_order.id}) için {order_data.target_count} adet"
+        # Conditional debit: rejected if a concurrent spend already took the balance below the cost
+        balance = CoinLedger(db).debit(
+            current_user.id, total_cost, CoinTransactionType.spend,
+            note=f"{order_data.order_type.value} siparişi ({db_order.id}) için {order_data.target_count} adet",
+            category=CoinTransactionCategory.order_payment,
+            reference_id=db_order.id
         )
-        db.add(coin_tx)
+        if balance is None:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=f"Sipariş için yetersiz coin. Gerekli: {total_cost}")
         
         # Create tasks with proper fields populated
         tasks_to_create = []
@@ -2131,6 +2256,7 @@ def create_order(order_data: OrderCreate, current_user: User = Depends(get_curre
         db.add_all(tasks_to_create)
         
         db.commit()
+        invalidate_user_usage(current_user.id)
         # db.refresh(db_order) # Not strictly necessary as we commit, but good for having updated state if used immediately
         # db.refresh(current_user) # For coin_balance, also good practice
 
@@ -2148,6 +2274,8 @@ def create_order(order_data: OrderCreate, current_user: User = Depends(get_curre
         
         return {"order_id": db_order.id, "message": "Sipariş başarıyla oluşturuldu."}
     
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Sipariş oluşturulurken veritabanı hatası (kullanıcı: {current_user.username}): {str(e)}", exc_info=True)
@@ -2180,6 +2308,7 @@ def take_task(current_user: User = Depends(get_current_user), db: Session = Depe
         task_to_assign.expires_at = datetime.utcnow() + timedelta(hours=DEFAULT_TASK_EXPIRATION_HOURS)
         
         db.commit()
+        invalidate_user_usage(current_user.id)
         
         logger.info(f"User {current_user.username} took task {task_to_assign.id} for order {task_to_assign.order_id}.")
         
@@ -2267,6 +2396,7 @@ def complete_task(data: TaskComplete, current_user: User = Depends(get_current_u
                 if not media_pk_str: raise ValueError("Beğeni için Media PK mevcut değil.")
                 if ig_client.media_like(media_pk_str): action_performed_successfully = True
             elif order.order_type == OrderType.follow:
+                from instagrapi import Client
                 target_username = Client().username_from_url(order.post_url)
                 if not target_username: raise ValueError("Takip için kullanıcı adı çıkarılamadı.")
                 target_user_pk = ig_client.user_id_from_username(target_username)
@@ -2327,10 +2457,12 @@ def complete_task(data: TaskComplete, current_user: User = Depends(get_current_u
                 amount=reward, 
                 type=CoinTransactionType.earn, 
                 task_id=task.id, 
-                note=f"Görev ({task.id}) tamamlandı: {order.order_type.value} on {order.post_url}"
+                note=f"Görev ({task.id}) tamamlandı: {order.order_type.value} on {order.post_url}",
+                category=CoinTransactionCategory.task_reward
             )
             db.add(coin_tx)
             db.commit() 
+            invalidate_user_usage(current_user.id)
 
             # Check for level up and achievements
             completed_tasks_count = db.query(Task).filter_by(assigned_user_id=current_user.id, status=TaskStatus.completed).count()
@@ -2361,7 +2493,8 @@ def complete_task(data: TaskComplete, current_user: User = Depends(get_current_u
                     user_id=current_user.id,
                     amount=level_bonus,
                     type=CoinTransactionType.earn,
-                    note=f"Seviye yükseltme bonusu: {new_level}"
+                    note=f"Seviye yükseltme bonusu: {new_level}",
+                    category=CoinTransactionCategory.level_bonus
                 )
                 db.add(level_tx)
                 db.commit()
@@ -2386,7 +2519,8 @@ def complete_task(data: TaskComplete, current_user: User = Depends(get_current_u
                     user_id=current_user.id,
                     amount=achievement_bonus,
                     type=CoinTransactionType.earn,
-                    note=f"Başarım bonusu: {completed_tasks_count} görev tamamlandı"
+                    note=f"Başarım bonusu: {completed_tasks_count} görev tamamlandı",
+                    category=CoinTransactionCategory.achievement_bonus
                 )
                 db.add(achievement_tx)
                 db.commit()
@@ -2450,6 +2584,7 @@ def complete_task(data: TaskComplete, current_user: User = Depends(get_current_u
         else:
             task.status = TaskStatus.failed
             db.commit() 
+            invalidate_user_usage(current_user.id)
 
             logger.warn(f"Task {task.id} for order {order.id} by user {current_user.username} failed. Reason: {validation_details}")
             notify_user_task_update(current_user.id, db) 
@@ -2482,6 +2617,7 @@ def complete_task(data: TaskComplete, current_user: User = Depends(get_current_u
 
 # Coin çekme
 @app.post("/withdraw-coins")
+@idempotent("withdraw_coins", user_param="current_user_param")
 def withdraw_coins(data: WithdrawRequest, current_user_param: User = Depends(get_current_user), db: Session = Depends(get_db)):
     user_for_withdrawal = db.query(User).filter_by(id=current_user_param.id).with_for_update().first()
     if not user_for_withdrawal: 
@@ -2493,21 +2629,29 @@ def withdraw_coins(data: WithdrawRequest, current_user_param: User = Depends(get
         if completed_count < MIN_COMPLETED_TASKS_FOR_WITHDRAWAL:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Coin çekebilmek için en az {MIN_COMPLETED_TASKS_FOR_WITHDRAWAL} görev tamamlamalısınız. Tamamlanan: {completed_count}")
         
-        if user_for_withdrawal.coin_balance < data.amount:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Yetersiz coin. Çekilmek istenen: {data.amount}, Mevcut: {user_for_withdrawal.coin_balance}")
-        
         if data.amount <= 0:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Çekilecek coin miktarı pozitif olmalıdır.")
 
-        user_for_withdrawal.coin_balance -= data.amount
-        db.add(CoinTransaction(user_id=user_for_withdrawal.id, amount=-data.amount, type=CoinTransactionType.withdraw, note=f"Coin çekim: {data.amount}"))
+        if user_for_withdrawal.coin_balance < data.amount:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Yetersiz coin. Çekilmek istenen: {data.amount}, Mevcut: {user_for_withdrawal.coin_balance}")
+
+        # Balance check and decrement in one conditional UPDATE: concurrent withdrawals cannot overdraw
+        balance = CoinLedger(db).debit(
+            user_for_withdrawal.id, data.amount, CoinTransactionType.withdraw,
+            note=f"Coin çekim: {data.amount}", category=CoinTransactionCategory.withdrawal
+        )
+        if balance is None:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Yetersiz coin. Çekilmek istenen: {data.amount}")
         db.commit()
         
-        logger.info(f"User {user_for_withdrawal.username} withdrew {data.amount} coins. New balance: {user_for_withdrawal.coin_balance}")
+        logger.info(f"User {user_for_withdrawal.username} withdrew {data.amount} coins. New balance: {balance}")
         notify_user_coin_update(user_for_withdrawal.id, db) 
         
-        return {"message": "Coin çekildi.", "coin": user_for_withdrawal.coin_balance}
+        return {"message": "Coin çekildi.", "coin": balance}
     
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Coin çekme sırasında veritabanı hatası (kullanıcı: {user_for_withdrawal.username}): {str(e)}", exc_info=True)
@@ -2561,15 +2705,9 @@ async def get_profile(current_user: User = Depends(get_current_user), db: Sessio
         )
 
     # Calculate completed and active tasks
-    completed_tasks_count = db.query(func.count(Task.id)).filter(
-        Task.assigned_user_id == current_user.id,
-        Task.status == TaskStatus.completed
-    ).scalar() or 0
-
-    active_tasks_count = db.query(func.count(Task.id)).filter(
-        Task.assigned_user_id == current_user.id,
-        Task.status == TaskStatus.assigned
-    ).scalar() or 0
+    aggregates = await user_aggregates.aget(current_user.id)
+    completed_tasks_count = aggregates.completed_tasks
+    active_tasks_count = aggregates.active_tasks
 
     # Default values
     followers_count = 0
@@ -2761,6 +2899,7 @@ async def get_user_badges_endpoint(
 
 @app.get("/tasks", response_model=List[TaskSchema], tags=["Tasks"])
 def get_tasks(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Rows are shaped here from typed columns, so the response skips response_model re-validation
     # Base query
     query = db.query(
         Task.id,
@@ -2788,18 +2927,18 @@ def get_tasks(current_user: User = Depends(get_current_user), db: Session = Depe
 
     tasks_response = []
     for task_data in user_tasks_query_results:
-        tasks_response.append(TaskSchema(
-            id=task_data[0],
-            order_id=task_data[1],
-            service_type=task_data[2].value if hasattr(task_data[2], 'value') else str(task_data[2]),
-            target_url=task_data[3],
-            status=task_data[4].value if hasattr(task_data[4], 'value') else str(task_data[4]),
-            assigned_at=task_data[5],
-            completed_at=task_data[6],
-            expires_at=task_data[7]
-        ))
+        tasks_response.append({
+            "id": task_data[0],
+            "order_id": task_data[1],
+            "service_type": task_data[2].value if hasattr(task_data[2], 'value') else str(task_data[2]),
+            "target_url": task_data[3],
+            "status": task_data[4].value if hasattr(task_data[4], 'value') else str(task_data[4]),
+            "assigned_at": task_data[5],
+            "completed_at": task_data[6],
+            "expires_at": task_data[7]
+        })
     
-    return tasks_response
+    return FastJSONResponse(tasks_response)
 
 # Bildirimler
 class NotificationResponse(BaseModel):
@@ -2810,8 +2949,13 @@ class NotificationResponse(BaseModel):
 
 @app.get("/notifications", response_model=list[NotificationResponse])
 def get_notifications(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    notifs = db.query(Notification).filter_by(user_id=current_user.id).order_by(desc(Notification.created_at)).all()
-    return [NotificationResponse(id=n.id, message=n.message, is_read=n.read, created_at=n.created_at) for n in notifs]
+    # Plain column rows serialized directly; the NotificationResponse model only documents the shape
+    rows = db.query(
+        Notification.id, Notification.message, Notification.read, Notification.created_at
+    ).filter_by(user_id=current_user.id).order_by(desc(Notification.created_at)).all()
+    return FastJSONResponse([
+        {"id": n.id, "message": n.message, "is_read": n.read, "created_at": n.created_at} for n in rows
+    ])
 
 @app.post("/notifications/read/{notif_id}")
 def mark_notification_read(notif_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -2830,24 +2974,28 @@ def get_admin_user(current_user: User = Depends(get_current_user)):
 
 # Admin paneli endpointleri
 @app.get("/admin/users")
+@rate_limited("admin_lists", user_param="admin")
 def admin_list_users(admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     users = db.query(User).all()
     return [{"id": u.id, "username": u.username, "full_name": u.full_name, "is_admin": u.is_admin, "coin": u.coin_balance} for u in users]
 
 @app.get("/admin/orders")
+@rate_limited("admin_lists", user_param="admin")
 def admin_list_orders(admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     orders = db.query(Order).all()
     return [{"id": o.id, "user_id": o.user_id, "post_url": o.post_url, "order_type": o.order_type.value, "target_count": o.target_count, "completed_count": o.completed_count, "status": o.status} for o in orders]
 
 @app.get("/admin/tasks")
+@rate_limited("admin_lists", user_param="admin")
 def admin_list_tasks(admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     tasks = db.query(Task).all()
     return [{"id": t.id, "order_id": t.order_id, "assigned_user_id": t.assigned_user_id, "status": t.status.value, "assigned_at": t.assigned_at, "completed_at": t.completed_at} for t in tasks]
 
 @app.get("/admin/coin-transactions")
+@rate_limited("admin_lists", user_param="admin")
 def admin_list_coin_transactions(admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     txs = db.query(CoinTransaction).all()
-    return [{"id": tx.id, "user_id": tx.user_id, "amount": tx.amount, "type": tx.type.value, "created_at": tx.created_at, "note": tx.note} for tx in txs]
+    return [{"id": tx.id, "user_id": tx.user_id, "amount": tx.amount, "type": tx.type.value, "category": tx.category.value if tx.category else None, "reference_id": tx.reference_id, "created_at": tx.created_at, "note": tx.note} for tx in txs]
 
 # İstatistikler
 @app.get("/stats/user")
@@ -2882,51 +3030,53 @@ from enhanced_notifications import (
     NotificationType, NotificationPriority, cleanup_old_notifications
 )
 
+register_notification_metrics(notification_manager)
+
 # Initialize enhanced notification service
 notification_service = NotificationService(db_session_factory=SessionLocal)
 
-# Legacy websockets for backward compatibility
-active_websockets: Dict[int, WebSocket] = {}
+def _authenticate_websocket(token: str) -> Optional[int]:
+    """Resolve the socket's user once; the session is closed before the socket is accepted"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if not username:
+        return None
+    db = SessionLocal()
+    try:
+        return db.query(User.id).filter_by(username=username, is_active=True).scalar()
+    finally:
+        db.close()
 
 @app.websocket("/ws/notifications")
-async def websocket_notifications(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
-    user = None 
+async def websocket_notifications(websocket: WebSocket, token: str):
+    user_id = await run_in_threadpool(_authenticate_websocket, token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    connection = await notification_manager.connect(websocket, user_id)
+    if connection is None:
+        return
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        user = db.query(User).filter_by(username=username).first()
-        if not user:
-            await websocket.close()
-            return
-        
-        # Use enhanced notification manager
-        await notification_manager.connect(websocket, user.id)
-        
-        # Keep legacy support
-        active_websockets[user.id] = websocket
-        
-        # Send welcome message with current stats
-        notification_service = NotificationService(db)
-        await notification_service.create_notification(
-            user_id=user.id,
+        # Welcome message for this device only
+        await notification_manager.send_to_connection(connection, notification_service.build_realtime_payload(
+            user_id=user_id,
             title="Gerçek Zamanlı Bildirimler Aktif! 🔔",
             message="Artık tüm güncellemeleri anında alacaksınız.",
             notification_type=NotificationType.SYSTEM_UPDATE,
-            priority=NotificationPriority.LOW,
-            send_push=False,
-            send_realtime=True
-        )
-        
-        while True:
-            data = await websocket.receive_text()
-            # Handle any client messages if needed
-            logger.info(f"Received message from user {user.id}: {data}")
-            
-    except WebSocketDisconnect:
-        if user:
-            notification_manager.disconnect(user.id)
-            if user.id in active_websockets:
-                del active_websockets[user.id]
+            priority=NotificationPriority.LOW
+        ))
+        await notification_manager.serve(connection)
+    finally:
+        notification_manager.disconnect(connection)
+
+@app.get("/admin/websockets/stats", tags=["Admin"])
+def get_websocket_stats(admin: User = Depends(get_admin_user)):
+    """Open notification sockets, per-connection memory and the offline queue"""
+    return {**notification_manager.get_stats(), "process_rss_bytes": current_rss_bytes()}
 
 # Bildirim gönderme fonksiyonu (örnek)
 def send_notification(user_id: int, message: str, db: Session):
@@ -2934,10 +3084,7 @@ def send_notification(user_id: int, message: str, db: Session):
     db.add(notif)
     db.commit()
     db.refresh(notif) 
-    ws = active_websockets.get(user_id)
-    if ws:
-        import asyncio
-        asyncio.create_task(ws.send_json({"type": "new_notification", "id": notif.id, "message": message, "is_read": notif.is_read, "created_at": str(notif.created_at)}))
+    notification_manager.push_to_user(user_id, {"type": "new_notification", "id": notif.id, "message": message, "is_read": notif.read, "created_at": str(notif.created_at)})
 
 @app.post("/admin/ban-user/{user_id}")
 def admin_ban_user(user_id: int, admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
@@ -2951,11 +3098,15 @@ def admin_ban_user(user_id: int, admin: User = Depends(get_admin_user), db: Sess
 
 @app.post("/admin/coin-adjust/{user_id}")
 def admin_coin_adjust(user_id: int, amount: int, note: str = "Admin işlemi", admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(id=user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı.")
-    user.coin_balance += amount
-    db.add(CoinTransaction(user_id=user_id, amount=amount, type=CoinTransactionType.earn if amount > 0 else CoinTransactionType.withdraw, note=note))
+    balance = CoinLedger(db).adjust(
+        user_id, amount, CoinTransactionType.earn if amount > 0 else CoinTransactionType.withdraw, note,
+        category=CoinTransactionCategory.admin_adjustment
+    )
+    if balance is None:
+        db.rollback()
+        if not db.query(User.id).filter_by(id=user_id).first():
+            raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı.")
+        raise HTTPException(status_code=400, detail="Yetersiz bakiye.")
     db.commit()
     send_notification(user_id, f"Admin tarafından {amount} coin {(amount > 0 and 'eklendi' or 'çıkarıldı')}.", db)
     return {"message": f"Kullanıcıya {amount} coin {(amount > 0 and 'eklendi' or 'çıkarıldı')}."}
@@ -2970,53 +3121,21 @@ def register_fcm_token(token: str, current_user: User = Depends(get_current_user
 
 @app.post("/admin/send-push")
 def admin_send_push(user_id: int, title: str, body: str, admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    tokens = [t.token for t in db.query(UserFCMToken).filter_by(user_id=user_id).all()]
-    if not tokens:
+    token_count = db.query(func.count(UserFCMToken.id)).filter_by(user_id=user_id).scalar() or 0
+    if not token_count:
         raise HTTPException(status_code=404, detail="Kullanıcıya ait FCM token yok.")
     
-    if not firebase_admin._apps: 
+    if not push_worker.transport.is_configured():
         logger.error("Firebase Admin SDK not initialized. Cannot send push notification.")
         raise HTTPException(status_code=500, detail="Push bildirim servisi konfigüre edilmemiş.")
 
-    messages_to_send = []
-    for token in tokens:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            token=token,
-        )
-        messages_to_send.append(message)
-    
-    if not messages_to_send:
-        return {"message": "Gönderilecek geçerli token bulunamadı."}
-
-    try:
-        batch_response = messaging.send_all(messages_to_send)
-        logger.info(f"FCM send_all response: SuccessCount: {batch_response.success_count}, FailureCount: {batch_response.failure_count}")
-        
-        if batch_response.failure_count > 0:
-            for i, response in enumerate(batch_response.responses):
-                if not response.success:
-                    original_token = tokens[i] 
-                    logger.error(f"Failed to send FCM to token {original_token}: {response.exception}")
-                    if isinstance(response.exception, (messaging.UnregisteredError, messaging.InvalidRegistrationTokenError)):
-                        logger.info(f"Token {original_token} seems invalid. Consider removing it from UserFCMToken.")
-                        # db.query(UserFCMToken).filter_by(token=original_token).delete()
-                        # db.commit() 
-        
-        return {"message": f"Push notification(s) sent. Success: {batch_response.success_count}, Failed: {batch_response.failure_count}"}
-    except firebase_admin.exceptions.FirebaseError as e:
-        logger.error(f"FirebaseError sending push notification: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Push bildirimi gönderilirken Firebase hatası: {str(e)}")
-    except Exception as e:
-        logger.error(f"Unexpected error sending push notification: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Push bildirimi gönderilirken beklenmedik bir hata oluştu: {str(e)}")
+    # Delivered by the push worker: multicast, retries and unregistered-token cleanup happen there
+    if not push_worker.enqueue(PushMessage(user_id, title, body)):
+        raise HTTPException(status_code=503, detail="Push bildirim kuyruğu dolu, lütfen tekrar deneyin.")
+    return {"message": f"Push notification queued for {token_count} device(s)."}
 
 def notify_user_task_update(user_id: int, db: Session):
-    ws = active_websockets.get(user_id)
-    if ws:
+    if notification_manager.is_connected(user_id):
         active_task_db = db.query(Task).filter(Task.assigned_user_id == user_id, Task.status == TaskStatus.assigned).first()
         
         active_task_payload = None
@@ -3034,26 +3153,24 @@ def notify_user_task_update(user_id: int, db: Session):
 
         completed_tasks_count = db.query(Task).filter(Task.assigned_user_id == user_id, Task.status == TaskStatus.completed).count()
 
-        import asyncio
-        asyncio.create_task(ws.send_json({
+        notification_manager.push_to_user(user_id, {
             "type": "task_update",
             "active_task": active_task_payload,
             "completed_tasks_count": completed_tasks_count
-        }))
+        })
 
 def notify_user_coin_update(user_id: int, db: Session):
-    ws = active_websockets.get(user_id)
-    if ws:
-        from .models import User 
-        user = db.query(User).filter_by(id=user_id).first()
-        import asyncio
-        asyncio.create_task(ws.send_json({
+    if notification_manager.is_connected(user_id):
+        coin_balance = db.query(User.coin_balance).filter_by(id=user_id).scalar()
+        notification_manager.push_to_user(user_id, {
             "type": "coin_update",
-            "coin": user.coin_balance
-        }))
+            "coin": coin_balance
+        })
 
 # Helper function to get a logged-in Instagrapi client for a user
-def get_instagrapi_client_for_user(user: User, db: Session) -> Client:
+def get_instagrapi_client_for_user(user: User, db: Session) -> "Client":
+    from instagrapi import Client
+    from instagrapi.exceptions import LoginRequired, ClientError
     # Bypass Instagram session validation for test users
     if user.username == "testuser" or user.instagram_pk == "12345678901":
         logger.info(f"Bypassing Instagram session validation for test user: {user.username}")
@@ -3281,48 +3398,14 @@ def get_notification_stats(current_user: User = Depends(get_current_user), db: S
 # Daily Reward System
 @app.get("/daily-reward-status")
 async def get_daily_reward_status_enhanced(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Get daily reward status for current user using DailyReward table"""
+    """Get daily reward status from the user's streak columns (no extra query)"""
     try:
-        from sqlalchemy import func
-        today = datetime.utcnow().date()
-
-        # Check if already claimed today
-        today_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id,
-            func.date(DailyReward.claimed_date) == today.isoformat()
-        ).first()
-        can_claim = today_reward is None
-
-        # Get latest reward for streak calculation
-        latest_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id
-        ).order_by(desc(DailyReward.claimed_date)).first()
-
-        current_streak = 0
-        if latest_reward:
-            latest_date = latest_reward.claimed_date
-            if isinstance(latest_date, str):
-                latest_date = datetime.strptime(latest_date.split()[0], '%Y-%m-%d').date()
-            elif isinstance(latest_date, datetime):
-                latest_date = latest_date.date()
-            if latest_date == today:
-                current_streak = latest_reward.consecutive_days
-            elif latest_date == today - timedelta(days=1):
-                current_streak = latest_reward.consecutive_days
-
-        # Calculate next reward amount
-        next_consecutive_days = current_streak + 1 if can_claim else current_streak
-        base_reward = 50
-        bonus_multiplier = min(next_consecutive_days, 7)
-        next_reward = base_reward + (bonus_multiplier * 10)
-        if next_consecutive_days == 7:
-            next_reward += 200  # Weekly bonus
-
+        reward_status = DailyRewardService(db).get_status(current_user)
         return {
-            "can_claim": can_claim,
-            "streak": current_streak or 0,
-            "next_reward": next_reward or 0,
-            "last_claim": latest_reward.claimed_date.isoformat() if latest_reward else None,
+            "can_claim": reward_status.can_claim,
+            "streak": reward_status.streak,
+            "next_reward": reward_status.next_reward.total,
+            "last_claim": reward_status.last_claim.isoformat() if reward_status.last_claim else None,
             "current_balance": current_user.coin_balance or 0
         }
 
@@ -3331,93 +3414,29 @@ async def get_daily_reward_status_enhanced(current_user: User = Depends(get_curr
         raise HTTPException(status_code=500, detail="Günlük ödül durumu alınamadı")
 
 @app.post("/claim-daily-reward")
+@idempotent("claim_daily_reward")
 async def claim_daily_reward_enhanced(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Enhanced daily reward claiming with proper streak calculation and DailyReward table usage"""
+    """Claim today's reward; the unique (user_id, claimed_date) key rejects concurrent double claims"""
     try:
-        today = datetime.utcnow().date()
-        from sqlalchemy import func
-        existing_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id,
-            func.date(DailyReward.claimed_date) == today.isoformat()
-        ).first()
-
-        if existing_reward:
+        result = DailyRewardService(db).claim(current_user)
+        if not result.claimed:
             return {
                 "success": False,
                 "message": "Bugün zaten günlük ödül aldınız!",
-                "next_claim": (datetime.combine(today, datetime.min.time()) + timedelta(days=1)).isoformat()
+                "next_claim": result.next_claim.isoformat()
             }
+        reward = result.reward
 
-        # Calculate consecutive days and reward
-        yesterday = today - timedelta(days=1)
-        yesterday_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id,
-            func.date(DailyReward.claimed_date) == yesterday.isoformat()
-        ).first()
-        consecutive_days = (yesterday_reward.consecutive_days + 1) if yesterday_reward else 1
-
-        base_reward = 50
-        bonus_multiplier = min(consecutive_days, 7)
-        total_reward = base_reward + (bonus_multiplier * 10)
-        if consecutive_days == 7:
-            total_reward += 200
-
-        # Create reward record
-        daily_reward = DailyReward(
-            user_id=current_user.id,
-            coin_amount=total_reward,
-            consecutive_days=consecutive_days,
-            claimed_date=today
-        )
-        db.add(daily_reward)
-
-        # Update user balance and streak
-        current_user.coin_balance = (current_user.coin_balance or 0) + total_reward
-        current_user.daily_reward_streak = consecutive_days
-        current_user.last_daily_reward = datetime.utcnow()
-
-        # Create transaction record
-        transaction = CoinTransaction(
-            user_id=current_user.id,
-            amount=total_reward,
-            type=CoinTransactionType.earn,
-            note=f"Günlük ödül - {consecutive_days}. gün (Bonus: {bonus_multiplier}x)"
-        )
-        db.add(transaction)
-        db.commit()
-
-        # Notification
-        try:
-            from enhanced_notifications import notification_service, NotificationType
-            await notification_service.create_notification(
-                user_id=current_user.id,
-                title="Günlük Ödül Alındı! 💎",
-                message=f"{total_reward} coin kazandınız! Seri: {consecutive_days} gün",
-                notification_type=NotificationType.DAILY_LOGIN,
-            )
-        except Exception as e:
-            logger.error(f"Failed to send daily reward notification: {e}")
-
-        # Badge check
-        try:
-            import asyncio
-            asyncio.create_task(enhanced_badge_system.check_and_award_badges(current_user.id))
-        except Exception as badge_error:
-            logger.warning(f"Badge checking failed for user {current_user.id} after daily reward: {badge_error}")
-
+        # Notification and badge checks follow from the RewardClaimed outbox event
         return {
             "success": True,
-            "message": f"Günlük ödül alındı! +{total_reward} coin",
-            "coins_earned": total_reward,
-            "total_balance": current_user.coin_balance or 0,
-            "streak": consecutive_days or 0,
-            "consecutive_days": consecutive_days or 0,
-            "next_claim": (datetime.combine(today, datetime.min.time()) + timedelta(days=1)).isoformat(),
-            "bonus_info": {
-                "base_reward": base_reward,
-                "bonus_multiplier": bonus_multiplier,
-                "weekly_bonus": 200 if consecutive_days == 7 else 0
-            }
+            "message": f"Günlük ödül alındı! +{reward.total} coin",
+            "coins_earned": reward.total,
+            "total_balance": result.balance,
+            "streak": reward.consecutive_days,
+            "consecutive_days": reward.consecutive_days,
+            "next_claim": result.next_claim.isoformat(),
+            "bonus_info": reward.bonus_info()
         }
 
     except Exception as e:
@@ -3441,20 +3460,20 @@ def get_user_coins(current_user: User = Depends(get_current_user), db: Session =
                 "id": tx.id,
                 "amount": tx.amount,
                 "type": tx.type.value,
+                "category": tx.category.value if tx.category else None,
                 "note": tx.note,
                 "created_at": tx.created_at.isoformat()
             })
         
         # Calculate totals
-        total_earned = db.query(func.sum(CoinTransaction.amount)).filter(
-            CoinTransaction.user_id == current_user.id,
-            CoinTransaction.type == CoinTransactionType.earn
-        ).scalar() or 0
+        aggregates = user_aggregates.get(current_user.id)
+        total_earned = aggregates.total_earned
+        total_spent = aggregates.total_spent
         
-        total_spent = db.query(func.sum(CoinTransaction.amount)).filter(
-            CoinTransaction.user_id == current_user.id,
-            CoinTransaction.type == CoinTransactionType.spend
-        ).scalar() or 0
+        # Signed totals per ledger category (daily rewards, referrals, transfers, ...)
+        category_totals = {
+            category.value: total for category, total in CoinLedger(db).category_totals(current_user.id).items()
+        }
         
         # Return both coin and diamond compatible response
         balance = int(current_user.coin_balance or 0)
@@ -3466,6 +3485,7 @@ def get_user_coins(current_user: User = Depends(get_current_user), db: Session =
             "recent_transactions": transactions_list,
             "total_earned": int(total_earned or 0),
             "total_spent": int(abs(total_spent or 0)),
+            "category_totals": category_totals,
             # Diamond frontend compatibility fields
             "diamondBalance": balance,
             "diamond_balance": balance,
@@ -3482,6 +3502,7 @@ def get_user_coins(current_user: User = Depends(get_current_user), db: Session =
 
 # Email Verification
 @app.post("/send-verification-email")
+@rate_limited("send_verification_email")
 async def send_verification_email(email: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     import random
     import string
@@ -3554,7 +3575,8 @@ def verify_email(verification_code: str, current_user: User = Depends(get_curren
         user_id=current_user.id,
         amount=bonus_coins,
         type=CoinTransactionType.earn,
-        note="E-posta doğrulama bonusu"
+        note="E-posta doğrulama bonusu",
+        category=CoinTransactionCategory.security_bonus
     )
     db.add(coin_transaction)
     
@@ -3664,7 +3686,8 @@ def verify_2fa_setup(
         user_id=current_user.id,
         amount=bonus_coins,
         type=CoinTransactionType.earn,
-        note="2FA etkinleştirme bonusu"
+        note="2FA etkinleştirme bonusu",
+        category=CoinTransactionCategory.security_bonus
     )
     db.add(coin_transaction)
     
@@ -3713,6 +3736,7 @@ from models import Notification, UserStatistics
 import json
 
 @app.get("/statistics")
+@rate_limited("statistics")
 def get_user_statistics(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get user statistics for the statistics screen - REAL DATA ONLY"""
     try:
@@ -3720,15 +3744,9 @@ def get_user_statistics(current_user: User = Depends(get_current_user), db: Sess
         stats = db.query(UserStatistics).filter(UserStatistics.user_id == current_user.id).first()
         
         # Always recalculate real values from existing data
-        completed_tasks = db.query(Task).filter(
-            Task.assigned_user_id == current_user.id,
-            Task.status == TaskStatus.completed
-        ).count()
-        
-        active_tasks = db.query(Task).filter(
-            Task.assigned_user_id == current_user.id,
-            Task.status == TaskStatus.assigned
-        ).count()
+        aggregates = user_aggregates.get(current_user.id)
+        completed_tasks = aggregates.completed_tasks
+        active_tasks = aggregates.active_tasks
         
         # Generate REAL weekly earnings data (last 7 days)
         weekly_data = []
@@ -3783,11 +3801,8 @@ def get_user_statistics(current_user: User = Depends(get_current_user), db: Sess
         elif completed_tasks >= 20:
             level = "Gümüş"
         
-        # Calculate total earnings from ALL coin transactions
-        total_earnings = db.query(func.sum(CoinTransaction.amount)).filter(
-            CoinTransaction.user_id == current_user.id,
-            CoinTransaction.type == CoinTransactionType.earn
-        ).scalar() or 0
+        # Total earnings from ALL coin transactions
+        total_earnings = aggregates.total_earned
         
         # Update or create statistics record with REAL data
         if stats:
@@ -3862,6 +3877,7 @@ def get_notifications_v2(
     }
 
 @app.get("/badges/leaderboard", tags=["Enhanced Badges"])
+@cached_response("badges_leaderboard", ttl=120, tags=(BADGE_AWARDS_TAG,))
 async def get_badge_leaderboard(limit: int = 50):
     """Get badge leaderboard"""
     try:
@@ -3875,6 +3891,7 @@ async def get_badge_leaderboard(limit: int = 50):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/badges/categories", tags=["Enhanced Badges"])
+@cached_response("badges_categories", ttl=3600, tags=(BADGE_CATALOG_TAG,))
 async def get_badge_categories():
     """Get all available badge categories"""
     try:
@@ -3903,6 +3920,34 @@ async def get_badge_categories():
         logger.error(f"Error getting badge categories: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ============================================================================
+# RESPONSE CACHE ENDPOINTS
+# ============================================================================
+
+@app.get("/admin/response-cache/stats", tags=["Admin"])
+def get_response_cache_stats(admin: User = Depends(get_admin_user)):
+    """Per-route hit / miss / 304 counters of the response cache"""
+    return response_cache.get_stats()
+
+@app.post("/admin/response-cache/clear", tags=["Admin"])
+def clear_response_cache(admin: User = Depends(get_admin_user)):
+    """Drop every cached response (e.g. after editing catalog content by hand)"""
+    response_cache.clear()
+    return {"success": True, "message": "Yanıt önbelleği temizlendi"}
+
+# ============================================================================
+# METRICS ENDPOINT
+# ============================================================================
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Prometheus text format; merges all uvicorn workers when METRICS_MULTIPROC_DIR is set"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Yetkisiz")
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 # Include additional endpoints
 try:
     from additional_endpoints import router as additional_router
@@ -3936,5 +3981,8 @@ class ManualLoginOpenRequest(BaseModel):
     username: Optional[str] = None
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        print(profile_startup(service_registry))
+        sys.exit(0)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+Audit Log Pipeline
+- Non-blocking `record(event)` for DeviceIPLog, UserActivityLog and UserLoginHistory rows;
+  request transactions no longer carry audit inserts
+- Bounded in-memory buffer drained by a background thread with multi-row inserts per table
+- Backpressure: a full buffer wakes the flusher and holds the producer up to AUDIT_BLOCK_MS,
+  then drops the event (counted in audit_events_total{outcome="dropped"}); producers on the
+  event loop are never held and drop immediately
+- Failed batches are retried with backoff; stop() drains everything before shutdown
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import DeviceIPLog, UserActivityLog, UserLoginHistory
+from metrics import audit_events_total
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BUFFER_CAPACITY = int(os.getenv("AUDIT_BUFFER_CAPACITY", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+AUDIT_BLOCK_MS = float(os.getenv("AUDIT_BLOCK_MS", "50"))
+AUDIT_WRITE_ATTEMPTS = 3
+
+@dataclass(frozen=True)
+class AuditEvent:
+    """One audit row; created_at is taken when the event happens, not when it is flushed"""
+    model: type
+    values: Dict[str, Any] = field(hash=False)
+
+    @classmethod
+    def device_ip(cls, user_id: Optional[int], action: str, ip_address: Optional[str] = None,
+                  device_info: Optional[str] = None) -> "AuditEvent":
+        return cls(DeviceIPLog, {
+            "user_id": user_id,
+            "action": action,
+            "ip_address": ip_address,
+            "device_info": device_info,
+            "created_at": datetime.utcnow(),
+        })
+
+    @classmethod
+    def user_activity(cls, user_id: Optional[int], activity_type: str, details: Any = None,
+                      ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> "AuditEvent":
+        return cls(UserActivityLog, {
+            "user_id": user_id,
+            "activity_type": activity_type,
+            "activity_details": json.dumps(details) if details is not None else None,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_at": datetime.utcnow(),
+        })
+
+    @classmethod
+    def login(cls, user_id: Optional[int], login_status: str, ip_address: Optional[str] = None,
+              user_agent: Optional[str] = None, login_method: str = "password",
+              failure_reason: Optional[str] = None) -> "AuditEvent":
+        return cls(UserLoginHistory, {
+            "user_id": user_id,
+            "login_status": login_status,
+            "login_method": login_method,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "failure_reason": failure_reason,
+            "created_at": datetime.utcnow(),
+        })
+
+    @property
+    def table(self) -> str:
+        return self.model.__tablename__
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+class AuditLogWriter:
+    """Buffers audit events and writes them in batches from a daemon thread"""
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None,
+                 capacity: int = AUDIT_BUFFER_CAPACITY, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_seconds: float = AUDIT_FLUSH_SECONDS, block_ms: float = AUDIT_BLOCK_MS):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.block_seconds = block_ms / 1000.0
+        self._buffer: Deque[AuditEvent] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._closed = False
+        self._atexit_registered = False
+
+    def configure(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def pending_count(self) -> int:
+        return len(self._buffer)
+
+    def record(self, event: AuditEvent) -> bool:
+        """Queue `event`; False when it was dropped because the buffer stayed full"""
+        if self._closed:
+            # Shut down already: write inline rather than lose the event
+            self._write_batch([event])
+            return True
+
+        with self._cond:
+            if len(self._buffer) >= self.capacity:
+                self._cond.notify_all()
+                if not _on_event_loop():
+                    self._cond.wait_for(lambda: len(self._buffer) < self.capacity, timeout=self.block_seconds)
+                if len(self._buffer) >= self.capacity:
+                    audit_events_total.inc(table=event.table, outcome="dropped")
+                    logger.warning(f"Audit buffer full ({self.capacity}); dropped {event.table} event")
+                    return False
+            self._buffer.append(event)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        audit_events_total.inc(table=event.table, outcome="recorded")
+
+        if self._thread is None:
+            self.start()
+        return True
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+            self._thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.stop)
+            self._atexit_registered = True
+
+    def stop(self, timeout: float = 30.0):
+        """Drain the buffer and stop the flusher; later events are written inline"""
+        thread = self._thread
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"Audit writer did not drain within {timeout}s; {self.pending_count()} events left")
+        self._thread = None
+        self._closed = True
+        self.flush()
+
+    def flush(self):
+        """Write everything buffered so far from the calling thread"""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write_with_retry(batch)
+
+    def _take_batch(self) -> List[AuditEvent]:
+        with self._cond:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if batch:
+                self._cond.notify_all()  # room for producers held by backpressure
+            return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._buffer) >= self.batch_size,
+                    timeout=self.flush_seconds
+                )
+                stopping = self._stopping
+            batch = self._take_batch()
+            if batch:
+                self._write_with_retry(batch)
+            elif stopping:
+                return
+
+    def _write_with_retry(self, batch: List[AuditEvent]):
+        for attempt in range(1, AUDIT_WRITE_ATTEMPTS + 1):
+            try:
+                self._write_batch(batch)
+                return
+            except Exception as e:
+                if attempt == AUDIT_WRITE_ATTEMPTS:
+                    for event in batch:
+                        audit_events_total.inc(table=event.table, outcome="failed")
+                    logger.error(f"Audit batch of {len(batch)} events lost after {attempt} attempts: {e}", exc_info=True)
+                    return
+                logger.warning(f"Audit batch write failed (attempt {attempt}), retrying: {e}")
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
+    def _write_batch(self, batch: List[AuditEvent]):
+        rows_by_model: Dict[type, List[Dict[str, Any]]] = {}
+        for event in batch:
+            rows_by_model.setdefault(event.model, []).append(event.values)
+
+        db = self._session()
+        try:
+            for model, rows in rows_by_model.items():
+                db.execute(insert(model), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for model, rows in rows_by_model.items():
+            audit_events_total.inc(len(rows), table=model.__tablename__, outcome="written")
+
+    def _session(self) -> Session:
+        if self.session_factory is None:
+            from dependencies import SessionLocal
+            self.session_factory = SessionLocal
+        return self.session_factory()
+
+# Global audit log writer instance
+audit_log = AuditLogWriter()
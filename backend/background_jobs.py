@@ -10,29 +10,39 @@ Advanced Background Job System
 
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, TYPE_CHECKING
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, insert
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from models import (
     User, Task, Order, CoinTransaction, CoinWithdrawalRequest, 
-    TaskStatus, OrderType, CoinTransactionType, NotificationSetting,
-    MentalHealthLog, DeviceIPLog, GDPRRequest, Leaderboard, UserBadge, Badge
+    TaskStatus, OrderType, CoinTransactionType, CoinTransactionCategory, NotificationSetting,
+    MentalHealthLog, DeviceIPLog, GDPRRequest, Leaderboard, OutboxEvent
 )
-from instagram_service import InstagramAPIService # Changed from instagram_service
 from enhanced_notifications import NotificationService, NotificationType, NotificationPriority
+from usage_analytics import invalidate_user_usage
+from badge_catalog import badge_catalog, LEADERBOARD_BADGES
+from metrics import background_job_duration_seconds, background_job_runs_total
+from audit_log import audit_log, AuditEvent
+from response_cache import invalidate_after_commit
+from social_features import SOCIAL_STATS_TAG
+import random
 import json
 
+if TYPE_CHECKING:
+    from instagram_service import InstagramAPIService
+
 logger = logging.getLogger(__name__)
 
 class BackgroundJobManager:
     """Advanced background job manager for all system maintenance tasks"""
     
-    def __init__(self, db_session_factory, instagram_api_service: InstagramAPIService): # Added instagram_api_service
+    def __init__(self, db_session_factory, instagram_api_service: "InstagramAPIService"): # Added instagram_api_service
         self.db_session_factory = db_session_factory
         self.notification_service = NotificationService(db_session_factory)
         self.instagram_api_service = instagram_api_service # Store the instance
@@ -91,12 +101,17 @@ class BackgroundJobManager:
         interval = self.job_intervals[job_name]
         
         while self.running:
+            started = time.perf_counter()
+            outcome = "success"
             try:
                 logger.debug(f"Running background job: {job_name}")
                 await job_func()
                 logger.debug(f"Completed background job: {job_name}")
             except Exception as e:
+                outcome = "error"
                 logger.error(f"Error in background job {job_name}: {e}", exc_info=True)
+            background_job_duration_seconds.observe(time.perf_counter() - started, job=job_name)
+            background_job_runs_total.inc(job=job_name, outcome=outcome)
             
             await asyncio.sleep(interval)
     
@@ -329,12 +344,11 @@ class BackgroundJobManager:
                     continue
                 
                 # Log suspicious activity
-                device_log = DeviceIPLog(
-                    user_id=user_id,
-                    action="suspicious_rapid_completion",
+                audit_log.record(AuditEvent.device_ip(
+                    user_id,
+                    "suspicious_rapid_completion",
                     device_info=f"Completed {task_count} tasks in 1 hour"
-                )
-                db.add(device_log)
+                ))
                 
                 # Lock user's withdrawals temporarily
                 pending_withdrawals = db.query(CoinWithdrawalRequest).filter(
@@ -413,7 +427,9 @@ class BackgroundJobManager:
                         user_id=user.id,
                         amount=-withdrawal.amount,
                         type=CoinTransactionType.withdraw,
-                        note=f"Çekim işlemi onaylandı (İstek #{withdrawal.id})"
+                        note=f"Çekim işlemi onaylandı (İstek #{withdrawal.id})",
+                        category=CoinTransactionCategory.withdrawal,
+                        reference_id=withdrawal.id
                     )
                     db.add(transaction)
                     
@@ -449,17 +465,43 @@ class BackgroundJobManager:
             now = datetime.utcnow()
             one_day_ago = now - timedelta(days=1)
             
-            # Find users who have been very active (completed many tasks)
+            cooldown_start = now - timedelta(hours=6)
+            notification_type = "activity_reminder"
+            
+            # Users who have been very active (completed many tasks)
             very_active_users = db.query(
-                Task.assigned_user_id,
+                Task.assigned_user_id.label('user_id'),
                 func.count(Task.id).label('task_count')
             ).filter(
                 Task.status == TaskStatus.completed,
                 Task.completed_at >= one_day_ago
             ).group_by(Task.assigned_user_id).having(
                 func.count(Task.id) > 20  # More than 20 tasks in 24 hours
+            ).subquery()
+            
+            # Anti-join against recent reminders (served by the user/type/sent_at index)
+            recently_notified = db.query(MentalHealthLog.id).filter(
+                MentalHealthLog.user_id == very_active_users.c.user_id,
+                MentalHealthLog.notification_type == notification_type,
+                MentalHealthLog.sent_at >= cooldown_start
+            ).exists()
+            
+            # Eligible recipients in one round trip: opted-in (or no settings row) and off cooldown
+            recipients = db.query(
+                very_active_users.c.user_id,
+                very_active_users.c.task_count
+            ).join(
+                User, User.id == very_active_users.c.user_id
+            ).outerjoin(
+                NotificationSetting, NotificationSetting.user_id == very_active_users.c.user_id
+            ).filter(
+                or_(NotificationSetting.id.is_(None), NotificationSetting.mental_health_notifications.is_(True)),
+                ~recently_notified
             ).all()
             
+            if not recipients:
+                return
+            
             mental_health_messages = [
                 "Mola vermeyi unutmayın! Sağlığınız coinlerden daha değerli. 🌱",
                 "Düzenli ara vermeyi unutmayın. Kendinize zaman ayırın! 🧘‍♀️",
@@ -468,57 +510,31 @@ class BackgroundJobManager:
                 "Başarılarınız muhteşem! Kendinizi ödüllendirmeyi de unutmayın. 🎉"
             ]
             
-            for user_id, task_count in very_active_users:
-                try:
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if not user:
-                        continue
-                    
-                    # Check notification settings
-                    settings = db.query(NotificationSetting).filter(
-                        NotificationSetting.user_id == user_id
-                    ).first()
-                    
-                    if settings and not settings.mental_health_notifications:
-                        continue
-                    
-                    # Check if we've sent a mental health notification recently
-                    recent_notification = db.query(MentalHealthLog).filter(
-                        MentalHealthLog.user_id == user_id,
-                        MentalHealthLog.sent_at >= now - timedelta(hours=6)
-                    ).first()
-                    
-                    if recent_notification:
-                        continue
-                    
-                    # Send notification
-                    import random
-                    message = random.choice(mental_health_messages)
-                    
-                    await self.notification_service.create_notification(
-                        user_id=user_id,
-                        title="Sağlığınızı Unutmayın 💚",
-                        message=message,
-                        notification_type=NotificationType.MENTAL_HEALTH,
-                        priority=NotificationPriority.LOW,
-                        send_push=True,
-                        send_realtime=True
-                    )
-                    
-                    # Log the notification
-                    mental_log = MentalHealthLog(
-                        user_id=user_id,
-                        notification_type="activity_reminder"
-                    )
-                    db.add(mental_log)
-                    
-                    logger.info(f"Sent mental health notification to user {user.username} (completed {task_count} tasks)")
-                    
-                except Exception as e:
-                    logger.error(f"Error sending mental health notification to user {user_id}: {e}")
-                    continue
-            
+            # Record the cooldown rows first so a crash mid-delivery cannot cause repeats
+            db.execute(
+                insert(MentalHealthLog),
+                [{"user_id": user_id, "notification_type": notification_type, "sent_at": now} for user_id, _ in recipients]
+            )
             db.commit()
+            invalidate_user_usage(*[user_id for user_id, _ in recipients])
+            
+            await self.notification_service.create_notification_batch(
+                [
+                    {
+                        "user_id": user_id,
+                        "title": "Sağlığınızı Unutmayın 💚",
+                        "message": random.choice(mental_health_messages),
+                        "data": {"completed_tasks_24h": task_count}
+                    }
+                    for user_id, task_count in recipients
+                ],
+                notification_type=NotificationType.MENTAL_HEALTH,
+                priority=NotificationPriority.LOW,
+                send_push=True,
+                send_realtime=True
+            )
+            
+            logger.info(f"Sent mental health notifications to {len(recipients)} users")
             
         except Exception as e:
             db.rollback()
@@ -586,6 +602,8 @@ class BackgroundJobManager:
             await self._award_leaderboard_badges(weekly_scores[:3], "weekly", db)
             await self._award_leaderboard_badges(monthly_scores[:3], "monthly", db)
             
+            # The rebuild moves every rank; score refreshes between rebuilds leave /social/stats alone
+            invalidate_after_commit(db, SOCIAL_STATS_TAG)
             db.commit()
             logger.info(f"Updated leaderboards: {len(weekly_scores)} weekly, {len(monthly_scores)} monthly entries")
             
@@ -597,43 +615,13 @@ class BackgroundJobManager:
     
     async def _award_leaderboard_badges(self, top_users: List, period: str, db: Session):
         """Award badges to top leaderboard users"""
-        badge_names = {
-            ("weekly", 1): "Haftalık Şampiyon 🥇",
-            ("weekly", 2): "Haftalık İkinci 🥈", 
-            ("weekly", 3): "Haftalık Üçüncü 🥉",
-            ("monthly", 1): "Aylık Şampiyon 👑",
-            ("monthly", 2): "Aylık İkinci 🌟",
-            ("monthly", 3): "Aylık Üçüncü ⭐"
-        }
-        
         for rank, (user_id, score) in enumerate(top_users, 1):
-            badge_name = badge_names.get((period, rank))
+            badge_name = LEADERBOARD_BADGES.get((period, rank))
             if not badge_name:
                 continue
             
-            # Get or create badge
-            badge = db.query(Badge).filter(Badge.name == badge_name).first()
-            if not badge:
-                badge = Badge(
-                    name=badge_name,
-                    description=f"{period.title()} lider tablosunda {rank}. sıra ödülü"
-                )
-                db.add(badge)
-                db.flush()
-            
-            # Check if user already has this badge for this period
-            existing = db.query(UserBadge).filter(
-                UserBadge.user_id == user_id,
-                UserBadge.badge_id == badge.id
-            ).first()
-            
-            if not existing:
-                user_badge = UserBadge(
-                    user_id=user_id,
-                    badge_id=badge.id
-                )
-                db.add(user_badge)
-                
+            # No-op when the user already holds this badge
+            if badge_catalog.award(db, user_id, badge_name):
                 # Notify user
                 await self.notification_service.create_notification(
                     user_id=user_id,
@@ -752,10 +740,17 @@ class BackgroundJobManager:
                 GDPRRequest.processed_at < gdpr_cutoff
             ).delete()
             
+            # Clean up delivered outbox events (older than 7 days); dead ones stay for inspection
+            outbox_cutoff = now - timedelta(days=7)
+            deleted_outbox = db.query(OutboxEvent).filter(
+                OutboxEvent.status == "delivered",
+                OutboxEvent.dispatched_at < outbox_cutoff
+            ).delete(synchronize_session=False)
+            
             db.commit()
             
-            if deleted_logs or deleted_mental or deleted_gdpr:
-                logger.info(f"Cleaned up old data: {deleted_logs} device logs, {deleted_mental} mental health logs, {deleted_gdpr} GDPR requests")
+            if deleted_logs or deleted_mental or deleted_gdpr or deleted_outbox:
+                logger.info(f"Cleaned up old data: {deleted_logs} device logs, {deleted_mental} mental health logs, {deleted_gdpr} GDPR requests, {deleted_outbox} outbox events")
             
         except Exception as e:
             db.rollback()
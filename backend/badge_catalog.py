@@ -0,0 +1,172 @@
+"""
+Badge Catalog
+- Every code-defined badge synced with one bulk INSERT ... ON CONFLICT (name) DO UPDATE at startup
+- Immutable in-memory name -> badge map, swapped atomically on reload; award paths never query Badge
+- Awards are a single INSERT ... ON CONFLICT DO NOTHING against the unique (user_id, badge_id) index,
+  so "already has it" needs no read and concurrent awards cannot duplicate
+- The caller owns the transaction: nothing here commits
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import insert
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+import json
+import logging
+
+from models import Badge, UserBadge
+
+logger = logging.getLogger(__name__)
+
+# Dialects with native INSERT ... ON CONFLICT support
+_CONFLICT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Badges awarded outside EnhancedBadgeSystem; previously created on first award
+LEADERBOARD_BADGES: Mapping[tuple, str] = MappingProxyType({
+    ("weekly", 1): "Haftalık Şampiyon 🥇",
+    ("weekly", 2): "Haftalık İkinci 🥈",
+    ("weekly", 3): "Haftalık Üçüncü 🥉",
+    ("monthly", 1): "Aylık Şampiyon 👑",
+    ("monthly", 2): "Aylık İkinci 🌟",
+    ("monthly", 3): "Aylık Üçüncü ⭐",
+})
+
+EDUCATION_BADGES: Mapping[str, str] = MappingProxyType({
+    "onboarding_complete": "Platform Yeni Üyesi",
+    "instagram_expert": "Instagram Uzmanı",
+    "coin_master": "Coin Ustası",
+    "security_champion": "Güvenlik Şampiyonu",
+})
+
+SYSTEM_BADGE_DEFINITIONS: List[Dict[str, Any]] = [
+    *(
+        {
+            "name": name,
+            "description": f"{period.title()} lider tablosunda {rank}. sıra ödülü",
+            "category": "achievement",
+            "icon_url": name.split()[-1],
+        }
+        for (period, rank), name in LEADERBOARD_BADGES.items()
+    ),
+    {"name": "İlk Görev 🎯", "description": "İlk görevinizi tamamladınız", "category": "achievement", "icon_url": "🎯"},
+    {"name": "Görev Ustası 💪", "description": "100 görev tamamladınız", "category": "achievement", "icon_url": "💪"},
+    {"name": "Coin Koleksiyoncusu 🪙", "description": "1000 coin kazandınız", "category": "achievement", "icon_url": "🪙"},
+    {"name": "Sosyal Kelebek 🦋", "description": "5 kişi davet ettiniz", "category": "social", "icon_url": "🦋"},
+    {"name": "Yardımsever El 🤝", "description": "100 coin transfer ettiniz", "category": "social", "icon_url": "🤝"},
+    {"name": "En İyi Performans 🏆", "description": "Lider tablosunda 1. oldunuz", "category": "achievement", "icon_url": "🏆"},
+    {"name": "Platform Yeni Üyesi", "description": "Platform onboarding'ini başarıyla tamamladı", "category": "expert", "icon_url": "🎓"},
+    {"name": "Instagram Uzmanı", "description": "Instagram temelleri eğitimini tamamladı", "category": "expert", "icon_url": "📱"},
+    {"name": "Coin Ustası", "description": "Coin sistemi eğitimini tamamladı", "category": "expert", "icon_url": "💰"},
+    {"name": "Güvenlik Şampiyonu", "description": "Güvenlik ve gizlilik eğitimini tamamladı", "category": "expert", "icon_url": "🔒"},
+]
+
+@dataclass(frozen=True)
+class CatalogBadge:
+    id: int
+    name: str
+    description: Optional[str]
+    category: Optional[str]
+    icon_url: Optional[str]
+
+class BadgeCatalog:
+    """Process-wide badge lookup; reads are plain dict lookups on an immutable snapshot"""
+
+    def __init__(self):
+        self._badges: Mapping[str, CatalogBadge] = MappingProxyType({})
+
+    def sync(self, db: Session, definitions: Iterable[Dict[str, Any]] = ()) -> int:
+        """Upsert the system badges plus `definitions` in one statement and reload the map.
+
+        Returns the number of badges in the catalog.
+        """
+        rows: Dict[str, Dict[str, Any]] = {}
+        for definition in (*SYSTEM_BADGE_DEFINITIONS, *definitions):
+            requirements = definition.get("requirements")
+            rows[definition["name"]] = {
+                "name": definition["name"],
+                "description": definition.get("description"),
+                "category": definition.get("category", "achievement"),
+                "icon_url": definition.get("icon_url"),
+                "requirements_json": json.dumps(requirements) if requirements is not None else None,
+                "is_active": True,
+            }
+
+        if rows:
+            conflict_insert = _CONFLICT_INSERTS.get(db.get_bind().dialect.name)
+            if conflict_insert is not None:
+                stmt = conflict_insert(Badge).values(list(rows.values()))
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["name"],
+                    # is_active stays as admins left it
+                    set_={
+                        "description": stmt.excluded.description,
+                        "category": stmt.excluded.category,
+                        "icon_url": stmt.excluded.icon_url,
+                        "requirements_json": stmt.excluded.requirements_json,
+                    },
+                ))
+            else:
+                existing = {name for (name,) in db.query(Badge.name).filter(Badge.name.in_(rows))}
+                missing = [row for name, row in rows.items() if name not in existing]
+                if missing:
+                    db.execute(insert(Badge), missing)
+
+        return self.load(db)
+
+    def load(self, db: Session) -> int:
+        """Replace the in-memory snapshot with the badges table"""
+        badges = {
+            row.name: CatalogBadge(row.id, row.name, row.description, row.category, row.icon_url)
+            for row in db.query(Badge.id, Badge.name, Badge.description, Badge.category, Badge.icon_url)
+        }
+        self._badges = MappingProxyType(badges)
+        logger.debug(f"Badge catalog loaded: {len(badges)} badges")
+        return len(badges)
+
+    def get(self, name: str, db: Optional[Session] = None) -> Optional[CatalogBadge]:
+        """Badge by name; with a session, a miss reloads once (badge created by an admin or another worker)"""
+        badge = self._badges.get(name)
+        if badge is None and db is not None:
+            self.load(db)
+            badge = self._badges.get(name)
+        return badge
+
+    def badges(self) -> Mapping[str, CatalogBadge]:
+        return self._badges
+
+    def award(self, db: Session, user_id: int, name: str) -> Optional[CatalogBadge]:
+        """Give `name` to the user; returns the badge only when this call awarded it"""
+        badge = self.get(name, db)
+        if badge is None:
+            logger.warning(f"Badge '{name}' is not in the catalog; award to user {user_id} skipped")
+            return None
+        return badge if self.award_id(db, user_id, badge.id) else None
+
+    def award_id(self, db: Session, user_id: int, badge_id: int) -> bool:
+        """Insert the (user_id, badge_id) row; False when the user already had it"""
+        values = {"user_id": user_id, "badge_id": badge_id}
+        conflict_insert = _CONFLICT_INSERTS.get(db.get_bind().dialect.name)
+        if conflict_insert is not None:
+            stmt = (
+                conflict_insert(UserBadge)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=["user_id", "badge_id"])
+                .returning(UserBadge.id)
+            )
+            return db.execute(stmt).first() is not None
+
+        try:
+            with db.begin_nested():
+                db.execute(insert(UserBadge).values(**values))
+            return True
+        except IntegrityError:
+            return False
+
+# Global badge catalog instance
+badge_catalog = BadgeCatalog()
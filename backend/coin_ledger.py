@@ -0,0 +1,146 @@
+"""
+Coin Ledger
+- Atomic balance mutations as single conditional UPDATE statements (no read-modify-write in Python)
+- Debits only apply while the balance covers them: ... WHERE id = :id AND coin_balance >= :amount
+- Two-party transfers touch user rows in ascending id order, so concurrent transfers cannot deadlock
+- Matching CoinTransaction rows written as one multi-row insert in the same transaction
+- Every row carries a typed category (and optional reference id); per-category totals are one grouped aggregate
+- The caller owns the transaction: nothing here commits, and a rejected mutation means roll back
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, update, func
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+
+from models import User, CoinTransaction, CoinTransactionType, CoinTransactionCategory
+
+logger = logging.getLogger(__name__)
+
+# Categories that count as a user's earnings; transfers, refunds and admin adjustments only move coins
+EARNING_CATEGORIES = frozenset({
+    CoinTransactionCategory.task_reward,
+    CoinTransactionCategory.daily_reward,
+    CoinTransactionCategory.referral_bonus,
+    CoinTransactionCategory.education_reward,
+})
+
+@dataclass(frozen=True)
+class LedgerEntry:
+    """One balance change and the CoinTransaction row that records it"""
+    user_id: int
+    amount: int  # signed: positive credits, negative debits
+    type: CoinTransactionType
+    note: Optional[str] = None
+    category: CoinTransactionCategory = CoinTransactionCategory.other
+    reference_id: Optional[int] = None
+
+@dataclass(frozen=True)
+class TransferResult:
+    sender_balance: int
+    recipient_balance: int
+
+class CoinLedger:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def credit(self, user_id: int, amount: int, type: CoinTransactionType = CoinTransactionType.earn,
+               note: Optional[str] = None, extra_values: Optional[Dict[str, Any]] = None,
+               category: CoinTransactionCategory = CoinTransactionCategory.other,
+               reference_id: Optional[int] = None) -> Optional[int]:
+        """Add coins; returns the new balance, or None when the user does not exist.
+
+        extra_values sets further user columns in the same UPDATE (e.g. reward streak state).
+        """
+        entry = LedgerEntry(user_id, amount, type, note, category, reference_id)
+        balance = self._apply(entry, extra_values=extra_values)
+        if balance is not None:
+            self._record([entry])
+        return balance
+
+    def debit(self, user_id: int, amount: int, type: CoinTransactionType = CoinTransactionType.spend,
+              note: Optional[str] = None, category: CoinTransactionCategory = CoinTransactionCategory.other,
+              reference_id: Optional[int] = None) -> Optional[int]:
+        """Remove coins if the balance covers them; returns the new balance, or None when rejected"""
+        entry = LedgerEntry(user_id, -amount, type, note, category, reference_id)
+        balance = self._apply(entry)
+        if balance is not None:
+            self._record([entry])
+        return balance
+
+    def adjust(self, user_id: int, amount: int, type: CoinTransactionType, note: Optional[str] = None,
+               category: CoinTransactionCategory = CoinTransactionCategory.other) -> Optional[int]:
+        """Signed change: credits positive amounts, conditionally debits negative ones"""
+        if amount >= 0:
+            return self.credit(user_id, amount, type, note, category=category)
+        return self.debit(user_id, -amount, type, note, category=category)
+
+    def transfer(self, sender_id: int, recipient_id: int, amount: int, fee: int = 0,
+                 sender_note: Optional[str] = None, recipient_note: Optional[str] = None) -> Optional[TransferResult]:
+        """Move `amount` to the recipient, charging the sender `amount + fee`.
+
+        Returns None when the sender cannot cover the total or either user is
+        missing; the recipient may already have been credited by then, so the
+        caller must roll the transaction back. Transfers to oneself raise ValueError.
+        """
+        if sender_id == recipient_id:
+            raise ValueError("Cannot transfer coins to the same user")
+        entries = {
+            sender_id: LedgerEntry(sender_id, -(amount + fee), CoinTransactionType.spend, sender_note,
+                                   CoinTransactionCategory.transfer_out, recipient_id),
+            recipient_id: LedgerEntry(recipient_id, amount, CoinTransactionType.earn, recipient_note,
+                                      CoinTransactionCategory.transfer_in, sender_id),
+        }
+        balances: Dict[int, int] = {}
+        # Row locks are taken in ascending id order regardless of transfer direction
+        for user_id in sorted(entries):
+            balance = self._apply(entries[user_id])
+            if balance is None:
+                return None
+            balances[user_id] = balance
+
+        self._record([entries[sender_id], entries[recipient_id]])
+        return TransferResult(sender_balance=balances[sender_id], recipient_balance=balances[recipient_id])
+
+    def _apply(self, entry: LedgerEntry, extra_values: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """Single conditional UPDATE ... RETURNING; None when no row matched"""
+        stmt = update(User).where(User.id == entry.user_id)
+        if entry.amount < 0:
+            stmt = stmt.where(User.coin_balance >= -entry.amount)
+        stmt = (
+            stmt.values(coin_balance=func.coalesce(User.coin_balance, 0) + entry.amount, **(extra_values or {}))
+            .returning(User.coin_balance)
+            .execution_options(synchronize_session=False)
+        )
+        return self.db.execute(stmt).scalar_one_or_none()
+
+    def _record(self, entries: List[LedgerEntry]):
+        self.db.execute(insert(CoinTransaction), [
+            {
+                "user_id": entry.user_id,
+                "amount": entry.amount,
+                "type": entry.type,
+                "note": entry.note,
+                "category": entry.category,
+                "reference_id": entry.reference_id,
+            }
+            for entry in entries
+        ])
+
+    def category_totals(self, user_id: int, categories: Optional[Iterable[CoinTransactionCategory]] = None,
+                        since: Optional[datetime] = None) -> Dict[CoinTransactionCategory, int]:
+        """Signed sum per category, read from the (user_id, category, created_at, amount) index"""
+        query = self.db.query(CoinTransaction.category, func.sum(CoinTransaction.amount)).filter(
+            CoinTransaction.user_id == user_id
+        )
+        if categories is not None:
+            query = query.filter(CoinTransaction.category.in_(list(categories)))
+        if since is not None:
+            query = query.filter(CoinTransaction.created_at >= since)
+        return {
+            category: int(total or 0)
+            for category, total in query.group_by(CoinTransaction.category)
+            if category is not None
+        }
@@ -5,6 +5,8 @@ Advanced Coin Security and Withdrawal System
 - Multi-layer security checks
 - Locked coin management
 - Real-time fraud detection
+- Security scores and withdrawal eligibility cached per user (SECURITY_CACHE_TTL_SECONDS) and dropped
+  when the user's tasks, device logs, withdrawals, transactions or balance change
 """
 
 import logging
@@ -14,16 +16,40 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func
 from models import (
     User, CoinTransaction, CoinWithdrawalRequest, DeviceIPLog,
-    Task, TaskStatus, CoinTransactionType, InstagramProfile, CoinWithdrawalVerification
+    Task, TaskStatus, CoinTransactionType, CoinTransactionCategory, InstagramProfile, CoinWithdrawalVerification
 )
 from enhanced_notifications import NotificationService, NotificationType, NotificationPriority
-from instagram_service import InstagramAPIService
+from audit_log import audit_log, AuditEvent
+from coin_ledger import CoinLedger
+from domain_events import publish, WithdrawalRequested
+from user_cache import PerUserCache
 import hashlib
 import json
+import os
 import random
 
 logger = logging.getLogger(__name__)
 
+SECURITY_CACHE_TTL_SECONDS = float(os.getenv("SECURITY_CACHE_TTL_SECONDS", "60"))
+SECURITY_CACHE_MAX_ENTRIES = int(os.getenv("SECURITY_CACHE_MAX_ENTRIES", "10000"))
+
+# Inputs of the security score and eligibility checks, by user id column
+security_results = PerUserCache(
+    "coin_security",
+    {
+        User: "id",
+        Task: "assigned_user_id",
+        DeviceIPLog: "user_id",
+        CoinTransaction: "user_id",
+        CoinWithdrawalRequest: "user_id",
+        InstagramProfile: "user_id",
+    },
+    SECURITY_CACHE_TTL_SECONDS,
+    SECURITY_CACHE_MAX_ENTRIES,
+    # Ledger balance UPDATEs always come with CoinTransaction rows, which carry the user ids
+    unit_of_work_only=(User,),
+)
+
 class CoinSecurityManager:
     """Advanced coin security and withdrawal management"""
     
@@ -82,6 +108,9 @@ class CoinSecurityManager:
                 amount=amount,
                 status="pending"
             )
+            # Flush for the id: the lock transaction and the outbox event reference it
+            db.add(withdrawal_request)
+            db.flush()
             
             # Calculate fraud score
             fraud_score = await self._calculate_fraud_score(user, db)
@@ -92,65 +121,46 @@ class CoinSecurityManager:
                 withdrawal_request.locked_until = datetime.utcnow() + timedelta(hours=self.withdrawal_lock_hours * 2)
                 
                 # Log suspicious activity
-                device_log = DeviceIPLog(
-                    user_id=user_id,
-                    device_info=device_info,
+                audit_log.record(AuditEvent.device_ip(
+                    user_id,
+                    f"suspicious_withdrawal_request_fraud_score_{fraud_score:.2f}",
                     ip_address=ip_address,
-                    action=f"suspicious_withdrawal_request_fraud_score_{fraud_score:.2f}"
-                )
-                db.add(device_log)
-                
-                # Notify user
-                await self.notification_service.create_notification(
-                    user_id=user_id,
-                    title="Çekim Talebi Güvenlik İncelemesinde 🔒",
-                    message=f"Güvenlik nedeniyle çekim talebiniz incelemeye alındı. {withdrawal_request.locked_until.strftime('%d.%m.%Y %H:%M')} tarihine kadar bekleyiniz.",
-                    notification_type=NotificationType.WITHDRAWAL_LOCKED,
-                    priority=NotificationPriority.HIGH,
-                    data={"amount": amount, "fraud_score": fraud_score}
-                )
-                
-                # Notify admins
-                await self._notify_admins_suspicious_activity(user, fraud_score, amount, db)
+                    device_info=device_info
+                ))
                 
             else:
                 # Normal processing - lock for 48 hours
                 withdrawal_request.locked_until = datetime.utcnow() + timedelta(hours=self.withdrawal_lock_hours)
                 
-                # Lock coins in user balance
-                locked_amount = min(amount, user.coin_balance)
-                user.coin_balance -= locked_amount
-                
-                # Create locked coin transaction
-                locked_transaction = CoinTransaction(
-                    user_id=user_id,
-                    amount=-locked_amount,
-                    type=CoinTransactionType.withdraw,
-                    note=f"Çekim talebi için kilitlendi (Talep #{withdrawal_request.id})"
-                )
-                db.add(locked_transaction)
-                
-                # Notify user
-                await self.notification_service.create_notification(
-                    user_id=user_id,
-                    title="Çekim Talebi Alındı ⏳",
-                    message=f"{amount} coin çekim talebiniz alındı. 48 saat içinde işleme alınacak.",
-                    notification_type=NotificationType.WITHDRAWAL_PENDING,
-                    priority=NotificationPriority.MEDIUM,
-                    data={"amount": amount, "unlock_time": withdrawal_request.locked_until.isoformat()}
+                # Lock coins in user balance; one conditional UPDATE, so concurrent requests cannot overdraw
+                balance = CoinLedger(db).debit(
+                    user_id, amount, CoinTransactionType.withdraw,
+                    note=f"Çekim talebi için kilitlendi (Talep #{withdrawal_request.id})",
+                    category=CoinTransactionCategory.withdrawal,
+                    reference_id=withdrawal_request.id
                 )
+                if balance is None:
+                    db.rollback()
+                    return {"success": False, "message": "Yetersiz bakiye"}
+            
+            # User and admin notifications are delivered through the outbox
+            publish(db, WithdrawalRequested(
+                user_id,
+                withdrawal_request.id,
+                amount,
+                withdrawal_request.status,
+                round(fraud_score, 4),
+                withdrawal_request.locked_until.isoformat() if withdrawal_request.locked_until else None
+            ))
+            db.commit()
             
             # Log withdrawal request
-            device_log = DeviceIPLog(
-                user_id=user_id,
-                device_info=device_info,
+            audit_log.record(AuditEvent.device_ip(
+                user_id,
+                f"withdrawal_request_{amount}_coins",
                 ip_address=ip_address,
-                action=f"withdrawal_request_{amount}_coins"
-            )
-            db.add(device_log)
-            
-            db.add(withdrawal_request)
-            db.commit()
+                device_info=device_info
+            ))
             
             logger.info(f"Withdrawal request created for user {user.username}: {amount} coins, status: {withdrawal_request.status}")
             
@@ -200,7 +210,8 @@ class CoinSecurityManager:
                 }
             
             # Verify Instagram account is still active
-            instagram_service = InstagramAPIService()
+            from dependencies import get_instagram_service
+            instagram_service = get_instagram_service()
             try:
                 profile_data = await instagram_service.get_user_profile_data(user, db)
                 if not profile_data or profile_data.get('is_private') is None:
@@ -346,6 +357,9 @@ class CoinSecurityManager:
     
     async def _calculate_fraud_score(self, user: User, db: Session) -> float:
         """Calculate fraud risk score (0.0 to 1.0)"""
+        return self._fraud_score(user, db)
+
+    def _fraud_score(self, user: User, db: Session) -> float:
         score = 0.0
         now = datetime.utcnow()
         
@@ -420,20 +434,26 @@ class CoinSecurityManager:
         
         return min(1.0, score)  # Cap at 1.0
     
-    async def _notify_admins_suspicious_activity(self, user: User, fraud_score: float, 
-                                               amount: int, db: Session):
+    async def notify_admins_suspicious_activity(self, user_id: int, fraud_score: float, amount: int):
         """Notify admins about suspicious withdrawal activity"""
-        admin_users = db.query(User).filter(User.is_admin == True).all()
+        db = self.db_session_factory()
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            admin_ids = [admin_id for (admin_id,) in db.query(User.id).filter(User.is_admin == True)]
+        finally:
+            db.close()
+        if not user:
+            return
         
-        for admin in admin_users:
+        for admin_id in admin_ids:
             await self.notification_service.create_notification(
-                user_id=admin.id,
+                user_id=admin_id,
                 title="Şüpheli Çekim Talebi 🚨",
                 message=f"Kullanıcı {user.username} için yüksek risk skoru: {fraud_score:.2f} (Miktar: {amount} coin)",
                 notification_type=NotificationType.SECURITY_ALERT,
                 priority=NotificationPriority.URGENT,
                 data={
-                    "suspicious_user_id": user.id,
+                    "suspicious_user_id": user_id,
                     "fraud_score": fraud_score,
                     "withdrawal_amount": amount
                 }
@@ -522,16 +542,12 @@ class CoinSecurityManager:
                 return {"success": False, "message": "Kullanıcı bulunamadı"}
             
             # Unlock coins
-            user.coin_balance += withdrawal.amount
-            
-            # Create unlock transaction
-            unlock_transaction = CoinTransaction(
-                user_id=user_id,
-                amount=withdrawal.amount,
-                type=CoinTransactionType.earn,
-                note=f"Çekim talebi iptali (Talep #{withdrawal.id})"
+            CoinLedger(db).credit(
+                user_id, withdrawal.amount, CoinTransactionType.earn,
+                note=f"Çekim talebi iptali (Talep #{withdrawal.id})",
+                category=CoinTransactionCategory.withdrawal_refund,
+                reference_id=withdrawal.id
             )
-            db.add(unlock_transaction)
             
             # Cancel withdrawal
             withdrawal.status = "cancelled"
@@ -630,7 +646,14 @@ class CoinSecurityManager:
         return min(1.0, base_score + instagram_risk)
 
     async def verify_withdrawal_eligibility(self, user_id: int) -> Dict[str, Any]:
-        """Comprehensive withdrawal eligibility check"""
+        """Comprehensive withdrawal eligibility check (cached; `computed_at` tells when it ran)"""
+        cached = await security_results.aget(
+            user_id, "withdrawal_eligibility", lambda: self._withdrawal_eligibility(user_id),
+            cacheable=lambda result: "checks" in result
+        )
+        return {**cached.value, "computed_at": cached.computed_at.isoformat()}
+
+    def _withdrawal_eligibility(self, user_id: int) -> Dict[str, Any]:
         db = self.db_session_factory()
         try:
             user = db.query(User).filter(User.id == user_id).first()
@@ -649,7 +672,7 @@ class CoinSecurityManager:
             reasons = []
             
             # Minimum balance check
-            if user.coins >= 100:  # Minimum withdrawal amount
+            if (user.coin_balance or 0) >= 100:  # Minimum withdrawal amount
                 checks["minimum_balance"] = True
             else:
                 reasons.append("En az 100 coin gereklidir")
@@ -684,7 +707,7 @@ class CoinSecurityManager:
                 reasons.append("Bekleyen bir çekim talebiniz var")
             
             # User not flagged as suspicious
-            if not user.is_suspicious:
+            if user.account_status != "suspended":
                 checks["not_suspicious"] = True
             else:
                 reasons.append("Hesabınız güvenlik incelemesi altında")
@@ -707,7 +730,7 @@ class CoinSecurityManager:
                 "checks": checks,
                 "reasons": reasons,
                 "minimum_withdrawal": 100,
-                "current_balance": user.coins,
+                "current_balance": user.coin_balance or 0,
                 "instagram_verified": instagram_profile is not None
             }
             
@@ -718,7 +741,14 @@ class CoinSecurityManager:
             db.close()
 
     async def calculate_user_security_score(self, user_id: int) -> Dict[str, Any]:
-        """Calculate user's security score (public method)"""
+        """Calculate user's security score (public method; cached, `computed_at` tells when it ran)"""
+        cached = await security_results.aget(
+            user_id, "security_score", lambda: self._security_score(user_id),
+            cacheable=lambda result: result["success"]
+        )
+        return {**cached.value, "computed_at": cached.computed_at.isoformat()}
+
+    def _security_score(self, user_id: int) -> Dict[str, Any]:
         db = self.db_session_factory()
         try:
             user = db.query(User).filter(User.id == user_id).first()
@@ -726,7 +756,7 @@ class CoinSecurityManager:
                 return {"success": False, "message": "Kullanıcı bulunamadı"}
             
             # Calculate fraud score
-            fraud_score = await self._calculate_fraud_score(user, db)
+            fraud_score = self._fraud_score(user, db)
             security_score = 1.0 - fraud_score  # Convert fraud risk to security score
             
             # Risk level classification
@@ -0,0 +1,171 @@
+"""
+Daily Rewards
+- One claim per user per UTC day, enforced by the unique (user_id, claimed_date) index
+- Atomic claim: INSERT ... ON CONFLICT DO NOTHING picks the single winner, the ledger credits the balance in SQL
+- Streak state lives on the user row (daily_reward_streak / last_daily_reward), so status needs no extra query
+- Progressive reward table shared by every daily reward endpoint
+- A RewardClaimed outbox event commits with the claim; notification and badge checks follow from it
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import insert
+from datetime import date, datetime, timedelta
+from dataclasses import dataclass
+from typing import Optional
+import logging
+
+from models import User, DailyReward, CoinTransactionCategory
+from coin_ledger import CoinLedger
+from domain_events import publish, RewardClaimed
+
+logger = logging.getLogger(__name__)
+
+BASE_REWARD = 50
+STREAK_BONUS = 10
+MAX_STREAK_MULTIPLIER = 7
+WEEKLY_BONUS_DAY = 7
+WEEKLY_BONUS = 200
+
+# Dialects with native INSERT ... ON CONFLICT support
+_CONFLICT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+@dataclass(frozen=True)
+class RewardQuote:
+    consecutive_days: int
+    bonus_multiplier: int
+    weekly_bonus: int
+    total: int
+    base_reward: int = BASE_REWARD
+
+    def bonus_info(self) -> dict:
+        return {
+            "base_reward": self.base_reward,
+            "bonus_multiplier": self.bonus_multiplier,
+            "weekly_bonus": self.weekly_bonus
+        }
+
+@dataclass(frozen=True)
+class DailyRewardStatus:
+    can_claim: bool
+    streak: int
+    last_claim: Optional[date]
+    next_reward: RewardQuote
+    next_claim: datetime
+
+@dataclass(frozen=True)
+class ClaimResult:
+    claimed: bool
+    balance: int
+    next_claim: datetime
+    reward: Optional[RewardQuote] = None
+
+def quote_reward(consecutive_days: int) -> RewardQuote:
+    bonus_multiplier = min(consecutive_days, MAX_STREAK_MULTIPLIER)
+    weekly_bonus = WEEKLY_BONUS if consecutive_days == WEEKLY_BONUS_DAY else 0
+    return RewardQuote(
+        consecutive_days=consecutive_days,
+        bonus_multiplier=bonus_multiplier,
+        weekly_bonus=weekly_bonus,
+        total=BASE_REWARD + bonus_multiplier * STREAK_BONUS + weekly_bonus
+    )
+
+def next_claim_at(today: date) -> datetime:
+    return datetime.combine(today + timedelta(days=1), datetime.min.time())
+
+def last_claim_date(user: User) -> Optional[date]:
+    last = user.last_daily_reward
+    if last is None:
+        return None
+    return last.date() if isinstance(last, datetime) else last
+
+def active_streak(user: User, today: date) -> int:
+    """Streak still alive today: claimed today or yesterday, otherwise broken"""
+    last = last_claim_date(user)
+    if last in (today, today - timedelta(days=1)):
+        return user.daily_reward_streak or 0
+    return 0
+
+class DailyRewardService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_status(self, user: User, today: Optional[date] = None) -> DailyRewardStatus:
+        """Status from the user's streak columns; no query beyond the already loaded user row"""
+        today = today or datetime.utcnow().date()
+        last = last_claim_date(user)
+        can_claim = last != today
+        streak = active_streak(user, today)
+        return DailyRewardStatus(
+            can_claim=can_claim,
+            streak=streak,
+            last_claim=last,
+            next_reward=quote_reward(streak + 1 if can_claim else streak),
+            next_claim=next_claim_at(today)
+        )
+
+    def claim(self, user: User, now: Optional[datetime] = None) -> ClaimResult:
+        """Claim today's reward; concurrent claims for the same day yield exactly one winner"""
+        now = now or datetime.utcnow()
+        today = now.date()
+        next_claim = next_claim_at(today)
+        if last_claim_date(user) == today:
+            return ClaimResult(claimed=False, balance=user.coin_balance or 0, next_claim=next_claim)
+
+        quote = quote_reward(active_streak(user, today) + 1)
+        try:
+            if not self._insert_claim(user.id, today, quote):
+                self.db.rollback()
+                return ClaimResult(claimed=False, balance=user.coin_balance or 0, next_claim=next_claim)
+
+            balance = CoinLedger(self.db).credit(
+                user.id,
+                quote.total,
+                note=f"Günlük ödül - {quote.consecutive_days}. gün (Bonus: {quote.bonus_multiplier}x)",
+                extra_values={"daily_reward_streak": quote.consecutive_days, "last_daily_reward": now},
+                category=CoinTransactionCategory.daily_reward
+            )
+            publish(self.db, RewardClaimed(
+                user.id, quote.total, quote.consecutive_days, quote.bonus_multiplier, quote.weekly_bonus
+            ))
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Daily reward claim failed for user {user.id}: {e}", exc_info=True)
+            self.db.rollback()
+            raise
+
+        # Reflect the committed values without another round trip
+        set_committed_value(user, "coin_balance", balance)
+        set_committed_value(user, "daily_reward_streak", quote.consecutive_days)
+        set_committed_value(user, "last_daily_reward", now)
+        return ClaimResult(claimed=True, balance=balance, next_claim=next_claim, reward=quote)
+
+    def _insert_claim(self, user_id: int, today: date, quote: RewardQuote) -> bool:
+        """Insert today's claim row; False when the (user_id, claimed_date) key already exists"""
+        values = {
+            "user_id": user_id,
+            "claimed_date": today,
+            "coin_amount": quote.total,
+            "consecutive_days": quote.consecutive_days
+        }
+        conflict_insert = _CONFLICT_INSERTS.get(self.db.get_bind().dialect.name)
+        if conflict_insert is not None:
+            stmt = (
+                conflict_insert(DailyReward)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=["user_id", "claimed_date"])
+                .returning(DailyReward.id)
+            )
+            return self.db.execute(stmt).first() is not None
+
+        try:
+            with self.db.begin_nested():
+                self.db.execute(insert(DailyReward).values(**values))
+            return True
+        except IntegrityError:
+            return False
@@ -15,8 +15,8 @@ import os
 # Import models
 from models import User, Base
 
-# Import Instagram service
-from instagram_service import InstagramAPIService
+# Heavy integrations are constructed lazily through the service registry
+from service_registry import service_registry
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./instagram_platform.db")
@@ -27,8 +27,13 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Initialize Instagram service instance
-instagram_service_instance = InstagramAPIService(db_session_maker=SessionLocal)
+# Instagram service (instagrapi + Selenium stack) is built on first use
+def _create_instagram_service():
+    from instagram_service import InstagramAPIService
+    return InstagramAPIService(db_session_maker=SessionLocal)
+
+service_registry.register("instagram_service", _create_instagram_service)
+instagram_service_instance = service_registry.proxy("instagram_service")
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
@@ -68,4 +73,4 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
 def get_instagram_service():
     """Get Instagram service instance"""
-    return instagram_service_instance
+    return service_registry.get("instagram_service")
@@ -0,0 +1,374 @@
+"""
+Domain Events and Transactional Outbox
+- Typed events (CoinEarned, RewardClaimed, BadgeAwarded, ...) published into the outbox_events table
+  inside the caller's transaction: the event exists exactly when the change that caused it committed
+- Event bus of named consumers (notifications, badges, leaderboard, stats) per event type
+- Dispatcher drains the outbox in batches off the request path; a committing publisher wakes it,
+  otherwise it polls every OUTBOX_POLL_SECONDS. Claim / ack queries and sync consumers run in the
+  threadpool, never on the event loop
+- At-least-once: claimed rows are leased, failed consumers retried with exponential backoff,
+  consumers that already succeeded are not re-run; rows that keep failing are parked as 'dead'
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import event, update
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, ClassVar, Dict, List, Optional, Tuple, Type, Union
+import asyncio
+import inspect
+import json
+import logging
+import os
+
+from fastapi.concurrency import run_in_threadpool
+
+from models import OutboxEvent
+from metrics import outbox_events_total, outbox_delivery_lag_seconds
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2.0"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+
+# session.info flag: this transaction published events, wake the dispatcher on commit
+_PUBLISHED_KEY = "outbox_published"
+
+# --- Events ---
+
+@dataclass(frozen=True)
+class DomainEvent:
+    event_type: ClassVar[str] = ""
+    user_id: int
+
+@dataclass(frozen=True)
+class CoinEarned(DomainEvent):
+    event_type: ClassVar[str] = "CoinEarned"
+    amount: int
+    category: str
+    reference_id: Optional[int] = None
+
+@dataclass(frozen=True)
+class RewardClaimed(DomainEvent):
+    event_type: ClassVar[str] = "RewardClaimed"
+    amount: int
+    streak: int
+    bonus_multiplier: int = 0
+    weekly_bonus: int = 0
+
+@dataclass(frozen=True)
+class BadgeAwarded(DomainEvent):
+    event_type: ClassVar[str] = "BadgeAwarded"
+    badge_id: int
+    badge_name: str
+
+@dataclass(frozen=True)
+class CoinsTransferred(DomainEvent):
+    """user_id is the sender"""
+    event_type: ClassVar[str] = "CoinsTransferred"
+    recipient_id: int
+    amount: int
+    fee: int
+    sender_username: str
+    recipient_username: str
+    message: Optional[str] = None
+
+@dataclass(frozen=True)
+class ReferralApplied(DomainEvent):
+    """user_id is the referred user"""
+    event_type: ClassVar[str] = "ReferralApplied"
+    referrer_id: int
+    bonus: int
+    username: str
+    referrer_username: str
+
+@dataclass(frozen=True)
+class ReferralBonusGranted(DomainEvent):
+    """user_id is the referrer"""
+    event_type: ClassVar[str] = "ReferralBonusGranted"
+    referred_id: int
+    bonus: int
+    referred_username: str
+    completed_tasks: int
+
+@dataclass(frozen=True)
+class WithdrawalRequested(DomainEvent):
+    event_type: ClassVar[str] = "WithdrawalRequested"
+    withdrawal_id: int
+    amount: int
+    status: str
+    fraud_score: float
+    locked_until: Optional[str] = None
+
+EVENT_TYPES: Dict[str, Type[DomainEvent]] = {
+    cls.event_type: cls
+    for cls in (CoinEarned, RewardClaimed, BadgeAwarded, CoinsTransferred, ReferralApplied, ReferralBonusGranted,
+                WithdrawalRequested)
+}
+
+def publish(db: Session, *events: DomainEvent):
+    """Add `events` to the outbox in the session's current transaction; the caller commits"""
+    if not events:
+        return
+    now = datetime.utcnow()
+    for domain_event in events:
+        db.add(OutboxEvent(
+            event_type=domain_event.event_type,
+            user_id=domain_event.user_id,
+            payload_json=json.dumps(asdict(domain_event)),
+            status="pending",
+            attempts=0,
+            available_at=now,
+            created_at=now,
+        ))
+        outbox_events_total.inc(event_type=domain_event.event_type, outcome="published")
+    db.info[_PUBLISHED_KEY] = True
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.info.pop(_PUBLISHED_KEY, False):
+        outbox_dispatcher.notify()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_published(session):
+    session.info.pop(_PUBLISHED_KEY, None)
+
+# --- Bus ---
+
+Handler = Callable[[DomainEvent], Union[Awaitable[None], None]]
+
+class EventBus:
+    """Consumers by event type; each consumer has a stable name used to track delivery"""
+
+    def __init__(self):
+        self._consumers: Dict[str, List[Tuple[str, Handler]]] = {}
+
+    def subscribe(self, event_class: Type[DomainEvent], consumer: str, handler: Handler):
+        consumers = self._consumers.setdefault(event_class.event_type, [])
+        if any(name == consumer for name, _ in consumers):
+            raise ValueError(f"Consumer '{consumer}' already subscribed to {event_class.event_type}")
+        consumers.append((consumer, handler))
+
+    def consumer(self, consumer: str, *event_classes: Type[DomainEvent]):
+        """Decorator form of subscribe"""
+        def decorator(handler: Handler) -> Handler:
+            for event_class in event_classes:
+                self.subscribe(event_class, consumer, handler)
+            return handler
+        return decorator
+
+    def consumers_for(self, event_type: str) -> List[Tuple[str, Handler]]:
+        return self._consumers.get(event_type, [])
+
+    async def deliver(self, domain_event: DomainEvent, skip: frozenset = frozenset()) -> Tuple[List[str], Dict[str, str]]:
+        """Run every consumer not in `skip`; returns (succeeded, {failed consumer: error})"""
+        succeeded: List[str] = []
+        failed: Dict[str, str] = {}
+        for name, handler in self.consumers_for(domain_event.event_type):
+            if name in skip:
+                continue
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    await handler(domain_event)
+                else:
+                    result = await run_in_threadpool(handler, domain_event)
+                    if inspect.isawaitable(result):
+                        await result
+                succeeded.append(name)
+            except Exception as e:
+                logger.warning(f"Consumer '{name}' failed on {domain_event.event_type} for user {domain_event.user_id}: {e}")
+                failed[name] = f"{type(e).__name__}: {e}"
+        return succeeded, failed
+
+# --- Dispatcher ---
+
+@dataclass
+class _ClaimedEvent:
+    id: int
+    event_type: str
+    payload_json: str
+    attempts: int
+    delivered_to: frozenset
+    created_at: datetime
+
+class OutboxDispatcher:
+    """Delivers committed outbox rows to the bus; safe to run in every worker"""
+
+    def __init__(self, bus: EventBus, session_factory: Optional[Callable[[], Session]] = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS,
+                 lease_seconds: int = OUTBOX_LEASE_SECONDS, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.bus = bus
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def configure(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def notify(self):
+        """Wake the dispatch loop; callable from any thread"""
+        if self._loop is not None and self._wake is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Outbox dispatcher started")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wake = None
+        self._loop = None
+        logger.info("Outbox dispatcher stopped")
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.dispatch_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}", exc_info=True)
+                processed = 0
+            if processed >= self.batch_size:
+                continue  # backlog: next batch right away
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def dispatch_pending(self) -> int:
+        """Claim and deliver one batch; returns the number of events handled"""
+        claimed = await run_in_threadpool(self._claim)
+        if not claimed:
+            return 0
+
+        delivered: List[int] = []
+        failures: Dict[int, Tuple[_ClaimedEvent, List[str], Dict[str, str]]] = {}
+        now = datetime.utcnow()
+        for row in claimed:
+            domain_event = self._decode(row)
+            if domain_event is None:
+                failures[row.id] = (row, [], {"decode": f"unknown event type {row.event_type}"})
+                continue
+            succeeded, failed = await self.bus.deliver(domain_event, skip=row.delivered_to)
+            if failed:
+                failures[row.id] = (row, succeeded, failed)
+            else:
+                delivered.append(row.id)
+                outbox_events_total.inc(event_type=row.event_type, outcome="delivered")
+                outbox_delivery_lag_seconds.observe((now - row.created_at).total_seconds(), event_type=row.event_type)
+
+        await run_in_threadpool(self._record_results, delivered, failures)
+        return len(claimed)
+
+    def _claim(self) -> List[_ClaimedEvent]:
+        """Lease up to batch_size due rows so other workers skip them while they are delivered"""
+        db = self._session()
+        try:
+            now = datetime.utcnow()
+            query = db.query(
+                OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.payload_json,
+                OutboxEvent.attempts, OutboxEvent.delivered_to_json, OutboxEvent.created_at
+            ).filter(
+                OutboxEvent.status == "pending",
+                OutboxEvent.available_at <= now
+            ).order_by(OutboxEvent.id).limit(self.batch_size)
+            if db.get_bind().dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            rows = query.all()
+            if rows:
+                db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_([row.id for row in rows]))
+                    .values(available_at=now + timedelta(seconds=self.lease_seconds))
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            return [
+                _ClaimedEvent(
+                    row.id, row.event_type, row.payload_json, row.attempts,
+                    frozenset(json.loads(row.delivered_to_json)) if row.delivered_to_json else frozenset(),
+                    row.created_at
+                )
+                for row in rows
+            ]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _record_results(self, delivered: List[int], failures: Dict[int, Tuple[_ClaimedEvent, List[str], Dict[str, str]]]):
+        db = self._session()
+        try:
+            now = datetime.utcnow()
+            if delivered:
+                db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_(delivered))
+                    .values(status="delivered", dispatched_at=now, last_error=None)
+                    .execution_options(synchronize_session=False)
+                )
+            for event_id, (row, succeeded, failed) in failures.items():
+                attempts = row.attempts + 1
+                dead = attempts >= self.max_attempts
+                backoff = min(OUTBOX_MAX_BACKOFF_SECONDS, 2 ** attempts)
+                db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id == event_id)
+                    .values(
+                        status="dead" if dead else "pending",
+                        attempts=attempts,
+                        available_at=now + timedelta(seconds=backoff),
+                        delivered_to_json=json.dumps(sorted(row.delivered_to.union(succeeded))),
+                        last_error=json.dumps(failed, ensure_ascii=False)
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                outbox_events_total.inc(event_type=row.event_type, outcome="dead" if dead else "retried")
+                if dead:
+                    logger.error(f"Outbox event {event_id} ({row.event_type}) gave up after {attempts} attempts: {failed}")
+            db.commit()
+        except Exception as e:
+            # Leases expire, so the batch is redelivered: at-least-once
+            db.rollback()
+            logger.error(f"Could not record outbox delivery results: {e}", exc_info=True)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _decode(row: _ClaimedEvent) -> Optional[DomainEvent]:
+        event_class = EVENT_TYPES.get(row.event_type)
+        if event_class is None:
+            return None
+        return event_class(**json.loads(row.payload_json))
+
+    def _session(self) -> Session:
+        if self.session_factory is None:
+            from dependencies import SessionLocal
+            self.session_factory = SessionLocal
+        return self.session_factory()
+
+# Global event bus and dispatcher instances
+event_bus = EventBus()
+outbox_dispatcher = OutboxDispatcher(event_bus)
@@ -7,7 +7,6 @@ Enhanced Badge System for Instagram Platform
 """
 
 import logging
-import json
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
@@ -21,6 +20,8 @@ from models import (
 # OrderStatus'ı models.<name> olarak kullanacağız
 
 from enhanced_notifications import NotificationService, NotificationType, NotificationPriority
+from badge_catalog import badge_catalog, CatalogBadge
+from domain_events import publish, BadgeAwarded
 
 logger = logging.getLogger(__name__)
 
@@ -352,29 +353,12 @@ class EnhancedBadgeSystem:
         ]
     
     async def initialize_badges(self) -> bool:
-        """Initialize all badge definitions in database"""
+        """Sync all badge definitions into the database and load the badge catalog"""
         db = self.db_session_factory()
         try:
-            created_count = 0
-            
-            for badge_def in self.badge_definitions:
-                # Check if badge already exists
-                existing_badge = db.query(Badge).filter(Badge.name == badge_def["name"]).first()
-                
-                if not existing_badge:
-                    badge = Badge(
-                        name=badge_def["name"],
-                        description=badge_def["description"],
-                        category=badge_def["category"],
-                        icon_url=badge_def["icon_url"],
-                        requirements_json=json.dumps(badge_def["requirements"]),
-                        is_active=True
-                    )
-                    db.add(badge)
-                    created_count += 1
-            
+            badge_count = badge_catalog.sync(db, self.badge_definitions)
             db.commit()
-            logger.info(f"Initialized {created_count} new badges")
+            logger.info(f"Badge catalog synced: {badge_count} badges")
             return True
             
         except Exception as e:
@@ -384,7 +368,7 @@ class EnhancedBadgeSystem:
         finally:
             db.close()
     
-    async def check_and_award_badges(self, user_id: int) -> List[Badge]:
+    async def check_and_award_badges(self, user_id: int) -> List[CatalogBadge]:
         """Check all badge requirements and award eligible badges"""
         db = self.db_session_factory()
         awarded_badges = []
@@ -395,30 +379,23 @@ class EnhancedBadgeSystem:
                 return awarded_badges
             
             # Get user's current badges
-            current_badge_ids = {ub.badge_id for ub in db.query(UserBadge).filter(
+            current_badge_ids = {badge_id for (badge_id,) in db.query(UserBadge.badge_id).filter(
                 UserBadge.user_id == user_id
-            ).all()}
+            )}
             
             # Check each badge definition
             for badge_def in self.badge_definitions:
-                badge = db.query(Badge).filter(Badge.name == badge_def["name"]).first()
+                badge = badge_catalog.get(badge_def["name"])
                 if not badge or badge.id in current_badge_ids:
                     continue
                 
-                # Check if user meets requirements
-                if await self._check_badge_requirements(user_id, badge_def["requirements"], db):
-                    # Award the badge
-                    user_badge = UserBadge(
-                        user_id=user_id,
-                        badge_id=badge.id,
-                        awarded_at=datetime.utcnow()
-                    )
-                    db.add(user_badge)
+                # Check if user meets requirements; the insert is a no-op if a concurrent check won
+                if await self._check_badge_requirements(user_id, badge_def["requirements"], db) \
+                        and badge_catalog.award_id(db, user_id, badge.id):
                     awarded_badges.append(badge)
-                    
-                    # Send notification
-                    await self._send_badge_notification(user_id, badge)
             
+            # Notifications go out through the outbox once the awards commit
+            publish(db, *(BadgeAwarded(user_id, badge.id, badge.name) for badge in awarded_badges))
             db.commit()
             
             if awarded_badges:
@@ -504,7 +481,7 @@ class EnhancedBadgeSystem:
             logger.error(f"Error checking requirements {requirements}: {e}")
             return False
     
-    async def _send_badge_notification(self, user_id: int, badge: Badge):
+    async def send_badge_notification(self, user_id: int, badge: CatalogBadge):
         """Send notification for new badge"""
         try:
             await self.notification_service.create_notification(
@@ -528,32 +505,13 @@ class EnhancedBadgeSystem:
         """Manually award a special badge"""
         db = self.db_session_factory()
         try:
-            # Find badge
-            badge = db.query(Badge).filter(Badge.name == badge_name).first()
+            # None when the badge does not exist or the user already has it
+            badge = badge_catalog.award(db, user_id, badge_name)
             if not badge:
                 return False
-            
-            # Check if user already has this badge
-            existing = db.query(UserBadge).filter(
-                UserBadge.user_id == user_id,
-                UserBadge.badge_id == badge.id
-            ).first()
-            
-            if existing:
-                return False
-            
-            # Award badge
-            user_badge = UserBadge(
-                user_id=user_id,
-                badge_id=badge.id,
-                awarded_at=datetime.utcnow()
-            )
-            db.add(user_badge)
+            publish(db, BadgeAwarded(user_id, badge.id, badge.name))
             db.commit()
             
-            # Send notification
-            await self._send_badge_notification(user_id, badge)
-            
             logger.info(f"Manually awarded badge '{badge_name}' to user {user_id}")
             return True
             
@@ -18,9 +18,10 @@ from instagrapi.exceptions import (
 
 from models import (
     User, InstagramProfile, InstagramCredential, InstagramPost, 
-    InstagramConnection, UserActivityLog
+    InstagramConnection
 )
 from dependencies import SessionLocal
+from audit_log import audit_log, AuditEvent
 
 # --- SCRAPING FALLBACK ---
 # Legacy scraper import removed; only modern scraper is used now
@@ -72,15 +73,15 @@ class EnhancedInstagramDataCollector:
             await self._save_posts_data(db, user_id, posts_data)
             logger.info(f"[ENHANCED_COLLECTOR] Posts data saved")
             
+            db.commit()
+            db.close()
+            
             # Log activity
-            await self._log_user_activity(db, user_id, "instagram_data_sync", {
+            self._log_user_activity(user_id, "instagram_data_sync", {
                 "profile_updated": bool(profile_data),
                 "posts_count": len(posts_data.get("posts", [])),
             })
             
-            db.commit()
-            db.close()
-            
             logger.info(f"[ENHANCED_COLLECTOR] Successfully completed data collection for user {user_id}")
             
             return {
@@ -294,15 +295,9 @@ class EnhancedInstagramDataCollector:
     
     # Removed _save_connections_data method as per requirement to not collect follower/following data
     
-    async def _log_user_activity(self, db: Session, user_id: int, activity_type: str, details: Dict[str, Any]):
-        """Log user activity"""
-        activity_log = UserActivityLog(
-            user_id=user_id,
-            activity_type=activity_type,
-            activity_details=json.dumps(details),
-            created_at=datetime.utcnow()
-        )
-        db.add(activity_log)
+    def _log_user_activity(self, user_id: int, activity_type: str, details: Dict[str, Any]):
+        """Log user activity through the batched audit writer"""
+        audit_log.record(AuditEvent.user_activity(user_id, activity_type, details))
     
     async def sync_user_instagram_data(self, user_id: int) -> Dict[str, Any]:
         """Main function to sync all Instagram data for a user"""
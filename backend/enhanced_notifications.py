@@ -1,11 +1,12 @@
 """
 Enhanced Real-time Notification System for Instagram Coin Platform
 Features:
-- WebSocket real-time notifications
-- Push notifications via Firebase
+- WebSocket real-time notifications (multi-device registry, heartbeats, idle timeout, connection cap)
+- Push notifications via Firebase (queued for the batched push delivery worker)
 - Notification categories and priorities
 - Real-time badge updates
 - Notification history management
+- Recipient preferences (cached bitmasks) applied before any payload is built
 """
 
 from fastapi import WebSocket, WebSocketDisconnect, Depends, HTTPException
@@ -13,12 +14,22 @@ from sqlalchemy.orm import Session
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Enum
 from datetime import datetime, timedelta
 from dataclasses import dataclass
-import json
+from collections import deque
 import asyncio
-from typing import Dict, List, Optional
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Deque, Dict, List, Optional, Union
 import logging
 from enum import Enum as PyEnum
 
+from metrics import websocket_events_total, notifications_suppressed_total
+from fast_json import PreSerialized
+from notification_preferences import notification_preferences, category_enabled, NotificationPref
+from push_delivery import push_worker, PushMessage
+
 logger = logging.getLogger(__name__)
 
 # Enhanced Notification Types
@@ -69,57 +80,244 @@ class NotificationStats:
     last_notification_time: Optional[datetime]
     notification_types: Dict[str, int]
 
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", 10000))
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", 5))
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", 25))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", 75))
+WS_OFFLINE_QUEUE_LIMIT = int(os.getenv("WS_OFFLINE_QUEUE_LIMIT", 50))
+
+# Close codes (RFC 6455 / IANA registry)
+WS_CLOSE_GOING_AWAY = 1001
+WS_CLOSE_UNSUPPORTED_DATA = 1003
+WS_CLOSE_POLICY_VIOLATION = 1008
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+PING_PAYLOAD = PreSerialized({"type": "ping"})
+PONG_PAYLOAD = PreSerialized({"type": "pong"})
+
+@dataclass(eq=False)
+class WebSocketConnection:
+    """One device's socket; a user may hold several"""
+    id: int
+    user_id: int
+    websocket: WebSocket
+    connected_at: float
+    last_seen: float
+    messages_sent: int = 0
+
+    def approx_size(self) -> int:
+        """Python-level bytes held for this connection: registry entry, WebSocket object and ASGI scope"""
+        websocket = self.websocket
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+            + sys.getsizeof(websocket) + sys.getsizeof(getattr(websocket, "__dict__", {}))
+            + sys.getsizeof(getattr(websocket, "scope", {}))
+        )
+
 class RealTimeNotificationManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
-        self.notification_queue: Dict[int, List[dict]] = {}
+    """
+    Single registry of notification sockets: user id -> connection id -> connection.
+
+    Sockets hold no DB session; callers authenticate before connect(). The
+    receive loop in serve() answers JSON pings, sends a ping every heartbeat
+    interval and closes sockets idle for longer than the idle timeout or
+    sending binary frames.
+    """
+
+    def __init__(self, max_connections: int = WS_MAX_CONNECTIONS,
+                 max_connections_per_user: int = WS_MAX_CONNECTIONS_PER_USER,
+                 heartbeat_seconds: float = WS_HEARTBEAT_SECONDS,
+                 idle_timeout_seconds: float = WS_IDLE_TIMEOUT_SECONDS,
+                 offline_queue_limit: int = WS_OFFLINE_QUEUE_LIMIT):
+        self.max_connections = max_connections
+        self.max_connections_per_user = max_connections_per_user
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.offline_queue_limit = offline_queue_limit
+        self.active_connections: Dict[int, Dict[int, WebSocketConnection]] = {}
+        self.notification_queue: Dict[int, Deque[PreSerialized]] = {}
+        self._connection_ids = itertools.count(1)
+        self._connection_count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
     
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Connect a user to real-time notifications"""
+    async def connect(self, websocket: WebSocket, user_id: int) -> Optional[WebSocketConnection]:
+        """Accept and register an authenticated socket; None when the server is at capacity"""
+        if self._connection_count >= self.max_connections:
+            websocket_events_total.inc(event="rejected")
+            logger.warning(f"WebSocket limit reached ({self.max_connections}); rejecting user {user_id}")
+            await websocket.close(code=WS_CLOSE_TRY_AGAIN_LATER)
+            return None
+
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected to real-time notifications")
+        self._loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        connection = WebSocketConnection(
+            id=next(self._connection_ids), user_id=user_id, websocket=websocket, connected_at=now, last_seen=now
+        )
+        devices = self.active_connections.setdefault(user_id, {})
+        devices[connection.id] = connection
+        self._connection_count += 1
+        websocket_events_total.inc(event="connect")
+        logger.info(f"User {user_id} connected to real-time notifications ({len(devices)} device(s))")
+
+        # Too many devices: the oldest socket is most likely a stale one
+        while len(devices) > self.max_connections_per_user:
+            oldest = devices[min(devices)]
+            self.disconnect(oldest)
+            await self._close(oldest, WS_CLOSE_POLICY_VIOLATION)
         
         # Send any queued notifications
-        if user_id in self.notification_queue:
-            for notification in self.notification_queue[user_id]:
-                await self.send_notification_to_user(user_id, notification)
-            del self.notification_queue[user_id]
+        queued = self.notification_queue.pop(user_id, None)
+        if queued:
+            for payload in queued:
+                await self.send_to_connection(connection, payload)
+        return connection
     
-    def disconnect(self, user_id: int):
-        """Disconnect a user from real-time notifications"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected from real-time notifications")
-    
-    async def send_notification_to_user(self, user_id: int, notification: dict):
-        """Send notification to specific user"""
-        if user_id in self.active_connections:
+    def disconnect(self, connection: WebSocketConnection):
+        """Remove a socket from the registry (idempotent)"""
+        devices = self.active_connections.get(connection.user_id)
+        if devices is None or devices.pop(connection.id, None) is None:
+            return
+        if not devices:
+            del self.active_connections[connection.user_id]
+        self._connection_count -= 1
+        websocket_events_total.inc(event="disconnect")
+        logger.info(f"User {connection.user_id} disconnected from real-time notifications")
+
+    async def serve(self, connection: WebSocketConnection):
+        """Receive loop with heartbeats; returns once the client is gone or timed out"""
+        websocket = connection.websocket
+        while True:
             try:
-                await self.active_connections[user_id].send_text(json.dumps(notification))
-                return True
-            except Exception as e:
-                logger.error(f"Error sending notification to user {user_id}: {e}")
-                self.disconnect(user_id)
-                return False
-        else:
-            # Queue notification for when user connects
-            if user_id not in self.notification_queue:
-                self.notification_queue[user_id] = []
-            self.notification_queue[user_id].append(notification)
+                message = await asyncio.wait_for(websocket.receive(), timeout=self.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if time.monotonic() - connection.last_seen >= self.idle_timeout_seconds:
+                    websocket_events_total.inc(event="idle_timeout")
+                    await self._close(connection, WS_CLOSE_GOING_AWAY)
+                    return
+                if not await self.send_to_connection(connection, PING_PAYLOAD):
+                    return
+                continue
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            if message["type"] == "websocket.disconnect":
+                return
+
+            text = message.get("text")
+            if text is None:
+                # The protocol is JSON text; binary frames are refused
+                websocket_events_total.inc(event="unsupported_frame")
+                await self._close(connection, WS_CLOSE_UNSUPPORTED_DATA)
+                return
+
+            # Any client frame counts as liveness; "pong" replies need no answer
+            connection.last_seen = time.monotonic()
+            try:
+                payload = json.loads(text)
+            except ValueError:
+                payload = text
+            message_type = payload.get("type") if isinstance(payload, dict) else payload
+            if message_type == "ping":
+                await self.send_to_connection(connection, PONG_PAYLOAD)
+            elif message_type != "pong":
+                logger.debug(f"Received message from user {connection.user_id}: {text[:200]}")
+
+    async def send_to_connection(self, connection: WebSocketConnection, notification: Union[dict, PreSerialized]) -> bool:
+        payload = PreSerialized(notification)
+        try:
+            await connection.websocket.send_text(payload.text)
+        except Exception as e:
+            logger.warning(f"Error sending to user {connection.user_id} socket {connection.id}: {e}")
+            self.disconnect(connection)
             return False
+        connection.messages_sent += 1
+        websocket_events_total.inc(event="send")
+        return True
+    
+    async def send_notification_to_user(self, user_id: int, notification: Union[dict, PreSerialized],
+                                        queue_if_offline: bool = True) -> bool:
+        """Send to every device of a user; queued in serialized form while they are offline"""
+        payload = PreSerialized(notification)
+        devices = self.active_connections.get(user_id)
+        if devices:
+            results = [await self.send_to_connection(connection, payload) for connection in list(devices.values())]
+            return any(results)
+        if queue_if_offline:
+            # Queue notification for when user connects; only the most recent ones are kept
+            queue = self.notification_queue.get(user_id)
+            if queue is None:
+                queue = self.notification_queue[user_id] = deque(maxlen=self.offline_queue_limit)
+            queue.append(payload)
+            websocket_events_total.inc(event="queued")
+        return False
+
+    def push_to_user(self, user_id: int, notification: dict):
+        """Fire-and-forget live update (no offline queueing), callable from sync code and worker threads"""
+        if user_id not in self.active_connections:
+            return
+        coroutine = self.send_notification_to_user(user_id, notification, queue_if_offline=False)
+        try:
+            asyncio.get_running_loop().create_task(coroutine)
+        except RuntimeError:
+            if self._loop is None or self._loop.is_closed():
+                coroutine.close()
+                return
+            asyncio.run_coroutine_threadsafe(coroutine, self._loop)
     
     async def broadcast_notification(self, notification: dict, user_ids: List[int] = None):
         """Broadcast notification to multiple users or all connected users"""
         target_users = user_ids if user_ids else list(self.active_connections.keys())
+        payload = PreSerialized(notification)  # encoded once for every recipient
         
         for user_id in target_users:
-            await self.send_notification_to_user(user_id, notification)
+            await self.send_notification_to_user(user_id, payload)
     
+    def is_connected(self, user_id: int) -> bool:
+        return bool(self.active_connections.get(user_id))
+
     def get_connected_users(self) -> List[int]:
         """Get list of currently connected user IDs"""
         return list(self.active_connections.keys())
 
+    def connection_count(self) -> int:
+        return self._connection_count
+
+    def queued_count(self) -> int:
+        return sum(len(queue) for queue in list(self.notification_queue.values()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        connections = [connection for devices in list(self.active_connections.values()) for connection in devices.values()]
+        connection_bytes = sum(connection.approx_size() for connection in connections)
+        queued_bytes = sum(len(payload) for queue in list(self.notification_queue.values()) for payload in queue)
+        now = time.monotonic()
+        return {
+            "connections": len(connections),
+            "connected_users": len(self.active_connections),
+            "max_devices_per_user": max((len(devices) for devices in self.active_connections.values()), default=0),
+            "limits": {
+                "max_connections": self.max_connections,
+                "max_connections_per_user": self.max_connections_per_user,
+                "heartbeat_seconds": self.heartbeat_seconds,
+                "idle_timeout_seconds": self.idle_timeout_seconds,
+            },
+            "oldest_connection_seconds": round(max((now - c.connected_at for c in connections), default=0), 1),
+            "memory": {
+                "approx_bytes_per_connection": round(connection_bytes / len(connections)) if connections else 0,
+                "approx_connection_bytes": connection_bytes,
+                "offline_queue_bytes": queued_bytes,
+            },
+            "offline_queue": {
+                "users": len(self.notification_queue),
+                "notifications": self.queued_count(),
+            },
+        }
+
+    async def _close(self, connection: WebSocketConnection, code: int):
+        try:
+            await connection.websocket.close(code=code)
+        except Exception:
+            pass  # already closed by the peer
+
 # Global notification manager instance
 notification_manager = RealTimeNotificationManager()
 
@@ -138,11 +336,76 @@ class NotificationService:
         data: Optional[dict] = None,
         send_push: bool = True,
         send_realtime: bool = True
-    ) -> dict:
-        """Create and send a notification"""
+    ) -> Optional[dict]:
+        """Create and send a notification; None when the user's preferences mute its category"""
+        mask = await notification_preferences.aget(user_id)
+        if not category_enabled(mask, notification_type):
+            notifications_suppressed_total.inc(type=notification_type.value)
+            return None
+        send_push = send_push and bool(mask & NotificationPref.PUSH)
+        notification_data = self._build_notification_data(user_id, title, message, notification_type, priority, data)
+        
+        # Store in database (assuming enhanced notification model)
+        try:
+            # Here you would insert into your enhanced notification table
+            # notification_data["id"] = inserted_notification.id
+            pass
+        except Exception as e:
+            logger.error(f"Error storing notification in database: {e}")
+        
+        await self._deliver_notification(notification_data, send_push, send_realtime)
+        return notification_data
+    
+    async def create_notification_batch(
+        self,
+        notifications: List[dict],
+        notification_type: NotificationType = NotificationType.SYSTEM_UPDATE,
+        priority: NotificationPriority = NotificationPriority.MEDIUM,
+        send_push: bool = True,
+        send_realtime: bool = True,
+        batch_size: int = 100
+    ) -> List[dict]:
+        """Create and deliver many notifications concurrently, in bounded batches.
+        
+        Each item needs user_id, title and message; data is optional. Preferences of
+        the whole audience are loaded up front and muted recipients are skipped.
+        """
+        masks = await notification_preferences.aload_many(item["user_id"] for item in notifications)
+        created = []
+        for item in notifications:
+            if not category_enabled(masks[item["user_id"]], notification_type):
+                notifications_suppressed_total.inc(type=notification_type.value)
+                continue
+            created.append(self._build_notification_data(
+                item["user_id"], item["title"], item["message"],
+                notification_type, priority, item.get("data")
+            ))
+        
+        for start in range(0, len(created), batch_size):
+            chunk = created[start:start + batch_size]
+            results = await asyncio.gather(
+                *(
+                    self._deliver_notification(n, send_push and bool(masks[n["user_id"]] & NotificationPref.PUSH), send_realtime)
+                    for n in chunk
+                ),
+                return_exceptions=True
+            )
+            for notification_data, result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error delivering batched notification to user {notification_data['user_id']}: {result}")
         
-        # Create notification object
-        notification_data = {
+        return created
+    
+    def _build_notification_data(
+        self,
+        user_id: int,
+        title: str,
+        message: str,
+        notification_type: NotificationType,
+        priority: NotificationPriority,
+        data: Optional[dict] = None
+    ) -> dict:
+        return {
             "id": None,  # Will be set after DB insert
             "user_id": user_id,
             "title": title,
@@ -154,39 +417,48 @@ class NotificationService:
             "created_at": datetime.utcnow().isoformat(),
             "expires_at": (datetime.utcnow() + timedelta(days=30)).isoformat()
         }
-        
-        # Store in database (assuming enhanced notification model)
-        try:
-            # Here you would insert into your enhanced notification table
-            # notification_data["id"] = inserted_notification.id
-            pass
-        except Exception as e:
-            logger.error(f"Error storing notification in database: {e}")
+    
+    def build_realtime_payload(
+        self,
+        user_id: int,
+        title: str,
+        message: str,
+        notification_type: NotificationType = NotificationType.SYSTEM_UPDATE,
+        priority: NotificationPriority = NotificationPriority.MEDIUM,
+        data: Optional[dict] = None
+    ) -> dict:
+        """Socket payload for a notification, for callers addressing one connection directly"""
+        return self._realtime_payload(
+            self._build_notification_data(user_id, title, message, notification_type, priority, data)
+        )
+
+    @staticmethod
+    def _realtime_payload(notification_data: dict) -> dict:
+        return {
+            "type": "notification",
+            "notification": notification_data,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    async def _deliver_notification(self, notification_data: dict, send_push: bool, send_realtime: bool):
+        user_id = notification_data["user_id"]
         
         # Send real-time notification
         if send_realtime:
-            realtime_payload = {
-                "type": "notification",
-                "notification": notification_data,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            await notification_manager.send_notification_to_user(user_id, realtime_payload)
+            await notification_manager.send_notification_to_user(user_id, self._realtime_payload(notification_data))
         
         # Send push notification (if enabled and user has FCM token)
         if send_push:
-            await self._send_push_notification(user_id, title, message, notification_data)
-        
-        return notification_data
+            await self._send_push_notification(user_id, notification_data["title"], notification_data["message"], notification_data)
     
     async def _send_push_notification(self, user_id: int, title: str, message: str, data: dict):
-        """Send push notification via Firebase"""
+        """Queue a push notification for the push delivery worker (tokens are resolved there)"""
         try:
-            # Get user's FCM token from database
-            # user = self.db.query(User).filter(User.id == user_id).first()
-            # if user and user.fcm_token:
-            #     # Send via Firebase
-            #     pass
-            logger.info(f"Push notification would be sent to user {user_id}: {title}")
+            push_worker.enqueue(PushMessage(user_id, title, message, {
+                "type": data["type"],
+                "priority": data["priority"],
+                "data": json.dumps(data.get("data") or {}, sort_keys=True, default=str),
+            }))
         except Exception as e:
             logger.error(f"Error sending push notification: {e}")
     
@@ -229,16 +501,13 @@ class NotificationService:
             # Send to all users (you'd get this from database)
             user_ids = []  # Get all user IDs from database
         
-        for user_id in user_ids:
-            await self.create_notification(
-                user_id=user_id,
-                title=title,
-                message=message,
-                notification_type=NotificationType.SYSTEM_UPDATE,
-                priority=NotificationPriority.URGENT,
-                send_push=True,
-                send_realtime=True
-            )
+        await self.create_notification_batch(
+            [{"user_id": user_id, "title": title, "message": message} for user_id in user_ids],
+            notification_type=NotificationType.SYSTEM_UPDATE,
+            priority=NotificationPriority.URGENT,
+            send_push=True,
+            send_realtime=True
+        )
     
     def create_notification_sync(
         self,
@@ -0,0 +1,176 @@
+"""
+Domain Event Consumers
+- notifications: user-facing notifications for rewards, transfers, referrals, withdrawals and badges
+- badges: badge and social achievement checks after coin changes
+- leaderboard: keeps the scores of already ranked users current between leaderboard rebuilds
+- stats: keeps UserStatistics earnings (earning categories only) and streak current between
+  /statistics recalculations
+- Delivery is at-least-once, so every consumer tolerates seeing an event twice: notifications may
+  repeat, scores and earnings are recomputed from the ledger rather than incremented
+"""
+
+from sqlalchemy import update, select, case, func
+from datetime import datetime, timedelta
+import logging
+
+from models import User, Leaderboard, UserStatistics, CoinTransaction, CoinTransactionType, CoinTransactionCategory
+from coin_ledger import EARNING_CATEGORIES
+from badge_catalog import badge_catalog, CatalogBadge
+from enhanced_notifications import NotificationType, NotificationPriority
+from domain_events import (
+    EventBus, CoinEarned, RewardClaimed, BadgeAwarded, CoinsTransferred, ReferralApplied, ReferralBonusGranted,
+    WithdrawalRequested
+)
+
+logger = logging.getLogger(__name__)
+
+# Leaderboard period -> scoring window, as rebuilt by BackgroundJobManager.update_leaderboards
+LEADERBOARD_WINDOWS = {"weekly": timedelta(days=7), "monthly": timedelta(days=30)}
+
+def register_event_consumers(bus: EventBus, session_factory, notification_service, badge_system,
+                             social_manager, coin_security):
+    """Subscribe the application's consumers; services may be lazy proxies, nothing is built here"""
+
+    # --- notifications ---
+
+    @bus.consumer("notifications", RewardClaimed)
+    async def notify_reward(event: RewardClaimed):
+        await notification_service.create_notification(
+            user_id=event.user_id,
+            title="Günlük Ödül Alındı! 💎",
+            message=f"{event.amount} coin kazandınız! Seri: {event.streak} gün",
+            notification_type=NotificationType.DAILY_LOGIN,
+        )
+
+    @bus.consumer("notifications", CoinsTransferred)
+    async def notify_transfer(event: CoinsTransferred):
+        transfer_message = f" - Mesaj: {event.message}" if event.message else ""
+        await notification_service.create_notification(
+            user_id=event.recipient_id,
+            title="Coin Transferi Alındı! 💸",
+            message=f"{event.sender_username} size {event.amount} coin gönderdi{transfer_message}",
+            notification_type=NotificationType.COIN_TRANSFER_RECEIVED,
+            priority=NotificationPriority.HIGH,
+            data={"amount": event.amount, "sender_username": event.sender_username, "message": event.message}
+        )
+        await notification_service.create_notification(
+            user_id=event.user_id,
+            title="Coin Transferi Gönderildi! 📤",
+            message=f"{event.recipient_username} kullanıcısına {event.amount} coin gönderildi (Fee: {event.fee} coin)",
+            notification_type=NotificationType.COIN_TRANSFER_SENT,
+            priority=NotificationPriority.MEDIUM,
+            data={"amount": event.amount, "recipient_username": event.recipient_username, "fee": event.fee}
+        )
+
+    @bus.consumer("notifications", ReferralApplied)
+    async def notify_referral(event: ReferralApplied):
+        await notification_service.create_notification(
+            user_id=event.user_id,
+            title="Referans Bonusu Kazandınız! 🎁",
+            message=f"Referans kodunu kullandığınız için {event.bonus} coin kazandınız!",
+            notification_type=NotificationType.REFERRAL_BONUS,
+            priority=NotificationPriority.HIGH,
+            data={"bonus_amount": event.bonus, "referrer_username": event.referrer_username}
+        )
+        await notification_service.create_notification(
+            user_id=event.referrer_id,
+            title="Yeni Referans! 👥",
+            message=f"{event.username} sizin referans kodunuzu kullandı!",
+            notification_type=NotificationType.NEW_REFERRAL,
+            priority=NotificationPriority.MEDIUM,
+            data={"referred_username": event.username}
+        )
+
+    @bus.consumer("notifications", ReferralBonusGranted)
+    async def notify_referral_bonus(event: ReferralBonusGranted):
+        await notification_service.create_notification(
+            user_id=event.user_id,
+            title="Referans Bonusu Kazandınız! 💰",
+            message=f"{event.referred_username} {event.completed_tasks} görev tamamladı! {event.bonus} coin kazandınız!",
+            notification_type=NotificationType.REFERRAL_BONUS,
+            priority=NotificationPriority.HIGH,
+            data={"bonus_amount": event.bonus, "referred_username": event.referred_username}
+        )
+
+    @bus.consumer("notifications", WithdrawalRequested)
+    async def notify_withdrawal(event: WithdrawalRequested):
+        locked_until = datetime.fromisoformat(event.locked_until) if event.locked_until else None
+        if event.status == "locked":
+            await notification_service.create_notification(
+                user_id=event.user_id,
+                title="Çekim Talebi Güvenlik İncelemesinde 🔒",
+                message=f"Güvenlik nedeniyle çekim talebiniz incelemeye alındı. {locked_until.strftime('%d.%m.%Y %H:%M')} tarihine kadar bekleyiniz.",
+                notification_type=NotificationType.WITHDRAWAL_LOCKED,
+                priority=NotificationPriority.HIGH,
+                data={"amount": event.amount, "fraud_score": event.fraud_score}
+            )
+            await coin_security.notify_admins_suspicious_activity(event.user_id, event.fraud_score, event.amount)
+        else:
+            await notification_service.create_notification(
+                user_id=event.user_id,
+                title="Çekim Talebi Alındı ⏳",
+                message=f"{event.amount} coin çekim talebiniz alındı. 48 saat içinde işleme alınacak.",
+                notification_type=NotificationType.WITHDRAWAL_PENDING,
+                priority=NotificationPriority.MEDIUM,
+                data={"amount": event.amount, "unlock_time": event.locked_until}
+            )
+
+    @bus.consumer("notifications", BadgeAwarded)
+    async def notify_badge(event: BadgeAwarded):
+        badge = badge_catalog.get(event.badge_name) or CatalogBadge(event.badge_id, event.badge_name, None, None, None)
+        await badge_system.send_badge_notification(event.user_id, badge)
+
+    # --- badges ---
+
+    @bus.consumer("badges", RewardClaimed, CoinEarned)
+    async def check_badges(event):
+        await badge_system.check_and_award_badges(event.user_id)
+
+    @bus.consumer("badges", CoinsTransferred)
+    async def check_transfer_badges(event: CoinsTransferred):
+        await social_manager.award_transfer_achievements(event.user_id)
+
+    @bus.consumer("badges", ReferralApplied)
+    async def check_referral_badges(event: ReferralApplied):
+        await social_manager.award_referral_achievements(event.referrer_id)
+
+    # --- leaderboard / stats ---
+
+    @bus.consumer("leaderboard", RewardClaimed, CoinEarned)
+    def refresh_leaderboard_score(event):
+        # Only users already ranked have rows; ranks are reassigned by the periodic rebuild
+        now = datetime.utcnow()
+        window_start = case(
+            *((Leaderboard.period == period, now - window) for period, window in LEADERBOARD_WINDOWS.items()),
+            else_=now - LEADERBOARD_WINDOWS["weekly"]
+        )
+        earned = select(func.coalesce(func.sum(CoinTransaction.amount), 0)).where(
+            CoinTransaction.user_id == event.user_id,
+            CoinTransaction.type == CoinTransactionType.earn,
+            CoinTransaction.created_at >= window_start
+        ).scalar_subquery()
+        _apply(session_factory, update(Leaderboard).where(Leaderboard.user_id == event.user_id).values(score=earned))
+
+    @bus.consumer("stats", RewardClaimed, CoinEarned)
+    def refresh_user_statistics(event):
+        if isinstance(event, CoinEarned) and CoinTransactionCategory(event.category) not in EARNING_CATEGORIES:
+            return
+        earnings = select(func.coalesce(func.sum(CoinTransaction.amount), 0)).where(
+            CoinTransaction.user_id == event.user_id,
+            CoinTransaction.category.in_(EARNING_CATEGORIES)
+        ).scalar_subquery()
+        streak = select(func.coalesce(User.daily_reward_streak, 0)).where(User.id == event.user_id).scalar_subquery()
+        _apply(session_factory, update(UserStatistics).where(UserStatistics.user_id == event.user_id).values(
+            total_earnings=earnings, daily_streak=streak
+        ))
+
+def _apply(session_factory, stmt):
+    db = session_factory()
+    try:
+        db.execute(stmt.execution_options(synchronize_session=False))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,79 @@
+"""
+Fast JSON Serialization
+- orjson-backed encoding with a stdlib `json` fallback (orjson missing or JSON_BACKEND=stdlib)
+- Output matches FastAPI's JSONResponse: compact separators, UTF-8, datetimes as ISO 8601,
+  enums by value, Pydantic models dumped in JSON mode
+- FastJSONResponse: drop-in JSONResponse subclass used as the app's default response class
+- Pre-serialized payloads: encode a broadcast once, send the same text to every socket
+"""
+
+import json
+import logging
+import os
+from decimal import Decimal
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKEND = "orjson" if orjson is not None and os.getenv("JSON_BACKEND", "orjson").lower() != "stdlib" else "stdlib"
+
+def _default(obj: Any) -> Any:
+    """Types orjson does not encode natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return jsonable_encoder(obj)
+
+if JSON_BACKEND == "orjson":
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(
+            jsonable_encoder(content),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+def dumps_text(content: Any) -> str:
+    """Serialized form for WebSocket send_text"""
+    return dumps(content).decode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast encoder.
+
+    Endpoints returning one directly also skip FastAPI's response_model
+    validation and jsonable_encoder pass, so use that only for data the
+    endpoint built itself.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class PreSerialized:
+    """A payload encoded once and sent as-is to any number of sockets"""
+    __slots__ = ("text",)
+
+    def __init__(self, content: Any):
+        self.text = content.text if isinstance(content, PreSerialized) else dumps_text(content)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+logger.debug(f"JSON backend: {JSON_BACKEND}")
@@ -19,6 +19,7 @@ from models import (
     Referral, UserBadge, UserSocial, NotificationSetting
 )
 from enhanced_notifications import NotificationService, NotificationType, NotificationPriority
+from notification_preferences import notification_preferences
 import zipfile
 import io
 import csv
@@ -451,6 +452,7 @@ class GDPRComplianceManager:
                 gdpr_request.processed_at = datetime.utcnow()
             
             db.commit()
+            notification_preferences.invalidate(user_id)
             
             logger.info(f"User data anonymized for user ID {user_id} (formerly {original_username})")
             
@@ -530,6 +532,7 @@ class GDPRComplianceManager:
                     updated_settings[setting_name] = value
             
             db.commit()
+            notification_preferences.invalidate(user_id)
             
             # Notify user of privacy settings update
             await self.notification_service.create_notification(
@@ -0,0 +1,188 @@
+"""
+Idempotency Keys
+- `Idempotency-Key` header support for coin-mutating endpoints
+- Compact in-process store: 16-byte key digest -> request fingerprint, status and rendered body, with TTL expiry
+- In-flight deduplication: concurrent duplicates wait for the first execution and replay its result
+- Replays never reach the endpoint, so validation and ledger writes run once per key
+- Same key with a different request body is rejected (422); 5xx outcomes are not stored
+"""
+
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from response_cache import bind_request, render_json
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAY_HEADER = "Idempotent-Replayed"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 100_000
+MAX_KEY_LENGTH = 255
+
+@dataclass(frozen=True, slots=True)
+class StoredOutcome:
+    fingerprint: bytes
+    status_code: int
+    body: bytes
+    expires_at: float
+
+    def to_response(self) -> Response:
+        return Response(
+            content=self.body,
+            status_code=self.status_code,
+            media_type="application/json",
+            headers={REPLAY_HEADER: "true"},
+        )
+
+class IdempotencyStore:
+    """Outcomes keyed by a 16-byte digest of (route, user, key); entries expire in insertion order"""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._outcomes: "OrderedDict[bytes, StoredOutcome]" = OrderedDict()
+        self._in_flight: Dict[bytes, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"executed": 0, "replayed": 0, "waited": 0, "mismatched": 0}
+
+    @staticmethod
+    def digest(route: str, user_id: Any, key: str) -> bytes:
+        return hashlib.blake2b(f"{route}\x00{user_id}\x00{key}".encode("utf-8"), digest_size=16).digest()
+
+    def get(self, digest: bytes) -> Optional[StoredOutcome]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._outcomes.get(digest)
+
+    def put(self, digest: bytes, fingerprint: bytes, status_code: int, body: bytes):
+        outcome = StoredOutcome(
+            fingerprint=fingerprint,
+            status_code=status_code,
+            body=body,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        with self._lock:
+            self._outcomes.pop(digest, None)
+            self._outcomes[digest] = outcome
+            while len(self._outcomes) > self.max_entries:
+                self._outcomes.popitem(last=False)
+
+    def claim(self, digest: bytes) -> Optional[asyncio.Future]:
+        """Register the caller as the executor for a key; returns the running execution's future otherwise"""
+        with self._lock:
+            running = self._in_flight.get(digest)
+            if running is None:
+                self._in_flight[digest] = asyncio.get_running_loop().create_future()
+            return running
+
+    def release(self, digest: bytes):
+        with self._lock:
+            future = self._in_flight.pop(digest, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def clear(self):
+        with self._lock:
+            self._outcomes.clear()
+
+    def count(self, outcome: str):
+        """Bump a stats counter; requests on the loop and in the threadpool share the store"""
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _expire(self, now: float):
+        while self._outcomes:
+            oldest = next(iter(self._outcomes.values()))
+            if oldest.expires_at > now:
+                break
+            self._outcomes.popitem(last=False)
+
+# Global idempotency store
+idempotency_store = IdempotencyStore()
+
+def idempotent(route: str, user_param: str = "current_user", store: Optional[IdempotencyStore] = None):
+    """
+    Make a JSON endpoint safe to retry under an `Idempotency-Key` header.
+
+    Requests without the header run normally. The first request for a key
+    runs the endpoint and stores its outcome (2xx/4xx, including HTTPException
+    responses); later requests with the same key and body get that outcome
+    back with `Idempotent-Replayed: true`, and duplicates arriving while it
+    runs wait for it instead of executing.
+    """
+    def decorator(func: Callable):
+        is_coroutine = asyncio.iscoroutinefunction(func)
+
+        async def execute(args, kwargs) -> Response:
+            try:
+                if is_coroutine:
+                    result = await func(*args, **kwargs)
+                else:
+                    result = await run_in_threadpool(func, *args, **kwargs)
+            except HTTPException as e:
+                return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            if isinstance(result, Response):
+                return result
+            return Response(content=render_json(result), media_type="application/json")
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            idempotency = store or idempotency_store
+            request = take_request(kwargs)
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                if is_coroutine:
+                    return await func(*args, **kwargs)
+                return await run_in_threadpool(func, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                raise HTTPException(status_code=400, detail="Idempotency-Key çok uzun")
+
+            digest = idempotency.digest(route, kwargs[user_param].id, key)
+            fingerprint = hashlib.blake2b(
+                request.url.query.encode("utf-8") + b"\x00" + await request.body(), digest_size=16
+            ).digest()
+
+            while True:
+                outcome = idempotency.get(digest)
+                if outcome is not None:
+                    if outcome.fingerprint != fingerprint:
+                        idempotency.count("mismatched")
+                        raise HTTPException(
+                            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Idempotency-Key farklı bir istek için kullanılmış"
+                        )
+                    idempotency.count("replayed")
+                    return outcome.to_response()
+
+                running = idempotency.claim(digest)
+                if running is None:
+                    break
+                # A duplicate is executing; wait for it, then replay (or take over if it stored nothing)
+                idempotency.count("waited")
+                await asyncio.shield(running)
+
+            try:
+                response = await execute(args, kwargs)
+                idempotency.count("executed")
+                if response.status_code < 500 and response.media_type == "application/json":
+                    idempotency.put(digest, fingerprint, response.status_code, response.body)
+                return response
+            finally:
+                idempotency.release(digest)
+
+        take_request = bind_request(func, wrapper)
+        return wrapper
+
+    return decorator
@@ -6,15 +6,18 @@ Bu dosya app.py'ye import edilecek
 from fastapi import APIRouter, Depends, HTTPException, Body, Query
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import func, select
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import logging
 
 # Import models and dependencies - Avoid circular import
-from models import User, Order, Task, TaskStatus, OrderType, CoinTransaction, CoinTransactionType, DailyReward, Leaderboard
+from models import User, Order, OrderType, DailyReward, Leaderboard
 # Import dependencies - these will be injected when including the router
 from dependencies import get_current_user, get_db
+from daily_rewards import DailyRewardService, quote_reward
+from singleflight import SingleFlight
+from user_aggregates import user_aggregates
 
 logger = logging.getLogger(__name__)
 
@@ -236,6 +239,15 @@ async def get_account_health(
 # Social router for leaderboard fixes
 social_router = APIRouter(prefix="/social", tags=["Social Features"])
 
+rank_flight = SingleFlight("social_rank")
+
+def _rank_counts(db: Session, coins: int):
+    higher_users, total_users = db.execute(select(
+        select(func.count(User.id)).where(User.coin_balance > coins).scalar_subquery(),
+        select(func.count(User.id)).scalar_subquery(),
+    )).one()
+    return int(higher_users or 0), int(total_users or 0)
+
 @social_router.get("/my-rank")
 async def get_my_rank(
     current_user: User = Depends(get_current_user),
@@ -246,19 +258,16 @@ async def get_my_rank(
         # Get user's total coin balance
         user_coins = current_user.coin_balance or 0
         
-        # Count users with higher coin balance (rank calculation)
-        higher_users = db.query(User).filter(User.coin_balance > user_coins).count()
+        # Users with a higher coin balance (rank) and all users (percentage) in one statement;
+        # concurrent requests at the same balance share it
+        higher_users, total_users = await rank_flight.do_async(
+            user_coins, lambda: _rank_counts(db, user_coins)
+        )
         current_rank = higher_users + 1
-        
-        # Get total users for percentage calculation
-        total_users = db.query(User).count()
         rank_percentage = (current_rank / total_users * 100) if total_users > 0 else 0
         
         # Get user's completed tasks count
-        completed_tasks = db.query(Task).filter(
-            Task.assigned_user_id == current_user.id,
-            Task.status == TaskStatus.completed
-        ).count()
+        completed_tasks = (await user_aggregates.aget(current_user.id)).completed_tasks
         
         # Determine user level based on completed tasks
         if completed_tasks >= 100:
@@ -377,73 +386,22 @@ async def claim_daily_reward_extended(
 ):
     """Enhanced daily reward claiming"""
     try:
-        today = datetime.utcnow().date()
-        
-        # Check if already claimed today
-        existing_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id,
-            DailyReward.claimed_date == today
-        ).first()
-        
-        if existing_reward:
+        result = DailyRewardService(db).claim(current_user)
+        if not result.claimed:
             return {
                 "success": False,
                 "message": "Bugün zaten günlük ödül aldınız!",
-                "next_claim": (datetime.combine(today, datetime.min.time()) + timedelta(days=1)).isoformat()
+                "next_claim": result.next_claim.isoformat()
             }
         
-        # Calculate consecutive days and reward
-        yesterday = today - timedelta(days=1)
-        yesterday_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id,
-            DailyReward.claimed_date == yesterday
-        ).first()
-        
-        consecutive_days = (yesterday_reward.consecutive_days + 1) if yesterday_reward else 1
-        
-        # Progressive reward system
-        base_reward = 50
-        bonus_multiplier = min(consecutive_days, 7)  # Max 7x bonus
-        total_reward = base_reward + (bonus_multiplier * 10)
-        
-        # Special weekly bonus
-        if consecutive_days == 7:
-            total_reward += 200  # Weekly bonus
-        
-        # Create reward record
-        daily_reward = DailyReward(
-            user_id=current_user.id,
-            coin_amount=total_reward,
-            consecutive_days=consecutive_days,
-            claimed_date=today
-        )
-        db.add(daily_reward)
-        
-        # Update user balance
-        current_user.coin_balance = (current_user.coin_balance or 0) + total_reward
-        
-        # Create transaction record
-        transaction = CoinTransaction(
-            user_id=current_user.id,
-            amount=total_reward,
-            type=CoinTransactionType.earn,
-            note=f"Günlük ödül - {consecutive_days}. gün (Bonus: {bonus_multiplier}x)"
-        )
-        db.add(transaction)
-        
-        db.commit()
-        
+        reward = result.reward
         return {
             "success": True,
-            "message": f"Günlük ödül alındı! +{total_reward} coin",
-            "reward_amount": total_reward,
-            "consecutive_days": consecutive_days,
-            "next_claim": (datetime.combine(today, datetime.min.time()) + timedelta(days=1)).isoformat(),
-            "bonus_info": {
-                "base_reward": base_reward,
-                "bonus_multiplier": bonus_multiplier,
-                "weekly_bonus": 200 if consecutive_days == 7 else 0
-            }
+            "message": f"Günlük ödül alındı! +{reward.total} coin",
+            "reward_amount": reward.total,
+            "consecutive_days": reward.consecutive_days,
+            "next_claim": result.next_claim.isoformat(),
+            "bonus_info": reward.bonus_info()
         }
         
     except Exception as e:
@@ -458,44 +416,17 @@ async def get_reward_streak_info(
 ):
     """Get daily reward streak information"""
     try:
-        today = datetime.utcnow().date()
-        
-        # Get latest reward
-        latest_reward = db.query(DailyReward).filter(
-            DailyReward.user_id == current_user.id
-        ).order_by(desc(DailyReward.claimed_date)).first()
-        
-        if not latest_reward:
-            return {
-                "success": True,
-                "current_streak": 0,
-                "can_claim_today": True,
-                "total_rewards": 0,
-                "next_reward": 50
-            }
-        
-        # Check if can claim today
-        can_claim = latest_reward.claimed_date != today
-        
-        # Calculate current streak
-        current_streak = 0
-        if latest_reward.claimed_date == today:
-            current_streak = latest_reward.consecutive_days
-        elif latest_reward.claimed_date == today - timedelta(days=1):
-            current_streak = latest_reward.consecutive_days
+        reward_status = DailyRewardService(db).get_status(current_user)
+        current_streak = reward_status.streak
+        can_claim = reward_status.can_claim
+        next_reward = reward_status.next_reward.total
         
         # Get total rewards earned
-        total_rewards = db.query(func.sum(DailyReward.coin_amount)).filter(
-            DailyReward.user_id == current_user.id
-        ).scalar() or 0
-        
-        # Calculate next reward amount
-        next_streak = current_streak + 1 if can_claim else current_streak
-        base_reward = 50
-        bonus_multiplier = min(next_streak, 7)
-        next_reward = base_reward + (bonus_multiplier * 10)
-        if next_streak == 7:
-            next_reward += 200
+        total_rewards = 0
+        if reward_status.last_claim:
+            total_rewards = db.query(func.sum(DailyReward.coin_amount)).filter(
+                DailyReward.user_id == current_user.id
+            ).scalar() or 0
         
         return {
             "success": True,
@@ -505,8 +436,8 @@ async def get_reward_streak_info(
             "next_reward": next_reward,
             "streak_info": {
                 "days": [
-                    {"day": i+1, "reward": 50 + (min(i+1, 7) * 10) + (200 if i+1 == 7 else 0)}
-                    for i in range(7)
+                    {"day": day, "reward": quote_reward(day).total}
+                    for day in range(1, 8)
                 ]
             }
         }
@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+"""
+In-Process HTTP Load Benchmark
+- Boots the FastAPI app against a seeded local SQLite database (synthetic_data.py)
+- Outbound integrations stubbed: Instagram scraping/API, Selenium, Firebase; no lifespan jobs
+- Concurrent authenticated traffic mixes over the hot endpoints via httpx's ASGI transport
+- Per-endpoint p50/p95/p99 latency, requests per second and SQL queries per request
+- JSON baseline output, and comparison against a previous baseline for regressions
+
+Usage:
+    python load_benchmark.py --users 20000 --transactions 400000 --mix read_heavy \\
+        --concurrency 32 --requests 5000 --output baseline.json
+    python load_benchmark.py --database /tmp/bench.db --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import types
+from dataclasses import dataclass, field, asdict, replace
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class BenchmarkEndpoint:
+    name: str
+    method: str
+    path: str
+
+ENDPOINTS = {
+    endpoint.name: endpoint for endpoint in (
+        BenchmarkEndpoint("profile", "GET", "/profile"),
+        BenchmarkEndpoint("statistics", "GET", "/statistics"),
+        BenchmarkEndpoint("coins", "GET", "/coins"),
+        BenchmarkEndpoint("notifications", "GET", "/notifications-v2"),
+        BenchmarkEndpoint("notifications_all", "GET", "/notifications"),
+        BenchmarkEndpoint("leaderboard", "GET", "/social/leaderboard?period=all&limit=50"),
+        BenchmarkEndpoint("my_rank", "GET", "/social/my-rank"),
+        BenchmarkEndpoint("claim_daily_reward", "POST", "/claim-daily-reward"),
+    )
+}
+
+# Relative request weights per endpoint
+TRAFFIC_MIXES: Dict[str, Dict[str, int]] = {
+    "read_heavy": {
+        "profile": 20, "coins": 20, "notifications": 25, "statistics": 10,
+        "leaderboard": 10, "my_rank": 10, "claim_daily_reward": 5,
+    },
+    "uniform": {name: 1 for name in ENDPOINTS},
+    # Large serialized bodies: full notification history and leaderboard pages
+    "payload_heavy": {"notifications_all": 50, "leaderboard": 20, "notifications": 20, "coins": 10},
+    "morning_rush": {
+        "claim_daily_reward": 35, "coins": 25, "notifications": 20, "profile": 10, "my_rank": 10,
+    },
+}
+
+# Fraction by which a metric may get worse before --compare reports a regression
+DEFAULT_REGRESSION_TOLERANCE = 0.15
+
+@dataclass
+class BenchmarkConfig:
+    database: str
+    mix: str = "read_heavy"
+    concurrency: int = 16
+    requests: int = 2000
+    warmup: int = 100
+    active_users: int = 1000
+    seed: int = 42
+    json_backend: str = "orjson"  # "stdlib" measures the fallback encoder
+    # Dataset, only used when the database does not exist yet
+    users: int = 10_000
+    transactions: int = 200_000
+    notifications: int = 100_000
+
+@dataclass
+class EndpointResult:
+    latencies: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    db_seconds: List[float] = field(default_factory=list)
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+    def record(self, seconds: float, query_count: int, db_seconds: float, status_code: int):
+        self.latencies.append(seconds)
+        self.queries.append(query_count)
+        self.db_seconds.append(db_seconds)
+        self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        return {
+            "requests": count,
+            "errors": sum(n for code, n in self.statuses.items() if code >= 500),
+            "statuses": {str(code): n for code, n in sorted(self.statuses.items())},
+            "rps": round(count / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                "mean": round(sum(latencies) / count * 1000, 3) if count else None,
+                "p50": _percentile_ms(latencies, 50),
+                "p95": _percentile_ms(latencies, 95),
+                "p99": _percentile_ms(latencies, 99),
+                "max": round(latencies[-1] * 1000, 3) if count else None,
+            },
+            "queries_per_request": {
+                "mean": round(sum(self.queries) / count, 2) if count else None,
+                "max": max(self.queries) if count else None,
+            },
+            "db_ms_per_request": round(sum(self.db_seconds) / count * 1000, 3) if count else None,
+        }
+
+def _percentile_ms(sorted_values: List[float], percentile: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list, in milliseconds"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return round(sorted_values[int(rank) - 1] * 1000, 3)
+
+# --- Integration stubs ---
+
+class StubIntegration:
+    """Stands in for an outbound integration: every call fails fast without I/O"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        def call(*args, **kwargs):
+            return {"success": False, "error": f"{self._name} stubbed in benchmark"}
+        return call
+
+class StubInstagramScraper:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def scrape_profile(self, username: str) -> Dict[str, Any]:
+        return {"success": False, "error": "Instagram scraping stubbed in benchmark"}
+
+STUBBED_SERVICES = ("instagram_service", "selenium_service", "firebase_admin")
+
+def install_integration_stubs():
+    """Must run before the app is imported so lazy imports pick up the stub scraper"""
+    scraper_module = types.ModuleType("modern_instagram_scraper")
+    scraper_module.ModernInstagramScraper = StubInstagramScraper
+    sys.modules["modern_instagram_scraper"] = scraper_module
+
+def stub_registered_services():
+    """Swap the registry factories for outbound services once app.py has registered them"""
+    from service_registry import service_registry
+    for name in STUBBED_SERVICES:
+        service_registry.register(name, lambda name=name: StubIntegration(name), replace=True)
+
+# --- Setup ---
+
+def prepare_database(config: BenchmarkConfig) -> Optional[Dict[str, Any]]:
+    """Seed the benchmark database unless it already exists; returns the load summary"""
+    if os.path.exists(config.database):
+        logger.info(f"Reusing benchmark database {config.database}")
+        return None
+    from sqlalchemy import create_engine
+    from synthetic_data import SyntheticDataConfig, generate
+
+    engine = create_engine(f"sqlite:///{config.database}", connect_args={"check_same_thread": False})
+    data_config = SyntheticDataConfig(
+        users=config.users,
+        transactions=config.transactions,
+        notifications=config.notifications,
+        user_badges=config.users * 3,
+        device_logs=config.users * 5,
+        seed=config.seed,
+    )
+    logger.info(f"Seeding benchmark database {config.database} ({config.users:,} users)")
+    summary = generate(engine, data_config, create_schema=True)
+    engine.dispose()
+    return summary.as_dict()
+
+def load_app(database: str, json_backend: str = "orjson"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ["JSON_BACKEND"] = json_backend
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    install_integration_stubs()
+    import app as app_module
+    stub_registered_services()
+    # Per-request statement counts come back in the instrumentation's debug headers
+    from query_instrumentation import query_instrumentation
+    query_instrumentation.config = replace(query_instrumentation.config, debug_headers=True, sample_rate=0.0)
+    return app_module
+
+def issue_tokens(app_module, config: BenchmarkConfig) -> List[str]:
+    """Bearer tokens for a seeded sample of users, the same way /login signs them"""
+    from jose import jwt
+    from models import User
+
+    db = app_module.SessionLocal()
+    try:
+        usernames = [row.username for row in db.query(User.username).filter(
+            User.username.like("synthetic\\_%", escape="\\")
+        ).order_by(User.id).all()]
+    finally:
+        db.close()
+    if not usernames:
+        raise RuntimeError("Benchmark database has no synthetic users")
+
+    rng = random.Random(config.seed)
+    sample = rng.sample(usernames, min(config.active_users, len(usernames)))
+    expires = datetime.utcnow() + timedelta(hours=6)
+    return [
+        jwt.encode({"sub": username, "exp": expires}, app_module.SECRET_KEY, algorithm=app_module.ALGORITHM)
+        for username in sample
+    ]
+
+# --- Run ---
+
+async def drive_traffic(app, tokens: List[str], mix: Dict[str, int], total: int, concurrency: int,
+                        seed: int) -> Tuple[Dict[str, EndpointResult], float, float]:
+    import httpx
+    from query_instrumentation import QUERY_COUNT_HEADER, DB_TIME_HEADER
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    rng = random.Random(seed)
+    # Plan the whole run up front so every run with a seed issues the same request sequence
+    plan = [(ENDPOINTS[rng.choices(names, weights)[0]], rng.choice(tokens)) for _ in range(total)]
+    results: Dict[str, EndpointResult] = {name: EndpointResult() for name in names}
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < len(plan):
+            endpoint, token = plan[next_index]
+            next_index += 1
+            started = time.perf_counter()
+            response = await client.request(endpoint.method, endpoint.path, headers={"Authorization": f"Bearer {token}"})
+            elapsed = time.perf_counter() - started
+            results[endpoint.name].record(
+                elapsed,
+                int(response.headers.get(QUERY_COUNT_HEADER.decode(), 0)),
+                float(response.headers.get(DB_TIME_HEADER.decode(), 0)) / 1000,
+                response.status_code,
+            )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        cpu_seconds = time.process_time() - cpu_started
+        elapsed = time.perf_counter() - started
+    return results, elapsed, cpu_seconds
+
+def run_benchmark(config: BenchmarkConfig) -> Dict[str, Any]:
+    if config.mix not in TRAFFIC_MIXES:
+        raise ValueError(f"Unknown traffic mix: {config.mix}")
+    dataset = prepare_database(config)
+    app_module = load_app(config.database, config.json_backend)
+    from fast_json import JSON_BACKEND
+    tokens = issue_tokens(app_module, config)
+    mix = TRAFFIC_MIXES[config.mix]
+
+    if config.warmup:
+        asyncio.run(drive_traffic(app_module.app, tokens, mix, config.warmup, config.concurrency, config.seed + 1))
+    logger.info(f"Running {config.requests:,} requests, mix={config.mix}, concurrency={config.concurrency}")
+    results, elapsed, cpu_seconds = asyncio.run(
+        drive_traffic(app_module.app, tokens, mix, config.requests, config.concurrency, config.seed)
+    )
+
+    overall = EndpointResult()
+    for result in results.values():
+        overall.latencies.extend(result.latencies)
+        overall.queries.extend(result.queries)
+        overall.db_seconds.extend(result.db_seconds)
+        for code, n in result.statuses.items():
+            overall.statuses[code] = overall.statuses.get(code, 0) + n
+
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "json_backend": JSON_BACKEND,
+        },
+        "config": asdict(config),
+        "dataset": dataset,
+        "elapsed_seconds": round(elapsed, 3),
+        # Process CPU (all threads, client included) over the measured run
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_ms_per_request": round(cpu_seconds / config.requests * 1000, 3) if config.requests else None,
+        "overall": overall.summary(elapsed),
+        "endpoints": {name: result.summary(elapsed) for name, result in results.items() if result.latencies},
+    }
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any],
+                    tolerance: float = DEFAULT_REGRESSION_TOLERANCE) -> List[str]:
+    """Regressions beyond `tolerance` in p95/p99 latency, RPS or queries per request"""
+    regressions = []
+    sections = {"overall": (current["overall"], baseline.get("overall"))}
+    for name, summary in current["endpoints"].items():
+        sections[name] = (summary, baseline.get("endpoints", {}).get(name))
+
+    for name, (now, before) in sections.items():
+        if not before:
+            continue
+        checks = [
+            ("p95 latency", now["latency_ms"]["p95"], before["latency_ms"]["p95"], True),
+            ("p99 latency", now["latency_ms"]["p99"], before["latency_ms"]["p99"], True),
+            ("queries/request", now["queries_per_request"]["mean"], before["queries_per_request"]["mean"], True),
+            ("rps", now["rps"], before["rps"], False),
+        ]
+        if name == "overall":
+            checks.append(("cpu ms/request", current.get("cpu_ms_per_request"), baseline.get("cpu_ms_per_request"), True))
+        for label, value, reference, lower_is_better in checks:
+            if value is None or not reference:
+                continue
+            change = (value - reference) / reference
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"{name}: {label} {reference} -> {value} ({change:+.0%})")
+    return regressions
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"Load benchmark: mix={report['config']['mix']} concurrency={report['config']['concurrency']} "
+        f"requests={report['overall']['requests']} elapsed={report['elapsed_seconds']} s "
+        f"cpu={report['cpu_seconds']} s ({report['cpu_ms_per_request']} ms/request, json={report['environment']['json_backend']})",
+        "",
+        f"  {'endpoint':<20} {'reqs':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/req':>7} {'5xx':>5}",
+    ]
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, summary in rows:
+        latency = summary["latency_ms"]
+        lines.append(
+            f"  {name:<20} {summary['requests']:>6} {summary['rps']:>9} {latency['p50']:>9} {latency['p95']:>9} "
+            f"{latency['p99']:>9} {summary['queries_per_request']['mean']:>7} {summary['errors']:>5}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="In-process HTTP load benchmark for the hot endpoints")
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "jaegram_benchmark.db"),
+                        help="SQLite file; seeded with synthetic data if it does not exist")
+    parser.add_argument("--mix", default="read_heavy", choices=sorted(TRAFFIC_MIXES))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--active-users", type=int, default=1000, help="distinct users sending traffic")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json-backend", default="orjson", choices=["orjson", "stdlib"])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--notifications", type=int, default=100_000)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = BenchmarkConfig(
+        database=args.database,
+        mix=args.mix,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        warmup=args.warmup,
+        active_users=args.active_users,
+        seed=args.seed,
+        json_backend=args.json_backend,
+        users=args.users,
+        transactions=args.transactions,
+        notifications=args.notifications,
+    )
+    # Endpoint logging would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmark(config)
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
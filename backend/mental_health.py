@@ -1,17 +1,19 @@
 """
 Mental Health and Wellness Monitoring System
 Real mental health notifications, usage pattern analysis, and wellness features
+Usage data comes from a single cached SQL aggregation (see usage_analytics)
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, desc
+from sqlalchemy import func, or_
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any, Tuple
 import json
 import logging
 from enum import Enum
 
-from models import User, MentalHealthLog, Task, Order, CoinTransaction, UserStatistics, Notification
+from models import User, MentalHealthLog, TaskStatus, CoinTransaction, UserStatistics, Notification
+from usage_analytics import UsageSnapshot, get_usage_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +78,9 @@ class MentalHealthService:
                 "⭐ Bugün kendiniz için gurur duyabileceğiniz bir şey yapın."
             ]
         }
+        
+        # Log types that indicate a recent escalation
+        self.high_severity_log_types = {"crisis_intervention_triggered", "wellness_check"}
 
     def analyze_user_wellness(self, user_id: int) -> Dict[str, Any]:
         """Comprehensive wellness analysis for a user"""
@@ -84,28 +89,64 @@ class MentalHealthService:
             if not user:
                 raise ValueError("User not found")
             
-            # Get recent activity data
-            recent_logs = self._get_recent_mental_health_logs(user_id, days=7)
-            usage_patterns = self._analyze_usage_patterns(user_id)
-            risk_assessment = self._assess_mental_health_risk(user_id, usage_patterns)
-            recommendations = self._generate_wellness_recommendations(user_id, risk_assessment, usage_patterns)
+            # One grouped query feeds every section of the analysis
+            snapshot = get_usage_snapshot(self.db, user_id)
+            return self._build_wellness_report(snapshot)
+            
+        except Exception as e:
+            logger.error(f"Error analyzing wellness for user {user_id}: {e}")
+            raise
+
+    def get_wellness_status(self, user_id: int) -> Dict[str, Any]:
+        """Current wellness status for an authenticated user (single cached query)"""
+        try:
+            snapshot = get_usage_snapshot(self.db, user_id)
+            report = self._build_wellness_report(snapshot)
+            report["success"] = True
+            return report
+            
+        except Exception as e:
+            logger.error(f"Error getting wellness status for user {user_id}: {e}")
+            raise
+
+    def get_wellness_recommendations(self, user_id: int) -> Dict[str, Any]:
+        """Personalized recommendations derived from the shared usage snapshot"""
+        try:
+            snapshot = get_usage_snapshot(self.db, user_id)
+            usage_patterns = self._analyze_usage_patterns(snapshot)
+            risk_assessment = self._assess_mental_health_risk(snapshot, usage_patterns)
             
             return {
+                "success": True,
                 "user_id": user_id,
-                "assessment_date": datetime.utcnow().isoformat(),
                 "risk_level": risk_assessment["level"],
-                "risk_score": risk_assessment["score"],
-                "usage_patterns": usage_patterns,
-                "recent_logs": recent_logs,
-                "recommendations": recommendations,
-                "wellness_metrics": self._calculate_wellness_metrics(user_id),
+                "recommendations": self._generate_wellness_recommendations(user_id, risk_assessment, usage_patterns),
+                "tips": self.wellness_tips["excessive_usage"] if usage_patterns["pattern_type"] in (UsagePattern.EXCESSIVE, UsagePattern.OBSESSIVE) else self.wellness_tips["break_reminder"],
                 "support_resources": self._get_support_resources(risk_assessment["level"])
             }
             
         except Exception as e:
-            logger.error(f"Error analyzing wellness for user {user_id}: {e}")
+            logger.error(f"Error getting wellness recommendations for user {user_id}: {e}")
             raise
 
+    def _build_wellness_report(self, snapshot: UsageSnapshot) -> Dict[str, Any]:
+        """Assemble risk, metrics and recommendations from one snapshot"""
+        usage_patterns = self._analyze_usage_patterns(snapshot)
+        risk_assessment = self._assess_mental_health_risk(snapshot, usage_patterns)
+        recommendations = self._generate_wellness_recommendations(snapshot.user_id, risk_assessment, usage_patterns)
+        
+        return {
+            "user_id": snapshot.user_id,
+            "assessment_date": datetime.utcnow().isoformat(),
+            "risk_level": risk_assessment["level"],
+            "risk_score": risk_assessment["score"],
+            "usage_patterns": usage_patterns,
+            "recent_logs": self._get_recent_mental_health_logs(snapshot, days=7),
+            "recommendations": recommendations,
+            "wellness_metrics": self._calculate_wellness_metrics(snapshot),
+            "support_resources": self._get_support_resources(risk_assessment["level"])
+        }
+
     def log_mental_health_event(
         self, 
         user_id: int, 
@@ -140,60 +181,21 @@ class MentalHealthService:
             logger.error(f"Error logging mental health event for user {user_id}: {e}")
             raise
 
-    def _get_recent_mental_health_logs(self, user_id: int, days: int = 7) -> List[Dict]:
-        """Get recent mental health logs for analysis"""
-        try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            
-            logs = self.db.query(MentalHealthLog).filter(
-                and_(
-                    MentalHealthLog.user_id == user_id,
-                    MentalHealthLog.logged_at >= cutoff_date
-                )
-            ).order_by(desc(MentalHealthLog.logged_at)).all()
-            
-            return [
-                {
-                    "id": log.id,
-                    "event_type": log.event_type,
-                    "severity": log.severity,
-                    "description": log.description,
-                    "metadata": log.metadata or {},
-                    "logged_at": log.logged_at.isoformat()
-                }
-                for log in logs
-            ]
-            
-        except Exception as e:
-            logger.error(f"Error getting recent mental health logs for user {user_id}: {e}")
-            return []
+    def _get_recent_mental_health_logs(self, snapshot: UsageSnapshot, days: int = 7) -> List[Dict]:
+        """Recent mental health log counts per day and notification type"""
+        since_day = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+        return [
+            {"date": day, "notification_type": notification_type, "count": count}
+            for (day, notification_type), count in sorted(snapshot.log_counts.items(), reverse=True)
+            if day >= since_day
+        ]
 
-    def _analyze_usage_patterns(self, user_id: int) -> Dict[str, Any]:
+    def _analyze_usage_patterns(self, snapshot: UsageSnapshot) -> Dict[str, Any]:
         """Analyze user's usage patterns for mental health insights"""
         try:
-            now = datetime.utcnow()
-            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_ago = today - timedelta(days=7)
-            
-            # Get recent tasks and orders
-            recent_tasks = self.db.query(Task).filter(
-                and_(
-                    Task.user_id == user_id,
-                    Task.created_at >= week_ago
-                )
-            ).all()
-            
-            recent_orders = self.db.query(Order).filter(
-                and_(
-                    Order.user_id == user_id,
-                    Order.created_at >= week_ago
-                )
-            ).all()
-            
-            # Analyze patterns
-            daily_activity = self._analyze_daily_activity(recent_tasks, recent_orders)
-            hourly_distribution = self._analyze_hourly_distribution(recent_tasks, recent_orders)
-            task_completion_patterns = self._analyze_task_completion_patterns(recent_tasks)
+            daily_activity = self._analyze_daily_activity(snapshot)
+            hourly_distribution = self._analyze_hourly_distribution(snapshot)
+            task_completion_patterns = self._analyze_task_completion_patterns(snapshot)
             
             # Determine overall usage pattern
             usage_pattern = self._classify_usage_pattern(daily_activity, hourly_distribution, task_completion_patterns)
@@ -204,37 +206,19 @@ class MentalHealthService:
                 "hourly_distribution": hourly_distribution,
                 "task_completion": task_completion_patterns,
                 "analysis_period": {
-                    "start": week_ago.isoformat(),
-                    "end": now.isoformat(),
-                    "days": 7
+                    "start": snapshot.window_start.isoformat(),
+                    "end": snapshot.generated_at.isoformat(),
+                    "days": (snapshot.generated_at.date() - snapshot.window_start.date()).days
                 }
             }
             
         except Exception as e:
-            logger.error(f"Error analyzing usage patterns for user {user_id}: {e}")
+            logger.error(f"Error analyzing usage patterns for user {snapshot.user_id}: {e}")
             return {"pattern_type": "unknown"}
 
-    def _analyze_daily_activity(self, tasks: List, orders: List) -> Dict[str, Any]:
+    def _analyze_daily_activity(self, snapshot: UsageSnapshot) -> Dict[str, Any]:
         """Analyze daily activity levels"""
-        daily_stats = {}
-        
-        for task in tasks:
-            date_key = task.created_at.date().isoformat()
-            if date_key not in daily_stats:
-                daily_stats[date_key] = {"tasks": 0, "orders": 0, "hours_active": set()}
-            daily_stats[date_key]["tasks"] += 1
-            daily_stats[date_key]["hours_active"].add(task.created_at.hour)
-        
-        for order in orders:
-            date_key = order.created_at.date().isoformat()
-            if date_key not in daily_stats:
-                daily_stats[date_key] = {"tasks": 0, "orders": 0, "hours_active": set()}
-            daily_stats[date_key]["orders"] += 1
-            daily_stats[date_key]["hours_active"].add(order.created_at.hour)
-        
-        # Convert hours_active sets to counts
-        for date_key in daily_stats:
-            daily_stats[date_key]["hours_active"] = len(daily_stats[date_key]["hours_active"])
+        daily_stats = {day: snapshot.day_totals(day) for day in snapshot.days()}
         
         # Calculate averages
         if daily_stats:
@@ -253,15 +237,9 @@ class MentalHealthService:
             }
         }
 
-    def _analyze_hourly_distribution(self, tasks: List, orders: List) -> Dict[str, Any]:
+    def _analyze_hourly_distribution(self, snapshot: UsageSnapshot) -> Dict[str, Any]:
         """Analyze hourly activity distribution"""
-        hourly_counts = {hour: 0 for hour in range(24)}
-        
-        for task in tasks:
-            hourly_counts[task.created_at.hour] += 1
-        
-        for order in orders:
-            hourly_counts[order.created_at.hour] += 1
+        hourly_counts = dict(enumerate(snapshot.hourly_totals()))
         
         # Identify peak hours and concerning patterns
         peak_hour = max(hourly_counts.items(), key=lambda x: x[1])[0] if any(hourly_counts.values()) else 12
@@ -275,22 +253,18 @@ class MentalHealthService:
             "concerning_hours": late_night_activity > total_activity * 0.2 if total_activity > 0 else False
         }
 
-    def _analyze_task_completion_patterns(self, tasks: List) -> Dict[str, Any]:
+    def _analyze_task_completion_patterns(self, snapshot: UsageSnapshot) -> Dict[str, Any]:
         """Analyze task completion patterns for frustration indicators"""
-        if not tasks:
+        total_tasks = snapshot.total_tasks
+        if not total_tasks:
             return {"completion_rate": 0, "average_completion_time": 0, "frustration_indicators": []}
         
-        completed_tasks = [t for t in tasks if t.status == "completed" and t.completed_at]
-        completion_rate = len(completed_tasks) / len(tasks)
+        completed_tasks = snapshot.task_status_counts.get(TaskStatus.completed.value, 0)
+        failed_tasks = snapshot.task_status_counts.get(TaskStatus.failed.value, 0)
+        completion_rate = completed_tasks / total_tasks
         
-        # Calculate average completion time
-        completion_times = []
-        for task in completed_tasks:
-            if task.assigned_at:
-                completion_time = (task.completed_at - task.assigned_at).total_seconds() / 60  # minutes
-                completion_times.append(completion_time)
-        
-        avg_completion_time = sum(completion_times) / len(completion_times) if completion_times else 0
+        # Average completion time in minutes, summed in SQL
+        avg_completion_time = (snapshot.completion_seconds / 60 / snapshot.timed_completions) if snapshot.timed_completions else 0
         
         # Identify frustration indicators
         frustration_indicators = []
@@ -300,17 +274,16 @@ class MentalHealthService:
         if avg_completion_time > 30:  # Taking more than 30 minutes average
             frustration_indicators.append("slow_completion")
         
-        failed_tasks = [t for t in tasks if t.status == "failed"]
-        if len(failed_tasks) > len(tasks) * 0.3:
+        if failed_tasks > total_tasks * 0.3:
             frustration_indicators.append("high_failure_rate")
         
         return {
             "completion_rate": round(completion_rate, 2),
             "average_completion_time": round(avg_completion_time, 1),
             "frustration_indicators": frustration_indicators,
-            "total_tasks": len(tasks),
-            "completed_tasks": len(completed_tasks),
-            "failed_tasks": len(failed_tasks)
+            "total_tasks": total_tasks,
+            "completed_tasks": completed_tasks,
+            "failed_tasks": failed_tasks
         }
 
     def _classify_usage_pattern(self, daily_activity: Dict, hourly_distribution: Dict, task_completion: Dict) -> UsagePattern:
@@ -333,7 +306,7 @@ class MentalHealthService:
         else:
             return UsagePattern.HEALTHY
 
-    def _assess_mental_health_risk(self, user_id: int, usage_patterns: Dict) -> Dict[str, Any]:
+    def _assess_mental_health_risk(self, snapshot: UsageSnapshot, usage_patterns: Dict) -> Dict[str, Any]:
         """Assess mental health risk level"""
         risk_score = 0
         risk_factors = []
@@ -370,9 +343,8 @@ class MentalHealthService:
             risk_factors.append("some_frustration_indicators")
         
         # Recent mental health logs
-        recent_logs = self._get_recent_mental_health_logs(user_id, days=3)
-        critical_logs = [log for log in recent_logs if log["severity"] in ["high", "critical"]]
-        if critical_logs:
+        since_day = (datetime.utcnow() - timedelta(days=3)).date().isoformat()
+        if snapshot.log_count(since_day, self.high_severity_log_types):
             risk_score += 30
             risk_factors.append("recent_critical_mental_health_events")
         
@@ -481,46 +453,17 @@ class MentalHealthService:
         
         return recommendations[:5]  # Return top 5 recommendations
 
-    def _calculate_wellness_metrics(self, user_id: int) -> Dict[str, Any]:
+    def _calculate_wellness_metrics(self, snapshot: UsageSnapshot) -> Dict[str, Any]:
         """Calculate various wellness metrics"""
-        try:
-            now = datetime.utcnow()
-            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Today's activity
-            today_tasks = self.db.query(Task).filter(
-                and_(
-                    Task.user_id == user_id,
-                    Task.created_at >= today
-                )
-            ).count()
-            
-            today_orders = self.db.query(Order).filter(
-                and_(
-                    Order.user_id == user_id,
-                    Order.created_at >= today
-                )
-            ).count()
-            
-            # Recent wellness trends
-            week_ago = today - timedelta(days=7)
-            weekly_logs = self.db.query(MentalHealthLog).filter(
-                and_(
-                    MentalHealthLog.user_id == user_id,
-                    MentalHealthLog.logged_at >= week_ago
-                )
-            ).count()
-            
-            return {
-                "today_tasks": today_tasks,
-                "today_orders": today_orders,
-                "weekly_mental_health_logs": weekly_logs,
-                "last_calculated": now.isoformat()
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating wellness metrics for user {user_id}: {e}")
-            return {}
+        today = datetime.utcnow().date().isoformat()
+        today_totals = snapshot.day_totals(today)
+        
+        return {
+            "today_tasks": today_totals["tasks"],
+            "today_orders": today_totals["orders"],
+            "weekly_mental_health_logs": snapshot.log_count(),
+            "last_calculated": snapshot.generated_at.isoformat()
+        }
 
     def _get_support_resources(self, risk_level: MentalHealthRiskLevel) -> List[Dict[str, Any]]:
         """Get appropriate support resources based on risk level"""
@@ -0,0 +1,467 @@
+"""
+Metrics
+- Counters, gauges and histograms rendered in the Prometheus text exposition format (`/metrics`)
+- Lock-free hot path: each thread records into its own shard; shards are summed at scrape time
+- Callback gauges sampled at scrape time (DB pool, WebSocket connections, offline queue)
+- Multi-worker aware: with METRICS_MULTIPROC_DIR set, every uvicorn worker writes periodic
+  snapshots there and a scrape on any worker merges them (dead workers keep counters and
+  histograms, their gauges are dropped)
+- ASGI middleware recording request count and latency by route template
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+DEFAULT_FLUSH_SECONDS = 5.0
+
+LabelValues = Tuple[str, ...]
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[LabelValues, Any]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[LabelValues, Any]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # Only taken once per thread; recording itself never locks
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _labels(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"type": self.kind, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        shard = self._shard()
+        key = self._labels(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[LabelValues, float]]:
+        totals: Dict[LabelValues, float] = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0) + value
+        return list(totals.items())
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._labels(labels)
+        series = shard.get(key)
+        if series is None:
+            # [per-bucket counts..., +Inf count, sum]
+            series = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+    def samples(self) -> List[Tuple[LabelValues, List[float]]]:
+        totals: Dict[LabelValues, List[float]] = {}
+        for shard in list(self._shards):
+            for key, series in list(shard.items()):
+                total = totals.setdefault(key, [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+        return list(totals.items())
+
+class Gauge(_Metric):
+    """Set/inc/dec gauge, or one sampled from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Any]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._labels(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._labels(labels)
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Tuple[LabelValues, float]]:
+        totals: Dict[LabelValues, float] = dict(self._values)
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0) + value
+        if self.callback is not None:
+            try:
+                sampled = self.callback()
+            except Exception as e:
+                logger.warning(f"Metrics callback for {self.name} failed: {e}")
+                sampled = None
+            if isinstance(sampled, dict):
+                for key, value in sampled.items():
+                    key = key if isinstance(key, tuple) else (key,)
+                    totals[tuple(str(part) for part in key)] = value
+            elif sampled is not None:
+                totals[()] = sampled
+        return list(totals.items())
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def render_snapshot(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    """Prometheus text format for a {name: {type, help, labelnames, [buckets], samples}} snapshot"""
+    lines: List[str] = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        labelnames = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric["samples"], key=lambda sample: tuple(sample[0])):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_label_text(labelnames, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*metric["buckets"], math.inf], value[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{name}_bucket{_label_text(labelnames, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{name}_sum{_label_text(labelnames, labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_label_text(labelnames, labels)} {_format_value(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MetricsRegistry:
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_seconds: float = DEFAULT_FLUSH_SECONDS):
+        self.multiproc_dir = multiproc_dir
+        self.flush_seconds = flush_seconds
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {**metric.describe(), "samples": [[list(labels), value] for labels, value in metric.samples()]}
+            for metric in metrics
+        }
+
+    # --- Multi-worker export ---
+
+    def write_worker_snapshot(self):
+        if not self.multiproc_dir:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = os.path.join(self.multiproc_dir, f"worker_{os.getpid()}.json")
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "written_at": time.time(), "metrics": self.snapshot()}, f)
+        os.replace(temp_path, path)
+
+    def start_worker_exporter(self):
+        """Periodically publish this worker's snapshot for the other workers' scrapes"""
+        if not self.multiproc_dir or self._flusher is not None:
+            return
+        self._stop.clear()
+
+        def flush_loop():
+            while not self._stop.wait(self.flush_seconds):
+                try:
+                    self.write_worker_snapshot()
+                except Exception as e:
+                    logger.warning(f"Could not write metrics snapshot: {e}")
+
+        self._flusher = threading.Thread(target=flush_loop, name="metrics-exporter", daemon=True)
+        self._flusher.start()
+
+    def stop_worker_exporter(self):
+        if self._flusher is None:
+            return
+        self._stop.set()
+        self._flusher.join(timeout=self.flush_seconds)
+        self._flusher = None
+        try:
+            self.write_worker_snapshot()
+        except Exception as e:
+            logger.warning(f"Could not write final metrics snapshot: {e}")
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """This worker's snapshot, merged with the other workers' when running multi-process"""
+        if not self.multiproc_dir:
+            return self.snapshot()
+        self.write_worker_snapshot()
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        for filename in sorted(os.listdir(self.multiproc_dir)):
+            if not (filename.startswith("worker_") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, filename), encoding="utf-8") as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(worker["pid"])
+            for name, metric in worker["metrics"].items():
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**metric, "samples": {}})
+                for labels, value in metric["samples"]:
+                    key = tuple(labels)
+                    if metric["type"] == "histogram":
+                        total = target["samples"].setdefault(key, [0] * len(value))
+                        for index, part in enumerate(value):
+                            total[index] += part
+                    else:
+                        target["samples"][key] = target["samples"].get(key, 0) + value
+        for metric in merged.values():
+            metric["samples"] = [[list(labels), value] for labels, value in metric["samples"].items()]
+        return merged
+
+    def render(self) -> str:
+        return render_snapshot(self.collect())
+
+# Global registry
+metrics_registry = MetricsRegistry(
+    multiproc_dir=os.getenv("METRICS_MULTIPROC_DIR") or None,
+    flush_seconds=float(os.getenv("METRICS_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)),
+)
+
+# --- Shared instruments ---
+
+http_requests_total = metrics_registry.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code", ("method", "route", "status")
+)
+http_request_duration_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template", ("method", "route")
+)
+http_requests_in_progress = metrics_registry.gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled"
+)
+background_job_duration_seconds = metrics_registry.histogram(
+    "background_job_duration_seconds", "Duration of periodic background job runs", ("job",), buckets=JOB_BUCKETS
+)
+background_job_runs_total = metrics_registry.counter(
+    "background_job_runs_total", "Periodic background job runs by outcome", ("job", "outcome")
+)
+websocket_events_total = metrics_registry.counter(
+    "websocket_events_total", "Real-time notification socket connects, disconnects and sends", ("event",)
+)
+audit_events_total = metrics_registry.counter(
+    "audit_events_total", "Audit log events by table and outcome (recorded, written, dropped, failed)", ("table", "outcome")
+)
+rate_limit_rejections_total = metrics_registry.counter(
+    "rate_limit_rejections_total", "Requests rejected by a rate limit policy, by key scope (user or ip)", ("policy", "scope")
+)
+outbox_events_total = metrics_registry.counter(
+    "outbox_events_total", "Outbox domain events by type and outcome (published, delivered, retried, dead)", ("event_type", "outcome")
+)
+outbox_delivery_lag_seconds = metrics_registry.histogram(
+    "outbox_delivery_lag_seconds", "Time from publishing a domain event to delivery to all consumers", ("event_type",),
+    buckets=JOB_BUCKETS
+)
+singleflight_calls_total = metrics_registry.counter(
+    "singleflight_calls_total", "Coalesced computations by group and outcome (executed, shared)", ("name", "outcome")
+)
+notifications_suppressed_total = metrics_registry.counter(
+    "notifications_suppressed_total", "Notifications dropped before delivery by the recipient's category preferences", ("type",)
+)
+push_messages_total = metrics_registry.counter(
+    "push_messages_total", "Push messages by outcome (queued, dropped, no_tokens, unconfigured)", ("outcome",)
+)
+push_tokens_total = metrics_registry.counter(
+    "push_tokens_total", "Push deliveries per device token by outcome (sent, unregistered, failed, retried)", ("outcome",)
+)
+user_cache_lookups_total = metrics_registry.counter(
+    "user_cache_lookups_total", "Per-user cache lookups by cache and outcome (hit, miss)", ("cache", "outcome")
+)
+
+_db_pools: Dict[str, Any] = {}
+
+def _pool_reader(method: str) -> Callable[[], Dict[str, Any]]:
+    def read():
+        values = {}
+        for name, pool in list(_db_pools.items()):
+            reader = getattr(pool, method, None)
+            if callable(reader):
+                values[name] = reader()
+        return values
+    return read
+
+def register_db_pool_metrics(engine, name: str = "main"):
+    """Pool gauges sampled at scrape time; pools without sizing (NullPool, StaticPool) are skipped"""
+    _db_pools[name] = engine.pool
+    metrics_registry.gauge("db_pool_size", "Configured DB pool size", ("pool",), callback=_pool_reader("size"))
+    metrics_registry.gauge("db_pool_checked_out", "DB connections currently checked out", ("pool",), callback=_pool_reader("checkedout"))
+    metrics_registry.gauge("db_pool_checked_in", "Idle DB connections in the pool", ("pool",), callback=_pool_reader("checkedin"))
+    metrics_registry.gauge("db_pool_overflow", "DB connections opened beyond the pool size", ("pool",), callback=_pool_reader("overflow"))
+
+def register_notification_metrics(manager):
+    """Connected sockets and queued offline notifications of a RealTimeNotificationManager"""
+    metrics_registry.gauge(
+        "websocket_connections", "Open real-time notification sockets (all devices)",
+        callback=manager.connection_count
+    )
+    metrics_registry.gauge(
+        "websocket_connected_users", "Distinct users with at least one notification socket",
+        callback=lambda: len(manager.active_connections)
+    )
+    metrics_registry.gauge(
+        "offline_notifications_queued", "Notifications queued for users who are not connected",
+        callback=manager.queued_count
+    )
+    metrics_registry.gauge(
+        "offline_notification_users", "Users with queued offline notifications",
+        callback=lambda: len(manager.notification_queue)
+    )
+
+def register_audit_metrics(writer):
+    """Buffer depth of an AuditLogWriter"""
+    metrics_registry.gauge(
+        "audit_buffer_events", "Audit events waiting for the background flusher",
+        callback=writer.pending_count
+    )
+
+def register_rate_limit_metrics(limiter):
+    """Token buckets currently tracked by a RateLimiter's store"""
+    metrics_registry.gauge(
+        "rate_limit_buckets", "Active rate limit token buckets (full buckets are evicted)",
+        callback=limiter.store.size
+    )
+
+def register_push_metrics(worker):
+    """Queue depth of a PushDeliveryWorker"""
+    metrics_registry.gauge(
+        "push_queue_messages", "Push messages waiting for the delivery worker",
+        callback=worker.pending_count
+    )
+
+# --- Request middleware ---
+
+def _route_template(scope) -> str:
+    """Path template of the matched route, so /users/42 and /users/7 share a series"""
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+    templates = getattr(app.state, "metrics_route_templates", None)
+    if templates is None:
+        templates = {}
+        for route in app.routes:
+            route_endpoint = getattr(route, "endpoint", None)
+            if route_endpoint is not None and hasattr(route, "path"):
+                templates.setdefault(route_endpoint, []).append(route)
+        app.state.metrics_route_templates = templates
+    routes = templates.get(endpoint)
+    if not routes:
+        return "unmatched"
+    if len(routes) > 1:
+        for route in routes:
+            if route.path_regex.match(scope["path"]):
+                return route.path
+    return routes[0].path
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec()
+            route = _route_template(scope)
+            method = scope["method"]
+            http_request_duration_seconds.observe(elapsed, method=method, route=route)
+            http_requests_total.inc(method=method, route=route, status=status_code)
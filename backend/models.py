@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, Enum, create_engine, Date
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, Enum, create_engine, Date, Index, JSON
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -156,6 +156,23 @@ class CoinTransactionType(enum.Enum):
     withdraw = "withdraw"
     admin = "admin"
 
+class CoinTransactionCategory(enum.Enum):
+    """What caused a ledger row; `type` only says which way the coins moved"""
+    task_reward = "task_reward"
+    level_bonus = "level_bonus"
+    achievement_bonus = "achievement_bonus"
+    daily_reward = "daily_reward"
+    referral_bonus = "referral_bonus"
+    education_reward = "education_reward"
+    security_bonus = "security_bonus"  # email verification / 2FA
+    transfer_in = "transfer_in"
+    transfer_out = "transfer_out"
+    order_payment = "order_payment"
+    withdrawal = "withdrawal"
+    withdrawal_refund = "withdrawal_refund"
+    admin_adjustment = "admin_adjustment"
+    other = "other"
+
 class CoinTransaction(Base):
     __tablename__ = "coin_transactions"
     id = Column(Integer, primary_key=True, index=True)
@@ -166,8 +183,16 @@ class CoinTransaction(Base):
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=True, index=True)
     created_at = Column(DateTime, server_default=func.now())
     note = Column(Text, nullable=True)
+    category = Column(Enum(CoinTransactionCategory), nullable=True)
+    # Id of the row behind the entry: withdrawal request, counterparty user (transfers, referrals)
+    reference_id = Column(Integer, nullable=True)
     user = relationship("User", back_populates="coin_transactions")
 
+    __table_args__ = (
+        # Per-user category history and breakdowns; amount trails so SUM(amount) is answered from the index
+        Index("ix_coin_transactions_user_category_created", "user_id", "category", "created_at", "amount"),
+    )
+
 class ValidationLog(Base):
     __tablename__ = "validation_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -235,6 +260,11 @@ class DailyReward(Base):
     
     user = relationship("User", back_populates="daily_rewards")
 
+    __table_args__ = (
+        # One claim per user per day; the claim itself is an insert-or-conflict on this key
+        Index("uq_daily_rewards_user_date", "user_id", "claimed_date", unique=True),
+    )
+
 class EmailVerification(Base):
     __tablename__ = "email_verifications"
     id = Column(Integer, primary_key=True, index=True)
@@ -289,6 +319,10 @@ class UserBadge(Base):
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
     badge_id = Column(Integer, ForeignKey("badges.id"), index=True)
     awarded_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        # Each badge once per user; awards are an insert-or-conflict on this key
+        Index("uq_user_badges_user_badge", "user_id", "badge_id", unique=True),
+    )
 
 class Leaderboard(Base):
     __tablename__ = "leaderboards"
@@ -337,6 +371,14 @@ class UserEducation(Base):
     step = Column(String, nullable=False)
     completed = Column(Boolean, default=False)
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    module_type = Column(String, nullable=True)
+    current_step = Column(String, nullable=True)
+    progress_data = Column(JSON, nullable=True)
+    score = Column(Integer, default=0)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index("ix_user_education_user_module", "user_id", "module_type", unique=True),
+    )
 
 class MentalHealthLog(Base):
     __tablename__ = "mental_health_logs"
@@ -344,6 +386,10 @@ class MentalHealthLog(Base):
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
     notification_type = Column(String, nullable=False)
     sent_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        # Cooldown lookups: "was this user sent this type recently?"
+        Index("ix_mental_health_logs_user_type_sent", "user_id", "notification_type", "sent_at"),
+    )
 
 class CoinWithdrawalRequest(Base):
     __tablename__ = "coin_withdrawal_requests"
@@ -517,3 +563,21 @@ class UserActivityLog(Base):
     user_agent = Column(Text, nullable=True)
     extra_metadata = Column(Text, nullable=True)  # Additional JSON metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Transactional outbox: domain events written with the change that caused them
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(50), nullable=False)  # 'CoinEarned', 'BadgeAwarded', 'RewardClaimed', ...
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    payload_json = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # 'pending', 'delivered', 'dead'
+    attempts = Column(Integer, nullable=False, default=0)
+    delivered_to_json = Column(Text, nullable=True)  # consumers that already handled the event
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # next delivery attempt / lease expiry
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    dispatched_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_outbox_events_status_available", "status", "available_at", "id"),
+    )
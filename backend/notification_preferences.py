@@ -0,0 +1,181 @@
+"""
+Notification Preferences
+- Each user's NotificationSetting row folded into one int bitmask (channels + categories)
+- In-process LRU of masks (NOTIFICATION_PREFS_CACHE_SIZE); users without a row get the column defaults
+- Bulk loading for broadcast audiences: one IN query per chunk for the users not cached yet
+- Dropped by /notifications/settings updates and GDPR deletions
+- Notification types map to at most one category; transactional ones (transfers, withdrawals,
+  security, GDPR) have none and cannot be muted
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from collections import OrderedDict
+from enum import IntFlag
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, Mapping, Optional
+import os
+import threading
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+
+from models import NotificationSetting
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_PREFS_CACHE_SIZE = int(os.getenv("NOTIFICATION_PREFS_CACHE_SIZE", "50000"))
+BULK_LOAD_CHUNK = 500
+
+class NotificationPref(IntFlag):
+    PUSH = 1 << 0
+    EMAIL = 1 << 1
+    SMS = 1 << 2
+    ORDER = 1 << 3
+    TASK = 1 << 4
+    REWARD = 1 << 5
+    SYSTEM = 1 << 6
+    MENTAL_HEALTH = 1 << 7
+
+# Mask bit -> NotificationSetting column, in column order
+PREF_COLUMNS: Mapping[NotificationPref, str] = MappingProxyType({
+    NotificationPref.PUSH: "push_enabled",
+    NotificationPref.EMAIL: "email_enabled",
+    NotificationPref.SMS: "sms_enabled",
+    NotificationPref.ORDER: "order_notifications",
+    NotificationPref.TASK: "task_notifications",
+    NotificationPref.REWARD: "reward_notifications",
+    NotificationPref.SYSTEM: "system_notifications",
+    NotificationPref.MENTAL_HEALTH: "mental_health_notifications",
+})
+
+# Mask of a user without a settings row: the column defaults
+DEFAULT_MASK = int(NotificationPref.PUSH | NotificationPref.EMAIL | NotificationPref.ORDER | NotificationPref.TASK
+                   | NotificationPref.REWARD | NotificationPref.SYSTEM | NotificationPref.MENTAL_HEALTH)
+
+# NotificationType value -> category (enhanced_notifications imports this module, so values rather than members)
+NOTIFICATION_CATEGORIES: Mapping[str, NotificationPref] = MappingProxyType({
+    "task_assigned": NotificationPref.TASK,
+    "task_completed": NotificationPref.TASK,
+    "task_expired": NotificationPref.TASK,
+    "task_cancelled": NotificationPref.TASK,
+    "order_created": NotificationPref.ORDER,
+    "order_update": NotificationPref.ORDER,
+    "order_completed": NotificationPref.ORDER,
+    "order_cancelled": NotificationPref.ORDER,
+    "coin_earned": NotificationPref.REWARD,
+    "level_up": NotificationPref.REWARD,
+    "daily_login": NotificationPref.REWARD,
+    "daily_reward_streak": NotificationPref.REWARD,
+    "daily_reward_claimed": NotificationPref.REWARD,
+    "streak_milestone": NotificationPref.REWARD,
+    "referral_reward": NotificationPref.REWARD,
+    "referral_bonus": NotificationPref.REWARD,
+    "new_referral": NotificationPref.REWARD,
+    "achievement_unlocked": NotificationPref.REWARD,
+    "badge_earned": NotificationPref.REWARD,
+    "system_update": NotificationPref.SYSTEM,
+    "mental_health": NotificationPref.MENTAL_HEALTH,
+})
+
+def _row_mask(values) -> int:
+    mask = 0
+    for bit, value in zip(PREF_COLUMNS, values):
+        # NULL falls back to the column default
+        if value or (value is None and DEFAULT_MASK & bit):
+            mask |= bit
+    return mask
+
+def category_enabled(mask: int, notification_type) -> bool:
+    category = NOTIFICATION_CATEGORIES.get(notification_type.value)
+    return category is None or bool(mask & category)
+
+class NotificationPreferenceCache:
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None,
+                 max_entries: int = NOTIFICATION_PREFS_CACHE_SIZE):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self._masks: "OrderedDict[int, int]" = OrderedDict()
+        self._invalidations = 0  # loads that overlap an invalidation are returned but not cached
+        self._lock = threading.Lock()
+
+    def configure(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def cached(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            mask = self._masks.get(user_id)
+            if mask is not None:
+                self._masks.move_to_end(user_id)
+            return mask
+
+    def get(self, user_id: int) -> int:
+        mask = self.cached(user_id)
+        if mask is None:
+            mask = self.load_many([user_id])[user_id]
+        return mask
+
+    async def aget(self, user_id: int) -> int:
+        """Like get; a miss is loaded in the threadpool"""
+        mask = self.cached(user_id)
+        if mask is None:
+            mask = (await run_in_threadpool(self.load_many, [user_id]))[user_id]
+        return mask
+
+    def load_many(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        """Masks of all `user_ids`, querying only the ones not cached"""
+        masks: Dict[int, int] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            mask = self.cached(user_id)
+            if mask is None:
+                missing.append(user_id)
+            else:
+                masks[user_id] = mask
+        if not missing:
+            return masks
+
+        invalidations = self._invalidations
+        columns = [getattr(NotificationSetting, column) for column in PREF_COLUMNS.values()]
+        loaded = dict.fromkeys(missing, DEFAULT_MASK)
+        db = self._session()
+        try:
+            for start in range(0, len(missing), BULK_LOAD_CHUNK):
+                chunk = missing[start:start + BULK_LOAD_CHUNK]
+                rows = db.execute(
+                    select(NotificationSetting.user_id, *columns).where(NotificationSetting.user_id.in_(chunk))
+                )
+                for user_id, *values in rows:
+                    loaded[user_id] = _row_mask(values)
+        finally:
+            db.close()
+
+        with self._lock:
+            if invalidations == self._invalidations:
+                self._masks.update(loaded)
+                while len(self._masks) > self.max_entries:
+                    self._masks.popitem(last=False)
+        masks.update(loaded)
+        return masks
+
+    async def aload_many(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        """Like load_many, in the threadpool"""
+        return await run_in_threadpool(self.load_many, list(user_ids))
+
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            self._invalidations += 1
+            for user_id in user_ids:
+                self._masks.pop(user_id, None)
+
+    def size(self) -> int:
+        return len(self._masks)
+
+    def _session(self) -> Session:
+        if self.session_factory is None:
+            from dependencies import SessionLocal
+            self.session_factory = SessionLocal
+        return self.session_factory()
+
+# Global notification preference cache instance
+notification_preferences = NotificationPreferenceCache()
@@ -0,0 +1,328 @@
+"""
+Push Delivery
+- Push messages are queued (PUSH_QUEUE_CAPACITY, dropped when full) and sent by one worker off the request path
+- Each drained batch resolves its users' FCM tokens with one query and sends multicasts of up to 500 tokens;
+  messages with identical content (broadcasts) share multicasts
+- Bounded send concurrency (PUSH_CONCURRENCY); transient errors retried per token with exponential backoff
+  and jitter (PUSH_MAX_ATTEMPTS, PUSH_BACKOFF_SECONDS)
+- Unregistered tokens (and tokens of another sender) deleted in bulk after every batch; payload errors
+  such as INVALID_ARGUMENT only count as failed, they say nothing about the token
+- Shutdown lets the batch in flight finish, then delivers what is still queued
+- Transports: Firebase Admin SDK, or an in-memory fake for tests and load runs (PUSH_TRANSPORT=fake)
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+import asyncio
+import os
+import random
+import threading
+import time
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+
+from models import UserFCMToken
+from metrics import push_messages_total, push_tokens_total
+
+logger = logging.getLogger(__name__)
+
+PUSH_TRANSPORT = os.getenv("PUSH_TRANSPORT", "firebase")
+PUSH_QUEUE_CAPACITY = int(os.getenv("PUSH_QUEUE_CAPACITY", "10000"))
+PUSH_CONCURRENCY = int(os.getenv("PUSH_CONCURRENCY", "4"))
+PUSH_MAX_ATTEMPTS = int(os.getenv("PUSH_MAX_ATTEMPTS", "4"))
+PUSH_BACKOFF_SECONDS = float(os.getenv("PUSH_BACKOFF_SECONDS", "1.0"))
+PUSH_MAX_BACKOFF_SECONDS = 60.0
+PUSH_DRAIN_BATCH = 1000  # messages per worker iteration
+MULTICAST_LIMIT = 500  # FCM tokens per multicast request
+PRUNE_CHUNK = 500
+
+# Per-token outcomes reported by transports
+SENT = "sent"
+UNREGISTERED = "unregistered"
+RETRY = "retry"
+FAILED = "failed"
+
+@dataclass(frozen=True)
+class PushMessage:
+    user_id: int
+    title: str
+    body: str
+    data: Mapping[str, str] = field(default_factory=dict)  # FCM data payloads are string -> string
+
+    @property
+    def content(self) -> Tuple[str, str, Tuple[Tuple[str, str], ...]]:
+        return self.title, self.body, tuple(sorted(self.data.items()))
+
+@dataclass
+class PushReport:
+    messages: int = 0
+    sent: int = 0
+    unregistered: int = 0
+    failed: int = 0
+    retried: int = 0
+
+    def add(self, outcomes: Iterable[str]):
+        for outcome in outcomes:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+class FirebaseTransport:
+    """FCM via firebase_admin (the app registered in service_registry on first use)"""
+
+    def is_configured(self) -> bool:
+        from service_registry import service_registry
+        try:
+            return bool(service_registry.get("firebase_admin")._apps)
+        except Exception as e:
+            logger.error(f"Firebase Admin SDK unavailable: {e}")
+            return False
+
+    def send_multicast(self, tokens: Sequence[str], title: str, body: str, data: Mapping[str, str]) -> List[str]:
+        from firebase_admin import messaging, exceptions
+        try:
+            response = messaging.send_each_for_multicast(messaging.MulticastMessage(
+                tokens=list(tokens),
+                notification=messaging.Notification(title=title, body=body),
+                data=dict(data),
+            ))
+        except (exceptions.UnavailableError, exceptions.InternalError, exceptions.DeadlineExceededError,
+                exceptions.ResourceExhaustedError, messaging.QuotaExceededError) as e:
+            logger.warning(f"FCM multicast of {len(tokens)} tokens failed, will retry: {e}")
+            return [RETRY] * len(tokens)
+        return [self._outcome(result) for result in response.responses]
+
+    @staticmethod
+    def _outcome(result) -> str:
+        from firebase_admin import messaging, exceptions
+        if result.success:
+            return SENT
+        error = result.exception
+        if isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+            return UNREGISTERED
+        if isinstance(error, (exceptions.UnavailableError, exceptions.InternalError, exceptions.DeadlineExceededError,
+                              exceptions.ResourceExhaustedError, messaging.QuotaExceededError)):
+            return RETRY
+        logger.error(f"FCM send failed: {error}")
+        return FAILED
+
+class FakePushTransport:
+    """In-memory transport: records every multicast and never touches the network"""
+
+    def __init__(self, unregistered: Iterable[str] = (), transient_failures: int = 0, latency: float = 0.0):
+        self.unregistered = set(unregistered)
+        self.transient_failures = transient_failures  # multicasts answered with RETRY for every token
+        self.latency = latency
+        self.multicasts: List[Tuple[Tuple[str, ...], str, str, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+
+    def is_configured(self) -> bool:
+        return True
+
+    def send_multicast(self, tokens: Sequence[str], title: str, body: str, data: Mapping[str, str]) -> List[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.transient_failures:
+                self.transient_failures -= 1
+                return [RETRY] * len(tokens)
+            self.multicasts.append((tuple(tokens), title, body, dict(data)))
+        return [UNREGISTERED if token in self.unregistered else SENT for token in tokens]
+
+class PushDeliveryWorker:
+    def __init__(self, transport=None, session_factory: Optional[Callable[[], Session]] = None,
+                 capacity: int = PUSH_QUEUE_CAPACITY, concurrency: int = PUSH_CONCURRENCY,
+                 max_attempts: int = PUSH_MAX_ATTEMPTS, backoff_seconds: float = PUSH_BACKOFF_SECONDS):
+        self.transport = transport if transport is not None else _create_transport()
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._queue: Deque[PushMessage] = deque()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def configure(self, session_factory: Callable[[], Session], transport=None):
+        self.session_factory = session_factory
+        if transport is not None:
+            self.transport = transport
+
+    def enqueue(self, *messages: PushMessage) -> int:
+        """Queue messages for delivery; callable from any thread. Returns how many were accepted"""
+        with self._lock:
+            accepted = min(len(messages), self.capacity - len(self._queue))
+            self._queue.extend(messages[:accepted])
+        if accepted:
+            push_messages_total.inc(accepted, outcome="queued")
+        if accepted < len(messages):
+            push_messages_total.inc(len(messages) - accepted, outcome="dropped")
+            logger.warning(f"Push queue full, dropped {len(messages) - accepted} message(s)")
+        if accepted and self._loop is not None and self._wake is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return accepted
+
+    def pending_count(self) -> int:
+        return len(self._queue)
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        if self._queue:
+            self._wake.set()  # messages queued before the loop existed
+        self._task = asyncio.create_task(self._run())
+        logger.info("Push delivery worker started")
+
+    async def stop(self):
+        """Stop the worker once its current flush is done, then deliver what is still queued"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        self._wake = None
+        self._loop = None
+        await self.flush()
+        logger.info("Push delivery worker stopped")
+
+    async def flush(self) -> PushReport:
+        """Deliver everything queued right now"""
+        report = PushReport()
+        while True:
+            messages = self._drain()
+            if not messages:
+                return report
+            batch = await self.deliver(messages)
+            for name, value in vars(batch).items():
+                setattr(report, name, getattr(report, name) + value)
+
+    async def _run(self):
+        while not self._stopping:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Push delivery failed: {e}", exc_info=True)
+
+    def _drain(self) -> List[PushMessage]:
+        with self._lock:
+            return [self._queue.popleft() for _ in range(min(PUSH_DRAIN_BATCH, len(self._queue)))]
+
+    async def deliver(self, messages: Sequence[PushMessage]) -> PushReport:
+        """Send one batch of messages now: token lookup, multicasts, retries, token pruning"""
+        report = PushReport(messages=len(messages))
+        if not self.transport.is_configured():
+            push_messages_total.inc(len(messages), outcome="unconfigured")
+            return report
+        tokens_by_user = await run_in_threadpool(self._tokens_for, {message.user_id for message in messages})
+
+        # Identical content to many users (broadcasts) goes out as shared multicasts
+        audiences: Dict[tuple, Dict[str, None]] = {}  # content -> tokens, in order without duplicates
+        for message in messages:
+            tokens = tokens_by_user.get(message.user_id)
+            if not tokens:
+                push_messages_total.inc(outcome="no_tokens")
+                continue
+            audiences.setdefault(message.content, {}).update(dict.fromkeys(tokens))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unregistered: List[str] = []
+
+        async def send(content, tokens: List[str]):
+            title, body, data = content
+            async with semaphore:
+                outcomes = await self._send_with_retries(tokens, title, body, dict(data), report)
+            report.add(outcomes.values())
+            unregistered.extend(token for token, outcome in outcomes.items() if outcome == UNREGISTERED)
+
+        multicasts = []
+        for content, audience in audiences.items():
+            tokens = list(audience)
+            multicasts.extend(send(content, tokens[start:start + MULTICAST_LIMIT])
+                              for start in range(0, len(tokens), MULTICAST_LIMIT))
+        await asyncio.gather(*multicasts)
+
+        for outcome in (SENT, UNREGISTERED, FAILED):
+            if getattr(report, outcome):
+                push_tokens_total.inc(getattr(report, outcome), outcome=outcome)
+        if report.retried:
+            push_tokens_total.inc(report.retried, outcome="retried")
+        if unregistered:
+            await run_in_threadpool(self._prune, unregistered)
+        return report
+
+    async def _send_with_retries(self, tokens: List[str], title: str, body: str, data: Dict[str, str],
+                                 report: PushReport) -> Dict[str, str]:
+        outcomes: Dict[str, str] = {}
+        pending = tokens
+        for attempt in range(self.max_attempts):
+            if attempt:
+                report.retried += len(pending)
+                await asyncio.sleep(min(PUSH_MAX_BACKOFF_SECONDS, self.backoff_seconds * 2 ** (attempt - 1))
+                                    * random.uniform(0.5, 1.0))
+            try:
+                results = await run_in_threadpool(self.transport.send_multicast, pending, title, body, data)
+            except Exception as e:
+                logger.error(f"Push transport error for {len(pending)} tokens: {e}")
+                results = [RETRY] * len(pending)
+            retry = []
+            for token, outcome in zip(pending, results):
+                if outcome == RETRY:
+                    retry.append(token)
+                else:
+                    outcomes[token] = outcome
+            if not retry:
+                return outcomes
+            pending = retry
+        outcomes.update(dict.fromkeys(pending, FAILED))
+        return outcomes
+
+    def _tokens_for(self, user_ids: Iterable[int]) -> Dict[int, List[str]]:
+        db = self._session()
+        try:
+            tokens: Dict[int, List[str]] = {}
+            rows = db.execute(select(UserFCMToken.user_id, UserFCMToken.token).where(UserFCMToken.user_id.in_(list(user_ids))))
+            for user_id, token in rows:
+                tokens.setdefault(user_id, []).append(token)
+            return tokens
+        finally:
+            db.close()
+
+    def _prune(self, tokens: List[str]):
+        db = self._session()
+        try:
+            for start in range(0, len(tokens), PRUNE_CHUNK):
+                db.execute(delete(UserFCMToken).where(UserFCMToken.token.in_(tokens[start:start + PRUNE_CHUNK])))
+            db.commit()
+            logger.info(f"Removed {len(tokens)} unregistered FCM token(s)")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error removing unregistered FCM tokens: {e}")
+        finally:
+            db.close()
+
+    def _session(self) -> Session:
+        if self.session_factory is None:
+            from dependencies import SessionLocal
+            self.session_factory = SessionLocal
+        return self.session_factory()
+
+def _create_transport():
+    if PUSH_TRANSPORT == "fake":
+        return FakePushTransport()
+    return FirebaseTransport()
+
+# Global push delivery worker instance
+push_worker = PushDeliveryWorker()
@@ -0,0 +1,218 @@
+"""
+Query Instrumentation
+- SQLAlchemy engine events count every statement and time it, per request (contextvar scoped)
+- Keeps the slowest statements of each request with normalized SQL (literals and IN lists folded)
+- Flags N+1 patterns: the most repeated statement and its count
+- Debug mode: X-DB-Query-Count / X-DB-Time-Ms / X-DB-Slowest-Ms response headers
+- Structured (JSON) logs: slow or statement-heavy requests always, others sampled
+- Slow statements outside requests (background jobs) are logged on their own
+"""
+
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = b"x-db-query-count"
+DB_TIME_HEADER = b"x-db-time-ms"
+SLOWEST_HEADER = b"x-db-slowest-ms"
+
+_START_TIMES_KEY = "query_instrumentation_start"
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+@dataclass(frozen=True)
+class QueryInstrumentationConfig:
+    debug_headers: bool = False
+    slow_query_ms: float = 100.0       # a single statement slower than this is "slow"
+    slow_request_db_ms: float = 500.0  # total DB time per request that counts as slow
+    max_queries: int = 50              # statement count per request that counts as N+1-ish
+    sample_rate: float = 0.01          # fraction of unremarkable requests logged anyway
+    slowest_kept: int = 3
+
+    @classmethod
+    def from_env(cls) -> "QueryInstrumentationConfig":
+        return cls(
+            debug_headers=_env_flag("QUERY_DEBUG_HEADERS", os.getenv("DEVELOPMENT_MODE", "false")),
+            slow_query_ms=float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100)),
+            slow_request_db_ms=float(os.getenv("SLOW_REQUEST_DB_MS", 500)),
+            max_queries=int(os.getenv("QUERY_COUNT_WARNING", 50)),
+            sample_rate=float(os.getenv("QUERY_LOG_SAMPLE_RATE", 0.01)),
+            slowest_kept=int(os.getenv("QUERY_SLOWEST_KEPT", 3)),
+        )
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re.compile(r"(\(\?, \.\.\.\))(?:\s*,\s*\(\?, \.\.\.\))+"), r"\1, ..."),
+    (re.compile(r"\s+"), " "),
+]
+
+@lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    """Literal-free form of a statement, so the same query shape groups together"""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+class RequestQueryStats:
+    """Statements issued while handling one request"""
+    __slots__ = ("count", "total_seconds", "slowest", "_kept", "_by_statement")
+
+    def __init__(self, kept: int):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest: List[Tuple[float, str]] = []  # min-heap of the `kept` slowest
+        self._kept = kept
+        self._by_statement: Dict[str, int] = {}
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        # Compiled statements are cached by SQLAlchemy, so equal queries are usually the same str
+        self._by_statement[statement] = self._by_statement.get(statement, 0) + 1
+        if len(self.slowest) < self._kept:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    @property
+    def slowest_seconds(self) -> float:
+        return max((seconds for seconds, _ in self.slowest), default=0.0)
+
+    def most_repeated(self) -> Tuple[Optional[str], int]:
+        if not self._by_statement:
+            return None, 0
+        statement, count = max(self._by_statement.items(), key=lambda item: item[1])
+        return normalize_sql(statement), count
+
+    def as_dict(self) -> Dict[str, Any]:
+        repeated_sql, repeated_count = self.most_repeated()
+        return {
+            "queries": self.count,
+            "db_ms": round(self.total_seconds * 1000, 2),
+            "slowest": [
+                {"ms": round(seconds * 1000, 2), "sql": normalize_sql(statement)}
+                for seconds, statement in sorted(self.slowest, reverse=True)
+            ],
+            "most_repeated": {"count": repeated_count, "sql": repeated_sql} if repeated_count > 1 else None,
+        }
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+class QueryInstrumentation:
+    def __init__(self, config: Optional[QueryInstrumentationConfig] = None):
+        self.config = config or QueryInstrumentationConfig.from_env()
+        self._installed = False
+
+    def install(self):
+        """Listen on every Engine (app.py and dependencies.py each create their own)"""
+        if self._installed:
+            return
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(Engine, "handle_error", self._handle_error)
+        self._installed = True
+
+    def start_request(self) -> Tuple[RequestQueryStats, Any]:
+        stats = RequestQueryStats(self.config.slowest_kept)
+        return stats, _current_stats.set(stats)
+
+    def finish_request(self, token: Any):
+        _current_stats.reset(token)
+
+    def current(self) -> Optional[RequestQueryStats]:
+        return _current_stats.get()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info[_START_TIMES_KEY].pop()
+        seconds = time.perf_counter() - started
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.add(statement, seconds)
+        elif seconds * 1000 >= self.config.slow_query_ms:
+            payload = {"event": "slow_query", "ms": round(seconds * 1000, 2), "sql": normalize_sql(statement)}
+            logger.warning(json.dumps(payload), extra={"db": payload})
+
+    def _handle_error(self, exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        connection = exception_context.connection
+        if connection is not None and connection.info.get(_START_TIMES_KEY):
+            connection.info[_START_TIMES_KEY].pop()
+
+    def log_request(self, method: str, path: str, status_code: int, stats: RequestQueryStats, seconds: float):
+        config = self.config
+        slow = (
+            stats.slowest_seconds * 1000 >= config.slow_query_ms
+            or stats.total_seconds * 1000 >= config.slow_request_db_ms
+            or stats.count >= config.max_queries
+        )
+        if not slow and random.random() >= config.sample_rate:
+            return
+        payload = {
+            "event": "slow_request_db" if slow else "request_db",
+            "method": method,
+            "path": path,
+            "status": status_code,
+            "request_ms": round(seconds * 1000, 2),
+            **stats.as_dict(),
+        }
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(payload, ensure_ascii=False), extra={"db": payload})
+
+# Global instrumentation
+query_instrumentation = QueryInstrumentation()
+
+class QueryInstrumentationMiddleware:
+    """ASGI middleware scoping statement stats to each HTTP request"""
+
+    def __init__(self, app, instrumentation: Optional[QueryInstrumentation] = None):
+        self.app = app
+        self.instrumentation = instrumentation or query_instrumentation
+        self.instrumentation.install()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        instrumentation = self.instrumentation
+        stats, token = instrumentation.start_request()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_headers(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if instrumentation.config.debug_headers:
+                    # Body is rendered by now, so the endpoint's statements are all counted
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (QUERY_COUNT_HEADER, str(stats.count).encode()),
+                        (DB_TIME_HEADER, f"{stats.total_seconds * 1000:.2f}".encode()),
+                        (SLOWEST_HEADER, f"{stats.slowest_seconds * 1000:.2f}".encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            instrumentation.finish_request(token)
+            instrumentation.log_request(scope["method"], scope["path"], status_code, stats, time.perf_counter() - started)
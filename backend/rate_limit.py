@@ -0,0 +1,255 @@
+"""
+Rate Limiting
+- Token buckets per (policy, user id or client IP): `capacity` requests of burst, refilled at `refill_per_second`
+- Route policies applied with `@rate_limited("login")`; user-scoped policies fall back to the client IP
+  when the route has no authenticated user
+- Behind RATE_LIMIT_TRUSTED_PROXIES reverse proxies the client IP is the X-Forwarded-For entry the
+  outermost trusted proxy appended; entries further left are client-supplied and ignored
+- Two stores: in-process (one (tokens, updated, full_at) tuple per active key) and a shared SQLite file
+  for multi-worker deployments on one host (RATE_LIMIT_STORE=sqlite, RATE_LIMIT_STORE_PATH)
+- Buckets that have refilled completely are evicted: a missing bucket is a full one, so eviction
+  never changes a decision; RATE_LIMIT_MAX_KEYS caps memory under key spraying
+- Rejections are 429 with Retry-After and counted in rate_limit_rejections_total
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from response_cache import bind_request
+from metrics import rate_limit_rejections_total
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_STORE_PATH = os.getenv("RATE_LIMIT_STORE_PATH", "/tmp/jaegram-rate-limit.sqlite")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_IDLE_SECONDS = float(os.getenv("RATE_LIMIT_IDLE_SECONDS", "3600"))
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+SWEEP_EVERY = 256
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    capacity: float
+    refill_per_second: float
+    scope: str = "user"  # "user" (falls back to IP) or "ip"
+
+    @classmethod
+    def per_minute(cls, name: str, requests: int, burst: Optional[int] = None, scope: str = "user") -> "RateLimitPolicy":
+        return cls(name, burst or requests, requests / 60.0, scope)
+
+    @classmethod
+    def per_hour(cls, name: str, requests: int, burst: Optional[int] = None, scope: str = "user") -> "RateLimitPolicy":
+        return cls(name, burst or requests, requests / 3600.0, scope)
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    remaining: float
+    retry_after: float  # seconds until `cost` tokens are available; 0 when allowed
+
+DEFAULT_POLICIES: Mapping[str, RateLimitPolicy] = MappingProxyType({
+    policy.name: policy for policy in (
+        # bcrypt verification per attempt; keyed by IP because the caller is not authenticated yet
+        RateLimitPolicy.per_minute("login", 10, scope="ip"),
+        RateLimitPolicy.per_hour("register", 10, burst=5, scope="ip"),
+        RateLimitPolicy.per_hour("send_verification_email", 5, burst=3),
+        RateLimitPolicy.per_minute("security_score", 10),
+        RateLimitPolicy.per_minute("statistics", 30, burst=10),
+        RateLimitPolicy.per_minute("admin_lists", 30),
+    )
+})
+
+def _take(state: Optional[Tuple[float, float, float]], now: float, capacity: float, rate: float,
+          cost: float) -> Tuple[RateLimitDecision, Tuple[float, float, float]]:
+    """Refill, try to spend `cost`; returns the decision and the new (tokens, updated, full_at) state"""
+    tokens = capacity if state is None else min(capacity, state[0] + max(0.0, now - state[1]) * rate)
+    if tokens >= cost:
+        tokens -= cost
+        decision = RateLimitDecision(True, tokens, 0.0)
+    else:
+        decision = RateLimitDecision(False, tokens, (cost - tokens) / rate)
+    return decision, (tokens, now, now + (capacity - tokens) / rate)
+
+class MemoryBucketStore:
+    """Per-process buckets in touch order; sweeping from the front finds the idle ones first"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, idle_seconds: float = RATE_LIMIT_IDLE_SECONDS):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> RateLimitDecision:
+        now = time.monotonic()
+        with self._lock:
+            decision, state = _take(self._buckets.get(key), now, capacity, rate, cost)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            self._evict(now)
+        return decision
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            _, updated, full_at = next(iter(buckets.values()))
+            if full_at > now and now - updated < self.idle_seconds and len(buckets) <= self.max_keys:
+                break
+            buckets.popitem(last=False)
+
+class SQLiteBucketStore:
+    """Buckets in a local SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path: str = RATE_LIMIT_STORE_PATH, idle_seconds: float = RATE_LIMIT_IDLE_SECONDS):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._ops = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing buckets on a crash only forgives some requests
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_buckets_full_at ON rate_limit_buckets (full_at)")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> RateLimitDecision:
+        now = time.time()  # wall clock: shared between processes
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at, full_at FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            decision, (tokens, updated, full_at) = _take(row, now, capacity, rate, cost)
+            conn.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, "
+                "updated_at = excluded.updated_at, full_at = excluded.full_at",
+                (key, tokens, updated, full_at)
+            )
+            self._ops += 1
+            if self._ops % SWEEP_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM rate_limit_buckets WHERE full_at <= ? OR updated_at < ?",
+                    (now, now - self.idle_seconds)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return decision
+
+    def size(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rate_limit_buckets")
+
+class RateLimiter:
+    def __init__(self, store=None, policies: Mapping[str, RateLimitPolicy] = DEFAULT_POLICIES,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.policies = policies
+        self.enabled = enabled
+
+    def check(self, policy_name: str, identity: str, cost: float = 1.0) -> RateLimitDecision:
+        policy = self.policies[policy_name]
+        if not self.enabled:
+            return RateLimitDecision(True, policy.capacity, 0.0)
+        try:
+            decision = self.store.take(f"{policy.name}:{identity}", policy.capacity, policy.refill_per_second, cost)
+        except Exception as e:
+            # Fail open: a broken limiter store must not take the routes down with it
+            logger.error(f"Rate limit store error for policy '{policy.name}': {e}")
+            return RateLimitDecision(True, 0.0, 0.0)
+        if not decision.allowed:
+            rate_limit_rejections_total.inc(policy=policy.name, scope=identity.split(":", 1)[0])
+        return decision
+
+def client_ip(request: Request, trusted_proxies: Optional[int] = None) -> str:
+    """Address of the client that reached the first trusted proxy (or this server when there is none)"""
+    trusted_proxies = RATE_LIMIT_TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    if trusted_proxies > 0:
+        hops = [hop.strip() for hop in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return request.client.host if request.client else "unknown"
+
+def _create_rate_limiter() -> RateLimiter:
+    if RATE_LIMIT_STORE == "sqlite":
+        return RateLimiter(SQLiteBucketStore())
+    return RateLimiter(MemoryBucketStore())
+
+# Global rate limiter instance
+rate_limiter = _create_rate_limiter()
+
+def rate_limited(policy_name: str, user_param: str = "current_user", limiter: Optional[RateLimiter] = None):
+    """
+    Apply a token-bucket policy to an endpoint before it runs.
+
+    User-scoped policies key on the `user_param` dependency's id when the route
+    has one, otherwise on the client IP. Rejected calls get 429 with Retry-After.
+    """
+    if policy_name not in DEFAULT_POLICIES and limiter is None:
+        raise ValueError(f"Unknown rate limit policy: {policy_name}")
+
+    def decorator(func: Callable):
+        is_coroutine = asyncio.iscoroutinefunction(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            active = limiter or rate_limiter
+            request = take_request(kwargs)
+            user = kwargs.get(user_param)
+            if active.policies[policy_name].scope == "user" and user is not None:
+                identity = f"user:{user.id}"
+            else:
+                identity = f"ip:{client_ip(request)}"
+
+            decision = active.check(policy_name, identity)
+            if not decision.allowed:
+                retry_after = max(1, math.ceil(decision.retry_after))
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Çok fazla istek. Lütfen {retry_after} saniye sonra tekrar deneyin.",
+                    headers={"Retry-After": str(retry_after)}
+                )
+
+            if is_coroutine:
+                return await func(*args, **kwargs)
+            return await run_in_threadpool(func, *args, **kwargs)
+
+        take_request = bind_request(func, wrapper)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,74 @@
+"""
+Referral Codes
+- Codes derived from the user id: a keyed 4-round Feistel permutation over 40 bits, rendered as
+  8 Crockford base-32 characters; O(1), no lookup, no probe loop
+- Bijective, so two users can never derive the same code; ids that are neighbours give unrelated codes
+- Keyed with REFERRAL_CODE_KEY (falls back to SECRET_KEY) so codes cannot be mapped back to user ids
+- Tweak rounds give a user an alternative code if a legacy random code already took the derived one
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CODE_LENGTH = 8
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base-32: no I, L, O, U
+DOMAIN_BITS = CODE_LENGTH * 5
+HALF_BITS = DOMAIN_BITS // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+MAX_TWEAKS = 4
+
+_DECODE = {char: index for index, char in enumerate(ALPHABET)}
+
+class ReferralCodeAllocator:
+    """Keyed permutation of user ids onto 8-character codes"""
+
+    def __init__(self, key: str):
+        self._key = key.encode("utf-8")
+
+    def _round(self, tweak: int, round_index: int, half: int) -> int:
+        digest = hmac.new(self._key, bytes((tweak, round_index)) + half.to_bytes(3, "big"), hashlib.sha256).digest()
+        return int.from_bytes(digest[:3], "big") & HALF_MASK
+
+    def permute(self, value: int, tweak: int = 0) -> int:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_index in range(ROUNDS):
+            left, right = right, left ^ self._round(tweak, round_index, right)
+        return (left << HALF_BITS) | right
+
+    def invert(self, value: int, tweak: int = 0) -> int:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_index in reversed(range(ROUNDS)):
+            left, right = right ^ self._round(tweak, round_index, left), left
+        return (left << HALF_BITS) | right
+
+    def code_for(self, user_id: int, tweak: int = 0) -> str:
+        """The referral code for `user_id`; distinct users always get distinct codes for the same tweak"""
+        if not 0 <= user_id < (1 << DOMAIN_BITS):
+            raise ValueError(f"user id {user_id} outside the referral code domain")
+        value = self.permute(user_id, tweak)
+        return "".join(ALPHABET[(value >> shift) & 0x1F] for shift in range(DOMAIN_BITS - 5, -1, -5))
+
+    def user_id_for(self, code: str, tweak: int = 0) -> Optional[int]:
+        """Inverse of code_for; None when `code` is not a derived code"""
+        code = normalize_code(code)
+        if len(code) != CODE_LENGTH or any(char not in _DECODE for char in code):
+            return None
+        value = 0
+        for char in code:
+            value = (value << 5) | _DECODE[char]
+        return self.invert(value, tweak)
+
+def normalize_code(code: str) -> str:
+    """Codes are stored upper-case; accept pasted input with spaces or lower case"""
+    return (code or "").strip().upper()
+
+# Global allocator instance
+referral_codes = ReferralCodeAllocator(
+    os.getenv("REFERRAL_CODE_KEY") or os.getenv("SECRET_KEY") or "referral-code-key-change-in-production"
+)
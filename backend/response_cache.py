@@ -0,0 +1,348 @@
+"""
+HTTP Response Cache
+- In-process TTL + LRU store of serialized JSON responses for catalog-style endpoints
+- Strong content-hash ETags; If-None-Match answered with 304 Not Modified
+- Tag-based invalidation, driven by ORM commits touching watched models or explicit per-transaction tags;
+  models can also drop the per-user tags of only the users whose rows were written;
+  the per-user caches in user_cache share the same commit hooks
+- Per-route hit / miss / 304 counters
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, inspect as inspect_state
+from sqlalchemy.orm import Session
+
+from fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 2048
+
+_PENDING_TAGS_KEY = "response_cache_pending_tags"
+_REQUEST_PARAM = "_cache_request"
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    expires_at: float
+    tags: FrozenSet[str]
+
+@dataclass
+class RouteStats:
+    hits: int = 0
+    misses: int = 0
+    not_modified: int = 0
+    uncacheable: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison per RFC 9110: any listed tag (W/ prefix ignored) or '*'"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def user_tag(tag: str, user_id: int) -> str:
+    """Tag scoping a cached entry to one user, e.g. education:user:42"""
+    return f"{tag}:user:{user_id}"
+
+def render_json(content: Any) -> bytes:
+    # Same encoder as the app's FastJSONResponse so cached bodies are byte-identical
+    return dumps(content)
+
+class ResponseCache:
+    """Thread-safe TTL + LRU store of rendered responses, indexed by tag for invalidation"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, default_ttl: int = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Tuple, body: bytes, ttl: Optional[int] = None, tags: Iterable[str] = ()) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            etag=make_etag(body),
+            expires_at=time.monotonic() + (ttl if ttl is not None else self.default_ttl),
+            tags=frozenset(tags),
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """Drop every entry carrying any of the given tags; returns the number removed"""
+        wanted = set(tags)
+        if not wanted:
+            return 0
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.tags & wanted]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.debug(f"Invalidated {len(stale)} cached responses for tags {sorted(wanted)}")
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, route: str, outcome: str):
+        with self._lock:
+            stats = self._stats.setdefault(route, RouteStats())
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {
+                route: {**asdict(stats), "hit_ratio": round(stats.hit_ratio, 4)}
+                for route, stats in self._stats.items()
+            }
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "routes": routes,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+# Global response cache
+response_cache = ResponseCache()
+
+def bind_request(func: Callable, wrapper: Callable) -> Callable[[Dict[str, Any]], Request]:
+    """
+    Make sure an endpoint wrapper receives the Request.
+
+    Reuses the endpoint's own Request parameter when it declares one; otherwise
+    exposes a hidden one on the wrapper's signature for FastAPI to fill. Returns
+    a getter that extracts the Request from the call kwargs (removing the hidden one).
+    """
+    signature = inspect.signature(func)
+    declared = next(
+        (name for name, param in signature.parameters.items() if param.annotation is Request),
+        None,
+    )
+    if declared:
+        return lambda kwargs: kwargs[declared]
+
+    extra = inspect.Parameter(_REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), extra])
+    return lambda kwargs: kwargs.pop(_REQUEST_PARAM)
+
+def _is_cacheable(result: Any) -> bool:
+    # Service methods report failures as {"success": False, ...}; never pin those
+    return not (isinstance(result, dict) and result.get("success") is False)
+
+def cached_response(
+    route: str,
+    ttl: Optional[int] = None,
+    tags: Iterable[str] = (),
+    vary_on_user: bool = False,
+    cache: Optional[ResponseCache] = None,
+):
+    """
+    Cache a JSON endpoint's rendered body and serve conditional requests.
+
+    The key is the route name, request path and query string (plus the
+    `current_user` id when vary_on_user is set, which also tags the entry with
+    user_tag(tag, id) for each tag). Only for endpoints without a response_model:
+    the cached body is returned as-is.
+    """
+    tags = tuple(tags)
+
+    def decorator(func: Callable):
+        is_coroutine = asyncio.iscoroutinefunction(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            store = cache or response_cache
+            request = take_request(kwargs)
+
+            user_id = None
+            entry_tags = tags
+            if vary_on_user:
+                user_id = kwargs["current_user"].id
+                entry_tags = tags + tuple(user_tag(tag, user_id) for tag in tags)
+            key = (route, request.url.path, tuple(sorted(request.query_params.multi_items())), user_id)
+
+            entry = store.get(key)
+            if entry is not None:
+                store.record(route, "hits")
+            else:
+                store.record(route, "misses")
+                if is_coroutine:
+                    result = await func(*args, **kwargs)
+                else:
+                    result = await run_in_threadpool(func, *args, **kwargs)
+                if isinstance(result, Response):
+                    store.record(route, "uncacheable")
+                    return result
+                body = render_json(result)
+                if not _is_cacheable(result):
+                    store.record(route, "uncacheable")
+                    return Response(content=body, media_type="application/json")
+                entry = store.set(key, body, ttl, entry_tags)
+
+            headers = {
+                "ETag": entry.etag,
+                "Cache-Control": f"{'private' if vary_on_user else 'public'}, max-age=0, must-revalidate",
+            }
+            if etag_matches(request.headers.get("if-none-match"), entry.etag):
+                store.record(route, "not_modified")
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            return Response(content=entry.body, media_type="application/json", headers=headers)
+
+        take_request = bind_request(func, wrapper)
+        return wrapper
+
+    return decorator
+
+# --- Commit invalidation: one set of Session hooks collects tags per cache and applies them on commit ---
+
+@dataclass(frozen=True)
+class _CommitWatch:
+    model_tags: Dict[type, Tuple[str, ...]]
+    user_scoped: Dict[type, Tuple[str, Tuple[str, ...]]]
+    unit_of_work_only: FrozenSet[type]
+
+    def scoped_tags(self, model: type, user_ids: Optional[Iterable[Any]]) -> set:
+        tags = self.user_scoped[model][1]
+        if user_ids is None:
+            return set(tags)
+        return {user_tag(tag, user_id) for tag in tags for user_id in user_ids if user_id is not None}
+
+# Cache -> what invalidates it; caches are anything with invalidate_tags(*tags)
+_commit_watches: "weakref.WeakKeyDictionary[Any, List[_CommitWatch]]" = weakref.WeakKeyDictionary()
+
+def invalidate_after_commit(session: Session, *tags: str, cache: Optional[ResponseCache] = None):
+    """
+    Invalidate `tags` once the session's current transaction commits (dropped on rollback).
+
+    For writes the model map cannot attribute to a user, e.g. per-user tags.
+    """
+    _pending(session, cache or response_cache).update(tags)
+
+def invalidate_on_commit(model_tags: Dict[type, Tuple[str, ...]], cache: Optional[ResponseCache] = None,
+                         user_scoped: Optional[Dict[type, Tuple[str, Tuple[str, ...]]]] = None,
+                         unit_of_work_only: Iterable[type] = ()):
+    """
+    Invalidate cache tags whenever a committed transaction wrote one of the given models.
+
+    Covers ORM unit-of-work changes (add / modify / delete) and bulk ORM
+    insert / update / delete statements. Tags collected in a transaction that
+    rolls back are discarded.
+
+    `user_scoped` maps a model to (user id column, tags): writes drop
+    user_tag(tag, id) for the written rows' users only. Bulk statements whose
+    user ids cannot be told (UPDATE / DELETE) drop the plain tags, i.e. every user,
+    unless the model is listed in `unit_of_work_only`.
+
+    `cache` defaults to the global response cache; per-user caches register
+    themselves here too.
+    """
+    watch = _CommitWatch(model_tags, user_scoped or {}, frozenset(unit_of_work_only))
+    _commit_watches.setdefault(cache or response_cache, []).append(watch)
+
+def _pending(session: Session, cache) -> set:
+    return session.info.setdefault(_PENDING_TAGS_KEY, {}).setdefault(cache, set())
+
+def _bulk_user_ids(orm_execute_state, column: str) -> Optional[set]:
+    if not orm_execute_state.is_insert:
+        return None
+    params = orm_execute_state.parameters
+    if params:
+        rows = params if isinstance(params, list) else [params]
+    else:
+        # Single-row insert(...).values(...): the values are the compiled statement's parameters
+        dialect = orm_execute_state.session.get_bind().dialect
+        rows = [orm_execute_state.statement.compile(dialect=dialect).params]
+    user_ids = {row.get(column) for row in rows}
+    return None if None in user_ids else user_ids
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    written = (*session.new, *session.dirty, *session.deleted)
+    for cache, watches in list(_commit_watches.items()):
+        for watch in watches:
+            for obj in written:
+                model = type(obj)
+                model_tag_set = watch.model_tags.get(model)
+                if model_tag_set:
+                    _pending(session, cache).update(model_tag_set)
+                if model in watch.user_scoped:
+                    column = watch.user_scoped[model][0]
+                    # A reassigned row also changes its previous user's entries
+                    user_ids = {getattr(obj, column), *inspect_state(obj).attrs[column].history.deleted}
+                    _pending(session, cache).update(watch.scoped_tags(model, user_ids))
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    model = mapper.class_
+    for cache, watches in list(_commit_watches.items()):
+        for watch in watches:
+            model_tag_set = watch.model_tags.get(model)
+            if model_tag_set:
+                _pending(orm_execute_state.session, cache).update(model_tag_set)
+            if model in watch.user_scoped:
+                user_ids = _bulk_user_ids(orm_execute_state, watch.user_scoped[model][0])
+                if user_ids is None and model in watch.unit_of_work_only:
+                    continue
+                _pending(orm_execute_state.session, cache).update(watch.scoped_tags(model, user_ids))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    committed = session.info.pop(_PENDING_TAGS_KEY, None)
+    for cache, tags in (committed or {}).items():
+        if tags:
+            cache.invalidate_tags(*tags)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_TAGS_KEY, None)
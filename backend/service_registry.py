@@ -0,0 +1,186 @@
+"""
+Service Registry and Lazy Startup
+- Named factories for heavy integrations and managers, built once on first use
+- Attribute-forwarding proxies so existing module-level names keep working
+- Lazy module imports for heavy third-party packages
+- Import/construction time and RSS accounting per service
+- `--profile-startup` report for boot time and per-worker memory
+"""
+
+import importlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import psutil
+except ImportError:  # Optional: fall back to resource.getrusage
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (peak RSS when psutil is unavailable)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+def process_uptime_seconds() -> Optional[float]:
+    if psutil is None:
+        return None
+    return time.time() - psutil.Process().create_time()
+
+@dataclass
+class LoadRecord:
+    name: str
+    kind: str  # "service" or "module"
+    seconds: float
+    rss_delta_bytes: int
+
+class ServiceRegistry:
+    """Lazily constructed, process-wide service instances"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.load_records: List[LoadRecord] = []
+
+    def register(self, name: str, factory: Callable[[], Any], replace: bool = False):
+        with self._lock:
+            if name in self._factories and not replace:
+                raise ValueError(f"Service already registered: {name}")
+            self._factories[name] = factory
+            if replace:
+                self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown service: {name}")
+                self._instances[name] = self._measure(name, "service", self._factories[name])
+            return self._instances[name]
+
+    def proxy(self, name: str) -> "LazyService":
+        return LazyService(self, name)
+
+    def lazy_module(self, module_name: str) -> "LazyModule":
+        return LazyModule(self, module_name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def registered(self) -> List[str]:
+        return list(self._factories)
+
+    def warm(self, *names: str):
+        for name in names or self.registered():
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Failed to construct service {name}: {e}")
+
+    def reset(self, name: Optional[str] = None):
+        """Drop constructed instances (tests / reconfiguration)"""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def _measure(self, name: str, kind: str, loader: Callable[[], Any]) -> Any:
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        result = loader()
+        record = LoadRecord(
+            name=name,
+            kind=kind,
+            seconds=time.perf_counter() - started,
+            rss_delta_bytes=current_rss_bytes() - rss_before
+        )
+        self.load_records.append(record)
+        logger.debug(f"Loaded {kind} {name} in {record.seconds * 1000:.1f} ms")
+        return result
+
+class LazyService:
+    """Forwards attribute access to the registry instance, constructing it on first use"""
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: ServiceRegistry, name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._registry.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._registry.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._registry.is_loaded(self._name) else "not loaded"
+        return f"<LazyService {self._name} ({state})>"
+
+class LazyModule:
+    """Imports the wrapped module on first attribute access"""
+    __slots__ = ("_registry", "_module_name", "_module")
+
+    def __init__(self, registry: ServiceRegistry, module_name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_module_name", module_name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        if self._module is None:
+            module = self._registry._measure(
+                self._module_name, "module", lambda: importlib.import_module(self._module_name)
+            )
+            object.__setattr__(self, "_module", module)
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._module_name} ({state})>"
+
+def format_startup_report(registry: ServiceRegistry, boot_rss_bytes: int, boot_seconds: Optional[float]) -> str:
+    mb = 1024 * 1024
+    lines = [
+        "Startup profile",
+        f"  boot time:  {boot_seconds:.3f} s" if boot_seconds is not None else "  boot time:  n/a (psutil not installed)",
+        f"  boot RSS:   {boot_rss_bytes / mb:.1f} MB",
+        f"  lazy services registered: {len(registry.registered())}",
+        "",
+        f"  {'kind':<8} {'name':<36} {'time (ms)':>10} {'RSS delta (MB)':>15}",
+    ]
+    for record in sorted(registry.load_records, key=lambda r: r.seconds, reverse=True):
+        lines.append(
+            f"  {record.kind:<8} {record.name:<36} {record.seconds * 1000:>10.1f} {record.rss_delta_bytes / mb:>15.1f}"
+        )
+    lines.append("")
+    lines.append(f"  RSS after warming all services: {current_rss_bytes() / mb:.1f} MB")
+    return "\n".join(lines)
+
+def profile_startup(registry: ServiceRegistry) -> str:
+    """Report boot cost, then construct every registered service and report each one's cost"""
+    boot_rss = current_rss_bytes()
+    boot_seconds = process_uptime_seconds()
+    registry.warm()
+    return format_startup_report(registry, boot_rss, boot_seconds)
+
+# Global registry
+service_registry = ServiceRegistry()
+
+def lazy_import(module_name: str) -> LazyModule:
+    return service_registry.lazy_module(module_name)
@@ -0,0 +1,69 @@
+"""
+Singleflight
+- Concurrent computations of the same key run once; every caller arriving while it runs gets its result
+  (or its exception)
+- Works across threads (sync endpoints in the threadpool) and the event loop: `do` blocks a thread,
+  `do_async` awaits without blocking the loop and runs the leader's function in the threadpool
+- Nothing is cached: the key is forgotten as soon as the computation finishes
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+from metrics import singleflight_calls_total
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """The in-flight call for `key` and whether the caller has to run it"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                singleflight_calls_total.inc(name=self.name, outcome="shared")
+                return call, False
+            call = self._calls[key] = Future()
+        singleflight_calls_total.inc(name=self.name, outcome="executed")
+        return call, True
+
+    def _run(self, key: Hashable, call: Future, fn: Callable[[], T]) -> T:
+        try:
+            result = fn()
+        except BaseException as e:
+            self._forget(key)
+            call.set_exception(e)
+            raise
+        self._forget(key)
+        call.set_result(result)
+        return result
+
+    def _forget(self, key: Hashable):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        call, leader = self._join(key)
+        if leader:
+            return self._run(key, call, fn)
+        return call.result()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], T]) -> T:
+        call, leader = self._join(key)
+        if leader:
+            return await run_in_threadpool(self._run, key, call, fn)
+        return await asyncio.wrap_future(call)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -8,23 +8,29 @@ Advanced Social Features System
 """
 
 import logging
-import random
-import string
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_, or_
-from instagram_scraper import scrape_instagram_profile_modern
+from sqlalchemy import func, desc, and_, or_, update, select
+from sqlalchemy.exc import IntegrityError
 from models import (
     User, Referral, Badge, UserBadge, Leaderboard, UserSocial,
-    CoinTransaction, CoinTransactionType, Task, TaskStatus, InstagramProfile, InstagramCredential, InstagramPost, 
+    CoinTransaction, CoinTransactionType, CoinTransactionCategory, Task, TaskStatus, InstagramProfile, InstagramCredential, InstagramPost, 
     InstagramConnection, UserActivityLog
 )
 from dependencies import SessionLocal
-from enhanced_notifications import NotificationService, NotificationType, NotificationPriority
+from coin_ledger import CoinLedger
+from badge_catalog import badge_catalog
+from referral_codes import referral_codes, normalize_code, MAX_TWEAKS
+from response_cache import invalidate_after_commit, user_tag
+from enhanced_notifications import NotificationService
+from domain_events import publish, BadgeAwarded, CoinEarned, CoinsTransferred, ReferralApplied, ReferralBonusGranted
 
 logger = logging.getLogger(__name__)
 
+# Response cache tag of the per-user social summary (/social/stats)
+SOCIAL_STATS_TAG = "social_stats"
+
 class SocialFeaturesManager:
     """Advanced social features management"""
     
@@ -70,19 +76,31 @@ class SocialFeaturesManager:
                     "message": "Mevcut referans kodunuz"
                 }
             
-            # Generate unique code
-            while True:
-                code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-                existing = db.query(UserSocial).filter(UserSocial.referral_code == code).first()
-                if not existing:
+            # Derived from the user id, so no lookup; a later tweak is only needed if a legacy code holds it
+            code = None
+            for tweak in range(MAX_TWEAKS):
+                candidate = referral_codes.code_for(user_id, tweak)
+                try:
+                    with db.begin_nested():
+                        if user_social is None:
+                            db.add(UserSocial(user_id=user_id, referral_code=candidate))
+                        else:
+                            user_social.referral_code = candidate
+                    code = candidate
                     break
-            
-            if not user_social:
-                user_social = UserSocial(user_id=user_id, referral_code=code)
-                db.add(user_social)
-            else:
-                user_social.referral_code = code
-            
+                except IntegrityError:
+                    # A concurrent request for this user may have stored the same code first
+                    user_social = db.query(UserSocial).filter(UserSocial.user_id == user_id).first()
+                    if user_social and user_social.referral_code:
+                        code = user_social.referral_code
+                        break
+            
+            if code is None:
+                db.rollback()
+                logger.error(f"No free referral code for user {user_id} after {MAX_TWEAKS} tweaks")
+                return {"success": False, "message": "Referans kodu oluşturulurken hata oluştu"}
+            
+            self._invalidate_social_stats(db, user_id)
             db.commit()
             
             return {
@@ -100,6 +118,7 @@ class SocialFeaturesManager:
     
     async def apply_referral_code(self, user_id: int, referral_code: str) -> Dict[str, Any]:
         """Apply referral code for new user"""
+        referral_code = normalize_code(referral_code)
         db = self.db_session_factory()
         try:
             user = db.query(User).filter(User.id == user_id).first()
@@ -141,39 +160,23 @@ class SocialFeaturesManager:
             referrer_social.total_referrals += 1
             
             # Give immediate bonus to referred user
-            user.coin_balance += self.referred_bonus
-            transaction = CoinTransaction(
-                user_id=user_id,
-                amount=self.referred_bonus,
-                type=CoinTransactionType.earn,
-                note=f"Referans bonusu (Kod: {referral_code})"
-            )
-            db.add(transaction)
-            
-            # Notify both users
-            await self.notification_service.create_notification(
-                user_id=user_id,
-                title="Referans Bonusu Kazandınız! 🎁",
-                message=f"Referans kodunu kullandığınız için {self.referred_bonus} coin kazandınız!",
-                notification_type=NotificationType.REFERRAL_BONUS,
-                priority=NotificationPriority.HIGH,
-                data={"bonus_amount": self.referred_bonus, "referrer_username": referrer.username}
+            CoinLedger(db).credit(
+                user_id, self.referred_bonus, CoinTransactionType.earn,
+                note=f"Referans bonusu (Kod: {referral_code})",
+                category=CoinTransactionCategory.referral_bonus,
+                reference_id=referrer_social.user_id
             )
             
-            await self.notification_service.create_notification(
-                user_id=referrer_social.user_id,
-                title="Yeni Referans! 👥",
-                message=f"{user.username} sizin referans kodunuzu kullandı!",
-                notification_type=NotificationType.NEW_REFERRAL,
-                priority=NotificationPriority.MEDIUM,
-                data={"referred_username": user.username}
+            # Notifications and referral achievements are delivered through the outbox
+            publish(
+                db,
+                ReferralApplied(user_id, referrer_social.user_id, self.referred_bonus, user.username, referrer.username),
+                CoinEarned(user_id, self.referred_bonus, CoinTransactionCategory.referral_bonus.value, referrer_social.user_id)
             )
             
+            self._invalidate_social_stats(db, user_id, referrer_social.user_id)
             db.commit()
             
-            # Check for achievements
-            await self._check_referral_achievements(referrer_social.user_id, db)
-            
             return {
                 "success": True,
                 "message": f"Referans kodu uygulandı! {self.referred_bonus} coin kazandınız!",
@@ -208,36 +211,44 @@ class SocialFeaturesManager:
             ).count()
             
             if completed_tasks >= self.min_tasks_for_referral_bonus:
-                # Give bonus to referrer
-                referrer = db.query(User).filter(User.id == referral.referrer_id).first()
                 referred = db.query(User).filter(User.id == referred_user_id).first()
+                if not referred:
+                    return
                 
-                if referrer and referred:
-                    referrer.coin_balance += self.referrer_bonus
-                    
-                    transaction = CoinTransaction(
-                        user_id=referral.referrer_id,
-                        amount=self.referrer_bonus,
-                        type=CoinTransactionType.earn,
-                        note=f"Referans bonusu ({referred.username} {self.min_tasks_for_referral_bonus} görev tamamladı)"
-                    )
-                    db.add(transaction)
-                    
-                    referral.bonus_given = True
-                    
-                    # Notify referrer
-                    await self.notification_service.create_notification(
-                        user_id=referral.referrer_id,
-                        title="Referans Bonusu Kazandınız! 💰",
-                        message=f"{referred.username} {self.min_tasks_for_referral_bonus} görev tamamladı! {self.referrer_bonus} coin kazandınız!",
-                        notification_type=NotificationType.REFERRAL_BONUS,
-                        priority=NotificationPriority.HIGH,
-                        data={"bonus_amount": self.referrer_bonus, "referred_username": referred.username}
-                    )
-                    
-                    db.commit()
-                    
-                    logger.info(f"Referral bonus given to {referrer.username} for referring {referred.username}")
+                # Claim the bonus first so concurrent checks cannot pay it twice
+                claimed = db.execute(
+                    update(Referral)
+                    .where(Referral.id == referral.id, Referral.bonus_given == False)
+                    .values(bonus_given=True)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not claimed:
+                    db.rollback()
+                    return
+                
+                # Give bonus to referrer
+                balance = CoinLedger(db).credit(
+                    referral.referrer_id, self.referrer_bonus, CoinTransactionType.earn,
+                    note=f"Referans bonusu ({referred.username} {self.min_tasks_for_referral_bonus} görev tamamladı)",
+                    category=CoinTransactionCategory.referral_bonus,
+                    reference_id=referred.id
+                )
+                if balance is None:
+                    db.rollback()
+                    return
+                
+                # Referrer notification and badge checks are delivered through the outbox
+                publish(
+                    db,
+                    ReferralBonusGranted(referral.referrer_id, referred.id, self.referrer_bonus, referred.username,
+                                         self.min_tasks_for_referral_bonus),
+                    CoinEarned(referral.referrer_id, self.referrer_bonus, CoinTransactionCategory.referral_bonus.value, referred.id)
+                )
+                
+                self._invalidate_social_stats(db, referral.referrer_id)
+                db.commit()
+                
+                logger.info(f"Referral bonus given to user {referral.referrer_id} for referring {referred.username}")
             
         except Exception as e:
             db.rollback()
@@ -275,74 +286,35 @@ class SocialFeaturesManager:
             if sender.coin_balance < total_cost:
                 return {"success": False, "message": f"Yetersiz bakiye (Gerekli: {total_cost} coin, Bakiye: {sender.coin_balance})"}
             
-            # Process transfer
-            sender.coin_balance -= total_cost
-            recipient.coin_balance += amount
-            
-            # Create transactions
-            sender_transaction = CoinTransaction(
-                user_id=sender_id,
-                amount=-total_cost,
-                type=CoinTransactionType.spend,
-                note=f"Transfer: {amount} coin -> {recipient_username} (Fee: {fee})"
-            )
-            db.add(sender_transaction)
-            
-            recipient_transaction = CoinTransaction(
-                user_id=recipient.id,
-                amount=amount,
-                type=CoinTransactionType.earn,
-                note=f"Transfer alındı: {sender.username} -> {amount} coin"
+            # Conditional debit + credit; rejected if the balance no longer covers the total
+            transfer = CoinLedger(db).transfer(
+                sender_id, recipient.id, amount, fee,
+                sender_note=f"Transfer: {amount} coin -> {recipient_username} (Fee: {fee})",
+                recipient_note=f"Transfer alındı: {sender.username} -> {amount} coin"
             )
-            db.add(recipient_transaction)
+            if transfer is None:
+                db.rollback()
+                return {"success": False, "message": f"Yetersiz bakiye (Gerekli: {total_cost} coin, Bakiye: {sender.coin_balance})"}
             
             # Update social stats
-            sender_social = db.query(UserSocial).filter(UserSocial.user_id == sender_id).first()
-            if not sender_social:
-                sender_social = UserSocial(user_id=sender_id, total_transferred=amount)
-                db.add(sender_social)
-            else:
-                sender_social.total_transferred += amount
-            
-            recipient_social = db.query(UserSocial).filter(UserSocial.user_id == recipient.id).first()
-            if not recipient_social:
-                recipient_social = UserSocial(user_id=recipient.id, total_received=amount)
-                db.add(recipient_social)
-            else:
-                recipient_social.total_received += amount
-            
-            # Notify both users
-            transfer_message = f" - Mesaj: {message}" if message else ""
-            
-            await self.notification_service.create_notification(
-                user_id=recipient.id,
-                title="Coin Transferi Alındı! 💸",
-                message=f"{sender.username} size {amount} coin gönderdi{transfer_message}",
-                notification_type=NotificationType.COIN_TRANSFER_RECEIVED,
-                priority=NotificationPriority.HIGH,
-                data={"amount": amount, "sender_username": sender.username, "message": message}
-            )
-            
-            await self.notification_service.create_notification(
-                user_id=sender_id,
-                title="Coin Transferi Gönderildi! 📤",
-                message=f"{recipient_username} kullanıcısına {amount} coin gönderildi (Fee: {fee} coin)",
-                notification_type=NotificationType.COIN_TRANSFER_SENT,
-                priority=NotificationPriority.MEDIUM,
-                data={"amount": amount, "recipient_username": recipient_username, "fee": fee}
+            self._increment_social_totals(db, sender_id, total_transferred=amount)
+            self._increment_social_totals(db, recipient.id, total_received=amount)
+            self._invalidate_social_stats(db, sender_id, recipient.id)
+            
+            # Notifications and transfer achievements are delivered through the outbox
+            publish(
+                db,
+                CoinsTransferred(sender_id, recipient.id, amount, fee, sender.username, recipient_username, message),
+                CoinEarned(recipient.id, amount, CoinTransactionCategory.transfer_in.value, sender_id)
             )
-            
             db.commit()
             
-            # Check for achievements
-            await self._check_transfer_achievements(sender_id, db)
-            
             return {
                 "success": True,
                 "message": "Transfer başarıyla tamamlandı",
                 "transferred_amount": amount,
                 "fee": fee,
-                "new_balance": sender.coin_balance
+                "new_balance": transfer.sender_balance
             }
             
         except Exception as e:
@@ -352,6 +324,20 @@ class SocialFeaturesManager:
         finally:
             db.close()
     
+    def _increment_social_totals(self, db: Session, user_id: int, **increments: int):
+        """Atomically bump UserSocial counters, creating the row on first use"""
+        updated = db.execute(
+            update(UserSocial)
+            .where(UserSocial.user_id == user_id)
+            .values({
+                getattr(UserSocial, column): func.coalesce(getattr(UserSocial, column), 0) + value
+                for column, value in increments.items()
+            })
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            db.add(UserSocial(user_id=user_id, **increments))
+    
     async def get_leaderboard(self, period: str = "weekly", limit: int = 100) -> List[Dict[str, Any]]:
         """Get leaderboard for specified period, always using Instagram profile photo if available"""
         db = self.db_session_factory()
@@ -484,7 +470,7 @@ class SocialFeaturesManager:
         """Get user's badges and achievements"""
         db = self.db_session_factory()
         try:
-            user_badges = db.query(
+            badges_query = db.query(
                 Badge.name,
                 Badge.description,
                 Badge.icon_url,
@@ -495,7 +481,16 @@ class SocialFeaturesManager:
                 UserBadge.user_id == user_id
             ).order_by(
                 UserBadge.awarded_at.desc()
-            ).all()
+            )
+            user_badges = badges_query.all()
+            
+            # Award new achievements, skipping badges already held so repeat visits write nothing
+            owned = {badge.name for badge in user_badges}
+            held = len(owned)
+            await self._check_all_achievements(user_id, db, owned)
+            if len(owned) > held:
+                db.commit()
+                user_badges = badges_query.all()
             
             badges_data = []
             for badge in user_badges:
@@ -506,9 +501,6 @@ class SocialFeaturesManager:
                     "awarded_at": badge.awarded_at.isoformat() if badge.awarded_at else None
                 })
             
-            # Check for new achievements
-            await self._check_all_achievements(user_id, db)
-            
             return {
                 "success": True,
                 "user_id": user_id,
@@ -526,47 +518,52 @@ class SocialFeaturesManager:
         """Get user's social statistics"""
         db = self.db_session_factory()
         try:
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return {"success": False, "message": "Kullanıcı bulunamadı"}
-            
-            user_social = db.query(UserSocial).filter(UserSocial.user_id == user_id).first()
-            
-            # Get referral stats
-            referrals_made = db.query(Referral).filter(Referral.referrer_id == user_id).count()
-            total_referral_earnings = db.query(func.sum(CoinTransaction.amount)).filter(
-                CoinTransaction.user_id == user_id,
-                CoinTransaction.type == CoinTransactionType.earn,
-                CoinTransaction.note.like("%referans%")
-            ).scalar() or 0
-            
-            # Get leaderboard position
-            weekly_position = db.query(Leaderboard.rank).filter(
-                Leaderboard.user_id == user_id,
+            # One round trip: every counter is an indexed scalar subquery on the user's row
+            referrals_made = select(func.count()).where(Referral.referrer_id == User.id).scalar_subquery()
+            referral_earnings = select(func.coalesce(func.sum(CoinTransaction.amount), 0)).where(
+                CoinTransaction.user_id == User.id,
+                CoinTransaction.category == CoinTransactionCategory.referral_bonus
+            ).scalar_subquery()
+            badge_count = select(func.count()).where(UserBadge.user_id == User.id).scalar_subquery()
+            weekly_position = select(Leaderboard.rank).where(
+                Leaderboard.user_id == User.id,
                 Leaderboard.period == "weekly"
-            ).scalar()
-            
-            monthly_position = db.query(Leaderboard.rank).filter(
-                Leaderboard.user_id == user_id,
+            ).limit(1).scalar_subquery()
+            monthly_position = select(Leaderboard.rank).where(
+                Leaderboard.user_id == User.id,
                 Leaderboard.period == "monthly"
-            ).scalar()
-            
-            # Get badge count
-            badge_count = db.query(UserBadge).filter(UserBadge.user_id == user_id).count()
+            ).limit(1).scalar_subquery()
+            
+            row = db.query(
+                User.username,
+                UserSocial.referral_code,
+                UserSocial.total_transferred,
+                UserSocial.total_received,
+                referrals_made.label("referrals_made"),
+                referral_earnings.label("referral_earnings"),
+                badge_count.label("badge_count"),
+                weekly_position.label("weekly_position"),
+                monthly_position.label("monthly_position")
+            ).outerjoin(
+                UserSocial, UserSocial.user_id == User.id
+            ).filter(User.id == user_id).first()
+            
+            if not row:
+                return {"success": False, "message": "Kullanıcı bulunamadı"}
             
             return {
                 "success": True,
                 "user_id": user_id,
-                "username": user.username,
-                "referral_code": user_social.referral_code if user_social else None,
-                "referrals_made": referrals_made,
-                "total_referral_earnings": total_referral_earnings,
-                "total_transferred": user_social.total_transferred if user_social else 0,
-                "total_received": user_social.total_received if user_social else 0,
-                "badge_count": badge_count,
+                "username": row.username,
+                "referral_code": row.referral_code,
+                "referrals_made": row.referrals_made,
+                "total_referral_earnings": int(row.referral_earnings or 0),
+                "total_transferred": row.total_transferred or 0,
+                "total_received": row.total_received or 0,
+                "badge_count": row.badge_count,
                 "leaderboard_positions": {
-                    "weekly": weekly_position,
-                    "monthly": monthly_position
+                    "weekly": row.weekly_position,
+                    "monthly": row.monthly_position
                 }
             }
             
@@ -576,15 +573,20 @@ class SocialFeaturesManager:
         finally:
             db.close()
     
-    async def _check_all_achievements(self, user_id: int, db: Session):
-        """Check and award all possible achievements for user"""
-        await self._check_task_achievements(user_id, db)
-        await self._check_coin_achievements(user_id, db)
-        await self._check_referral_achievements(user_id, db)
-        await self._check_transfer_achievements(user_id, db)
-        await self._check_leaderboard_achievements(user_id, db)
+    @staticmethod
+    def _invalidate_social_stats(db: Session, *user_ids: int):
+        """Drop the users' cached /social/stats once this transaction commits"""
+        invalidate_after_commit(db, *(user_tag(SOCIAL_STATS_TAG, user_id) for user_id in user_ids))
+    
+    async def _check_all_achievements(self, user_id: int, db: Session, owned: Optional[set] = None):
+        """Check and award all possible achievements for user; badge names in `owned` are skipped"""
+        await self._check_task_achievements(user_id, db, owned)
+        await self._check_coin_achievements(user_id, db, owned)
+        await self._check_referral_achievements(user_id, db, owned)
+        await self._check_transfer_achievements(user_id, db, owned)
+        await self._check_leaderboard_achievements(user_id, db, owned)
     
-    async def _check_task_achievements(self, user_id: int, db: Session):
+    async def _check_task_achievements(self, user_id: int, db: Session, owned: Optional[set] = None):
         """Check and award task-related achievements"""
         completed_tasks = db.query(Task).filter(
             Task.assigned_user_id == user_id,
@@ -593,13 +595,13 @@ class SocialFeaturesManager:
         
         # First task achievement
         if completed_tasks >= 1:
-            await self._award_badge_if_not_exists(user_id, "İlk Görev 🎯", "İlk görevinizi tamamladınız", db)
+            await self._award_badge_if_not_exists(user_id, "İlk Görev 🎯", "İlk görevinizi tamamladınız", db, owned)
         
         # Task master achievement
         if completed_tasks >= self.achievement_thresholds['task_master']:
-            await self._award_badge_if_not_exists(user_id, "Görev Ustası 💪", f"{self.achievement_thresholds['task_master']} görev tamamladınız", db)
+            await self._award_badge_if_not_exists(user_id, "Görev Ustası 💪", f"{self.achievement_thresholds['task_master']} görev tamamladınız", db, owned)
     
-    async def _check_coin_achievements(self, user_id: int, db: Session):
+    async def _check_coin_achievements(self, user_id: int, db: Session, owned: Optional[set] = None):
         """Check and award coin-related achievements"""
         total_earnings = db.query(func.sum(CoinTransaction.amount)).filter(
             CoinTransaction.user_id == user_id,
@@ -607,59 +609,63 @@ class SocialFeaturesManager:
         ).scalar() or 0
         
         if total_earnings >= self.achievement_thresholds['coin_collector']:
-            await self._award_badge_if_not_exists(user_id, "Coin Koleksiyoncusu 🪙", f"{self.achievement_thresholds['coin_collector']} coin kazandınız", db)
+            await self._award_badge_if_not_exists(user_id, "Coin Koleksiyoncusu 🪙", f"{self.achievement_thresholds['coin_collector']} coin kazandınız", db, owned)
+    
+    async def award_referral_achievements(self, user_id: int):
+        """Referral achievements in their own transaction (outbox consumer)"""
+        await self._award_in_session(self._check_referral_achievements, user_id)
+    
+    async def award_transfer_achievements(self, user_id: int):
+        """Transfer achievements in their own transaction (outbox consumer)"""
+        await self._award_in_session(self._check_transfer_achievements, user_id)
+    
+    async def _award_in_session(self, check, user_id: int):
+        db = self.db_session_factory()
+        try:
+            await check(user_id, db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
     
-    async def _check_referral_achievements(self, user_id: int, db: Session):
+    async def _check_referral_achievements(self, user_id: int, db: Session, owned: Optional[set] = None):
         """Check and award referral-related achievements"""
         referral_count = db.query(Referral).filter(Referral.referrer_id == user_id).count()
         
         if referral_count >= self.achievement_thresholds['social_butterfly']:
-            await self._award_badge_if_not_exists(user_id, "Sosyal Kelebek 🦋", f"{self.achievement_thresholds['social_butterfly']} kişi davet ettiniz", db)
+            await self._award_badge_if_not_exists(user_id, "Sosyal Kelebek 🦋", f"{self.achievement_thresholds['social_butterfly']} kişi davet ettiniz", db, owned)
     
-    async def _check_transfer_achievements(self, user_id: int, db: Session):
+    async def _check_transfer_achievements(self, user_id: int, db: Session, owned: Optional[set] = None):
         """Check and award transfer-related achievements"""
         user_social = db.query(UserSocial).filter(UserSocial.user_id == user_id).first()
         
         if user_social and user_social.total_transferred >= self.achievement_thresholds['helping_hand']:
-            await self._award_badge_if_not_exists(user_id, "Yardımsever El 🤝", f"{self.achievement_thresholds['helping_hand']} coin transfer ettiniz", db)
+            await self._award_badge_if_not_exists(user_id, "Yardımsever El 🤝", f"{self.achievement_thresholds['helping_hand']} coin transfer ettiniz", db, owned)
     
-    async def _check_leaderboard_achievements(self, user_id: int, db: Session):
+    async def _check_leaderboard_achievements(self, user_id: int, db: Session, owned: Optional[set] = None):
         """Check and award leaderboard-related achievements"""
         top_position = db.query(func.min(Leaderboard.rank)).filter(
             Leaderboard.user_id == user_id
         ).scalar()
         
         if top_position and top_position <= self.achievement_thresholds['top_performer']:
-            await self._award_badge_if_not_exists(user_id, "En İyi Performans 🏆", "Lider tablosunda 1. oldunuz", db)
+            await self._award_badge_if_not_exists(user_id, "En İyi Performans 🏆", "Lider tablosunda 1. oldunuz", db, owned)
     
-    async def _award_badge_if_not_exists(self, user_id: int, badge_name: str, description: str, db: Session):
+    async def _award_badge_if_not_exists(self, user_id: int, badge_name: str, description: str, db: Session,
+                                         owned: Optional[set] = None):
         """Award badge to user if they don't already have it"""
-        # Get or create badge
-        badge = db.query(Badge).filter(Badge.name == badge_name).first()
-        if not badge:
-            badge = Badge(name=badge_name, description=description)
-            db.add(badge)
-            db.flush()
-        
-        # Check if user already has this badge
-        existing = db.query(UserBadge).filter(
-            UserBadge.user_id == user_id,
-            UserBadge.badge_id == badge.id
-        ).first()
+        if owned is not None:
+            if badge_name in owned:
+                return
+            owned.add(badge_name)
         
-        if not existing:
-            user_badge = UserBadge(user_id=user_id, badge_id=badge.id)
-            db.add(user_badge)
-            
-            # Notify user
-            await self.notification_service.create_notification(
-                user_id=user_id,
-                title="Yeni Rozet Kazandınız! 🏆",
-                message=f"Tebrikler! '{badge_name}' rozetini kazandınız!",
-                notification_type=NotificationType.BADGE_EARNED,
-                priority=NotificationPriority.HIGH,
-                data={"badge_name": badge_name, "description": description}
-            )
+        # Single conflict-ignoring insert; None when the user already has it
+        badge = badge_catalog.award(db, user_id, badge_name)
+        if badge:
+            # Notified through the outbox when the caller commits
+            publish(db, BadgeAwarded(user_id, badge.id, badge.name))
             
             logger.info(f"Awarded badge '{badge_name}' to user {user_id}")
 
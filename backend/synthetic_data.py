@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+"""
+Synthetic Data Generator
+- Seeded, reproducible bulk load of users, coin transactions, notifications, badges,
+  device logs and daily rewards for load and regression testing
+- Power-law (Pareto) activity per user: a few heavy users, a long tail of light ones
+- Long-tail histories: heavy users tend to be older accounts, events skew towards recent days
+- Multi-row INSERT ... VALUES statements sized to the dialect's bound-parameter limit
+- Explicit ids; PostgreSQL id sequences are advanced past the loaded rows afterwards
+- Streams users in chunks (one transaction each), so memory stays flat at 1M+ users and
+  balances / streak columns agree with the generated ledger
+
+Usage:
+    python synthetic_data.py --database-url sqlite:///./synthetic.db --create-schema \\
+        --users 1000000 --transactions 20000000 --seed 42
+"""
+
+import argparse
+import logging
+import math
+import os
+import random
+import sys
+import time
+from array import array
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Connection, Engine
+
+# Add current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import (
+    Base, User, CoinTransaction, CoinTransactionType, CoinTransactionCategory, Notification, Badge, UserBadge,
+    DeviceIPLog, DailyReward
+)
+from daily_rewards import quote_reward
+
+logger = logging.getLogger(__name__)
+
+# Conservative bound-parameter limits per statement
+MAX_BIND_PARAMS = {"sqlite": 32_000, "postgresql": 60_000}
+DEFAULT_MAX_BIND_PARAMS = 10_000
+# Single heavy users are capped at this multiple of the minimum activity weight
+MAX_ACTIVITY_WEIGHT = 20_000.0
+
+NOTIFICATION_TYPES = [
+    ("task_completed", "Görev Tamamlandı ✅", "Görevi başarıyla tamamladınız", 30),
+    ("coin_earned", "Coin Kazandınız 💎", "Hesabınıza coin eklendi", 25),
+    ("daily_login", "Günlük Ödül Alındı! 💎", "Günlük ödülünüz hesabınıza eklendi", 15),
+    ("order_completed", "Sipariş Tamamlandı 🎉", "Siparişiniz tamamlandı", 10),
+    ("badge_earned", "Yeni Rozet Kazandınız! 🏆", "Tebrikler! Yeni bir rozet kazandınız", 5),
+    ("system_update", "Sistem Güncellemesi", "Platform güncellendi", 10),
+    ("security_alert", "Güvenlik Uyarısı", "Yeni bir cihazdan giriş yapıldı", 5),
+]
+DEVICE_ACTIONS = [("login", 85), ("task_complete", 8), ("withdrawal", 4), ("password_change", 3)]
+DEVICE_MODELS = ["iPhone 14", "iPhone 12", "Samsung Galaxy S23", "Xiaomi Redmi Note 12", "Pixel 7", "Chrome/Windows", "Safari/macOS"]
+
+@dataclass(frozen=True)
+class SyntheticDataConfig:
+    users: int = 10_000
+    transactions: int = 200_000       # activity transactions (daily reward credits come on top)
+    notifications: int = 100_000
+    user_badges: int = 30_000
+    device_logs: int = 50_000
+    badges: int = 40
+    reward_window_days: int = 60      # how far back daily reward streaks are generated
+    history_days: int = 730
+    activity_alpha: float = 1.16      # Pareto shape; 1.16 is roughly an 80/20 split
+    seed: int = 42
+    user_chunk: int = 5_000
+
+@dataclass
+class SyntheticDataSummary:
+    config: SyntheticDataConfig
+    rows: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        total = sum(self.rows.values())
+        return {
+            "config": asdict(self.config),
+            "rows": dict(self.rows),
+            "seconds": round(self.seconds, 2),
+            "rows_per_second": round(total / self.seconds) if self.seconds else None,
+        }
+
+class MultiRowWriter:
+    """Buffers rows for one table and writes them as multi-row INSERT ... VALUES statements"""
+
+    def __init__(self, conn: Connection, model, columns: Sequence[str]):
+        table = model.__table__
+        dialect = conn.dialect
+        self.conn = conn
+        self.table_name = table.name
+        self.columns = list(columns)
+        # Same conversions the ORM applies (enum names, SQLite datetime strings, ...)
+        self.processors = [table.c[name].type._cached_bind_processor(dialect) for name in self.columns]
+        limit = MAX_BIND_PARAMS.get(dialect.name, DEFAULT_MAX_BIND_PARAMS)
+        self.rows_per_statement = max(1, limit // len(self.columns))
+        self.placeholder = "?" if dialect.paramstyle == "qmark" else "%s"
+        quote = dialect.identifier_preparer.quote
+        self.prefix = f"INSERT INTO {quote(table.name)} ({', '.join(quote(c) for c in self.columns)}) VALUES "
+        self.row_sql = "(" + ", ".join([self.placeholder] * len(self.columns)) + ")"
+        self._statements: Dict[int, str] = {}
+        self.buffer: List[tuple] = []
+        self.written = 0
+
+    def add(self, *values):
+        self.buffer.append(values)
+        if len(self.buffer) >= self.rows_per_statement:
+            self.flush()
+
+    def flush(self):
+        while self.buffer:
+            chunk = self.buffer[:self.rows_per_statement]
+            del self.buffer[:self.rows_per_statement]
+            params = []
+            for row in chunk:
+                for processor, value in zip(self.processors, row):
+                    params.append(processor(value) if processor is not None and value is not None else value)
+            statement = self._statements.get(len(chunk))
+            if statement is None:
+                statement = self.prefix + ", ".join([self.row_sql] * len(chunk))
+                self._statements[len(chunk)] = statement
+            self.conn.exec_driver_sql(statement, tuple(params))
+            self.written += len(chunk)
+
+class SyntheticDataGenerator:
+    def __init__(self, engine: Engine, config: SyntheticDataConfig, now: Optional[datetime] = None):
+        self.engine = engine
+        self.config = config
+        self.rng = random.Random(config.seed)
+        # Histories end at `now`; pass a fixed value for byte-identical datasets across runs
+        self.now = now or datetime.utcnow().replace(microsecond=0)
+        self.password_hash = self._password_hash()
+
+    def run(self) -> SyntheticDataSummary:
+        started = time.perf_counter()
+        config = self.config
+        summary = SyntheticDataSummary(config=config)
+
+        with self.engine.begin() as conn:
+            self.next_ids = {model: self._max_id(conn, model) + 1 for model in (
+                User, CoinTransaction, Notification, Badge, UserBadge, DeviceIPLog, DailyReward
+            )}
+            badge_ids = self._insert_badges(conn, summary)
+
+        weights = self._activity_weights()
+        total_weight = math.fsum(weights)
+        first_user_id = self.next_ids[User]
+
+        for chunk_start in range(0, config.users, config.user_chunk):
+            chunk_end = min(chunk_start + config.user_chunk, config.users)
+            with self.engine.begin() as conn:
+                writers = self._writers(conn)
+                for index in range(chunk_start, chunk_end):
+                    self._generate_user(writers, first_user_id + index, weights[index], weights[index] / total_weight, badge_ids)
+                # Flush parents before children so foreign keys resolve
+                for writer in writers.values():
+                    writer.flush()
+                    summary.rows[writer.table_name] = summary.rows.get(writer.table_name, 0) + writer.written
+            logger.info(f"Generated {chunk_end:,}/{config.users:,} users ({time.perf_counter() - started:.1f} s)")
+
+        with self.engine.begin() as conn:
+            self._sync_id_sequences(conn)
+
+        summary.seconds = time.perf_counter() - started
+        return summary
+
+    def _writers(self, conn: Connection) -> Dict[str, MultiRowWriter]:
+        return {
+            "users": MultiRowWriter(conn, User, [
+                "id", "username", "email", "email_verified", "password_hash", "full_name", "coin_balance",
+                "is_admin", "is_active", "is_admin_platform", "created_at", "daily_reward_streak", "last_daily_reward"
+            ]),
+            "coin_transactions": MultiRowWriter(conn, CoinTransaction, ["id", "user_id", "amount", "type", "created_at", "note", "category"]),
+            "daily_rewards": MultiRowWriter(conn, DailyReward, ["id", "user_id", "claimed_date", "coin_amount", "consecutive_days", "created_at"]),
+            "notifications": MultiRowWriter(conn, Notification, ["id", "user_id", "title", "message", "type", "read", "created_at"]),
+            "user_badges": MultiRowWriter(conn, UserBadge, ["id", "user_id", "badge_id", "awarded_at"]),
+            "device_ip_logs": MultiRowWriter(conn, DeviceIPLog, ["id", "user_id", "device_info", "ip_address", "action", "created_at"]),
+        }
+
+    def _generate_user(self, writers: Dict[str, MultiRowWriter], user_id: int, weight: float, share: float, badge_ids: List[int]):
+        rng = self.rng
+        config = self.config
+        # Heavier users skew towards older accounts
+        age_exponent = 1 + min(weight, 50.0) / 5
+        age_days = max(1, int(config.history_days * (1 - rng.random() ** age_exponent)))
+        signup = self.now - timedelta(days=age_days, seconds=rng.randint(0, 86_399))
+        history = (self.now - signup).total_seconds()
+
+        def event_time() -> datetime:
+            # Recent days are busier than the start of a history
+            return self.now - timedelta(seconds=history * rng.random() ** 1.5)
+
+        # Ledger: replay events in time order so the balance never goes negative
+        balance = 0
+        tx = writers["coin_transactions"]
+        for created_at in sorted(event_time() for _ in range(self._count(config.transactions * share))):
+            roll = rng.random()
+            if roll < 0.22 and balance >= 20:
+                amount = -rng.randint(20, min(balance, 200))
+                kind, note, category = CoinTransactionType.spend, "Sipariş oluşturma", CoinTransactionCategory.order_payment
+            elif roll < 0.25 and balance >= 100:
+                amount = -rng.randint(100, min(balance, 500))
+                kind, note, category = CoinTransactionType.withdraw, "Coin çekim", CoinTransactionCategory.withdrawal
+            else:
+                amount = rng.randint(10, 60)
+                kind, note, category = CoinTransactionType.earn, "Görev ödülü", CoinTransactionCategory.task_reward
+            balance += amount
+            tx.add(self._take_id(CoinTransaction), user_id, amount, kind, created_at, note, category)
+
+        # Daily reward streaks inside the reward window; claimers are more likely among heavy users
+        # Users store the streak of their last claim, as DailyRewardService.claim does
+        streak, last_claim, last_claim_streak = 0, None, 0
+        if rng.random() < min(0.8, 0.04 * weight):
+            keep_streak = min(0.95, 0.55 + 0.05 * weight)
+            day = max(signup.date(), (self.now - timedelta(days=config.reward_window_days)).date())
+            while day <= self.now.date():
+                if rng.random() < keep_streak:
+                    streak += 1
+                    quote = quote_reward(streak)
+                    claimed_at = datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randint(0, 86_399))
+                    claimed_at = min(claimed_at, self.now)
+                    writers["daily_rewards"].add(self._take_id(DailyReward), user_id, day, quote.total, streak, claimed_at)
+                    tx.add(self._take_id(CoinTransaction), user_id, quote.total, CoinTransactionType.earn, claimed_at,
+                           f"Günlük ödül - {streak}. gün (Bonus: {quote.bonus_multiplier}x)", CoinTransactionCategory.daily_reward)
+                    balance += quote.total
+                    last_claim, last_claim_streak = claimed_at, streak
+                else:
+                    streak = 0
+                day += timedelta(days=1)
+
+        writers["users"].add(
+            user_id, f"synthetic_{config.seed}_{user_id}", f"synthetic_{config.seed}_{user_id}@example.com",
+            rng.random() < 0.7, self.password_hash, f"Synthetic User {user_id}", balance,
+            False, True, False, signup, last_claim_streak, last_claim
+        )
+
+        for _ in range(self._count(config.notifications * share)):
+            notification_type, title, message = self._weighted(NOTIFICATION_TYPES)
+            created_at = event_time()
+            read = created_at < self.now - timedelta(days=3) or rng.random() < 0.3
+            writers["notifications"].add(self._take_id(Notification), user_id, title, message, notification_type, read, created_at)
+
+        badge_count = min(len(badge_ids), self._count(config.user_badges * share))
+        for badge_id in rng.sample(badge_ids, badge_count):
+            writers["user_badges"].add(self._take_id(UserBadge), user_id, badge_id, event_time())
+
+        devices = [
+            (rng.choice(DEVICE_MODELS), f"{rng.randint(78, 212)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}")
+            for _ in range(1 + min(3, int(rng.paretovariate(2.5))))
+        ]
+        writers["device_ip_logs"].add(self._take_id(DeviceIPLog), user_id, devices[0][0], devices[0][1], "register", signup)
+        for _ in range(self._count(config.device_logs * share)):
+            device, ip_address = rng.choice(devices)
+            action = self._weighted_value(DEVICE_ACTIONS)
+            writers["device_ip_logs"].add(self._take_id(DeviceIPLog), user_id, device, ip_address, action, event_time())
+
+    def _insert_badges(self, conn: Connection, summary: SyntheticDataSummary) -> List[int]:
+        writer = MultiRowWriter(conn, Badge, ["id", "name", "description", "category", "icon", "is_active", "created_at"])
+        categories = ["starter", "bronze", "silver", "gold", "platinum", "diamond", "achievement", "social"]
+        badge_ids = []
+        for index in range(self.config.badges):
+            badge_id = self._take_id(Badge)
+            writer.add(
+                badge_id, f"Synthetic Badge {self.config.seed}-{badge_id}", f"Sentetik rozet #{index + 1}",
+                categories[index % len(categories)], "🏅", True, self.now - timedelta(days=self.config.history_days)
+            )
+            badge_ids.append(badge_id)
+        writer.flush()
+        summary.rows["badges"] = writer.written
+        return badge_ids
+
+    def _activity_weights(self) -> array:
+        rng = self.rng
+        alpha = self.config.activity_alpha
+        return array("d", (min(rng.paretovariate(alpha), MAX_ACTIVITY_WEIGHT) for _ in range(self.config.users)))
+
+    def _count(self, expected: float) -> int:
+        """Stochastic rounding, so per-user counts add up to the configured totals on average"""
+        whole = int(expected)
+        return whole + (1 if self.rng.random() < expected - whole else 0)
+
+    def _weighted(self, choices):
+        return self.rng.choices(choices, weights=[choice[-1] for choice in choices])[0][:-1]
+
+    def _weighted_value(self, choices):
+        return self._weighted(choices)[0]
+
+    def _take_id(self, model) -> int:
+        next_id = self.next_ids[model]
+        self.next_ids[model] = next_id + 1
+        return next_id
+
+    @staticmethod
+    def _max_id(conn: Connection, model) -> int:
+        return conn.execute(select(func.max(model.id))).scalar() or 0
+
+    def _sync_id_sequences(self, conn: Connection):
+        """Rows carry explicit ids, which leave PostgreSQL's SERIAL sequences behind; move them past the load"""
+        if conn.dialect.name != "postgresql":
+            return
+        for model in self.next_ids:
+            conn.execute(select(func.setval(func.pg_get_serial_sequence(model.__tablename__, "id"), func.max(model.id))))
+
+    @staticmethod
+    def _password_hash() -> str:
+        """One bcrypt hash of 'synthetic-password' shared by every generated user"""
+        from passlib.context import CryptContext
+        return CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("synthetic-password")
+
+def generate(engine: Engine, config: SyntheticDataConfig, create_schema: bool = False,
+             now: Optional[datetime] = None) -> SyntheticDataSummary:
+    if create_schema:
+        Base.metadata.create_all(bind=engine)
+    return SyntheticDataGenerator(engine, config, now=now).run()
+
+def main(argv=None):
+    defaults = SyntheticDataConfig()
+    parser = argparse.ArgumentParser(description="Bulk-load a reproducible synthetic dataset")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./synthetic.db"))
+    parser.add_argument("--create-schema", action="store_true", help="create missing tables from the models first")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--transactions", type=int, default=defaults.transactions)
+    parser.add_argument("--notifications", type=int, default=defaults.notifications)
+    parser.add_argument("--user-badges", type=int, default=defaults.user_badges)
+    parser.add_argument("--device-logs", type=int, default=defaults.device_logs)
+    parser.add_argument("--badges", type=int, default=defaults.badges)
+    parser.add_argument("--history-days", type=int, default=defaults.history_days)
+    parser.add_argument("--reward-window-days", type=int, default=defaults.reward_window_days)
+    parser.add_argument("--activity-alpha", type=float, default=defaults.activity_alpha,
+                        help="Pareto shape of per-user activity; lower is more skewed")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--user-chunk", type=int, default=defaults.user_chunk)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = SyntheticDataConfig(
+        users=args.users,
+        transactions=args.transactions,
+        notifications=args.notifications,
+        user_badges=args.user_badges,
+        device_logs=args.device_logs,
+        badges=args.badges,
+        reward_window_days=args.reward_window_days,
+        history_days=args.history_days,
+        activity_alpha=args.activity_alpha,
+        seed=args.seed,
+        user_chunk=args.user_chunk,
+    )
+    connect_args = {"check_same_thread": False} if args.database_url.startswith("sqlite") else {}
+    engine = create_engine(args.database_url, connect_args=connect_args)
+    summary = generate(engine, config, create_schema=args.create_schema)
+    result = summary.as_dict()
+    logger.info(f"Inserted {result['rows']} in {result['seconds']} s ({result['rows_per_second']} rows/s)")
+
+if __name__ == "__main__":
+    main()
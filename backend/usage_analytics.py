@@ -0,0 +1,205 @@
+"""
+Usage Analytics
+SQL-side activity aggregation for wellness analysis:
+- Day x hour activity matrices built from a single grouped UNION ALL query
+- Task completion / failure totals and completion durations computed in SQL
+- Mental health log counts per day and notification type
+- Bounded per-user snapshot cache with TTL, dropped when the user's tasks, orders or mental health logs are committed
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, cast, literal, extract, union_all, and_, String, Float
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from models import Task, Order, MentalHealthLog, TaskStatus
+from user_cache import PerUserCache
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_SECONDS = 300
+SNAPSHOT_MAX_ENTRIES = 10_000
+DEFAULT_WINDOW_DAYS = 7
+
+@dataclass(frozen=True)
+class UsageSnapshot:
+    """Immutable pre-aggregated view of a user's recent activity"""
+    user_id: int
+    window_start: datetime
+    generated_at: datetime
+    task_matrix: Dict[str, Tuple[int, ...]]      # "YYYY-MM-DD" -> 24 hourly task counts
+    order_matrix: Dict[str, Tuple[int, ...]]     # "YYYY-MM-DD" -> 24 hourly order counts
+    task_status_counts: Dict[str, int]           # status -> count
+    completion_seconds: float                    # summed assigned->completed duration
+    timed_completions: int                       # completed tasks with both timestamps
+    log_counts: Dict[Tuple[str, str], int]       # ("YYYY-MM-DD", notification_type) -> count
+
+    @property
+    def total_tasks(self) -> int:
+        return sum(self.task_status_counts.values())
+
+    def days(self) -> List[str]:
+        return sorted(set(self.task_matrix) | set(self.order_matrix))
+
+    def hourly_totals(self) -> List[int]:
+        """Combined task + order counts per hour of day across the window"""
+        totals = [0] * 24
+        for matrix in (self.task_matrix, self.order_matrix):
+            for row in matrix.values():
+                for hour, count in enumerate(row):
+                    totals[hour] += count
+        return totals
+
+    def day_totals(self, day: str) -> Dict[str, int]:
+        tasks = self.task_matrix.get(day, ())
+        orders = self.order_matrix.get(day, ())
+        active_hours = sum(
+            1 for hour in range(24)
+            if (tasks[hour] if tasks else 0) or (orders[hour] if orders else 0)
+        )
+        return {"tasks": sum(tasks), "orders": sum(orders), "hours_active": active_hours}
+
+    def log_count(self, since_day: Optional[str] = None, notification_types: Optional[set] = None) -> int:
+        return sum(
+            count for (day, notification_type), count in self.log_counts.items()
+            if (since_day is None or day >= since_day)
+            and (notification_types is None or notification_type in notification_types)
+        )
+
+# Global snapshot cache, keyed by user and window start
+_snapshot_cache = PerUserCache(
+    "usage_snapshot",
+    {Task: "assigned_user_id", Order: "user_id", MentalHealthLog: "user_id"},
+    SNAPSHOT_TTL_SECONDS,
+    SNAPSHOT_MAX_ENTRIES,
+)
+
+def _epoch_seconds(column, dialect_name: str):
+    """Dialect-aware epoch seconds expression for duration arithmetic"""
+    if dialect_name == "sqlite":
+        return func.julianday(column) * 86400.0
+    return extract("epoch", column)
+
+def _day_key(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return str(value)[:10]
+
+def _build_usage_query(db: Session, user_id: int, window_start: datetime):
+    dialect_name = db.get_bind().dialect.name
+
+    timed = and_(
+        Task.status == TaskStatus.completed,
+        Task.completed_at.isnot(None),
+        Task.assigned_at.isnot(None),
+    )
+    task_day = func.date(Task.assigned_at)
+    task_hour = extract("hour", Task.assigned_at)
+    task_status = cast(Task.status, String)
+    tasks_q = (
+        Task.__table__.select()
+        .with_only_columns(
+            literal("task").label("source"),
+            task_status.label("kind"),
+            task_day.label("day"),
+            task_hour.label("hour"),
+            func.count().label("events"),
+            func.sum(case(
+                (timed, _epoch_seconds(Task.completed_at, dialect_name) - _epoch_seconds(Task.assigned_at, dialect_name)),
+                else_=0.0,
+            )).label("duration"),
+            func.sum(case((timed, 1), else_=0)).label("timed"),
+        )
+        .where(Task.assigned_user_id == user_id, Task.assigned_at >= window_start)
+        .group_by(task_status, task_day, task_hour)
+    )
+
+    order_day = func.date(Order.created_at)
+    order_hour = extract("hour", Order.created_at)
+    orders_q = (
+        Order.__table__.select()
+        .with_only_columns(
+            literal("order").label("source"),
+            literal("").label("kind"),
+            order_day.label("day"),
+            order_hour.label("hour"),
+            func.count().label("events"),
+            cast(literal(0.0), Float).label("duration"),
+            literal(0).label("timed"),
+        )
+        .where(Order.user_id == user_id, Order.created_at >= window_start)
+        .group_by(order_day, order_hour)
+    )
+
+    log_day = func.date(MentalHealthLog.sent_at)
+    logs_q = (
+        MentalHealthLog.__table__.select()
+        .with_only_columns(
+            literal("log").label("source"),
+            MentalHealthLog.notification_type.label("kind"),
+            log_day.label("day"),
+            literal(0).label("hour"),
+            func.count().label("events"),
+            cast(literal(0.0), Float).label("duration"),
+            literal(0).label("timed"),
+        )
+        .where(MentalHealthLog.user_id == user_id, MentalHealthLog.sent_at >= window_start)
+        .group_by(MentalHealthLog.notification_type, log_day)
+    )
+
+    return union_all(tasks_q, orders_q, logs_q)
+
+def load_usage_snapshot(db: Session, user_id: int, days: int = DEFAULT_WINDOW_DAYS) -> UsageSnapshot:
+    """Aggregate a user's recent activity in one round trip (uncached)"""
+    now = datetime.utcnow()
+    window_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+    task_rows: Dict[str, List[int]] = {}
+    order_rows: Dict[str, List[int]] = {}
+    status_counts: Dict[str, int] = {}
+    log_counts: Dict[Tuple[str, str], int] = {}
+    completion_seconds = 0.0
+    timed_completions = 0
+
+    for source, kind, day, hour, events, duration, timed in db.execute(_build_usage_query(db, user_id, window_start)):
+        day_key = _day_key(day)
+        events = int(events or 0)
+        if source == "log":
+            key = (day_key, kind or "")
+            log_counts[key] = log_counts.get(key, 0) + events
+            continue
+
+        target = task_rows if source == "task" else order_rows
+        row = target.setdefault(day_key, [0] * 24)
+        row[int(hour or 0)] += events
+
+        if source == "task":
+            status_counts[kind] = status_counts.get(kind, 0) + events
+            completion_seconds += float(duration or 0.0)
+            timed_completions += int(timed or 0)
+
+    return UsageSnapshot(
+        user_id=user_id,
+        window_start=window_start,
+        generated_at=now,
+        task_matrix={day: tuple(row) for day, row in task_rows.items()},
+        order_matrix={day: tuple(row) for day, row in order_rows.items()},
+        task_status_counts=status_counts,
+        completion_seconds=completion_seconds,
+        timed_completions=timed_completions,
+        log_counts=log_counts,
+    )
+
+def get_usage_snapshot(db: Session, user_id: int, days: int = DEFAULT_WINDOW_DAYS) -> UsageSnapshot:
+    """Return the cached snapshot for a user, reloading it when stale"""
+    window_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    return _snapshot_cache.get(user_id, window_start, lambda: load_usage_snapshot(db, user_id, days)).value
+
+def invalidate_user_usage(*user_ids: int):
+    """Drop cached snapshots after a user records new activity outside a session commit"""
+    _snapshot_cache.invalidate(*user_ids)
+
+def clear_usage_cache():
+    _snapshot_cache.clear()
@@ -0,0 +1,100 @@
+"""
+Per-User Aggregates
+- Completed / active task counts and earned / spent coin totals read by /profile, /coins, /statistics
+  and /social/my-rank, loaded with one statement of scalar subqueries
+- Short-TTL per-user cache (USER_AGGREGATES_TTL_SECONDS, USER_AGGREGATES_MAX_ENTRIES); concurrent misses
+  share one load, commits that write a user's Task or CoinTransaction rows drop that user's entry
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+import os
+import logging
+
+from models import Task, TaskStatus, CoinTransaction, CoinTransactionType
+from user_cache import PerUserCache
+
+logger = logging.getLogger(__name__)
+
+USER_AGGREGATES_TTL_SECONDS = float(os.getenv("USER_AGGREGATES_TTL_SECONDS", "10"))
+USER_AGGREGATES_MAX_ENTRIES = int(os.getenv("USER_AGGREGATES_MAX_ENTRIES", "10000"))
+
+@dataclass(frozen=True)
+class UserAggregates:
+    user_id: int
+    completed_tasks: int
+    active_tasks: int
+    total_earned: int
+    total_spent: int
+    computed_at: datetime
+
+def _task_count(user_id: int, task_status: TaskStatus):
+    return (
+        select(func.count(Task.id))
+        .where(Task.assigned_user_id == user_id, Task.status == task_status)
+        .scalar_subquery()
+    )
+
+def _coin_total(user_id: int, transaction_type: CoinTransactionType):
+    return (
+        select(func.coalesce(func.sum(CoinTransaction.amount), 0))
+        .where(CoinTransaction.user_id == user_id, CoinTransaction.type == transaction_type)
+        .scalar_subquery()
+    )
+
+def load_user_aggregates(db: Session, user_id: int) -> UserAggregates:
+    """Uncached: one round trip regardless of how many aggregates are read"""
+    completed, active, earned, spent = db.execute(select(
+        _task_count(user_id, TaskStatus.completed),
+        _task_count(user_id, TaskStatus.assigned),
+        _coin_total(user_id, CoinTransactionType.earn),
+        _coin_total(user_id, CoinTransactionType.spend),
+    )).one()
+    return UserAggregates(
+        user_id=user_id,
+        completed_tasks=int(completed or 0),
+        active_tasks=int(active or 0),
+        total_earned=int(earned or 0),
+        total_spent=int(spent or 0),
+        computed_at=datetime.utcnow(),
+    )
+
+class UserAggregateCache:
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None,
+                 ttl: float = USER_AGGREGATES_TTL_SECONDS, max_entries: int = USER_AGGREGATES_MAX_ENTRIES):
+        self.session_factory = session_factory
+        self.cache = PerUserCache(
+            "user_aggregates", {Task: "assigned_user_id", CoinTransaction: "user_id"}, ttl, max_entries
+        )
+
+    def configure(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def get(self, user_id: int) -> UserAggregates:
+        return self.cache.get(user_id, "aggregates", lambda: self._load(user_id)).value
+
+    async def aget(self, user_id: int) -> UserAggregates:
+        """Like get, without blocking the event loop on the load"""
+        return (await self.cache.aget(user_id, "aggregates", lambda: self._load(user_id))).value
+
+    def invalidate(self, *user_ids: int):
+        self.cache.invalidate(*user_ids)
+
+    def _load(self, user_id: int) -> UserAggregates:
+        db = self._session()
+        try:
+            return load_user_aggregates(db, user_id)
+        finally:
+            db.close()
+
+    def _session(self) -> Session:
+        if self.session_factory is None:
+            from dependencies import SessionLocal
+            self.session_factory = SessionLocal
+        return self.session_factory()
+
+# Global per-user aggregate cache instance
+user_aggregates = UserAggregateCache()
@@ -0,0 +1,136 @@
+"""
+Per-User Caches
+- Short-TTL in-process caches of values derived from one user's rows, returned with their computation time
+- Concurrent misses for the same value share one computation (singleflight)
+- Each cache names the models it is derived from and their user id column; committed writes to those
+  rows drop the user's entries, writes that roll back are ignored (via response_cache.invalidate_on_commit)
+- A computation that was running when such a commit landed is returned to its callers but not cached
+- Bulk UPDATE / DELETE statements carry no per-row user ids and drop every entry of the caches watching
+  the model (except models listed as unit-of-work only)
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Generic, Hashable, Iterable, Mapping, Optional, Tuple, TypeVar
+import threading
+import time
+import logging
+
+from singleflight import SingleFlight
+from metrics import user_cache_lookups_total
+from response_cache import invalidate_on_commit, user_tag
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+@dataclass(frozen=True)
+class Cached(Generic[T]):
+    value: T
+    computed_at: datetime
+
+class PerUserCache:
+    def __init__(self, name: str, watches: Mapping[type, str], ttl: float, max_entries: int,
+                 unit_of_work_only: Iterable[type] = ()):
+        self.name = name
+        self.watches = watches
+        self.unit_of_work_only = frozenset(unit_of_work_only)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # user id -> {kind: (expires, cached)}, least recently stored user first
+        self._entries: "OrderedDict[int, Dict[Hashable, Tuple[float, Cached]]]" = OrderedDict()
+        # Only users with computations in flight have a generation; invalidating one bumps it
+        self._generations: Dict[int, int] = {}
+        self._waiting: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(name)
+        invalidate_on_commit(
+            {}, cache=self, user_scoped={model: (column, (name,)) for model, column in watches.items()},
+            unit_of_work_only=self.unit_of_work_only,
+        )
+
+    def get(self, user_id: int, kind: Hashable, compute: Callable[[], T],
+            cacheable: Optional[Callable[[T], bool]] = None) -> Cached[T]:
+        cached = self._lookup(user_id, kind)
+        if cached is not None:
+            return cached
+        generation = self._join(user_id)
+        try:
+            return self._flight.do(
+                (user_id, kind, generation), lambda: self._compute(user_id, kind, generation, compute, cacheable)
+            )
+        finally:
+            self._leave(user_id)
+
+    async def aget(self, user_id: int, kind: Hashable, compute: Callable[[], T],
+                   cacheable: Optional[Callable[[T], bool]] = None) -> Cached[T]:
+        """Like get; `compute` runs in the threadpool so the event loop is not blocked"""
+        cached = self._lookup(user_id, kind)
+        if cached is not None:
+            return cached
+        generation = self._join(user_id)
+        try:
+            return await self._flight.do_async(
+                (user_id, kind, generation), lambda: self._compute(user_id, kind, generation, compute, cacheable)
+            )
+        finally:
+            self._leave(user_id)
+
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                if user_id in self._generations:
+                    self._generations[user_id] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for user_id in self._generations:
+                self._generations[user_id] += 1
+
+    def invalidate_tags(self, *tags: str):
+        """Commit invalidation: the plain cache name drops every user, user tags drop one user each"""
+        if self.name in tags:
+            self.clear()
+            return
+        prefix = user_tag(self.name, "")
+        self.invalidate(*(int(tag[len(prefix):]) for tag in tags if tag.startswith(prefix)))
+
+    def size(self) -> int:
+        return sum(len(kinds) for kinds in list(self._entries.values()))
+
+    def _lookup(self, user_id: int, kind: Hashable) -> Optional[Cached]:
+        with self._lock:
+            entry = self._entries.get(user_id, {}).get(kind)
+            if entry is not None and entry[0] > time.monotonic():
+                user_cache_lookups_total.inc(cache=self.name, outcome="hit")
+                return entry[1]
+        user_cache_lookups_total.inc(cache=self.name, outcome="miss")
+        return None
+
+    def _join(self, user_id: int) -> int:
+        with self._lock:
+            self._waiting[user_id] = self._waiting.get(user_id, 0) + 1
+            return self._generations.setdefault(user_id, 0)
+
+    def _leave(self, user_id: int):
+        with self._lock:
+            self._waiting[user_id] -= 1
+            if not self._waiting[user_id]:
+                del self._waiting[user_id]
+                del self._generations[user_id]
+
+    def _compute(self, user_id: int, kind: Hashable, generation: int, compute: Callable[[], T],
+                 cacheable: Optional[Callable[[T], bool]]) -> Cached[T]:
+        result = Cached(compute(), datetime.utcnow())
+        if cacheable is not None and not cacheable(result.value):
+            return result
+        with self._lock:
+            if self._generations.get(user_id) == generation:
+                self._entries.setdefault(user_id, {})[kind] = (time.monotonic() + self.ttl, result)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
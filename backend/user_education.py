@@ -1,17 +1,25 @@
 """
 User Education and Interactive Guide System
 Real educational content, tutorials, and interactive onboarding for users
+- Immutable module-level catalog with precomputed step counts, rewards and quiz keys
+- Pre-serialized module/quiz payloads with content-hash ETags; answer keys never leave the server
+- Quizzes graded only from the submitted answers
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, update
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Mapping, Tuple
+from types import MappingProxyType
+from dataclasses import dataclass
+import hashlib
 import json
 import logging
 from enum import Enum
 
-from models import User, UserEducation, Badge, UserBadge, CoinTransaction, CoinTransactionType
+from models import User, UserEducation, UserBadge, CoinTransactionCategory
+from badge_catalog import badge_catalog, EDUCATION_BADGES
+from coin_ledger import CoinLedger
 
 logger = logging.getLogger(__name__)
 
@@ -31,173 +39,266 @@ class EducationStepType(str, Enum):
     VIDEO = "video"
     PRACTICE = "practice"
 
-class UserEducationService:
-    def __init__(self, db: Session):
-        self.db = db
-        
-        # Define education modules with structured content
-        self.education_modules = {
-            EducationModuleType.ONBOARDING: {
-                "title": "Platform'a Hoş Geldiniz! 🎉",
-                "description": "Instagram Coin Platform'unu nasıl kullanacağınızı öğrenin",
-                "duration_minutes": 10,
-                "coin_reward": 100,
-                "badge_id": "onboarding_complete",
-                "steps": [
-                    {
-                        "id": "welcome",
-                        "type": EducationStepType.TUTORIAL,
-                        "title": "Hoş Geldiniz!",
-                        "content": "Bu platform ile Instagram'da gerçek etkileşimler alabilir ve coin kazanabilirsiniz.",
-                        "duration_seconds": 30
-                    },
-                    {
-                        "id": "account_setup", 
-                        "type": EducationStepType.INTERACTIVE,
-                        "title": "Hesap Kurulumu",
-                        "content": "Instagram hesabınızı bağlayın ve profilinizi tamamlayın",
-                        "action_required": "connect_instagram",
-                        "duration_seconds": 120
-                    },
-                    {
-                        "id": "first_task",
-                        "type": EducationStepType.PRACTICE,
-                        "title": "İlk Göreviniz",
-                        "content": "Bir görev alın ve tamamlayın",
-                        "action_required": "complete_task",
-                        "duration_seconds": 180
-                    }
-                ]
+# Static education catalog. Frozen below at import time; never mutate at runtime.
+_EDUCATION_MODULE_DEFINITIONS = {
+    EducationModuleType.ONBOARDING: {
+        "title": "Platform'a Hoş Geldiniz! 🎉",
+        "description": "Instagram Coin Platform'unu nasıl kullanacağınızı öğrenin",
+        "duration_minutes": 10,
+        "coin_reward": 100,
+        "badge_id": "onboarding_complete",
+        "steps": [
+            {
+                "id": "welcome",
+                "type": EducationStepType.TUTORIAL,
+                "title": "Hoş Geldiniz!",
+                "content": "Bu platform ile Instagram'da gerçek etkileşimler alabilir ve coin kazanabilirsiniz.",
+                "duration_seconds": 30
             },
-            EducationModuleType.INSTAGRAM_BASICS: {
-                "title": "Instagram Temelleri 📱",
-                "description": "Instagram'da etkili etkileşim yöntemlerini öğrenin",
-                "duration_minutes": 15,
-                "coin_reward": 75,
-                "badge_id": "instagram_expert",
-                "steps": [
-                    {
-                        "id": "like_best_practices",
-                        "type": EducationStepType.TUTORIAL,
-                        "title": "Beğeni En İyi Uygulamaları",
-                        "content": "Doğal ve anlamlı beğeniler nasıl yapılır",
-                        "duration_seconds": 180
-                    },
-                    {
-                        "id": "follow_etiquette",
-                        "type": EducationStepType.TUTORIAL,
-                        "title": "Takip Etme Görgü Kuralları",
-                        "content": "Kaliteli hesapları takip etme stratejileri",
-                        "duration_seconds": 120
-                    },
-                    {
-                        "id": "comment_guidelines",
-                        "type": EducationStepType.QUIZ,
-                        "title": "Yorum Yazma Rehberi",
-                        "content": "Anlamlı ve değerli yorumlar yazma",
-                        "questions": [
-                            {
-                                "question": "Hangi tür yorumlar daha değerlidir?",
-                                "options": ["Emoji", "Kısa kelimeler", "Anlamlı cümleler", "Kopya yorumlar"],
-                                "correct": 2
-                            }
-                        ],
-                        "duration_seconds": 240
-                    }
-                ]
+            {
+                "id": "account_setup", 
+                "type": EducationStepType.INTERACTIVE,
+                "title": "Hesap Kurulumu",
+                "content": "Instagram hesabınızı bağlayın ve profilinizi tamamlayın",
+                "action_required": "connect_instagram",
+                "duration_seconds": 120
             },
-            EducationModuleType.COIN_SYSTEM: {
-                "title": "Coin Sistemi 💰",
-                "description": "Coin kazanma, harcama ve güvenlik özelliklerini öğrenin",
-                "duration_minutes": 12,
-                "coin_reward": 50,
-                "badge_id": "coin_master",
-                "steps": [
-                    {
-                        "id": "earning_coins",
-                        "type": EducationStepType.TUTORIAL,
-                        "title": "Coin Kazanma",
-                        "content": "Görevleri tamamlayarak ve referanslarla coin kazanın",
-                        "duration_seconds": 150
-                    },
-                    {
-                        "id": "spending_coins",
-                        "type": EducationStepType.TUTORIAL,
-                        "title": "Coin Harcama",
-                        "content": "Siparişler oluşturarak coinlerinizi kullanın",
-                        "duration_seconds": 120
-                    },
+            {
+                "id": "first_task",
+                "type": EducationStepType.PRACTICE,
+                "title": "İlk Göreviniz",
+                "content": "Bir görev alın ve tamamlayın",
+                "action_required": "complete_task",
+                "duration_seconds": 180
+            }
+        ]
+    },
+    EducationModuleType.INSTAGRAM_BASICS: {
+        "title": "Instagram Temelleri 📱",
+        "description": "Instagram'da etkili etkileşim yöntemlerini öğrenin",
+        "duration_minutes": 15,
+        "coin_reward": 75,
+        "badge_id": "instagram_expert",
+        "steps": [
+            {
+                "id": "like_best_practices",
+                "type": EducationStepType.TUTORIAL,
+                "title": "Beğeni En İyi Uygulamaları",
+                "content": "Doğal ve anlamlı beğeniler nasıl yapılır",
+                "duration_seconds": 180
+            },
+            {
+                "id": "follow_etiquette",
+                "type": EducationStepType.TUTORIAL,
+                "title": "Takip Etme Görgü Kuralları",
+                "content": "Kaliteli hesapları takip etme stratejileri",
+                "duration_seconds": 120
+            },
+            {
+                "id": "comment_guidelines",
+                "type": EducationStepType.QUIZ,
+                "title": "Yorum Yazma Rehberi",
+                "content": "Anlamlı ve değerli yorumlar yazma",
+                "questions": [
                     {
-                        "id": "withdrawal_security",
-                        "type": EducationStepType.INTERACTIVE,
-                        "title": "Güvenli Para Çekme",
-                        "content": "Güvenlik önlemlerini öğrenin ve ilk çekim talebinizi oluşturun",
-                        "action_required": "learn_withdrawal",
-                        "duration_seconds": 180
+                        "question": "Hangi tür yorumlar daha değerlidir?",
+                        "options": ["Emoji", "Kısa kelimeler", "Anlamlı cümleler", "Kopya yorumlar"],
+                        "correct": 2
                     }
-                ]
+                ],
+                "duration_seconds": 240
+            }
+        ]
+    },
+    EducationModuleType.COIN_SYSTEM: {
+        "title": "Coin Sistemi 💰",
+        "description": "Coin kazanma, harcama ve güvenlik özelliklerini öğrenin",
+        "duration_minutes": 12,
+        "coin_reward": 50,
+        "badge_id": "coin_master",
+        "steps": [
+            {
+                "id": "earning_coins",
+                "type": EducationStepType.TUTORIAL,
+                "title": "Coin Kazanma",
+                "content": "Görevleri tamamlayarak ve referanslarla coin kazanın",
+                "duration_seconds": 150
             },
-            EducationModuleType.SECURITY_PRIVACY: {
-                "title": "Güvenlik ve Gizlilik 🔒",
-                "description": "Hesap güvenliği ve gizlilik ayarlarınızı öğrenin",
-                "duration_minutes": 20,
-                "coin_reward": 125,
-                "badge_id": "security_champion",
-                "steps": [
-                    {
-                        "id": "account_security",
-                        "type": EducationStepType.TUTORIAL,
-                        "title": "Hesap Güvenliği",
-                        "content": "Güçlü şifreler ve iki faktörlü kimlik doğrulama",
-                        "duration_seconds": 300
-                    },
-                    {
-                        "id": "privacy_settings",
-                        "type": EducationStepType.INTERACTIVE,
-                        "title": "Gizlilik Ayarları",
-                        "content": "Kişisel verilerinizi koruyun",
-                        "action_required": "review_privacy",
-                        "duration_seconds": 240
-                    },
+            {
+                "id": "spending_coins",
+                "type": EducationStepType.TUTORIAL,
+                "title": "Coin Harcama",
+                "content": "Siparişler oluşturarak coinlerinizi kullanın",
+                "duration_seconds": 120
+            },
+            {
+                "id": "withdrawal_security",
+                "type": EducationStepType.INTERACTIVE,
+                "title": "Güvenli Para Çekme",
+                "content": "Güvenlik önlemlerini öğrenin ve ilk çekim talebinizi oluşturun",
+                "action_required": "learn_withdrawal",
+                "duration_seconds": 180
+            }
+        ]
+    },
+    EducationModuleType.SECURITY_PRIVACY: {
+        "title": "Güvenlik ve Gizlilik 🔒",
+        "description": "Hesap güvenliği ve gizlilik ayarlarınızı öğrenin",
+        "duration_minutes": 20,
+        "coin_reward": 125,
+        "badge_id": "security_champion",
+        "steps": [
+            {
+                "id": "account_security",
+                "type": EducationStepType.TUTORIAL,
+                "title": "Hesap Güvenliği",
+                "content": "Güçlü şifreler ve iki faktörlü kimlik doğrulama",
+                "duration_seconds": 300
+            },
+            {
+                "id": "privacy_settings",
+                "type": EducationStepType.INTERACTIVE,
+                "title": "Gizlilik Ayarları",
+                "content": "Kişisel verilerinizi koruyun",
+                "action_required": "review_privacy",
+                "duration_seconds": 240
+            },
+            {
+                "id": "fraud_prevention",
+                "type": EducationStepType.QUIZ,
+                "title": "Dolandırıcılık Önleme",
+                "content": "Şüpheli aktiviteleri tanıma ve raporlama",
+                "questions": [
                     {
-                        "id": "fraud_prevention",
-                        "type": EducationStepType.QUIZ,
-                        "title": "Dolandırıcılık Önleme",
-                        "content": "Şüpheli aktiviteleri tanıma ve raporlama",
-                        "questions": [
-                            {
-                                "question": "Şüpheli bir aktivite fark ettiğinizde ne yapmalısınız?",
-                                "options": ["Görmezden gel", "Hemen rapor et", "Arkadaşlarınla paylaş", "Panik yap"],
-                                "correct": 1
-                            }
-                        ],
-                        "duration_seconds": 180
+                        "question": "Şüpheli bir aktivite fark ettiğinizde ne yapmalısınız?",
+                        "options": ["Görmezden gel", "Hemen rapor et", "Arkadaşlarınla paylaş", "Panik yap"],
+                        "correct": 1
                     }
-                ]
+                ],
+                "duration_seconds": 180
             }
-        }
+        ]
+    }
+}
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+@dataclass(frozen=True)
+class CatalogPayload:
+    """Pre-serialized JSON body with a content-hash ETag"""
+    data: Dict[str, Any]
+    body: bytes
+    etag: str
+
+def _public_step(step: Mapping[str, Any]) -> Dict[str, Any]:
+    """Plain copy of a step for clients, without the quiz answer key"""
+    public = _thaw(step)
+    for question in public.get("questions", ()):
+        question.pop("correct", None)
+    return public
+
+def _make_payload(data: Dict[str, Any]) -> CatalogPayload:
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return CatalogPayload(data=data, body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+EDUCATION_MODULES: Mapping[EducationModuleType, Mapping[str, Any]] = _freeze(_EDUCATION_MODULE_DEFINITIONS)
+
+# Derived lookup tables
+MODULE_STEP_COUNTS: Mapping[EducationModuleType, int] = MappingProxyType({
+    module_type: len(module["steps"]) for module_type, module in EDUCATION_MODULES.items()
+})
+MODULE_STEP_INDEX: Mapping[EducationModuleType, Mapping[str, int]] = MappingProxyType({
+    module_type: MappingProxyType({step["id"]: index for index, step in enumerate(module["steps"])})
+    for module_type, module in EDUCATION_MODULES.items()
+})
+MODULE_REWARDS: Mapping[EducationModuleType, Tuple[int, Optional[str]]] = MappingProxyType({
+    module_type: (module["coin_reward"], module.get("badge_id"))
+    for module_type, module in EDUCATION_MODULES.items()
+})
+QUIZ_ANSWER_KEYS: Mapping[Tuple[EducationModuleType, str], Tuple[int, ...]] = MappingProxyType({
+    (module_type, step["id"]): tuple(question["correct"] for question in step.get("questions", ()))
+    for module_type, module in EDUCATION_MODULES.items()
+    for step in module["steps"]
+    if step["type"] == EducationStepType.QUIZ
+})
+
+# Module metadata merged into per-user progress responses
+MODULE_SUMMARIES: Mapping[EducationModuleType, Mapping[str, Any]] = MappingProxyType({
+    module_type: MappingProxyType({
+        "title": module["title"],
+        "description": module["description"],
+        "duration_minutes": module["duration_minutes"],
+        "coin_reward": module["coin_reward"],
+        "total_steps": MODULE_STEP_COUNTS[module_type]
+    })
+    for module_type, module in EDUCATION_MODULES.items()
+})
+
+MODULE_PAYLOADS: Mapping[EducationModuleType, CatalogPayload] = MappingProxyType({
+    module_type: _make_payload({
+        "type": module_type.value,
+        "title": module["title"],
+        "description": module["description"],
+        "duration_minutes": module["duration_minutes"],
+        "coin_reward": module["coin_reward"],
+        "steps": [_public_step(step) for step in module["steps"]]
+    })
+    for module_type, module in EDUCATION_MODULES.items()
+})
+def _first_quiz_step(module: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+    return next((step for step in module["steps"] if step["type"] == EducationStepType.QUIZ), None)
+
+QUIZ_PAYLOADS: Mapping[EducationModuleType, CatalogPayload] = MappingProxyType({
+    module_type: _make_payload({"quiz": _public_step(_first_quiz_step(module))})
+    for module_type, module in EDUCATION_MODULES.items()
+    if _first_quiz_step(module) is not None
+})
+
+class UserEducationService:
+    def __init__(self, db: Session):
+        self.db = db
+        
+        self.education_modules = EDUCATION_MODULES
 
     def get_user_education_progress(self, user_id: int) -> Dict[str, Any]:
         """Get user's education progress across all modules"""
         try:
-            education_records = self.db.query(UserEducation).filter(
-                UserEducation.user_id == user_id
-            ).all()
+            # Single query served by the (user_id, module_type) index
+            education_records = {
+                record.module_type: record
+                for record in self.db.query(
+                    UserEducation.module_type,
+                    UserEducation.completed,
+                    UserEducation.progress_data,
+                    UserEducation.completed_at,
+                    UserEducation.current_step,
+                    UserEducation.score
+                ).filter(UserEducation.user_id == user_id).all()
+            }
             
             progress = {}
             for module_type in EducationModuleType:
-                module_record = next(
-                    (r for r in education_records if r.module_type == module_type.value), 
-                    None
-                )
+                module_record = education_records.get(module_type.value)
                 
                 if module_record:
                     progress[module_type.value] = {
-                        "completed": module_record.completed,
+                        "completed": bool(module_record.completed),
                         "progress_data": module_record.progress_data or {},
                         "completed_at": module_record.completed_at.isoformat() if module_record.completed_at else None,
                         "current_step": module_record.current_step,
-                        "score": module_record.score
+                        "score": module_record.score or 0
                     }
                 else:
                     progress[module_type.value] = {
@@ -209,15 +310,8 @@ class UserEducationService:
                     }
                 
                 # Add module metadata
-                if module_type.value in self.education_modules:
-                    module_info = self.education_modules[module_type]
-                    progress[module_type.value].update({
-                        "title": module_info["title"],
-                        "description": module_info["description"],
-                        "duration_minutes": module_info["duration_minutes"],
-                        "coin_reward": module_info["coin_reward"],
-                        "total_steps": len(module_info["steps"])
-                    })
+                if module_type in MODULE_SUMMARIES:
+                    progress[module_type.value].update(MODULE_SUMMARIES[module_type])
 
             return {
                 "user_id": user_id,
@@ -235,7 +329,7 @@ class UserEducationService:
             if module_type not in self.education_modules:
                 raise ValueError(f"Invalid module type: {module_type}")
             
-            module_info = self.education_modules[module_type]
+            first_step_id = self.education_modules[module_type]["steps"][0]["id"]
             
             # Check if user already has this module
             education_record = self.db.query(UserEducation).filter(
@@ -249,24 +343,18 @@ class UserEducationService:
                 education_record = UserEducation(
                     user_id=user_id,
                     module_type=module_type.value,
+                    step=first_step_id,
                     started_at=datetime.utcnow(),
-                    current_step=module_info["steps"][0]["id"],
+                    current_step=first_step_id,
                     progress_data={"step_index": 0, "steps_completed": []},
                     score=0
                 )
                 self.db.add(education_record)
-                self.db.flush()
+                self.db.commit()
             
             return {
                 "education_id": education_record.id,
-                "module": {
-                    "type": module_type.value,
-                    "title": module_info["title"],
-                    "description": module_info["description"],
-                    "duration_minutes": module_info["duration_minutes"],
-                    "coin_reward": module_info["coin_reward"],
-                    "steps": module_info["steps"]
-                },
+                "module": MODULE_PAYLOADS[module_type].data,
                 "progress": {
                     "current_step": education_record.current_step,
                     "progress_data": education_record.progress_data or {},
@@ -276,6 +364,7 @@ class UserEducationService:
             }
             
         except Exception as e:
+            self.db.rollback()
             logger.error(f"Error starting education module {module_type} for user {user_id}: {e}")
             raise
 
@@ -301,39 +390,43 @@ class UserEducationService:
             if education_record.completed:
                 raise ValueError("Module already completed")
             
-            module_info = self.education_modules[module_type]
-            steps = module_info["steps"]
-            
-            # Find current step
-            step_index = next(
-                (i for i, step in enumerate(steps) if step["id"] == step_id),
-                None
-            )
+            steps = self.education_modules[module_type]["steps"]
+            step_count = MODULE_STEP_COUNTS[module_type]
             
+            step_index = MODULE_STEP_INDEX[module_type].get(step_id)
             if step_index is None:
                 raise ValueError(f"Invalid step_id: {step_id}")
             
             current_step = steps[step_index]
-            progress_data = education_record.progress_data or {"step_index": 0, "steps_completed": []}
+            # Copy so the JSON column sees a new value on assignment
+            stored_progress = education_record.progress_data or {}
+            progress_data = {
+                "step_index": stored_progress.get("step_index", 0),
+                "steps_completed": list(stored_progress.get("steps_completed", []))
+            }
             
             # Update progress
             if step_id not in progress_data["steps_completed"]:
                 progress_data["steps_completed"].append(step_id)
             
             # Calculate score based on step type and interaction
-            step_score = self._calculate_step_score(current_step, interaction_data)
-            education_record.score += step_score
+            step_score = self._calculate_step_score(module_type, current_step, interaction_data)
+            education_record.score = (education_record.score or 0) + step_score
             
             # Move to next step or complete module
-            if step_index < len(steps) - 1:
+            if step_index < step_count - 1:
                 next_step = steps[step_index + 1]
                 education_record.current_step = next_step["id"]
                 progress_data["step_index"] = step_index + 1
             else:
-                # Module completed
-                education_record.completed = True
-                education_record.completed_at = datetime.utcnow()
-                education_record.current_step = None
+                # Module completed; claimed conditionally so concurrent final steps pay out once
+                claimed = self.db.execute(
+                    update(UserEducation)
+                    .where(UserEducation.id == education_record.id, UserEducation.completed == False)
+                    .values(completed=True, completed_at=datetime.utcnow(), current_step=None)
+                ).rowcount
+                if not claimed:
+                    raise ValueError("Module already completed")
                 
                 # Award completion rewards
                 self._award_completion_rewards(user_id, module_type, education_record.score)
@@ -347,7 +440,7 @@ class UserEducationService:
                 "total_score": education_record.score,
                 "module_completed": education_record.completed,
                 "next_step": education_record.current_step,
-                "progress_percentage": len(progress_data["steps_completed"]) / len(steps) * 100
+                "progress_percentage": len(progress_data["steps_completed"]) / step_count * 100
             }
             
         except Exception as e:
@@ -355,7 +448,7 @@ class UserEducationService:
             logger.error(f"Error completing education step {step_id} for user {user_id}: {e}")
             raise
 
-    def _calculate_step_score(self, step: Dict, interaction_data: Optional[Dict]) -> int:
+    def _calculate_step_score(self, module_type: EducationModuleType, step: Mapping[str, Any], interaction_data: Optional[Dict]) -> int:
         """Calculate score for completing a step"""
         base_score = {
             EducationStepType.TUTORIAL: 10,
@@ -365,10 +458,13 @@ class UserEducationService:
             EducationStepType.PRACTICE: 25
         }.get(step["type"], 10)
         
-        # Bonus for quiz performance
-        if step["type"] == EducationStepType.QUIZ and interaction_data:
-            correct_answers = interaction_data.get("correct_answers", 0)
-            total_questions = len(step.get("questions", []))
+        # Bonus for quiz performance, graded server-side against the precomputed key
+        if step["type"] == EducationStepType.QUIZ and interaction_data and interaction_data.get("answers"):
+            answer_key = QUIZ_ANSWER_KEYS.get((module_type, step["id"]), ())
+            correct_answers = sum(
+                1 for given, expected in zip(interaction_data["answers"], answer_key) if given == expected
+            )
+            total_questions = len(answer_key)
             if total_questions > 0:
                 quiz_bonus = int((correct_answers / total_questions) * 10)
                 base_score += quiz_bonus
@@ -378,27 +474,20 @@ class UserEducationService:
     def _award_completion_rewards(self, user_id: int, module_type: EducationModuleType, final_score: int):
         """Award coins and badges for module completion"""
         try:
-            user = self.db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return
-            
             module_info = self.education_modules[module_type]
-            coin_reward = module_info["coin_reward"]
+            coin_reward, badge_id = MODULE_REWARDS[module_type]
             
             # Award coins
-            user.coin_balance += coin_reward
-            
-            # Create coin transaction record
-            coin_tx = CoinTransaction(
-                user_id=user_id,
-                amount=coin_reward,
-                type=CoinTransactionType.earn,
-                note=f"Eğitim modülü tamamlama: {module_info['title']} (Skor: {final_score})"
+            balance = CoinLedger(self.db).credit(
+                user_id,
+                coin_reward,
+                note=f"Eğitim modülü tamamlama: {module_info['title']} (Skor: {final_score})",
+                category=CoinTransactionCategory.education_reward
             )
-            self.db.add(coin_tx)
+            if balance is None:
+                return
             
             # Award badge if specified
-            badge_id = module_info.get("badge_id")
             if badge_id:
                 self._award_education_badge(user_id, badge_id, module_type.value)
             
@@ -409,69 +498,13 @@ class UserEducationService:
 
     def _award_education_badge(self, user_id: int, badge_id: str, module_type: str):
         """Award a badge for education completion"""
+        badge_name = EDUCATION_BADGES.get(badge_id)
+        if not badge_name:
+            logger.warning(f"Unknown education badge {badge_id} for module {module_type}")
+            return
         try:
-            # Check if badge already exists
-            existing_badge = self.db.query(UserBadge).join(Badge).filter(
-                and_(
-                    UserBadge.user_id == user_id,
-                    Badge.badge_type == badge_id
-                )
-            ).first()
-            
-            if existing_badge:
-                return
-            
-            # Find or create badge
-            badge = self.db.query(Badge).filter(Badge.badge_type == badge_id).first()
-            if not badge:
-                badge_info = {
-                    "onboarding_complete": {
-                        "name": "Platform Yeni Üyesi",
-                        "description": "Platform onboarding'ini başarıyla tamamladı",
-                        "icon_url": "🎓"
-                    },
-                    "instagram_expert": {
-                        "name": "Instagram Uzmanı",
-                        "description": "Instagram temelleri eğitimini tamamladı",
-                        "icon_url": "📱"
-                    },
-                    "coin_master": {
-                        "name": "Coin Ustası",
-                        "description": "Coin sistemi eğitimini tamamladı",
-                        "icon_url": "💰"
-                    },
-                    "security_champion": {
-                        "name": "Güvenlik Şampiyonu",
-                        "description": "Güvenlik ve gizlilik eğitimini tamamladı",
-                        "icon_url": "🔒"
-                    }
-                }.get(badge_id, {
-                    "name": "Eğitim Rozetı",
-                    "description": f"{module_type} eğitimini tamamladı",
-                    "icon_url": "🏆"
-                })
-                
-                badge = Badge(
-                    badge_type=badge_id,
-                    name=badge_info["name"],
-                    description=badge_info["description"],
-                    icon_url=badge_info["icon_url"],
-                    rarity="common",
-                    points_required=0
-                )
-                self.db.add(badge)
-                self.db.flush()
-            
-            # Award badge to user
-            user_badge = UserBadge(
-                user_id=user_id,
-                badge_id=badge.id,
-                earned_at=datetime.utcnow()
-            )
-            self.db.add(user_badge)
-            
-            logger.info(f"Awarded badge {badge_id} to user {user_id} for education completion")
-            
+            if badge_catalog.award(self.db, user_id, badge_name):
+                logger.info(f"Awarded badge {badge_id} to user {user_id} for education completion")
         except Exception as e:
             logger.error(f"Error awarding education badge {badge_id} to user {user_id}: {e}")
 
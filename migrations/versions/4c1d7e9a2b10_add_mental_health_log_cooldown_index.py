@@ -0,0 +1,32 @@
+"""add_mental_health_log_cooldown_index
+
+Revision ID: 4c1d7e9a2b10
+Revises: 03f62b82c8d8
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1d7e9a2b10'
+down_revision: Union[str, None] = '03f62b82c8d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_mental_health_logs_user_type_sent',
+        'mental_health_logs',
+        ['user_id', 'notification_type', 'sent_at'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mental_health_logs_user_type_sent', table_name='mental_health_logs')
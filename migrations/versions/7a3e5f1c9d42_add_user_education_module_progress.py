@@ -0,0 +1,38 @@
+"""add_user_education_module_progress
+
+Revision ID: 7a3e5f1c9d42
+Revises: 4c1d7e9a2b10
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3e5f1c9d42'
+down_revision: Union[str, None] = '4c1d7e9a2b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_education', sa.Column('module_type', sa.String(), nullable=True))
+    op.add_column('user_education', sa.Column('current_step', sa.String(), nullable=True))
+    op.add_column('user_education', sa.Column('progress_data', sa.JSON(), nullable=True))
+    op.add_column('user_education', sa.Column('score', sa.Integer(), nullable=True))
+    op.add_column('user_education', sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True))
+    op.create_index('ix_user_education_user_module', 'user_education', ['user_id', 'module_type'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_education_user_module', table_name='user_education')
+    op.drop_column('user_education', 'started_at')
+    op.drop_column('user_education', 'score')
+    op.drop_column('user_education', 'progress_data')
+    op.drop_column('user_education', 'current_step')
+    op.drop_column('user_education', 'module_type')
@@ -0,0 +1,65 @@
+"""add_daily_reward_unique_claim_key
+
+Revision ID: b5d2e8f04c63
+Revises: 7a3e5f1c9d42
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2e8f04c63'
+down_revision: Union[str, None] = '7a3e5f1c9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite':
+        # Older rows were written as full timestamps; normalise them to plain dates
+        op.execute("UPDATE daily_rewards SET claimed_date = date(claimed_date)")
+
+    # Drop double claims left by the old check-then-insert flow (keep the first row per day)
+    op.execute(
+        """
+        DELETE FROM daily_rewards
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM daily_rewards GROUP BY user_id, claimed_date
+        )
+        """
+    )
+    op.create_index(
+        'uq_daily_rewards_user_date',
+        'daily_rewards',
+        ['user_id', 'claimed_date'],
+        unique=True
+    )
+
+    # Streak state now lives on the user row; seed it from each user's latest claim
+    if op.get_bind().dialect.name == 'sqlite':
+        latest_claim = "(SELECT datetime(MAX(dr.claimed_date)) FROM daily_rewards dr WHERE dr.user_id = users.id)"
+    else:
+        latest_claim = "(SELECT CAST(MAX(dr.claimed_date) AS TIMESTAMP) FROM daily_rewards dr WHERE dr.user_id = users.id)"
+    op.execute(
+        f"""
+        UPDATE users
+        SET daily_reward_streak = (
+                SELECT dr.consecutive_days FROM daily_rewards dr
+                WHERE dr.user_id = users.id
+                ORDER BY dr.claimed_date DESC
+                LIMIT 1
+            ),
+            last_daily_reward = {latest_claim}
+        WHERE EXISTS (SELECT 1 FROM daily_rewards dr WHERE dr.user_id = users.id)
+          AND (last_daily_reward IS NULL OR last_daily_reward < {latest_claim})
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_daily_rewards_user_date', table_name='daily_rewards')
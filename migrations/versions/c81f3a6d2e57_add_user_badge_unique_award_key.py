@@ -0,0 +1,41 @@
+"""add_user_badge_unique_award_key
+
+Revision ID: c81f3a6d2e57
+Revises: b5d2e8f04c63
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f3a6d2e57'
+down_revision: Union[str, None] = 'b5d2e8f04c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Drop duplicate awards left by the old check-then-insert flow (keep the earliest row)
+    op.execute(
+        """
+        DELETE FROM user_badges
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM user_badges GROUP BY user_id, badge_id
+        )
+        """
+    )
+    op.create_index(
+        'uq_user_badges_user_badge',
+        'user_badges',
+        ['user_id', 'badge_id'],
+        unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_user_badges_user_badge', table_name='user_badges')
@@ -0,0 +1,107 @@
+"""add_coin_transaction_category
+
+Revision ID: d4a7c2e9b813
+Revises: c81f3a6d2e57
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a7c2e9b813'
+down_revision: Union[str, None] = 'c81f3a6d2e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CATEGORIES = (
+    'task_reward', 'level_bonus', 'achievement_bonus', 'daily_reward', 'referral_bonus',
+    'education_reward', 'security_bonus', 'transfer_in', 'transfer_out', 'order_payment',
+    'withdrawal', 'withdrawal_refund', 'admin_adjustment', 'other',
+)
+
+# Evaluated in order; notes are the fixed prefixes the application has always written
+NOTE_RULES = (
+    ("task_id IS NOT NULL AND type = 'earn'", 'task_reward'),
+    ("order_id IS NOT NULL AND type = 'spend'", 'order_payment'),
+    ("note LIKE 'Günlük ödül%'", 'daily_reward'),
+    ("note LIKE 'Referans bonusu%'", 'referral_bonus'),
+    ("note LIKE 'Transfer alındı:%'", 'transfer_in'),
+    ("note LIKE 'Transfer:%'", 'transfer_out'),
+    ("note LIKE 'Eğitim modülü tamamlama%'", 'education_reward'),
+    ("note LIKE 'Seviye yükseltme bonusu%'", 'level_bonus'),
+    ("note LIKE 'Başarım bonusu%'", 'achievement_bonus'),
+    ("note IN ('E-posta doğrulama bonusu', '2FA etkinleştirme bonusu')", 'security_bonus'),
+    ("note LIKE 'Çekim talebi iptali%'", 'withdrawal_refund'),
+    ("note LIKE 'Çekim%' OR note LIKE 'Coin çekim%'", 'withdrawal'),
+    ("type = 'admin' OR note = 'Admin işlemi'", 'admin_adjustment'),
+)
+
+# Reference ids recoverable from note text: a request number or a counterparty username
+REQUEST_NUMBER = re.compile(r"#(\d+)")
+REFERENCE_USERNAMES = {
+    'transfer_out': re.compile(r"^Transfer: \d+ coin -> (.+) \(Fee: \d+\)$"),
+    'transfer_in': re.compile(r"^Transfer alındı: (.+) -> \d+ coin$"),
+    'referral_bonus': re.compile(r"^Referans bonusu \((.+) \d+ görev tamamladı\)$"),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    category_type = sa.Enum(*CATEGORIES, name='cointransactioncategory')
+    category_type.create(bind, checkfirst=True)
+    op.add_column('coin_transactions', sa.Column('category', category_type, nullable=True))
+    op.add_column('coin_transactions', sa.Column('reference_id', sa.Integer(), nullable=True))
+
+    cases = "\n".join(f"WHEN {condition} THEN '{category}'" for condition, category in NOTE_RULES)
+    cast = "::cointransactioncategory" if bind.dialect.name == 'postgresql' else ""
+    op.execute(
+        f"""
+        UPDATE coin_transactions
+        SET category = (CASE {cases} ELSE 'other' END){cast}
+        WHERE category IS NULL
+        """
+    )
+
+    # Reference ids only for the categories whose notes carry one
+    usernames = None
+    updates = []
+    rows = bind.execute(sa.text(
+        "SELECT id, category, note FROM coin_transactions "
+        "WHERE note IS NOT NULL AND category IN ('withdrawal', 'withdrawal_refund', 'transfer_in', 'transfer_out', 'referral_bonus')"
+    ))
+    for tx_id, category, note in rows:
+        if category in ('withdrawal', 'withdrawal_refund'):
+            match = REQUEST_NUMBER.search(note)
+            reference_id = int(match.group(1)) if match else None
+        else:
+            match = REFERENCE_USERNAMES[category].match(note)
+            if not match:
+                continue
+            if usernames is None:
+                usernames = dict(bind.execute(sa.text("SELECT username, id FROM users")).all())
+            reference_id = usernames.get(match.group(1))
+        if reference_id is not None:
+            updates.append({"tx_id": tx_id, "reference_id": reference_id})
+    if updates:
+        bind.execute(sa.text("UPDATE coin_transactions SET reference_id = :reference_id WHERE id = :tx_id"), updates)
+
+    op.create_index(
+        'ix_coin_transactions_user_category_created',
+        'coin_transactions',
+        ['user_id', 'category', 'created_at', 'amount']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_coin_transactions_user_category_created', table_name='coin_transactions')
+    with op.batch_alter_table('coin_transactions') as batch_op:
+        batch_op.drop_column('reference_id')
+        batch_op.drop_column('category')
+    sa.Enum(name='cointransactioncategory').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+from sqlalchemy import event
+
+from models import DeviceIPLog, UserActivityLog, UserLoginHistory
+from audit_log import AuditLogWriter, AuditEvent
+
+def test_batches_are_multi_row_inserts_per_table(session_factory):
+    writer = AuditLogWriter(session_factory, capacity=100, batch_size=50, flush_seconds=60)
+    inserts = []
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, sql, params, context, executemany: sql.startswith("INSERT") and inserts.append(executemany))
+
+    for i in range(5):
+        assert writer.record(AuditEvent.device_ip(i, "withdrawal_request_10_coins", ip_address="10.0.0.1"))
+        assert writer.record(AuditEvent.user_activity(i, "instagram_data_sync", {"posts_count": i}))
+    assert writer.record(AuditEvent.login(1, "failed", failure_reason="invalid_password"))
+    writer.stop()
+
+    # One executemany per table, not one statement per event
+    assert inserts == [True, True, False]
+    db = session_factory()
+    assert db.query(DeviceIPLog).count() == 5
+    assert db.query(UserActivityLog).filter(UserActivityLog.activity_details == '{"posts_count": 3}').count() == 1
+    assert db.query(UserLoginHistory).one().failure_reason == "invalid_password"
+    db.close()
+
+def test_full_buffer_drops_after_backpressure_and_stop_drains(session_factory):
+    gate = threading.Event()
+
+    def slow_factory():
+        gate.wait(5)
+        return session_factory()
+
+    writer = AuditLogWriter(slow_factory, capacity=3, batch_size=1, flush_seconds=60, block_ms=10)
+    # First event is taken by the flusher, which then stalls on the session
+    assert writer.record(AuditEvent.device_ip(1, "a"))
+    for _ in range(50):
+        if writer.pending_count() == 0:
+            break
+        threading.Event().wait(0.01)
+    assert all(writer.record(AuditEvent.device_ip(1, "b")) for _ in range(3))
+    assert writer.record(AuditEvent.device_ip(1, "dropped")) is False
+
+    gate.set()
+    writer.stop()
+    assert writer.pending_count() == 0
+    # After shutdown events are written inline
+    assert writer.record(AuditEvent.device_ip(1, "late"))
+
+    db = session_factory()
+    actions = sorted(action for (action,) in db.query(DeviceIPLog.action))
+    assert actions == ["a", "b", "b", "b", "late"]
+    db.close()
+
+def test_full_buffer_never_holds_the_event_loop(session_factory):
+    gate = threading.Event()
+
+    def slow_factory():
+        gate.wait(5)
+        return session_factory()
+
+    writer = AuditLogWriter(slow_factory, capacity=1, batch_size=1, flush_seconds=60, block_ms=2000)
+    writer.record(AuditEvent.device_ip(1, "a"))
+    for _ in range(50):
+        if writer.pending_count() == 0:
+            break
+        threading.Event().wait(0.01)
+    writer.record(AuditEvent.device_ip(1, "b"))
+
+    async def endpoint():
+        started = time.monotonic()
+        recorded = writer.record(AuditEvent.device_ip(1, "dropped"))
+        return recorded, time.monotonic() - started
+
+    recorded, elapsed = asyncio.run(endpoint())
+    assert recorded is False and elapsed < 0.5
+    gate.set()
+    writer.stop()
@@ -0,0 +1,54 @@
+from sqlalchemy import event
+
+from models import User, Badge, UserBadge
+from badge_catalog import BadgeCatalog, SYSTEM_BADGE_DEFINITIONS
+
+def _count_statements(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+def test_sync_is_one_upsert_and_keeps_admin_state(session_factory):
+    db = session_factory()
+    db.add(Badge(name="İlk Görev 🎯", description="eski", is_active=False))
+    db.commit()
+
+    catalog = BadgeCatalog()
+    statements = _count_statements(db)
+    definitions = [{"name": "Yeni Rozet", "description": "d", "category": "special", "requirements": {"type": "special"}}]
+    assert catalog.sync(db, definitions) == len(SYSTEM_BADGE_DEFINITIONS) + 1
+    db.commit()
+
+    assert sum(sql.lstrip().upper().startswith("INSERT") for sql in statements) == 1
+    first_task = db.query(Badge).filter(Badge.name == "İlk Görev 🎯").one()
+    assert first_task.description == "İlk görevinizi tamamladınız"
+    assert first_task.is_active is False
+    assert catalog.get("Yeni Rozet").category == "special"
+    db.close()
+
+def test_award_is_a_single_conflict_ignoring_insert(session_factory):
+    db = session_factory()
+    user = User(username="badge_user")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+
+    catalog = BadgeCatalog()
+    catalog.sync(db)
+    db.commit()
+
+    statements = _count_statements(db)
+    assert catalog.award(db, user_id, "Sosyal Kelebek 🦋").name == "Sosyal Kelebek 🦋"
+    assert catalog.award(db, user_id, "Sosyal Kelebek 🦋") is None
+    db.commit()
+    assert len(statements) == 2 and all(sql.lstrip().upper().startswith("INSERT") for sql in statements)
+    assert db.query(UserBadge).filter(UserBadge.user_id == user_id).count() == 1
+
+    # Created elsewhere after the catalog loaded: one reload, then awarded
+    other = session_factory()
+    other.add(Badge(name="Admin Rozeti"))
+    other.commit()
+    other.close()
+    assert catalog.award(db, user_id, "Admin Rozeti") is not None
+    assert catalog.award(db, user_id, "Yok Böyle Rozet") is None
+    db.close()
@@ -0,0 +1,153 @@
+import asyncio
+import random
+import threading
+
+import pytest
+from sqlalchemy import func
+
+from models import User, CoinTransaction, CoinTransactionType, CoinTransactionCategory, CoinWithdrawalRequest
+from coin_ledger import CoinLedger
+from coin_security import CoinSecurityManager
+
+STARTING_BALANCE = 500
+
+@pytest.fixture
+def user_ids(session_factory):
+    db = session_factory()
+    users = [User(username=f"ledger_{i}", coin_balance=STARTING_BALANCE) for i in range(6)]
+    db.add_all(users)
+    db.commit()
+    ids = [user.id for user in users]
+    db.close()
+    return ids
+
+def _run_parallel(workers, target):
+    barrier = threading.Barrier(workers)
+    errors = []
+
+    def run(worker_index):
+        barrier.wait()
+        try:
+            target(worker_index)
+        except Exception as e:  # pragma: no cover - surfaced by the assertion below
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+def test_parallel_debits_never_overdraw(session_factory, user_ids):
+    user_id = user_ids[0]
+    outcomes = []
+
+    def debit(_):
+        db = session_factory()
+        try:
+            balance = CoinLedger(db).debit(user_id, 30, note="parallel debit")
+            if balance is None:
+                db.rollback()
+            else:
+                db.commit()
+            outcomes.append(balance is not None)
+        finally:
+            db.close()
+
+    _run_parallel(40, debit)
+
+    db = session_factory()
+    successes = sum(outcomes)
+    assert successes == STARTING_BALANCE // 30
+    assert db.get(User, user_id).coin_balance == STARTING_BALANCE - successes * 30
+    assert db.query(CoinTransaction).filter_by(user_id=user_id).count() == successes
+    db.close()
+
+def test_parallel_transfers_conserve_coins(session_factory, user_ids):
+    fee_total = []
+
+    def transfer_batch(worker_index):
+        rng = random.Random(worker_index)
+        db = session_factory()
+        try:
+            for _ in range(25):
+                sender_id, recipient_id = rng.sample(user_ids, 2)
+                amount = rng.randint(1, 120)
+                fee = amount // 10
+                if CoinLedger(db).transfer(sender_id, recipient_id, amount, fee) is None:
+                    db.rollback()
+                    continue
+                db.commit()
+                fee_total.append(fee)
+        finally:
+            db.close()
+
+    _run_parallel(24, transfer_batch)
+
+    db = session_factory()
+    balances = dict(db.query(User.id, User.coin_balance).filter(User.id.in_(user_ids)).all())
+    ledger = dict(
+        db.query(CoinTransaction.user_id, func.sum(CoinTransaction.amount))
+        .group_by(CoinTransaction.user_id).all()
+    )
+    spends = db.query(CoinTransaction).filter_by(type=CoinTransactionType.spend).count()
+    earns = db.query(CoinTransaction).filter_by(type=CoinTransactionType.earn).count()
+    db.close()
+
+    assert all(balance >= 0 for balance in balances.values())
+    assert sum(balances.values()) + sum(fee_total) == STARTING_BALANCE * len(user_ids)
+    # Every committed balance change has its transaction row and nothing else does
+    assert all(balances[user_id] == STARTING_BALANCE + (ledger.get(user_id) or 0) for user_id in user_ids)
+    assert spends == earns == len(fee_total)
+
+def test_entries_are_categorised_and_summed_per_category(session_factory, user_ids):
+    sender_id, recipient_id = user_ids[:2]
+    db = session_factory()
+    ledger = CoinLedger(db)
+    ledger.credit(sender_id, 50, category=CoinTransactionCategory.referral_bonus, reference_id=recipient_id)
+    ledger.credit(sender_id, 25, category=CoinTransactionCategory.referral_bonus)
+    ledger.credit(sender_id, 70, category=CoinTransactionCategory.daily_reward)
+    ledger.transfer(sender_id, recipient_id, 40, 4)
+    db.commit()
+
+    received = db.query(CoinTransaction).filter_by(user_id=recipient_id).one()
+    assert (received.category, received.reference_id) == (CoinTransactionCategory.transfer_in, sender_id)
+    assert ledger.category_totals(sender_id) == {
+        CoinTransactionCategory.referral_bonus: 75,
+        CoinTransactionCategory.daily_reward: 70,
+        CoinTransactionCategory.transfer_out: -44,
+    }
+    assert ledger.category_totals(sender_id, (CoinTransactionCategory.referral_bonus,)) == {
+        CoinTransactionCategory.referral_bonus: 75
+    }
+
+    with pytest.raises(ValueError):
+        ledger.transfer(sender_id, sender_id, 10)
+    assert db.query(User.coin_balance).filter_by(id=sender_id).scalar() == STARTING_BALANCE + 145 - 44
+    db.close()
+
+def test_withdrawal_lock_cannot_overdraw_after_a_concurrent_spend(session_factory, user_ids, monkeypatch):
+    user_id = user_ids[0]
+    manager = CoinSecurityManager(session_factory)
+
+    async def spend_meanwhile(user, amount, db):
+        # Another request spends most of the balance after the withdrawal's balance check
+        other = session_factory()
+        assert CoinLedger(other).debit(user_id, STARTING_BALANCE - 100) == 100
+        other.commit()
+        other.close()
+        return {"passed": True}
+
+    async def low_risk(user, db):
+        return 0.0
+
+    monkeypatch.setattr(manager, "_perform_security_checks", spend_meanwhile)
+    monkeypatch.setattr(manager, "_calculate_fraud_score", low_risk)
+    result = asyncio.run(manager.request_withdrawal(user_id, 300))
+
+    assert result == {"success": False, "message": "Yetersiz bakiye"}
+    db = session_factory()
+    assert db.get(User, user_id).coin_balance == 100
+    assert db.query(CoinWithdrawalRequest).count() == 0
+    db.close()
@@ -0,0 +1,78 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import User, DailyReward, CoinTransaction
+from daily_rewards import DailyRewardService, quote_reward
+
+NOW = datetime(2026, 3, 10, 9, 30)
+TODAY = NOW.date()
+
+@pytest.fixture
+def user_id(session_factory):
+    db = session_factory()
+    user = User(username="reward_user", coin_balance=100, daily_reward_streak=0)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+def _claim(session_factory, user_id, now):
+    db = session_factory()
+    try:
+        return DailyRewardService(db).claim(db.get(User, user_id), now=now)
+    finally:
+        db.close()
+
+def test_concurrent_claims_award_exactly_once(session_factory, user_id):
+    workers = 48
+    barrier = threading.Barrier(workers)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(_claim(session_factory, user_id, NOW))
+        except Exception as e:  # pragma: no cover - surfaced by the assertion below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert sum(result.claimed for result in results) == 1
+
+    db = session_factory()
+    reward = quote_reward(1).total
+    assert db.query(DailyReward).filter_by(user_id=user_id).count() == 1
+    assert db.query(CoinTransaction).filter_by(user_id=user_id).count() == 1
+    assert db.get(User, user_id).coin_balance == 100 + reward
+    db.close()
+
+def test_streak_continues_on_consecutive_days_and_resets_after_gap(session_factory, user_id):
+    assert _claim(session_factory, user_id, NOW).reward.consecutive_days == 1
+    assert _claim(session_factory, user_id, NOW + timedelta(days=1)).reward.consecutive_days == 2
+    assert not _claim(session_factory, user_id, NOW + timedelta(days=1)).claimed
+    assert _claim(session_factory, user_id, NOW + timedelta(days=3)).reward.consecutive_days == 1
+
+def test_status_reads_only_the_user_row(session_factory, user_id):
+    _claim(session_factory, user_id, NOW)
+    db = session_factory()
+    user = db.get(User, user_id)
+    user.coin_balance  # load the row before counting
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    today_status = DailyRewardService(db).get_status(user, today=TODAY)
+    tomorrow_status = DailyRewardService(db).get_status(user, today=TODAY + timedelta(days=1))
+    db.close()
+
+    assert statements == []
+    assert not today_status.can_claim and today_status.streak == 1
+    assert tomorrow_status.can_claim and tomorrow_status.next_reward == quote_reward(2)
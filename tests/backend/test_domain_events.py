@@ -0,0 +1,174 @@
+import asyncio
+
+from sqlalchemy import update
+
+from models import (
+    User, OutboxEvent, Leaderboard, UserStatistics, Referral, Task, TaskStatus, CoinTransaction, CoinTransactionCategory
+)
+from coin_ledger import CoinLedger
+from domain_events import EventBus, OutboxDispatcher, publish, CoinEarned, RewardClaimed
+from event_consumers import register_event_consumers
+from social_features import SocialFeaturesManager, SOCIAL_STATS_TAG
+from response_cache import response_cache
+from background_jobs import BackgroundJobManager
+
+def _make_due(session_factory):
+    db = session_factory()
+    db.execute(update(OutboxEvent).values(available_at=OutboxEvent.created_at))
+    db.commit()
+    db.close()
+
+def test_events_exist_only_with_their_transaction(session_factory):
+    db = session_factory()
+    user = User(username="outbox_user")
+    db.add(user)
+    db.commit()
+
+    publish(db, CoinEarned(user.id, 10, "task_reward"))
+    db.rollback()
+    publish(db, RewardClaimed(user.id, 60, 1, 1), CoinEarned(user.id, 5, "transfer_in", 2))
+    db.commit()
+
+    rows = db.query(OutboxEvent.event_type, OutboxEvent.status).order_by(OutboxEvent.id).all()
+    assert rows == [("RewardClaimed", "pending"), ("CoinEarned", "pending")]
+    db.close()
+
+def test_dispatch_retries_only_failed_consumers(session_factory):
+    db = session_factory()
+    user = User(username="dispatch_user")
+    db.add(user)
+    db.commit()
+    publish(db, *(CoinEarned(user.id, amount, "task_reward") for amount in (1, 2, 3)))
+    db.commit()
+    db.close()
+
+    bus = EventBus()
+    seen = {"stats": [], "badges": []}
+    failures = {"left": 1}
+
+    @bus.consumer("stats", CoinEarned)
+    def stats(event):
+        seen["stats"].append(event.amount)
+
+    @bus.consumer("badges", CoinEarned)
+    async def badges(event):
+        if event.amount == 2 and failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("badge check failed")
+        seen["badges"].append(event.amount)
+
+    dispatcher = OutboxDispatcher(bus, session_factory, batch_size=2, max_attempts=2)
+    assert asyncio.run(dispatcher.dispatch_pending()) == 2
+    assert asyncio.run(dispatcher.dispatch_pending()) == 1
+    # Event 2 is backing off; nothing else is due
+    assert asyncio.run(dispatcher.dispatch_pending()) == 0
+
+    _make_due(session_factory)
+    assert asyncio.run(dispatcher.dispatch_pending()) == 1
+    # The consumer that succeeded the first time is not re-run
+    assert sorted(seen["stats"]) == [1, 2, 3]
+    assert sorted(seen["badges"]) == [1, 2, 3]
+
+    db = session_factory()
+    assert {status for (status,) in db.query(OutboxEvent.status)} == {"delivered"}
+    db.close()
+
+def test_event_that_keeps_failing_is_parked(session_factory):
+    db = session_factory()
+    user = User(username="dead_user")
+    db.add(user)
+    db.commit()
+    publish(db, RewardClaimed(user.id, 50, 1))
+    db.commit()
+    db.close()
+
+    bus = EventBus()
+    bus.subscribe(RewardClaimed, "notifications", lambda event: 1 / 0)
+    dispatcher = OutboxDispatcher(bus, session_factory, max_attempts=2)
+    for _ in range(2):
+        assert asyncio.run(dispatcher.dispatch_pending()) == 1
+        _make_due(session_factory)
+    assert asyncio.run(dispatcher.dispatch_pending()) == 0
+
+    db = session_factory()
+    row = db.query(OutboxEvent).one()
+    assert (row.status, row.attempts) == ("dead", 2)
+    assert "ZeroDivisionError" in row.last_error
+    db.close()
+
+def test_counter_consumers_survive_redelivery(session_factory):
+    db = session_factory()
+    user = User(username="stats_user", daily_reward_streak=3)
+    db.add(user)
+    db.commit()
+    db.add_all([
+        Leaderboard(period="weekly", user_id=user.id, score=0, rank=1),
+        UserStatistics(user_id=user.id, total_earnings=0),
+    ])
+    ledger = CoinLedger(db)
+    ledger.credit(user.id, 30, category=CoinTransactionCategory.task_reward)
+    ledger.credit(user.id, 20, category=CoinTransactionCategory.transfer_in)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    bus = EventBus()
+    register_event_consumers(bus, session_factory, None, None, None, None)
+    earned = CoinEarned(user_id, 30, CoinTransactionCategory.task_reward.value)
+    for domain_event in (earned, earned, CoinEarned(user_id, 20, CoinTransactionCategory.transfer_in.value)):
+        succeeded, failed = asyncio.run(bus.deliver(domain_event, skip=frozenset({"notifications", "badges"})))
+        assert not failed and succeeded == ["leaderboard", "stats"]
+
+    db = session_factory()
+    # Transfers are not earnings, but the leaderboard ranks every earn row like its rebuild does
+    assert db.query(UserStatistics.total_earnings, UserStatistics.daily_streak).one() == (30, 3)
+    assert db.query(Leaderboard.score).scalar() == 50
+    db.close()
+
+def test_score_refreshes_leave_social_stats_cached_until_the_rebuild(session_factory):
+    db = session_factory()
+    user = User(username="ranked_user")
+    db.add(user)
+    db.commit()
+    db.add(Leaderboard(period="weekly", user_id=user.id, score=0, rank=1))
+    CoinLedger(db).credit(user.id, 40, category=CoinTransactionCategory.task_reward)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    response_cache.set(("social_stats",), b"{}", tags=(SOCIAL_STATS_TAG,))
+    bus = EventBus()
+    register_event_consumers(bus, session_factory, None, None, None, None)
+    asyncio.run(bus.deliver(CoinEarned(user_id, 40, "task_reward"), skip=frozenset({"notifications", "badges"})))
+    assert response_cache.get(("social_stats",)) is not None
+
+    asyncio.run(BackgroundJobManager(session_factory, None).update_leaderboards())
+    assert response_cache.get(("social_stats",)) is None
+    db = session_factory()
+    assert db.query(Leaderboard.period, Leaderboard.rank, Leaderboard.score).order_by(Leaderboard.period).all() == [
+        ("monthly", 1, 40), ("weekly", 1, 40)
+    ]
+    db.close()
+
+def test_referral_bonus_is_credited_once_through_the_outbox(session_factory):
+    db = session_factory()
+    referrer, referred = User(username="referrer", coin_balance=10), User(username="referred")
+    db.add_all([referrer, referred])
+    db.commit()
+    db.add(Referral(referrer_id=referrer.id, referred_id=referred.id))
+    db.add_all(Task(assigned_user_id=referred.id, status=TaskStatus.completed) for _ in range(10))
+    db.commit()
+
+    manager = SocialFeaturesManager(session_factory)
+    for _ in range(2):
+        asyncio.run(manager.check_referral_bonus_eligibility(referred.id))
+
+    db.expire_all()
+    assert db.get(User, referrer.id).coin_balance == 10 + manager.referrer_bonus
+    assert db.query(CoinTransaction.category).filter_by(user_id=referrer.id).all() == [
+        (CoinTransactionCategory.referral_bonus,)
+    ]
+    assert [event_type for (event_type,) in db.query(OutboxEvent.event_type).order_by(OutboxEvent.id)] == [
+        "ReferralBonusGranted", "CoinEarned"
+    ]
+    db.close()
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+import idempotency as idempotency_module
+from idempotency import IdempotencyStore, idempotent, REPLAY_HEADER
+
+class Transfer(BaseModel):
+    amount: int
+
+def _app(store, calls, delay=0.0):
+    app = FastAPI()
+
+    def current_user(user: int = 1):
+        return SimpleNamespace(id=user)
+
+    @app.post("/transfer")
+    @idempotent("transfer", store=store)
+    async def transfer(data: Transfer, current_user=Depends(current_user)):
+        calls.append(data.amount)
+        await asyncio.sleep(delay)
+        if data.amount > 100:
+            raise HTTPException(status_code=400, detail="Yetersiz bakiye")
+        return {"sent": data.amount, "call": len(calls)}
+
+    return app
+
+def test_completed_keys_replay_and_other_bodies_are_rejected():
+    store, calls = IdempotencyStore(), []
+    client = TestClient(_app(store, calls))
+    key = {"Idempotency-Key": "k1"}
+
+    first = client.post("/transfer", json={"amount": 10}, headers=key)
+    replay = client.post("/transfer", json={"amount": 10}, headers=key)
+    assert first.json() == replay.json() == {"sent": 10, "call": 1}
+    assert REPLAY_HEADER not in first.headers and replay.headers[REPLAY_HEADER] == "true"
+
+    assert client.post("/transfer", json={"amount": 20}, headers=key).status_code == 422
+    # Keys are per user, and 4xx outcomes are stored like successes
+    assert client.post("/transfer", json={"amount": 20}, headers=key, params={"user": 2}).json()["call"] == 2
+    assert client.post("/transfer", json={"amount": 20}, headers=key, params={"user": 2}).json()["call"] == 2
+    rejected = client.post("/transfer", json={"amount": 500}, headers={"Idempotency-Key": "k2"})
+    replayed = client.post("/transfer", json={"amount": 500}, headers={"Idempotency-Key": "k2"})
+    assert (replayed.status_code, replayed.json()) == (400, rejected.json())
+
+    # Without a key every request runs
+    client.post("/transfer", json={"amount": 10})
+    assert calls == [10, 20, 500, 10]
+    assert store.stats == {"executed": 3, "replayed": 3, "waited": 0, "mismatched": 1}
+
+def test_concurrent_duplicates_wait_for_the_first_execution():
+    store, calls = IdempotencyStore(), []
+    app = _app(store, calls, delay=0.2)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/transfer", json={"amount": 10}, headers={"Idempotency-Key": "same"}) for _ in range(5)
+            ))
+
+    responses = asyncio.run(run())
+    assert calls == [10]
+    assert {response.json()["call"] for response in responses} == {1}
+    assert sum(REPLAY_HEADER in response.headers for response in responses) == 4
+    assert (store.stats["executed"], store.stats["waited"], store.stats["replayed"]) == (1, 4, 4)
+
+def test_outcomes_expire_after_the_ttl(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(idempotency_module.time, "monotonic", lambda: clock.now)
+    store, calls = IdempotencyStore(ttl_seconds=60), []
+    client = TestClient(_app(store, calls))
+
+    client.post("/transfer", json={"amount": 10}, headers={"Idempotency-Key": "k"})
+    clock.now += 59
+    assert client.post("/transfer", json={"amount": 10}, headers={"Idempotency-Key": "k"}).headers[REPLAY_HEADER]
+    clock.now += 2
+    assert REPLAY_HEADER not in client.post("/transfer", json={"amount": 10}, headers={"Idempotency-Key": "k"}).headers
+    assert calls == [10, 10]
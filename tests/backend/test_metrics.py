@@ -0,0 +1,45 @@
+import json
+import threading
+
+from metrics import MetricsRegistry
+
+def test_thread_shards_are_summed_and_rendered():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+
+    def record():
+        for _ in range(1000):
+            requests.inc(route="/coins")
+            latency.observe(0.05, route="/coins")
+        latency.observe(5.0, route="/coins")
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = registry.render()
+    assert 'requests_total{route="/coins"} 8000' in text
+    assert 'latency_seconds_bucket{route="/coins",le="0.1"} 8000' in text
+    assert 'latency_seconds_bucket{route="/coins",le="1"} 8000' in text
+    assert 'latency_seconds_bucket{route="/coins",le="+Inf"} 8008' in text
+    assert 'latency_seconds_count{route="/coins"} 8008' in text
+
+def test_workers_are_merged_and_dead_worker_gauges_dropped(tmp_path):
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+    registry.counter("jobs_total", "Jobs", ("job",)).inc(3, job="expire_tasks")
+    registry.gauge("connections", "Connections", callback=lambda: 2)
+
+    # A worker that has exited since it last flushed
+    dead_pid = 2 ** 22 + 12345
+    with open(tmp_path / f"worker_{dead_pid}.json", "w") as f:
+        json.dump({"pid": dead_pid, "metrics": {
+            "jobs_total": {"type": "counter", "help": "Jobs", "labelnames": ["job"], "samples": [[["expire_tasks"], 4]]},
+            "connections": {"type": "gauge", "help": "Connections", "labelnames": [], "samples": [[[], 7]]},
+        }}, f)
+
+    text = registry.render()
+    assert 'jobs_total{job="expire_tasks"} 7' in text
+    assert "connections 2" in text
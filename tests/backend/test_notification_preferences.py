@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+import enhanced_notifications
+from models import User, NotificationSetting
+from enhanced_notifications import NotificationService, NotificationType
+from notification_preferences import NotificationPreferenceCache, NotificationPref, DEFAULT_MASK
+
+@pytest.fixture
+def session_factory(session_factory):
+    statements = []
+    event.listen(session_factory.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+    session_factory.statements = statements
+    return session_factory
+
+def _users(session_factory, count):
+    db = session_factory()
+    users = [User(username=f"pref_user_{i}") for i in range(count)]
+    db.add_all(users)
+    db.commit()
+    ids = [user.id for user in users]
+    db.add(NotificationSetting(user_id=ids[0], push_enabled=False, reward_notifications=False))
+    db.commit()
+    db.close()
+    return ids
+
+def test_masks_are_bulk_loaded_cached_and_invalidated(session_factory):
+    ids = _users(session_factory, 3)
+    cache = NotificationPreferenceCache(session_factory)
+    session_factory.statements.clear()
+
+    masks = cache.load_many(ids)
+    assert masks[ids[0]] == DEFAULT_MASK & ~NotificationPref.PUSH & ~NotificationPref.REWARD
+    assert masks[ids[1]] == masks[ids[2]] == DEFAULT_MASK
+    assert len(session_factory.statements) == 1
+    assert cache.get(ids[0]) == masks[ids[0]] and len(session_factory.statements) == 1
+
+    db = session_factory()
+    db.query(NotificationSetting).filter_by(user_id=ids[0]).update({"reward_notifications": True})
+    db.commit()
+    db.close()
+    cache.invalidate(ids[0])
+    assert cache.get(ids[0]) & NotificationPref.REWARD
+
+def test_muted_categories_are_dropped_before_delivery(session_factory, monkeypatch):
+    ids = _users(session_factory, 2)
+    monkeypatch.setattr(enhanced_notifications, "notification_preferences", NotificationPreferenceCache(session_factory))
+    delivered = []
+
+    async def deliver(notification_data, send_push, send_realtime):
+        delivered.append((notification_data["user_id"], notification_data["type"], send_push))
+
+    service = NotificationService(db_session_factory=session_factory)
+    monkeypatch.setattr(service, "_deliver_notification", deliver)
+
+    async def scenario():
+        assert await service.create_notification(ids[0], "Bonus", "...", NotificationType.COIN_EARNED) is None
+        # Transactional types cannot be muted; push follows the channel toggle
+        await service.create_notification(ids[0], "Transfer", "...", NotificationType.COIN_TRANSFER_RECEIVED)
+        await service.create_notification_batch(
+            [{"user_id": user_id, "title": "Seri", "message": "..."} for user_id in ids],
+            notification_type=NotificationType.DAILY_LOGIN
+        )
+
+    asyncio.run(scenario())
+    assert delivered == [
+        (ids[0], "coin_transfer_received", False),
+        (ids[1], "daily_login", True),
+    ]
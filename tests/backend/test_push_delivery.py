@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+from firebase_admin import exceptions, messaging
+
+from models import User, UserFCMToken
+from push_delivery import (
+    PushDeliveryWorker, FakePushTransport, FirebaseTransport, PushMessage, SENT, UNREGISTERED, RETRY, FAILED
+)
+
+def _users_with_tokens(session_factory, tokens_per_user):
+    db = session_factory()
+    users = [User(username=f"push_user_{i}") for i in range(len(tokens_per_user))]
+    db.add_all(users)
+    db.commit()
+    db.add_all(
+        UserFCMToken(user_id=user.id, token=f"u{user.id}-t{n}")
+        for user, count in zip(users, tokens_per_user) for n in range(count)
+    )
+    db.commit()
+    ids = [user.id for user in users]
+    db.close()
+    return ids
+
+def test_broadcast_is_multicast_in_batches_and_dead_tokens_are_pruned(session_factory):
+    ids = _users_with_tokens(session_factory, [400, 400, 400, 1])
+    dead = {f"u{ids[0]}-t0", f"u{ids[3]}-t0"}
+    transport = FakePushTransport(unregistered=dead)
+    worker = PushDeliveryWorker(transport, session_factory, concurrency=2)
+
+    worker.enqueue(*(PushMessage(user_id, "Duyuru", "Bakım") for user_id in ids[:3]))
+    worker.enqueue(PushMessage(ids[3], "Transfer", "50 coin"))
+    report = asyncio.run(worker.flush())
+
+    assert sorted(len(tokens) for tokens, *_ in transport.multicasts) == [1, 200, 500, 500]
+    assert (report.messages, report.sent, report.unregistered, report.failed) == (4, 1199, 2, 0)
+    db = session_factory()
+    assert db.query(UserFCMToken).count() == 1199
+    assert not db.query(UserFCMToken).filter(UserFCMToken.token.in_(dead)).count()
+    db.close()
+
+def test_transient_failures_are_retried_then_given_up(session_factory):
+    ids = _users_with_tokens(session_factory, [2])
+    worker = PushDeliveryWorker(FakePushTransport(transient_failures=1), session_factory, backoff_seconds=0)
+    worker.enqueue(PushMessage(ids[0], "Ödül", "60 coin", {"type": "daily_login"}))
+    report = asyncio.run(worker.flush())
+    assert (report.sent, report.retried, report.failed) == (2, 2, 0)
+
+    worker = PushDeliveryWorker(FakePushTransport(transient_failures=5), session_factory, max_attempts=3, backoff_seconds=0)
+    worker.enqueue(PushMessage(ids[0], "Ödül", "60 coin"))
+    report = asyncio.run(worker.flush())
+    assert (report.sent, report.retried, report.failed) == (0, 4, 2)
+
+def test_queue_is_bounded():
+    worker = PushDeliveryWorker(FakePushTransport(), capacity=2)
+    assert worker.enqueue(*(PushMessage(1, "a", "b") for _ in range(3))) == 2
+    assert worker.pending_count() == 2
+
+def test_only_dead_tokens_are_pruned_not_bad_payloads():
+    def outcome(error=None):
+        return FirebaseTransport._outcome(SimpleNamespace(success=error is None, exception=error))
+
+    assert outcome() == SENT
+    assert outcome(messaging.UnregisteredError("gone")) == UNREGISTERED
+    assert outcome(messaging.SenderIdMismatchError("other sender")) == UNREGISTERED
+    assert outcome(exceptions.UnavailableError("later")) == RETRY
+    # Oversized or malformed payloads are rejected with INVALID_ARGUMENT for every recipient
+    assert outcome(exceptions.InvalidArgumentError("message is too big")) == FAILED
+
+def test_stop_finishes_the_batch_in_flight_and_drains_the_queue(session_factory):
+    ids = _users_with_tokens(session_factory, [1, 1])
+    # The first send is slow and answered with a transient error, so the batch needs a retry to finish
+    transport = FakePushTransport(transient_failures=1, latency=0.3)
+    worker = PushDeliveryWorker(transport, session_factory, backoff_seconds=0)
+
+    async def run():
+        await worker.start()
+        worker.enqueue(PushMessage(ids[0], "Bakım", "Başlıyor"))
+        while worker.pending_count():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)  # the slow send is in progress
+        worker.enqueue(PushMessage(ids[1], "Bakım", "Bitti"))
+        await worker.stop()
+
+    asyncio.run(run())
+    assert sorted(body for _, _, body, _ in transport.multicasts) == ["Başlıyor", "Bitti"]
+    assert worker.pending_count() == 0
@@ -0,0 +1,50 @@
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from query_instrumentation import (
+    QueryInstrumentation, QueryInstrumentationConfig, QueryInstrumentationMiddleware, normalize_sql
+)
+
+def test_normalize_sql_folds_literals_and_in_lists():
+    assert normalize_sql(
+        "SELECT * FROM users\n  WHERE id IN (?, ?, ?) AND name = 'x''y' AND coin_balance > 10"
+    ) == "SELECT * FROM users WHERE id IN (?, ...) AND name = ? AND coin_balance > ?"
+    assert normalize_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)") == "INSERT INTO t (a, b) VALUES (?, ...), ..."
+
+def test_middleware_reports_counts_and_logs_repeated_statements(tmp_path, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'instrumented.db'}")
+    instrumentation = QueryInstrumentation(QueryInstrumentationConfig(debug_headers=True, max_queries=5, sample_rate=0.0))
+
+    app = FastAPI()
+    app.add_middleware(QueryInstrumentationMiddleware, instrumentation=instrumentation)
+
+    @app.get("/n-plus-one")
+    def n_plus_one():
+        with engine.connect() as conn:
+            return [conn.execute(text("SELECT :n"), {"n": n}).scalar() for n in range(6)]
+
+    @app.get("/single")
+    def single():
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT 1")).scalar()
+
+    client = TestClient(app)
+    with caplog.at_level(logging.INFO, logger="query_instrumentation"):
+        single_response = client.get("/single")
+        response = client.get("/n-plus-one")
+
+    assert single_response.headers["x-db-query-count"] == "1"
+    assert response.headers["x-db-query-count"] == "6"
+    assert float(response.headers["x-db-time-ms"]) >= float(response.headers["x-db-slowest-ms"]) > 0
+
+    # Only the statement-heavy request is logged when sampling is off
+    assert len(caplog.records) == 1
+    payload = json.loads(caplog.records[0].getMessage())
+    assert payload["event"] == "slow_request_db"
+    assert payload["path"] == "/n-plus-one"
+    assert payload["most_repeated"] == {"count": 6, "sql": "SELECT ?"}
+    engine.dispose()
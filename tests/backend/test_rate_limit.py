@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+import rate_limit
+from rate_limit import MemoryBucketStore, SQLiteBucketStore, RateLimiter, RateLimitPolicy, rate_limited, client_ip
+
+def test_bucket_refills_and_full_buckets_are_evicted(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock.now)
+    store = MemoryBucketStore()
+
+    assert [store.take("a", 3, 1.0).allowed for _ in range(4)] == [True, True, True, False]
+    assert store.take("a", 3, 1.0).retry_after == 1.0
+    clock.now += 1.5
+    assert store.take("a", 3, 1.0).allowed
+    assert not store.take("a", 3, 1.0).allowed
+
+    # "a" refills completely by t+3; touching another key sweeps it without changing any decision
+    clock.now += 3
+    store.take("b", 3, 1.0)
+    assert store.size() == 1
+    assert [store.take("a", 3, 1.0).allowed for _ in range(4)] == [True, True, True, False]
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "buckets.sqlite")
+    worker_a, worker_b = SQLiteBucketStore(path), SQLiteBucketStore(path)
+    assert worker_a.take("login:ip:1.2.3.4", 2, 0.001).allowed
+    assert worker_b.take("login:ip:1.2.3.4", 2, 0.001).allowed
+    decision = worker_a.take("login:ip:1.2.3.4", 2, 0.001)
+    assert not decision.allowed and decision.retry_after > 900
+    assert worker_b.size() == 1
+
+def test_decorator_rejects_with_retry_after_per_user():
+    limiter = RateLimiter(MemoryBucketStore(), {"stats": RateLimitPolicy("stats", 2, 0.01)}, enabled=True)
+    app = FastAPI()
+    users = {"1": SimpleNamespace(id=1), "2": SimpleNamespace(id=2)}
+
+    def current_user(user: str = "1"):
+        return users[user]
+
+    @app.get("/statistics")
+    @rate_limited("stats", limiter=limiter)
+    def statistics(current_user=Depends(current_user)):
+        return {"user": current_user.id}
+
+    client = TestClient(app)
+    assert [client.get("/statistics").status_code for _ in range(3)] == [200, 200, 429]
+    rejected = client.get("/statistics")
+    assert int(rejected.headers["Retry-After"]) >= 99
+    # Other users have their own bucket
+    assert client.get("/statistics", params={"user": "2"}).json() == {"user": 2}
+
+def test_client_ip_reads_only_the_trusted_forwarded_hop():
+    app = FastAPI()
+
+    @app.get("/ip")
+    def ip(request: Request, proxies: int = 0):
+        return client_ip(request, proxies)
+
+    client = TestClient(app)
+    router = {"X-Forwarded-For": "6.6.6.6, 203.0.113.7"}  # spoofed entry, then the one the router appended
+    assert client.get("/ip", headers=router).json() == "testclient"
+    assert client.get("/ip", params={"proxies": 1}, headers=router).json() == "203.0.113.7"
+    assert client.get("/ip", params={"proxies": 2}, headers=router).json() == "6.6.6.6"
+    # Fewer hops than trusted proxies: the request did not come through them
+    assert client.get("/ip", params={"proxies": 3}, headers=router).json() == "testclient"
@@ -0,0 +1,80 @@
+import asyncio
+
+from enhanced_notifications import RealTimeNotificationManager
+
+class FakeWebSocket:
+    def __init__(self, incoming=()):
+        self.sent = []
+        self.accepted = False
+        self.close_code = None
+        self.incoming = asyncio.Queue()
+        for message in incoming:
+            self.incoming.put_nowait(message)
+
+    async def accept(self):
+        self.accepted = True
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+    async def send_text(self, text):
+        if self.close_code is not None:
+            raise RuntimeError("socket closed")
+        self.sent.append(text)
+
+    async def receive(self):
+        message = await self.incoming.get()
+        if message is None:
+            return {"type": "websocket.disconnect", "code": 1000}
+        if isinstance(message, bytes):
+            return {"type": "websocket.receive", "bytes": message}
+        return {"type": "websocket.receive", "text": message}
+
+def test_devices_share_one_registry_and_oldest_is_evicted():
+    async def scenario():
+        manager = RealTimeNotificationManager(max_connections=3, max_connections_per_user=2)
+        await manager.send_notification_to_user(7, {"queued": True})
+        phone, tablet, laptop, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+
+        await manager.connect(phone, 7)
+        await manager.connect(tablet, 7)
+        assert phone.sent == ['{"queued":true}'] and manager.queued_count() == 0
+        await manager.send_notification_to_user(7, {"n": 1})
+        assert phone.sent[-1] == tablet.sent[-1] == '{"n":1}'
+
+        await manager.connect(laptop, 7)
+        assert phone.close_code == 1008 and manager.connection_count() == 2
+
+        await manager.connect(other, 8)
+        assert manager.connection_count() == 3
+        assert await manager.connect(FakeWebSocket(), 9) is None
+
+    asyncio.run(scenario())
+
+def test_heartbeat_answers_pings_and_closes_idle_sockets():
+    async def scenario():
+        manager = RealTimeNotificationManager(heartbeat_seconds=0.05, idle_timeout_seconds=0.2)
+        websocket = FakeWebSocket(incoming=["ping"])
+        connection = await manager.connect(websocket, 1)
+        await manager.serve(connection)
+        manager.disconnect(connection)
+        return websocket, manager
+
+    websocket, manager = asyncio.run(scenario())
+    assert websocket.sent[0] == '{"type":"pong"}'
+    assert '{"type":"ping"}' in websocket.sent[1:]
+    assert websocket.close_code == 1001
+    assert manager.connection_count() == 0 and manager.active_connections == {}
+
+def test_pings_are_parsed_as_json_and_binary_frames_close_the_socket():
+    async def scenario(*incoming):
+        manager = RealTimeNotificationManager(heartbeat_seconds=5, idle_timeout_seconds=5)
+        websocket = FakeWebSocket(incoming=incoming)
+        await manager.serve(await manager.connect(websocket, 1))
+        return websocket
+
+    websocket = asyncio.run(scenario('{ "type" : "ping" }', '{"type":"pong"}', '{"note":"pong"}', "not json", None))
+    assert websocket.sent == ['{"type":"pong"}'] and websocket.close_code is None
+
+    websocket = asyncio.run(scenario(b"\x00\x01", "ping"))
+    assert websocket.sent == [] and websocket.close_code == 1003
@@ -0,0 +1,18 @@
+from referral_codes import ReferralCodeAllocator, ALPHABET, CODE_LENGTH
+
+def test_codes_are_distinct_reversible_and_scrambled():
+    allocator = ReferralCodeAllocator("test-key")
+    codes = [allocator.code_for(user_id) for user_id in range(1, 20001)]
+
+    assert len(set(codes)) == len(codes)
+    assert all(len(code) == CODE_LENGTH and set(code) <= set(ALPHABET) for code in codes)
+    assert all(allocator.user_id_for(code.lower()) == user_id for user_id, code in enumerate(codes[:500], 1))
+    # Consecutive ids share no common prefix beyond chance
+    assert sum(a[:2] == b[:2] for a, b in zip(codes, codes[1:])) < 100
+
+def test_key_and_tweak_change_the_code():
+    allocator = ReferralCodeAllocator("test-key")
+    assert allocator.code_for(42) != ReferralCodeAllocator("other-key").code_for(42)
+    assert allocator.code_for(42) != allocator.code_for(42, tweak=1)
+    assert allocator.user_id_for(allocator.code_for(42, tweak=1), tweak=1) == 42
+    assert allocator.user_id_for("NOT-A-CODE") is None
@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import response_cache as response_cache_module
+from models import User, Badge, UserBadge
+from badge_catalog import BadgeCatalog
+from response_cache import ResponseCache, cached_response, invalidate_on_commit, invalidate_after_commit, user_tag
+
+def _client(cache, calls):
+    app = FastAPI()
+
+    def current_user(user: int = 1):
+        return SimpleNamespace(id=user)
+
+    @app.get("/catalog")
+    @cached_response("catalog", ttl=60, tags=("catalog",), cache=cache)
+    def catalog(page: int = 1):
+        calls.append(page)
+        return {"page": page, "items": ["a", "b"]}
+
+    @app.get("/stats")
+    @cached_response("stats", tags=("stats",), vary_on_user=True, cache=cache)
+    def stats(current_user=Depends(current_user)):
+        calls.append(("stats", current_user.id))
+        return {"user": current_user.id}
+
+    return TestClient(app)
+
+def test_conditional_requests_and_route_counters():
+    cache, calls = ResponseCache(), []
+    client = _client(cache, calls)
+
+    first = client.get("/catalog")
+    assert first.json() == {"page": 1, "items": ["a", "b"]}
+    etag = first.headers["ETag"]
+    assert client.get("/catalog", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/catalog", headers={"If-None-Match": f'W/"other", W/{etag}'}).status_code == 304
+    assert client.get("/catalog", headers={"If-None-Match": '"stale"'}).json()["page"] == 1
+    client.get("/catalog", params={"page": 2})
+    assert calls == [1, 2]
+
+    # Per-user entries are private and keyed by the user
+    assert client.get("/stats").headers["Cache-Control"].startswith("private")
+    client.get("/stats", params={"user": 2})
+    client.get("/stats")
+    assert calls[2:] == [("stats", 1), ("stats", 2)]
+
+    routes = cache.get_stats()["routes"]
+    assert routes["catalog"] == {"hits": 3, "misses": 2, "not_modified": 2, "uncacheable": 0, "hit_ratio": 0.6}
+    assert (routes["stats"]["hits"], routes["stats"]["misses"]) == (1, 2)
+
+def test_entries_expire_and_least_recently_used_are_evicted(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache_module.time, "monotonic", lambda: clock.now)
+    cache = ResponseCache(max_entries=2, default_ttl=10)
+
+    cache.set(("a",), b"1")
+    cache.set(("b",), b"2", ttl=100)
+    assert cache.get(("a",)).body == b"1"  # now most recently used
+    cache.set(("c",), b"3")
+    assert cache.get(("b",)) is None and cache.get(("a",)) is not None
+
+    clock.now += 11
+    assert cache.get(("a",)) is None and cache.get(("c",)) is None
+    assert cache.get_stats()["entries"] == 0
+
+def test_commits_invalidate_tags_and_rollbacks_do_not(session_factory):
+    cache = ResponseCache()
+    invalidate_on_commit({Badge: ("catalog",)}, cache=cache, user_scoped={UserBadge: ("user_id", ("stats",))})
+    db = session_factory()
+    users = [User(username="cache_a"), User(username="cache_b")]
+    db.add_all(users)
+    db.commit()
+    a, b = (user.id for user in users)
+
+    def fill():
+        cache.set(("catalog",), b"[]", tags=("catalog",))
+        for user_id in (a, b):
+            cache.set(("stats", user_id), b"{}", tags=("stats", user_tag("stats", user_id)))
+
+    # Every registered cache gets its own tags from the same commit
+    other = ResponseCache()
+    invalidate_on_commit({Badge: ("catalog",)}, cache=other)
+    other.set(("catalog",), b"[]", tags=("catalog",))
+
+    fill()
+    db.add(Badge(name="Rolled back"))
+    db.flush()
+    invalidate_after_commit(db, user_tag("stats", a))
+    db.rollback()
+    assert cache.get_stats()["entries"] == 3
+
+    badge = Badge(name="Committed")
+    db.add(badge)
+    db.commit()
+    assert cache.get(("catalog",)) is None and cache.get_stats()["entries"] == 2
+    assert other.get(("catalog",)) is None
+
+    # A badge award drops only the awarded user's entries
+    fill()
+    assert BadgeCatalog().award_id(db, a, badge.id)
+    db.commit()
+    assert cache.get(("stats", a)) is None
+    assert cache.get(("stats", b)) is not None and cache.get(("catalog",)) is not None
+
+    db.add(UserBadge(user_id=b, badge_id=badge.id))
+    db.commit()
+    assert cache.get(("stats", b)) is None and cache.get(("catalog",)) is not None
+    db.close()
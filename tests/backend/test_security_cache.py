@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert
+
+from models import User, DeviceIPLog, CoinWithdrawalRequest
+from coin_security import CoinSecurityManager, security_results
+
+@pytest.fixture(autouse=True)
+def clear_security_results():
+    yield
+    security_results.clear()
+
+def test_results_are_cached_until_the_users_inputs_change(session_factory):
+    db = session_factory()
+    user = User(username="security_user", coin_balance=500)
+    db.add(user)
+    db.commit()
+    manager = CoinSecurityManager(session_factory)
+
+    score = asyncio.run(manager.calculate_user_security_score(user.id))
+    eligibility = asyncio.run(manager.verify_withdrawal_eligibility(user.id))
+    assert score["success"] and eligibility["checks"]["minimum_balance"]
+    assert asyncio.run(manager.calculate_user_security_score(user.id)) == score
+
+    # Rolled back writes keep the cached results
+    db.add(CoinWithdrawalRequest(user_id=user.id, amount=100, status="pending"))
+    db.flush()
+    db.rollback()
+    assert asyncio.run(manager.verify_withdrawal_eligibility(user.id)) == eligibility
+
+    # Device logs written in bulk by the audit writer drop them
+    db.execute(insert(DeviceIPLog), [
+        {"user_id": user.id, "action": "login", "ip_address": f"10.0.0.{i}"} for i in range(6)
+    ])
+    db.commit()
+    fresh = asyncio.run(manager.calculate_user_security_score(user.id))
+    assert fresh["computed_at"] > score["computed_at"]
+    assert fresh["fraud_risk"] == round(score["fraud_risk"] + 0.2, 2)
+
+    # Balance changes too
+    db.get(User, user.id).coin_balance = 50
+    db.commit()
+    eligibility = asyncio.run(manager.verify_withdrawal_eligibility(user.id))
+    assert not eligibility["checks"]["minimum_balance"] and eligibility["current_balance"] == 50
+    db.close()
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import insert
+
+from models import User, MentalHealthLog
+import usage_analytics
+from usage_analytics import get_usage_snapshot, clear_usage_cache
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    yield
+    clear_usage_cache()
+
+def test_snapshots_are_bounded_and_dropped_by_committed_logs(session_factory, monkeypatch):
+    db = session_factory()
+    users = [User(username=f"usage_{i}") for i in range(3)]
+    db.add_all(users)
+    db.commit()
+    a, b, c = (user.id for user in users)
+
+    snapshot = get_usage_snapshot(db, a)
+    assert snapshot.log_count() == 0 and get_usage_snapshot(db, a) is snapshot
+
+    db.add(MentalHealthLog(user_id=a, notification_type="break_reminder"))
+    db.flush()
+    db.rollback()
+    assert get_usage_snapshot(db, a) is snapshot
+
+    # Cooldown logs are written in bulk by the wellness job
+    db.execute(insert(MentalHealthLog), [{"user_id": a, "notification_type": "break_reminder"}])
+    db.commit()
+    assert get_usage_snapshot(db, a).log_count() == 1
+
+    monkeypatch.setattr(usage_analytics._snapshot_cache, "max_entries", 2)
+    for user_id in (a, b, c):
+        get_usage_snapshot(db, user_id)
+    assert usage_analytics._snapshot_cache.size() == 2
+    db.close()
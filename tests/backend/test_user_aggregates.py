@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import insert
+
+from models import User, Task, TaskStatus, CoinTransaction, CoinTransactionType
+from singleflight import SingleFlight
+from user_aggregates import UserAggregateCache
+
+@pytest.fixture
+def cache(session_factory):
+    return UserAggregateCache(session_factory, ttl=60)
+
+def test_singleflight_shares_one_call_between_concurrent_callers():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flight.do, "key", compute)
+        started.wait(5)
+        followers = [pool.submit(flight.do, "key", compute) for _ in range(3)]
+        time.sleep(0.2)
+        release.set()
+        assert [f.result() for f in (leader, *followers)] == [42] * 4
+    assert len(calls) == 1 and flight.in_flight() == 0
+
+    with pytest.raises(ZeroDivisionError):
+        flight.do("key", lambda: 1 / 0)
+    assert flight.in_flight() == 0
+
+def test_aggregates_are_cached_until_a_commit_touches_the_user(session_factory, cache):
+    db = session_factory()
+    user, other = User(username="agg_user"), User(username="agg_other")
+    db.add_all([user, other])
+    db.commit()
+    db.add_all([
+        Task(assigned_user_id=user.id, status=TaskStatus.completed),
+        Task(assigned_user_id=user.id, status=TaskStatus.assigned),
+        CoinTransaction(user_id=user.id, amount=30, type=CoinTransactionType.earn),
+        CoinTransaction(user_id=user.id, amount=10, type=CoinTransactionType.spend),
+    ])
+    db.commit()
+
+    first = cache.get(user.id)
+    assert (first.completed_tasks, first.active_tasks, first.total_earned, first.total_spent) == (1, 1, 30, 10)
+    cache.get(other.id)
+    assert cache.get(user.id) is first
+
+    # Rolled back writes and other users' writes keep the entry
+    db.add(CoinTransaction(user_id=user.id, amount=5, type=CoinTransactionType.earn))
+    db.flush()
+    db.rollback()
+    db.add(CoinTransaction(user_id=other.id, amount=5, type=CoinTransactionType.earn))
+    db.commit()
+    assert cache.get(user.id) is first
+    assert cache.get(other.id).total_earned == 5
+
+    # Bulk ledger inserts and task state changes invalidate on commit
+    db.execute(insert(CoinTransaction), [{"user_id": user.id, "amount": 7, "type": CoinTransactionType.earn}])
+    db.commit()
+    assert cache.get(user.id).total_earned == 37
+
+    task = db.query(Task).filter_by(status=TaskStatus.assigned).one()
+    task.assigned_user_id = None
+    db.commit()
+    assert cache.get(user.id).active_tasks == 0
+    db.close()
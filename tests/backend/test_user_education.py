@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from models import User, UserEducation, CoinTransaction, CoinTransactionCategory
+from user_education import (
+    UserEducationService, EducationModuleType, MODULE_PAYLOADS, QUIZ_PAYLOADS, QUIZ_ANSWER_KEYS, MODULE_REWARDS
+)
+
+def test_payloads_never_contain_the_answer_key():
+    for payload in (*MODULE_PAYLOADS.values(), *QUIZ_PAYLOADS.values()):
+        assert '"correct"' not in payload.body.decode("utf-8")
+    quiz = json.loads(QUIZ_PAYLOADS[EducationModuleType.INSTAGRAM_BASICS].body)["quiz"]
+    assert quiz["questions"][0]["options"]
+
+def test_started_modules_persist_and_quizzes_are_graded_from_answers(session_factory):
+    db = session_factory()
+    user = User(username="student")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+
+    module = EducationModuleType.INSTAGRAM_BASICS
+    UserEducationService(db).start_education_module(user_id, module)
+    db.close()
+    db = session_factory()
+    assert db.query(UserEducation).filter_by(user_id=user_id, module_type=module.value).count() == 1
+
+    service = UserEducationService(db)
+    (_, quiz_step), answer_key = next(
+        (key, answers) for key, answers in QUIZ_ANSWER_KEYS.items() if key[0] == module
+    )
+    quiz = next(step for step in service.education_modules[module]["steps"] if step["id"] == quiz_step)
+    # A self-reported count earns no bonus; only the submitted answers are graded
+    assert service._calculate_step_score(module, quiz, {"correct_answers": 99}) == 20
+    assert service._calculate_step_score(module, quiz, {"answers": [(a + 1) % 4 for a in answer_key]}) == 20
+    assert service._calculate_step_score(module, quiz, {"answers": list(answer_key)}) == 30
+    db.close()
+
+def test_concurrent_final_steps_pay_the_completion_reward_once(session_factory):
+    db = session_factory()
+    user = User(username="finisher", coin_balance=0)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    module = EducationModuleType.INSTAGRAM_BASICS
+    first, second = session_factory(), session_factory()
+    service = UserEducationService(first)
+    service.start_education_module(user_id, module)
+    *steps, last = (step["id"] for step in service.education_modules[module]["steps"])
+    for step_id in steps:
+        service.complete_education_step(user_id, module, step_id)
+
+    # The second request has read the module as not completed yet
+    stale = second.query(UserEducation).filter_by(user_id=user_id).one()
+    assert not stale.completed
+    assert service.complete_education_step(user_id, module, last)["module_completed"]
+    with pytest.raises(ValueError):
+        UserEducationService(second).complete_education_step(user_id, module, last)
+
+    reward, _ = MODULE_REWARDS[module]
+    assert first.query(User.coin_balance).filter_by(id=user_id).scalar() == reward
+    assert first.query(CoinTransaction).filter_by(
+        user_id=user_id, category=CoinTransactionCategory.education_reward
+    ).count() == 1
+    first.close()
+    second.close()